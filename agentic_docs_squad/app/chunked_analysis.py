@@ -0,0 +1,317 @@
+import re
+import asyncio
+import difflib
+from dataclasses import dataclass
+from google.genai import types
+
+from app.tools.inline_text import InlineText, TextChunk, chunk_header, chunk_prompt
+
+# Viñetas y numeración que se eliminan al leer un hecho
+BULLET_PATTERN = re.compile(r'^\s*(?:[-*•]|\d+[.)])\s*')
+
+# Prefijo con el que el AnalystAgent informa de que no puede analizar el contenido (p. ej., ante una inyección)
+ERROR_REPORT_PREFIX = "ERROR"
+
+# Marca de tiempo al inicio de un hecho: "[12:34]", "01:02:03 -", "(12:34):"...
+TIMESTAMP_PATTERN = re.compile(r'^[\[(]?(\d{1,2}(?::\d{2}){1,2})[\])]?\s*[-–:]?\s*')
+
+
+@dataclass
+class ChunkingPolicy:
+    """
+    Configuración del análisis por segmentos de videos largos.
+
+    El video se divide en segmentos de `segment_seconds` que se solapan
+    `overlap_seconds` (para no perder lo que ocurre en los cortes) y se
+    analizan como máximo `max_concurrency` a la vez. Los videos que duran
+    menos de `min_duration_seconds` se siguen analizando de una sola vez.
+    """
+    segment_seconds: float = 600.0
+    overlap_seconds: float = 30.0
+    max_concurrency: int = 4
+    min_duration_seconds: float = 900.0
+
+    def applies_to(self, mime_type: str, duration_seconds: float | None) -> bool:
+        return (
+            mime_type.startswith("video/")
+            and duration_seconds is not None
+            and duration_seconds > self.min_duration_seconds
+        )
+
+
+@dataclass
+class Segment:
+    """Tramo [start_seconds, end_seconds) del video."""
+    index: int
+    start_seconds: float
+    end_seconds: float
+
+    def to_part(self, uri: str, mime_type: str) -> types.Part:
+        """Adjunto del archivo recortado a este tramo mediante los offsets de VideoMetadata."""
+        return types.Part(
+            file_data=types.FileData(file_uri=uri, mime_type=mime_type),
+            video_metadata=types.VideoMetadata(
+                start_offset=f"{self.start_seconds:g}s", end_offset=f"{self.end_seconds:g}s"
+            ),
+        )
+
+
+@dataclass
+class Fact:
+    """Un hecho técnico con su instante en el video (en segundos) y, si se conocen, su tipo y nota."""
+    seconds: float
+    text: str
+    segment: int
+    kind: str | None = None
+    note: str | None = None
+
+
+class SegmentAnalysisError(Exception):
+    """El análisis de un segmento no devolvió hechos válidos."""
+    def __init__(self, segment: Segment, response: str | None):
+        super().__init__(
+            f"segmento {segment.index + 1} ({format_timestamp(segment.start_seconds)}-"
+            f"{format_timestamp(segment.end_seconds)}): {response}"
+        )
+        self.segment = segment
+        self.response = response
+
+
+class AnalysisRejected(Exception):
+    """El AnalystAgent no devolvió hechos: respuesta vacía o su informe de error ("ERROR: ...")."""
+    def __init__(self, response: str | None):
+        super().__init__(response or "respuesta vacía")
+        self.response = response
+
+
+def check_analysis_reply(response: str | None) -> str:
+    """
+    Devuelve la respuesta del AnalystAgent o lanza AnalysisRejected si está
+    vacía o empieza por su informe de error. Un hecho que solo menciona la
+    palabra (las líneas ERROR de un log) no cuenta como fallo.
+    """
+    if not response or not response.strip() or response.lstrip().startswith(ERROR_REPORT_PREFIX):
+        raise AnalysisRejected(response)
+    return response
+
+
+class ChunkAnalysisError(Exception):
+    """El análisis de un fragmento de texto no devolvió hechos válidos."""
+    def __init__(self, chunk: TextChunk, response: str | None):
+        super().__init__(f"fragmento {chunk.index + 1} (líneas {chunk.start_line}-{chunk.end_line}): {response}")
+        self.chunk = chunk
+        self.response = response
+
+
+def plan_segments(duration_seconds: float, segment_seconds: float, overlap_seconds: float) -> list[Segment]:
+    """Divide la duración total en segmentos solapados que cubren todo el video."""
+    step = segment_seconds - overlap_seconds
+    if step <= 0:
+        raise ValueError("El solapamiento debe ser menor que la duración de cada segmento.")
+    segments = []
+    start = 0.0
+    while True:
+        end = min(start + segment_seconds, duration_seconds)
+        segments.append(Segment(len(segments), start, end))
+        if end >= duration_seconds:
+            return segments
+        start += step
+
+
+def format_timestamp(seconds: float) -> str:
+    seconds = int(seconds)
+    return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+
+
+def parse_timestamp(value: str) -> float:
+    seconds = 0
+    for component in value.split(":"):
+        seconds = seconds * 60 + int(component)
+    return float(seconds)
+
+
+def place_facts(facts: list[Fact], segment: Segment) -> list[Fact]:
+    """
+    Sitúa en la línea temporal del video los hechos de un segmento, que
+    llegan con el instante que indicó el modelo (None si no lo indicó).
+
+    Los hechos sin marca de tiempo heredan la del hecho anterior (o el inicio
+    del segmento). Si todas las marcas caben en la duración del segmento pero
+    alguna es anterior a su inicio, se interpretan como relativas al segmento.
+    """
+    stamped = [fact.seconds for fact in facts if fact.seconds is not None]
+    segment_length = segment.end_seconds - segment.start_seconds
+    relative = bool(stamped) and segment.start_seconds > 0 and (
+        max(stamped) <= segment_length and min(stamped) < segment.start_seconds
+    )
+
+    last_seconds = segment.start_seconds
+    for fact in facts:
+        if fact.seconds is None:
+            fact.seconds = last_seconds
+        elif relative:
+            fact.seconds += segment.start_seconds
+        last_seconds = fact.seconds
+    return facts
+
+
+def parse_facts(text: str, segment: Segment) -> list[Fact]:
+    """Extrae una lista de hechos (uno por línea) de la respuesta de un segmento (ver `place_facts`)."""
+    parsed = []
+    for line in text.splitlines():
+        line = BULLET_PATTERN.sub("", line.strip(), count=1).strip()
+        if not line or line.startswith("#"):
+            continue
+        match = TIMESTAMP_PATTERN.match(line)
+        seconds = parse_timestamp(match.group(1)) if match else None
+        fact_text = line[match.end():].strip() if match else line
+        if fact_text:
+            parsed.append(Fact(seconds, fact_text, segment.index))
+    return place_facts(parsed, segment)
+
+
+def _normalize(text: str) -> str:
+    return " ".join(re.sub(r"[^\w\s]", " ", text.casefold()).split())
+
+
+def _technical_tokens(text: str) -> set[str]:
+    """Números, rutas, IPs, opciones...: deben coincidir para que dos hechos parecidos sean el mismo."""
+    tokens = (token.strip(".,;:()[]'\"`") for token in text.casefold().split())
+    return {token for token in tokens if any(c.isdigit() or c in "/._-=" for c in token)}
+
+
+def merge_facts(fact_lists: list[list[Fact]], window_seconds: float, similarity: float = 0.85) -> list[Fact]:
+    """
+    Une los hechos de todos los segmentos en una única lista cronológica.
+
+    Un hecho se descarta como duplicado si otro ya aceptado ocurre a menos de
+    `window_seconds` y su texto es igual o casi igual (típico de la zona de
+    solapamiento entre dos segmentos). Para considerarse casi iguales, sus
+    datos técnicos (números, rutas, comandos con opciones...) deben coincidir.
+    """
+    ordered = sorted(
+        (fact for facts in fact_lists for fact in facts),
+        key=lambda fact: (fact.seconds, fact.segment),
+    )
+    merged: list[tuple[Fact, str, set[str]]] = []
+    for fact in ordered:
+        normalized = _normalize(fact.text)
+        technical = _technical_tokens(fact.text)
+        duplicate = False
+        for previous, previous_normalized, previous_technical in reversed(merged):
+            if fact.seconds - previous.seconds > window_seconds:
+                break
+            if normalized == previous_normalized or (
+                technical == previous_technical
+                and difflib.SequenceMatcher(None, normalized, previous_normalized).ratio() >= similarity
+            ):
+                duplicate = True
+                break
+        if not duplicate:
+            merged.append((fact, normalized, technical))
+    return [fact for fact, _, _ in merged]
+
+
+def format_facts(facts: list[Fact]) -> str:
+    return "\n".join(f"- [{format_timestamp(fact.seconds)}] {fact.text}" for fact in facts)
+
+
+def segment_prompt(segment: Segment, total_segments: int, user_context: str = "", format_prompt: str = "") -> str:
+    """
+    Instrucciones para un segmento. Sin `format_prompt` se pide un hecho por
+    línea con su marca de tiempo; con él (p. ej., el esquema de hechos), ese
+    formato y que las marcas sean las del video completo.
+    """
+    return f"""
+    Analiza SOLO el tramo del video adjunto entre {format_timestamp(segment.start_seconds)}
+    y {format_timestamp(segment.end_seconds)} (segmento {segment.index + 1} de {total_segments})
+    y extrae los hechos técnicos clave de ese tramo.
+    Contexto proporcionado por el usuario: '{user_context}'
+    """ + (format_prompt + """
+    Las marcas de tiempo son instantes dentro del video completo.
+    """ if format_prompt else """
+    Devuelve un hecho por línea con el formato "- [HH:MM:SS] hecho", donde
+    HH:MM:SS es el instante dentro del video completo.
+    """)
+
+
+async def analyze_in_segments(analyze_segment, uri: str, mime_type: str, duration_seconds: float,
+                              policy: ChunkingPolicy, user_context: str = "", format_prompt: str = "",
+                              parse=parse_facts, render=format_facts) -> str:
+    """
+    Análisis map-reduce de un video largo.
+
+    `analyze_segment(parts)` es una corrutina que envía las partes al modelo
+    y devuelve su texto (en el orquestador, el AnalystAgent; en las pruebas,
+    un modelo falso). Los segmentos se analizan en paralelo con el límite de
+    concurrencia de `policy` y sus hechos se fusionan en una lista
+    cronológica sin duplicados. Si un segmento no devuelve hechos (ver
+    `check_analysis_reply`) se cancelan los demás y se lanza
+    SegmentAnalysisError.
+
+    Por defecto se pide y se devuelve una lista de hechos en texto; con el
+    esquema de hechos, `format_prompt` lo pide, `parse(respuesta, segmento)`
+    lee cada respuesta y `render(hechos)` serializa la lista fusionada (ver
+    app/facts.py).
+    """
+    segments = plan_segments(duration_seconds, policy.segment_seconds, policy.overlap_seconds)
+    semaphore = asyncio.Semaphore(max(1, policy.max_concurrency))
+
+    async def analyze(segment: Segment) -> list[Fact]:
+        async with semaphore:
+            response = await analyze_segment([
+                types.Part(text=segment_prompt(segment, len(segments), user_context, format_prompt)),
+                segment.to_part(uri, mime_type),
+            ])
+        try:
+            check_analysis_reply(response)
+        except AnalysisRejected:
+            raise SegmentAnalysisError(segment, response)
+        return parse(response, segment)
+
+    tasks = [asyncio.create_task(analyze(segment)) for segment in segments]
+    try:
+        fact_lists = await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+    return render(merge_facts(fact_lists, window_seconds=max(policy.overlap_seconds, 1.0)))
+
+
+def text_part(chunk: TextChunk, file_name: str) -> types.Part:
+    """El contenido del fragmento como parte de texto, precedido del nombre del archivo y sus líneas."""
+    return types.Part(text=chunk_header(chunk, file_name) + chunk.text)
+
+
+async def analyze_text_chunks(analyze_chunk, inline: InlineText, file_name: str, max_concurrency: int,
+                              user_context: str = "", prompt_suffix: str = "") -> list[str]:
+    """
+    Análisis en paralelo de los fragmentos de un texto largo.
+
+    `analyze_chunk(parts)` envía las partes al modelo y devuelve su texto, o
+    lanza AnalysisRejected si el modelo no devolvió hechos (ver
+    `check_analysis_reply`). Devuelve las respuestas en el orden de los
+    fragmentos (para fusionarlas con `merge_text_facts` de app/tools/inline_text.py
+    o, si son registros de hechos, con sus propias reglas). Si un fragmento
+    falla se cancelan los demás y se lanza ChunkAnalysisError.
+    """
+    semaphore = asyncio.Semaphore(max(1, max_concurrency))
+
+    async def analyze(chunk: TextChunk) -> str:
+        async with semaphore:
+            try:
+                return await analyze_chunk([
+                    types.Part(text=chunk_prompt(chunk, len(inline.chunks), inline.total_lines, user_context) + prompt_suffix),
+                    text_part(chunk, file_name),
+                ])
+            except AnalysisRejected as e:
+                raise ChunkAnalysisError(chunk, e.response)
+
+    tasks = [asyncio.create_task(analyze(chunk)) for chunk in inline.chunks]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
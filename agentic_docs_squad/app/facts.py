@@ -0,0 +1,208 @@
+import re
+import json
+from dataclasses import dataclass, field
+
+from app.chunked_analysis import Fact, Segment, format_timestamp, parse_facts, parse_timestamp, place_facts
+
+# Versión del esquema: forma parte de la clave de la caché de análisis
+FACT_SCHEMA_VERSION = 1
+
+# Tipos de hecho admitidos; cualquier otro se guarda como "note"
+FACT_KINDS = ("command", "output", "error", "config", "host", "path", "step", "note")
+
+# Sinónimos habituales que usa el modelo para los tipos anteriores
+KIND_ALIASES = {
+    "cmd": "command", "comando": "command",
+    "log": "output", "salida": "output",
+    "exception": "error", "stacktrace": "error", "traceback": "error",
+    "configuration": "config", "configuracion": "config", "configuración": "config",
+    "ip": "host", "hostname": "host", "port": "host", "puerto": "host", "network": "host",
+    "file": "path", "archivo": "path", "ruta": "path",
+    "paso": "step", "action": "step",
+}
+
+# En estos tipos las mayúsculas importan (Linux distingue rutas y opciones)
+CASE_SENSITIVE_KINDS = ("command", "output", "config", "path")
+
+TIMESTAMP_VALUE_PATTERN = re.compile(r'^\[?(\d{1,2}(?::\d{2}){1,2})\]?$')
+JSON_FENCE_PATTERN = re.compile(r'```(?:json)?\s*(.*?)```', re.DOTALL)
+
+# Instrucciones de formato que se añaden al prompt del AnalystAgent
+FACT_SCHEMA_PROMPT = """
+        Responde ÚNICAMENTE con un objeto JSON con esta forma (sin texto adicional):
+        {"facts": [{"kind": "...", "value": "...", "t": "HH:MM:SS", "note": "..."}]}
+        - kind: uno de command, output, error, config, host, path, step, note.
+        - value: el dato exacto (comando literal, mensaje de error, bloque de
+          configuración completo, IP/host:puerto, ruta...). Un hecho por elemento.
+        - t: marca de tiempo en el contenido, si se conoce (omítela si no).
+        - note: aclaración breve y opcional (p. ej., el archivo de un bloque config).
+        No repitas hechos ni parafrasees el mismo dato varias veces.
+"""
+
+
+class FactSchemaError(Exception):
+    """La respuesta del analista no contiene un registro de hechos válido."""
+
+
+@dataclass
+class FactRecord:
+    """Un hecho técnico tipado. `t` es una marca HH:MM:SS en el contenido (o None)."""
+    kind: str
+    value: str
+    t: str | None = None
+    note: str | None = None
+
+    def to_dict(self) -> dict:
+        return {key: value for key, value in (("kind", self.kind), ("value", self.value), ("t", self.t),
+                                              ("note", self.note)) if value}
+
+
+@dataclass
+class FactSheet:
+    """Registro compacto de los hechos extraídos por el AnalystAgent."""
+    facts: list[FactRecord] = field(default_factory=list)
+    # Elementos de la respuesta descartados por no cumplir el esquema
+    rejected: int = 0
+
+    def to_json(self) -> str:
+        """Serialización canónica y compacta (la que se guarda en la caché de análisis)."""
+        return json.dumps({"v": FACT_SCHEMA_VERSION, "facts": [fact.to_dict() for fact in self.facts]},
+                          ensure_ascii=False, separators=(",", ":"))
+
+    def remap_timestamps(self, to_source):
+        """Traduce las marcas de tiempo con `to_source(segundos) -> segundos`."""
+        for fact in self.facts:
+            if fact.t:
+                fact.t = format_timestamp(round(to_source(parse_timestamp(fact.t))))
+
+
+def _normalize_timestamp(value) -> str | None:
+    if not isinstance(value, str):
+        return None
+    match = TIMESTAMP_VALUE_PATTERN.match(value.strip())
+    return format_timestamp(parse_timestamp(match.group(1))) if match else None
+
+
+def _normalize_kind(value) -> str:
+    kind = str(value or "").strip().lower()
+    kind = KIND_ALIASES.get(kind, kind)
+    return kind if kind in FACT_KINDS else "note"
+
+
+def _extract_json(text: str):
+    """Carga el JSON de la respuesta, admitiendo bloques ```json y texto alrededor."""
+    fenced = JSON_FENCE_PATTERN.search(text)
+    candidate = fenced.group(1) if fenced else text
+    start = min((i for i in (candidate.find("{"), candidate.find("[")) if i >= 0), default=-1)
+    if start < 0:
+        raise FactSchemaError("La respuesta no contiene JSON.")
+    try:
+        value, _ = json.JSONDecoder().raw_decode(candidate[start:])
+    except json.JSONDecodeError as e:
+        raise FactSchemaError(f"JSON no válido: {e}")
+    return value
+
+
+def parse_fact_sheet(text: str) -> FactSheet:
+    """
+    Valida la respuesta del analista contra el esquema de hechos. Los
+    elementos sin `value` se descartan, los tipos desconocidos pasan a
+    "note" y las marcas de tiempo no válidas se eliminan. Lanza
+    FactSchemaError si no queda ningún hecho válido.
+    """
+    data = _extract_json(text or "")
+    items = data.get("facts") if isinstance(data, dict) else data
+    if not isinstance(items, list):
+        raise FactSchemaError("El JSON no contiene una lista 'facts'.")
+
+    sheet = FactSheet()
+    for item in items:
+        value = item.get("value") if isinstance(item, dict) else None
+        if not isinstance(value, str) or not value.strip():
+            sheet.rejected += 1
+            continue
+        note = item.get("note")
+        sheet.facts.append(FactRecord(
+            kind=_normalize_kind(item.get("kind")),
+            value=value.strip(),
+            t=_normalize_timestamp(item.get("t")),
+            note=(note.strip() or None) if isinstance(note, str) else None,
+        ))
+    if not sheet.facts:
+        raise FactSchemaError("El registro de hechos está vacío.")
+    return sheet
+
+
+def _dedupe_key(fact: FactRecord) -> tuple:
+    value = " ".join(fact.value.split()).rstrip(".;")
+    if fact.kind not in CASE_SENSITIVE_KINDS:
+        value = value.casefold()
+    return fact.kind, value
+
+
+def dedupe_facts(sheet: FactSheet) -> FactSheet:
+    """
+    Elimina los hechos repetidos (mismo tipo y mismo valor, ignorando
+    espacios) y conserva la primera aparición, completando su marca de
+    tiempo y su nota con las de las repeticiones si le faltaban.
+    """
+    kept: dict[tuple, FactRecord] = {}
+    for fact in sheet.facts:
+        key = _dedupe_key(fact)
+        first = kept.get(key)
+        if first is None:
+            kept[key] = fact
+            continue
+        first.t = first.t or fact.t
+        first.note = first.note or fact.note
+    return FactSheet(facts=list(kept.values()), rejected=sheet.rejected)
+
+
+def load_fact_sheet(technical_facts: str) -> FactSheet | None:
+    """El FactSheet de una serialización canónica (p. ej., de la caché), o None si es texto libre."""
+    if not technical_facts.startswith('{"v":'):
+        return None
+    try:
+        return parse_fact_sheet(technical_facts)
+    except FactSchemaError:
+        return None
+
+
+def parse_segment_facts(text: str, segment: Segment) -> list[Fact]:
+    """
+    Hechos de un segmento de video que respondió con el esquema, situados en
+    la línea temporal como los de `parse_facts`. Si la respuesta no cumple el
+    esquema, se lee como una lista en texto (los hechos quedan sin tipo).
+    """
+    try:
+        sheet = parse_fact_sheet(text)
+    except FactSchemaError:
+        return parse_facts(text, segment)
+    return place_facts([
+        Fact(parse_timestamp(fact.t) if fact.t else None, fact.value, segment.index, fact.kind, fact.note)
+        for fact in sheet.facts
+    ], segment)
+
+
+def sheet_from_facts(facts: list[Fact]) -> FactSheet:
+    """Registro de hechos de la lista fusionada de un análisis por segmentos (sin tipo pasan a "note")."""
+    return FactSheet(facts=[
+        FactRecord(kind=fact.kind or "note", value=fact.text, t=format_timestamp(fact.seconds), note=fact.note)
+        for fact in facts
+    ])
+
+
+def render_facts(sheet: FactSheet) -> str:
+    """
+    Texto compacto para el prompt del TechWriterAgent: una línea por hecho
+    (`[HH:MM:SS] tipo: valor (nota)`); los valores de varias líneas, como
+    los bloques de configuración, se indentan debajo.
+    """
+    lines = []
+    for fact in sheet.facts:
+        prefix = f"[{fact.t}] " if fact.t else ""
+        note = f" ({fact.note})" if fact.note else ""
+        first, *rest = fact.value.splitlines()
+        lines.append(f"{prefix}{fact.kind}: {first}{note}")
+        lines.extend(f"    {line}" for line in rest)
+    return "\n".join(lines)
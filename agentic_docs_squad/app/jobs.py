@@ -0,0 +1,256 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import asyncio
+import threading
+from dataclasses import dataclass, field
+
+from app.orchestrator import PIPELINE_ERROR_PREFIX
+from app.stage_pipeline import PipelinedExecutor, stage_concurrency_from_env
+
+# Ubicación por defecto de la base de datos de trabajos
+DEFAULT_JOBS_DB_PATH = os.path.join(
+    os.path.expanduser("~"), ".cache", "agentic_docs_squad", "jobs.sqlite3"
+)
+
+# Número de archivos en curso a la vez por defecto (cada etapa tiene además su propio límite)
+DEFAULT_JOB_WORKERS = 4
+
+# Estados de un trabajo
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+FINISHED_STATUSES = (JOB_SUCCEEDED, JOB_FAILED)
+
+
+@dataclass
+class Job:
+    """Trabajo de documentación con su estado y el progreso de cada etapa."""
+    id: str
+    status: str
+    file_path: str
+    user_context: str = ""
+    content_hash: str | None = None
+    # Si es True, `file_path` es un temporal de una subida y se borra al terminar
+    cleanup: bool = False
+    current_stage: str | None = None
+    # {etapa: {"status": "running" | "completed" | "skipped", "seconds": float | None}}
+    stages: dict = field(default_factory=dict)
+    document: str | None = None
+    saved_path: str | None = None
+    error: str | None = None
+    created_at: float = 0.0
+    started_at: float | None = None
+    finished_at: float | None = None
+
+    def to_dict(self) -> dict:
+        """Estado público del trabajo (sin el documento, que se pide aparte)."""
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "current_stage": self.current_stage,
+            "stages": self.stages,
+            "error": self.error,
+            "saved_path": self.saved_path,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+        }
+
+
+class JobStore:
+    """
+    Persistencia (SQLite) de los trabajos, para que su estado y sus
+    resultados sobrevivan a un reinicio del servidor. Es segura entre hilos
+    dentro de un mismo proceso.
+    """
+    COLUMNS = ("id", "status", "file_path", "user_context", "content_hash", "cleanup", "current_stage",
+               "stages", "document", "saved_path", "error", "created_at", "started_at", "finished_at")
+
+    def __init__(self, path: str | None = None):
+        self.path = path or os.getenv("JOBS_DB_PATH", DEFAULT_JOBS_DB_PATH)
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    file_path TEXT NOT NULL,
+                    user_context TEXT NOT NULL,
+                    content_hash TEXT,
+                    cleanup INTEGER NOT NULL DEFAULT 0,
+                    current_stage TEXT,
+                    stages TEXT NOT NULL DEFAULT '{}',
+                    document TEXT,
+                    saved_path TEXT,
+                    error TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)")
+
+    def _row_to_job(self, row) -> Job:
+        values = dict(zip(self.COLUMNS, row))
+        values["cleanup"] = bool(values["cleanup"])
+        values["stages"] = json.loads(values["stages"])
+        return Job(**values)
+
+    def save(self, job: Job):
+        values = [getattr(job, column) for column in self.COLUMNS]
+        values[self.COLUMNS.index("stages")] = json.dumps(job.stages)
+        with self._lock, self._conn:
+            self._conn.execute(
+                f"INSERT OR REPLACE INTO jobs ({', '.join(self.COLUMNS)}) "
+                f"VALUES ({', '.join('?' for _ in self.COLUMNS)})",
+                values,
+            )
+
+    def get(self, job_id: str) -> Job | None:
+        with self._lock:
+            row = self._conn.execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE id = ?", (job_id,)
+            ).fetchone()
+        return self._row_to_job(row) if row else None
+
+    def unfinished(self) -> list[Job]:
+        """Trabajos en cola o interrumpidos a mitad, en orden de llegada."""
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT {', '.join(self.COLUMNS)} FROM jobs WHERE status IN (?, ?) ORDER BY created_at",
+                (JOB_QUEUED, JOB_RUNNING),
+            ).fetchall()
+        return [self._row_to_job(row) for row in rows]
+
+
+class JobManager:
+    """
+    Cola de trabajos de documentación ejecutada por `workers` tareas en el
+    propio proceso. Cada trabajo se ejecuta con `orchestrator.run_pipeline`
+    y sus eventos de progreso actualizan la etapa en curso y la duración de
+    cada etapa en el JobStore. Al arrancar se vuelven a encolar los trabajos
+    que quedaron pendientes o a medias en un reinicio anterior.
+
+    Con un `executor` (PipelinedExecutor), los trabajos en curso solapan sus
+    etapas respetando la concurrencia de cada una.
+    """
+    def __init__(self, orchestrator, store: JobStore | None = None, workers: int = DEFAULT_JOB_WORKERS,
+                 executor: PipelinedExecutor | None = None):
+        self.orchestrator = orchestrator
+        self.executor = executor
+        self.store = store or JobStore()
+        self.workers = max(1, workers)
+        self._queue: asyncio.Queue | None = None
+        self._tasks: list[asyncio.Task] = []
+
+    async def start(self):
+        self._queue = asyncio.Queue()
+        for job in self.store.unfinished():
+            print(f"🔁 Reanudando el trabajo {job.id} ({job.status}).")
+            job.status, job.current_stage, job.stages, job.started_at = JOB_QUEUED, None, {}, None
+            self.store.save(job)
+            self._queue.put_nowait(job.id)
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def submit(self, file_path: str, user_context: str = "", content_hash: str | None = None,
+               cleanup: bool = False) -> Job:
+        """Encola un trabajo y lo devuelve sin esperar a que se ejecute."""
+        job = Job(
+            id=uuid.uuid4().hex,
+            status=JOB_QUEUED,
+            file_path=file_path,
+            user_context=user_context,
+            content_hash=content_hash,
+            cleanup=cleanup,
+            created_at=time.time(),
+        )
+        self.store.save(job)
+        self._queue.put_nowait(job.id)
+        return job
+
+    def get(self, job_id: str) -> Job | None:
+        return self.store.get(job_id)
+
+    async def _worker(self):
+        while True:
+            job_id = await self._queue.get()
+            try:
+                job = self.store.get(job_id)
+                if job and job.status == JOB_QUEUED:
+                    await self._run(job)
+            except Exception as e:
+                print(f"💥 Error inesperado en el trabajo {job_id}: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _on_event(self, job: Job, event: str, data: dict):
+        stage = data.get("stage")
+        if event == "stage_started":
+            job.current_stage = stage
+            job.stages[stage] = {"status": "running", "seconds": None}
+        elif event == "stage_completed":
+            job.stages[stage] = {"status": "completed", "seconds": data["seconds"]}
+        elif event == "stage_skipped":
+            job.stages[stage] = {"status": "skipped", "seconds": None}
+        elif event == "completed":
+            job.saved_path = data.get("saved_path")
+            return
+        else:
+            # Los fragmentos del documento y demás eventos no cambian el estado persistido
+            return
+        self.store.save(job)
+
+    async def _run(self, job: Job):
+        print(f"▶️  Ejecutando el trabajo {job.id}: {job.file_path}")
+        job.status, job.started_at = JOB_RUNNING, time.time()
+        self.store.save(job)
+        try:
+            run_pipeline = self.executor.run if self.executor else self.orchestrator.run_pipeline
+            document = await run_pipeline(
+                job.file_path,
+                job.user_context,
+                on_event=lambda event, data: self._on_event(job, event, data),
+                content_hash=job.content_hash,
+            )
+            if document.startswith(PIPELINE_ERROR_PREFIX):
+                job.status, job.error = JOB_FAILED, document
+            else:
+                job.status, job.document = JOB_SUCCEEDED, document
+        except asyncio.CancelledError:
+            # El servidor se está deteniendo: el trabajo se reanudará en el próximo arranque
+            raise
+        except Exception as e:
+            job.status, job.error = JOB_FAILED, f"Error inesperado en el pipeline: {e}"
+        job.current_stage = None
+        job.finished_at = time.time()
+        self.store.save(job)
+        print(f"⏹️  Trabajo {job.id} terminado: {job.status}")
+        if job.cleanup and os.path.exists(job.file_path):
+            os.remove(job.file_path)
+
+
+def create_job_manager(orchestrator) -> JobManager:
+    """
+    Crea el gestor de trabajos. JOB_WORKERS fija cuántos archivos están en
+    curso a la vez, INGEST_CONCURRENCY, ANALYSIS_CONCURRENCY,
+    WRITER_CONCURRENCY y SAVER_CONCURRENCY la concurrencia de cada etapa y
+    JOBS_DB_PATH la ubicación de la base de datos.
+    """
+    return JobManager(
+        orchestrator,
+        workers=int(os.getenv("JOB_WORKERS", DEFAULT_JOB_WORKERS)),
+        executor=PipelinedExecutor(orchestrator, stage_concurrency_from_env(os.environ)),
+    )
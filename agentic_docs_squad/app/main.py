@@ -1,11 +1,17 @@
-from fastapi import FastAPI, HTTPException, UploadFile, File, Form
+from fastapi import FastAPI, HTTPException, UploadFile, File, Form, Request
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
 import re
+import json
 import os
-import shutil # Para manejar archivos temporales
 
 from app.config import configure_environment
-from app.orchestrator import create_orchestrator, Orchestrator
+from app.orchestrator import create_orchestrator, Orchestrator, PIPELINE_ERROR_PREFIX
+from app.jobs import create_job_manager, JobManager, FINISHED_STATUSES, JOB_FAILED
+from app.rate_limit import get_rate_limiter
+from app.telemetry import get_metrics
+from app.tools.file_registry import FileCollector, create_file_collector, get_file_registry
+from app.tools.upload_spool import SpooledUpload, UploadTooLarge, iter_upload_file, max_upload_bytes, spool_stream
 
 # --- Pydantic Models for API ---
 class PipelineRequest(BaseModel):
@@ -16,6 +22,23 @@ class PipelineRequest(BaseModel):
 class PipelineResponse(BaseModel):
     document: str
 
+class JobSubmitted(BaseModel):
+    job_id: str
+    status: str
+
+class JobStatus(BaseModel):
+    job_id: str
+    status: str
+    # Etapa en curso (IngestAgent, AnalystAgent, TechWriterAgent o SaverAgent)
+    current_stage: str | None = None
+    # Estado y duración en segundos de cada etapa iniciada
+    stages: dict
+    error: str | None = None
+    saved_path: str | None = None
+    created_at: float
+    started_at: float | None = None
+    finished_at: float | None = None
+
 # --- FastAPI App Initialization ---
 app = FastAPI(
     title="Agentic Docs Squad API",
@@ -25,6 +48,8 @@ app = FastAPI(
 
 # --- Orchestrator Initialization ---
 orchestrator: Orchestrator | None = None
+job_manager: JobManager | None = None
+file_collector: FileCollector | None = None
 
 # Directorio temporal para archivos subidos
 TEMPORARY_UPLOAD_DIR = "/tmp/agentic_docs_uploads"
@@ -42,6 +67,30 @@ def startup_event():
     os.makedirs(TEMPORARY_UPLOAD_DIR, exist_ok=True)
     print("✅ Orquestador y directorio temporal listos.")
 
+@app.on_event("startup")
+async def start_job_workers():
+    """Arranca los workers de trabajos asíncronos (y reanuda los pendientes)."""
+    global job_manager
+    job_manager = create_job_manager(orchestrator)
+    await job_manager.start()
+    print(f"✅ {job_manager.workers} workers de trabajos en marcha.")
+
+@app.on_event("startup")
+async def start_file_collector():
+    """Arranca el recolector que borra de Gemini los archivos que ya no se usan (FILE_GC=0 lo desactiva)."""
+    global file_collector
+    file_collector = create_file_collector()
+    if file_collector:
+        file_collector.start()
+        print(f"✅ Recolector de archivos remotos en marcha (cada {file_collector.interval:.0f} s).")
+
+@app.on_event("shutdown")
+async def stop_job_workers():
+    if job_manager:
+        await job_manager.stop()
+    if file_collector:
+        await file_collector.stop()
+
 def extract_path_from_prompt(prompt: str) -> str | None:
     """
     Extrae la primera ruta de archivo que parece válida de un prompt.
@@ -84,7 +133,7 @@ async def run_documentation_pipeline(request: PipelineRequest):
             user_context=request.user_context or ""
         )
         
-        if "ERROR" in final_document or "Falló" in final_document:
+        if final_document.startswith(PIPELINE_ERROR_PREFIX):
              raise HTTPException(status_code=500, detail=final_document)
 
         return PipelineResponse(document=final_document)
@@ -93,49 +142,208 @@ async def run_documentation_pipeline(request: PipelineRequest):
         print(f"💥 Error inesperado en el pipeline: {e}")
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {e}")
 
-@app.post("/document/upload_and_run", response_model=PipelineResponse)
-async def upload_and_run_documentation_pipeline(
-    file: UploadFile = File(...),
-    user_context: str | None = Form(None)
-):
+def format_sse(event: str, data: dict) -> str:
+    """Formatea un evento como Server-Sent Event (datos en JSON de una sola línea)."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+@app.post("/document/run/stream")
+async def stream_documentation_pipeline(request: PipelineRequest):
     """
-    Sube un archivo directamente y ejecuta el pipeline de documentación completo.
+    Igual que /document/run, pero responde con Server-Sent Events: el progreso
+    de cada etapa y el documento del TechWriterAgent fragmento a fragmento
+    (evento `chunk`), terminando con un evento `completed` o `failed`.
     """
     if not orchestrator:
         raise HTTPException(status_code=500, detail="El orquestador no está inicializado.")
 
-    # Crear una ruta temporal para guardar el archivo
-    temp_file_path = os.path.join(TEMPORARY_UPLOAD_DIR, file.filename)
-    
-    try:
-        # Guardar el archivo subido temporalmente
-        with open(temp_file_path, "wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-        print(f"💾 Archivo subido temporalmente guardado en: {temp_file_path}")
+    file_path = extract_path_from_prompt(request.user_prompt)
+    if not file_path:
+        raise HTTPException(
+            status_code=400,
+            detail="No se pudo encontrar una ruta de archivo válida en el prompt. "
+                   "Por favor, incluye la ruta al archivo que quieres documentar (ej: 'documenta /path/to/my_file.pdf')."
+        )
+
+    async def event_stream():
+        async for event, data in orchestrator.stream_pipeline(file_path, request.user_context or ""):
+            yield format_sse(event, data)
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+def check_content_length(request: Request):
+    """Rechaza de inmediato las subidas que anuncian un tamaño mayor que el permitido."""
+    content_length = request.headers.get("content-length")
+    if content_length and content_length.isdigit() and int(content_length) > max_upload_bytes():
+        raise HTTPException(status_code=413, detail=f"El archivo supera el tamaño máximo permitido ({max_upload_bytes()} bytes).")
 
-        # Ejecutar el pipeline con la ruta del archivo temporal
+async def run_spooled_upload(spooled: SpooledUpload, user_context: str | None) -> PipelineResponse:
+    """Ejecuta el pipeline sobre un archivo recibido y lo elimina al terminar."""
+    print(f"💾 Archivo recibido en {spooled.path} ({spooled.size_bytes} bytes, sha256 {spooled.sha256[:12]})")
+    try:
+        # El hash calculado durante la recepción permite a las cachés evitar otra lectura completa
         final_document = await orchestrator.run_pipeline(
-            file_path=temp_file_path,
-            user_context=user_context or ""
+            file_path=spooled.path,
+            user_context=user_context or "",
+            content_hash=spooled.sha256,
         )
-        
-        if "ERROR" in final_document or "Falló" in final_document:
+
+        if final_document.startswith(PIPELINE_ERROR_PREFIX):
              raise HTTPException(status_code=500, detail=final_document)
 
         return PipelineResponse(document=final_document)
 
+    except HTTPException:
+        raise
     except Exception as e:
         print(f"💥 Error inesperado en el pipeline de subida: {e}")
         raise HTTPException(status_code=500, detail=f"Error interno del servidor: {e}")
     finally:
         # Limpiar el archivo temporal
-        if os.path.exists(temp_file_path):
-            os.remove(temp_file_path)
-            print(f"🗑️ Archivo temporal eliminado: {temp_file_path}")
+        if os.path.exists(spooled.path):
+            os.remove(spooled.path)
+            print(f"🗑️ Archivo temporal eliminado: {spooled.path}")
+
+@app.post("/document/upload_and_run", response_model=PipelineResponse)
+async def upload_and_run_documentation_pipeline(
+    request: Request,
+    file: UploadFile = File(...),
+    user_context: str | None = Form(None)
+):
+    """
+    Sube un archivo directamente (multipart) y ejecuta el pipeline de documentación completo.
+    El archivo se copia por bloques a un archivo temporal único, sin bloquear
+    el event loop, y su SHA-256 se calcula durante la copia.
+    """
+    if not orchestrator:
+        raise HTTPException(status_code=500, detail="El orquestador no está inicializado.")
+    check_content_length(request)
+
+    try:
+        spooled = await spool_stream(iter_upload_file(file), TEMPORARY_UPLOAD_DIR, file.filename)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    return await run_spooled_upload(spooled, user_context)
+
+@app.post("/document/upload_and_run/raw", response_model=PipelineResponse)
+async def upload_raw_and_run_documentation_pipeline(
+    request: Request,
+    filename: str,
+    user_context: str | None = None
+):
+    """
+    Igual que /document/upload_and_run, pero el cuerpo de la petición es el
+    archivo en bruto (sin multipart): los bytes se escriben en disco y se
+    hashean a medida que llegan, sin esperar a recibir el cuerpo completo.
+    El nombre (para la extensión) y el contexto van en la query string.
+    """
+    if not orchestrator:
+        raise HTTPException(status_code=500, detail="El orquestador no está inicializado.")
+    check_content_length(request)
+
+    try:
+        spooled = await spool_stream(request.stream(), TEMPORARY_UPLOAD_DIR, filename)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    return await run_spooled_upload(spooled, user_context)
+
+@app.post("/jobs", response_model=JobSubmitted, status_code=202)
+async def submit_documentation_job(request: PipelineRequest):
+    """
+    Encola el pipeline de documentación para un archivo local del servidor y
+    responde de inmediato con el identificador del trabajo. El progreso se
+    consulta en GET /jobs/{job_id} y el documento en GET /jobs/{job_id}/result.
+    """
+    if not job_manager:
+        raise HTTPException(status_code=500, detail="El gestor de trabajos no está inicializado.")
+
+    file_path = extract_path_from_prompt(request.user_prompt)
+    if not file_path:
+        raise HTTPException(
+            status_code=400,
+            detail="No se pudo encontrar una ruta de archivo válida en el prompt. "
+                   "Por favor, incluye la ruta al archivo que quieres documentar (ej: 'documenta /path/to/my_file.pdf')."
+        )
+
+    job = job_manager.submit(file_path, request.user_context or "")
+    return JobSubmitted(job_id=job.id, status=job.status)
+
+@app.post("/jobs/upload", response_model=JobSubmitted, status_code=202)
+async def submit_upload_job(
+    request: Request,
+    file: UploadFile = File(...),
+    user_context: str | None = Form(None)
+):
+    """
+    Sube un archivo (multipart) y encola su documentación. El archivo
+    temporal se elimina cuando el trabajo termina.
+    """
+    if not job_manager:
+        raise HTTPException(status_code=500, detail="El gestor de trabajos no está inicializado.")
+    check_content_length(request)
+
+    try:
+        spooled = await spool_stream(iter_upload_file(file), TEMPORARY_UPLOAD_DIR, file.filename)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+    job = job_manager.submit(spooled.path, user_context or "", content_hash=spooled.sha256, cleanup=True)
+    return JobSubmitted(job_id=job.id, status=job.status)
+
+@app.get("/pipeline/stages")
+async def get_pipeline_stage_stats():
+    """Profundidad de cola, archivos activos y utilización de cada etapa del pipeline."""
+    if not job_manager or not job_manager.executor:
+        raise HTTPException(status_code=500, detail="El gestor de trabajos no está inicializado.")
+    return job_manager.executor.stats()
+
+@app.get("/rate_limits")
+async def get_rate_limit_stats():
+    """Llamadas, reintentos, 429 recibidos y límite de concurrencia actual por modelo y API de archivos."""
+    return get_rate_limiter().stats()
+
+@app.get("/files")
+async def get_remote_file_usage():
+    """Archivos subidos a Gemini que sigue el registro: número, bytes, referencias y ocupación de la cuota."""
+    return get_file_registry().usage()
+
+@app.get("/jobs/{job_id}", response_model=JobStatus)
+async def get_job_status(job_id: str):
+    """Estado de un trabajo: etapa en curso y duración de cada etapa."""
+    job = job_manager.get(job_id) if job_manager else None
+    if not job:
+        raise HTTPException(status_code=404, detail=f"No existe el trabajo {job_id}.")
+    return JobStatus(**job.to_dict())
+
+@app.get("/jobs/{job_id}/result", response_model=PipelineResponse)
+async def get_job_result(job_id: str):
+    """
+    Documento generado por un trabajo. Responde 409 si aún no ha terminado y
+    500 con el error si falló.
+    """
+    job = job_manager.get(job_id) if job_manager else None
+    if not job:
+        raise HTTPException(status_code=404, detail=f"No existe el trabajo {job_id}.")
+    if job.status not in FINISHED_STATUSES:
+        raise HTTPException(status_code=409, detail=f"El trabajo {job_id} aún no ha terminado ({job.status}).")
+    if job.status == JOB_FAILED:
+        raise HTTPException(status_code=500, detail=job.error)
+    return PipelineResponse(document=job.document)
+
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    """
+    Métricas del proceso en formato Prometheus: duración por etapa, latencia
+    y tokens de cada agente, bytes y duración de las subidas, espera del
+    procesamiento en Gemini y ejecuciones por resultado.
+    """
+    return PlainTextResponse(get_metrics().render(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 @app.get("/")
 def read_root():
-    return {"message": "Bienvenido a la API de Agentic Docs Squad. Usa el endpoint /document/run o /document/upload_and_run."}
+    return {"message": "Bienvenido a la API de Agentic Docs Squad. Usa el endpoint /document/run o /document/upload_and_run, o /jobs para ejecutarlo en segundo plano."}
 
 # --- Para ejecutar localmente ---
 if __name__ == "__main__":
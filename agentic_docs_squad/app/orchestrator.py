@@ -1,118 +1,837 @@
 import os
+import re
+import time
+import asyncio
 import datetime
-from google.adk.runners import InMemoryRunner
+from google.adk.agents.run_config import RunConfig, StreamingMode
+from google.adk.artifacts import InMemoryArtifactService
+from google.adk.memory import InMemoryMemoryService
+from google.adk.runners import Runner
+from google.genai import types
 from app.agents.ingest_agent import create_ingest_agent
 from app.agents.analyst_agent import create_analyst_agent
 from app.agents.writer_agent import create_writer_agent
 from app.agents.saver_agent import create_saver_agent
+from app.chunked_analysis import (
+    AnalysisRejected, ChunkAnalysisError, ChunkingPolicy, SegmentAnalysisError, analyze_in_segments,
+    analyze_text_chunks, check_analysis_reply, format_timestamp, text_part,
+)
+from app.facts import (
+    FACT_SCHEMA_PROMPT, FACT_SCHEMA_VERSION, FactSchemaError, FactSheet, dedupe_facts, load_fact_sheet,
+    parse_fact_sheet, parse_segment_facts, render_facts, sheet_from_facts,
+)
+from app.rate_limit import estimate_tokens, get_rate_limiter, model_name
+from app.session_store import BoundedSessionService, create_session_service
+from app.telemetry import Trace, get_metrics, span
+from app.tools.audio_preprocess import AudioPolicy, AudioPreprocessError, preprocess_audio
+from app.tools.analysis_cache import AnalysisCache, get_analysis_cache, instruction_hash
+from app.tools.file_poller import BackoffPolicy
+from app.tools.file_tools import IngestedFile, IngestError, check_file, detect_mime_type, ingest_file
+from app.tools.inline_text import InlineTextError, InlineTextPolicy, load_inline_text, merge_text_facts
+from app.tools.keyframes import KeyframeExtractionError, KeyframePolicy, extract_keyframes, keyframes_available
+from app.tools.upload_cache import hash_file
+from app.tools.file_registry import get_file_registry
+from app.tools.writer_tools import SavedDocument, write_document
+
+# Usuario con el que se crean las sesiones de los runners
+PIPELINE_USER_ID = "pipeline_user"
+
+# Nombre de aplicación de los runners (todos comparten el almacén de sesiones)
+PIPELINE_APP_NAME = "agentic_docs_squad"
+
+# URI de un archivo de la API de Gemini dentro de una respuesta de texto libre
+FILE_URI_PATTERN = re.compile(r'(https://generativelanguage\.googleapis\.com/v1beta/(files/[a-z0-9-]+))')
+
+# Prefijo de los mensajes de error que devuelve run_pipeline
+PIPELINE_ERROR_PREFIX = "Falló el paso de"
+
+
+class PipelineError(Exception):
+    """Error de una etapa del pipeline. El mensaje es el que se devuelve al usuario."""
+
 
 class Orchestrator:
     """
     Orquesta el flujo de trabajo entre los agentes especializados.
     No es un agente en sí mismo, sino una clase que gestiona los runners.
+
+    El pipeline se compone de cuatro etapas (`ingest`, `analyze`, `write` y
+    `save`) que pueden invocarse también por separado.
+
+    Por defecto la ingesta es directa: se llama a la herramienta de subida
+    en el propio proceso, sin pasar por un LLM. Con `direct_ingest=False`
+    se usa el IngestAgent como en la versión original. Del mismo modo, el
+    documento final se escribe directamente en `output_dir`; con
+    `use_saver_agent=True` se delega en el SaverAgent. `poll_policy`
+    configura la espera del procesamiento de archivos en Gemini.
+
+    Los cuatro runners comparten un `BoundedSessionService`, de modo que la
+    memoria de sesiones queda acotada aunque el orquestador viva tanto como
+    el proceso.
+
+    Con `analysis_cache`, los hechos técnicos se guardan por contenido del
+    archivo, contexto, modelo e instrucción del AnalystAgent; si ya existen,
+    el pipeline salta la ingesta y el análisis y pasa directamente a la
+    redacción.
+
+    Con `chunking`, los videos largos se analizan por segmentos temporales
+    solapados en paralelo y los hechos se fusionan antes de la redacción.
+
+    Con `keyframes` (requiere OpenCV), los videos se reducen localmente a sus
+    fotogramas clave, que se envían al AnalystAgent como imágenes con su marca
+    de tiempo en lugar de subir el video completo.
+
+    Con `audio`, los audios se pasan a mono, se remuestrean y se les recortan
+    los silencios antes de subirlos; las marcas de tiempo de los hechos se
+    traducen de vuelta a la línea temporal original.
+
+    Con `inline_text`, los textos y el código fuente se leen en local y se
+    envían al AnalystAgent como texto, sin subida ni espera del procesamiento;
+    los que no caben en la ventana de contexto se analizan por fragmentos en
+    paralelo y sus hechos se fusionan.
+
+    Con `fact_schema`, el AnalystAgent responde con un registro JSON tipado
+    de hechos (comandos, errores, bloques de configuración, hosts, rutas y
+    marcas de tiempo) que se valida y deduplica localmente; al
+    TechWriterAgent le llega una versión compacta de una línea por hecho.
+    Si la respuesta no cumple el esquema se usa el texto tal cual.
+
+    Cada ejecución registra sus tramos (etapas, llamadas a agentes con sus
+    tokens, subida y espera del procesamiento) en una traza que alimenta las
+    métricas del proceso (`app.telemetry`) y, con `trace_dir`, se guarda
+    como JSON.
     """
-    def __init__(self):
+    def __init__(self, direct_ingest: bool = True, use_saver_agent: bool = False, output_dir: str = "output",
+                 poll_policy: BackoffPolicy | None = None, session_service: BoundedSessionService | None = None,
+                 analysis_cache: AnalysisCache | None = None, chunking: ChunkingPolicy | None = None,
+                 keyframes: KeyframePolicy | None = None, audio: AudioPolicy | None = None,
+                 trace_dir: str | None = None, fact_schema: bool = False,
+                 inline_text: InlineTextPolicy | None = None):
         print("🤖 Creando y configurando agentes especializados...")
+        self.direct_ingest = direct_ingest
+        self.poll_policy = poll_policy or BackoffPolicy()
+        self.use_saver_agent = use_saver_agent
+        self.output_dir = output_dir
+        self.analysis_cache = analysis_cache
+        self.chunking = chunking
+        self.keyframes = keyframes
+        self.audio = audio
+        self.trace_dir = trace_dir
+        self.fact_schema = fact_schema
+        self.inline_text = inline_text
         self.ingest_agent = create_ingest_agent()
         self.analyst_agent = create_analyst_agent()
         self.writer_agent = create_writer_agent()
         self.saver_agent = create_saver_agent()
+        self.session_service = session_service or create_session_service()
 
         # Cada agente tiene su propio runner
-        self.ingest_runner = InMemoryRunner(agent=self.ingest_agent)
-        self.analyst_runner = InMemoryRunner(agent=self.analyst_agent)
-        self.writer_runner = InMemoryRunner(agent=self.writer_agent)
-        self.saver_runner = InMemoryRunner(agent=self.saver_agent)
+        self.ingest_runner = self._create_runner(self.ingest_agent)
+        self.analyst_runner = self._create_runner(self.analyst_agent)
+        self.writer_runner = self._create_runner(self.writer_agent)
+        self.saver_runner = self._create_runner(self.saver_agent)
         print("✅ Agentes y runners listos.")
 
-    async def run_pipeline(self, file_path: str, user_context: str = "") -> str:
+    def _create_runner(self, agent) -> Runner:
+        return Runner(
+            app_name=PIPELINE_APP_NAME,
+            agent=agent,
+            session_service=self.session_service,
+            artifact_service=InMemoryArtifactService(),
+            memory_service=InMemoryMemoryService(),
+        )
+
+    async def _run_agent(self, runner: Runner, parts: list[types.Part], on_partial=None) -> str | None:
         """
-        Ejecuta el pipeline completo de documentación.
-        
-        1. Ingesta el archivo.
-        2. Analiza el contenido.
-        3. Escribe la documentación.
-        4. Guarda la documentación.
+        Ejecuta un agente en una sesión nueva con las partes dadas y devuelve
+        el texto de su último evento (o None si no respondió).
+
+        Si se pasa `on_partial`, la respuesta se pide en streaming y la función
+        se llama con cada fragmento de texto según va llegando. La sesión es
+        de un solo uso y se elimina al terminar.
+
+        La llamada respeta la cuota del modelo en el limitador compartido y se
+        reintenta (en una sesión nueva) ante un 429 o un 5xx, salvo que ya se
+        hayan entregado fragmentos en streaming.
         """
-        print(f"--- INICIANDO PIPELINE PARA: {file_path} ---")
+        model = model_name(runner.agent.model)
+        estimated_tokens = estimate_tokens(parts)
+        delivered = False
 
-        # --- PASO 1: Ingesta ---
-        print("1️⃣  Llamando a IngestAgent...")
-        ingest_prompt = f"Sube y procesa el siguiente archivo: {file_path}"
-        ingest_events = await self.ingest_runner.run_debug(ingest_prompt)
-        ingest_response = "".join(part.text for part in ingest_events[-1].content.parts) if ingest_events and ingest_events[-1].content else None
+        def forward(chunk: str):
+            nonlocal delivered
+            delivered = True
+            on_partial(chunk)
+
+        rate_limiter = get_rate_limiter()
+        text, used_tokens = await rate_limiter.call(
+            model, self._run_agent_once, runner, parts, forward if on_partial else None,
+            tokens=estimated_tokens, can_retry=lambda: not delivered,
+        )
+        rate_limiter.record_tokens(model, estimated_tokens, used_tokens)
+        return text
 
+    async def _run_agent_once(self, runner: Runner, parts: list[types.Part], on_partial=None) -> tuple[str | None, int]:
+        """Un intento de `_run_agent`: devuelve el texto y los tokens consumidos."""
+        session = await runner.session_service.create_session(
+            app_name=runner.app_name, user_id=PIPELINE_USER_ID
+        )
+        message = types.Content(role="user", parts=parts)
+        run_config = RunConfig(streaming_mode=StreamingMode.SSE) if on_partial else None
+        events = []
+        try:
+            with span("agent_call", agent=runner.agent.name, input_tokens=0, output_tokens=0) as call:
+                async for event in runner.run_async(
+                    user_id=PIPELINE_USER_ID, session_id=session.id, new_message=message, run_config=run_config
+                ):
+                    if event.partial:
+                        # Los eventos parciales solo llevan el fragmento nuevo; el evento final trae el texto completo
+                        if on_partial and event.content and event.content.parts:
+                            chunk = "".join(part.text for part in event.content.parts if part.text)
+                            if chunk:
+                                on_partial(chunk)
+                        continue
+                    events.append(event)
+                    usage = event.usage_metadata
+                    if usage:
+                        call.attributes["input_tokens"] += usage.prompt_token_count or 0
+                        call.attributes["output_tokens"] += usage.candidates_token_count or 0
+        finally:
+            await runner.session_service.delete_session(
+                app_name=runner.app_name, user_id=PIPELINE_USER_ID, session_id=session.id
+            )
+        used_tokens = call.attributes["input_tokens"] + call.attributes["output_tokens"]
+        if not events or not events[-1].content or not events[-1].content.parts:
+            return None, used_tokens
+        return "".join(part.text for part in events[-1].content.parts if part.text), used_tokens
+
+    # --- ETAPAS DEL PIPELINE ---
+
+    async def ingest(self, file_path: str, content_hash: str | None = None) -> IngestedFile:
+        """Etapa 1: sube el archivo y devuelve su referencia estructurada."""
+        try:
+            if self.keyframes and keyframes_available():
+                ingested = await self._ingest_keyframes(file_path, content_hash)
+                if ingested:
+                    return ingested
+
+            if self.audio and detect_mime_type(file_path).startswith("audio/"):
+                ingested = await self._ingest_audio(file_path)
+                if ingested:
+                    return ingested
+
+            return await self._upload(file_path, content_hash)
+        except IngestError as e:
+            raise PipelineError(f"{PIPELINE_ERROR_PREFIX} ingesta: {e}")
+
+    async def read_inline(self, file_path: str, content_hash: str | None = None) -> IngestedFile | None:
+        """
+        Lectura local de textos y código fuente (con `inline_text`): su
+        contenido se envía al AnalystAgent en la propia petición, así que no
+        hay nada que subir. Devuelve None (y la ingesta sigue como siempre) si
+        el archivo no es de texto, supera el tamaño máximo o no se puede leer.
+        """
+        if not self.inline_text or not os.path.exists(file_path):
+            return None
+        try:
+            checked = await asyncio.to_thread(check_file, file_path, content_hash)
+        except IngestError as e:
+            raise PipelineError(f"{PIPELINE_ERROR_PREFIX} ingesta: {e}")
+        if not self.inline_text.applies_to(checked.is_text, checked.size_bytes):
+            return None
+        try:
+            inline = await asyncio.to_thread(load_inline_text, file_path, self.inline_text)
+        except InlineTextError as e:
+            print(f"⚠️  No se pudo leer el texto en local ({e}); se sube el archivo.")
+            return None
+
+        return IngestedFile(
+            uri="",
+            mime_type=checked.mime_type,
+            name=f"inline/{os.path.basename(file_path)}",
+            sha256=content_hash,
+            preflight=checked,
+            text=inline,
+            preprocessed={
+                "kind": "inline_text",
+                "source_bytes": inline.source_bytes,
+                "tokens": inline.tokens,
+                "chunks": len(inline.chunks),
+            },
+        )
+
+    async def _upload(self, file_path: str, content_hash: str | None = None) -> IngestedFile:
+        """Sube el archivo a Gemini, directamente o mediante el IngestAgent."""
+        if self.direct_ingest:
+            return await ingest_file(file_path, self.poll_policy, content_hash=content_hash)
+
+        ingest_prompt = f"Sube y procesa el siguiente archivo: {file_path}"
+        ingest_response = await self._run_agent(self.ingest_runner, [types.Part(text=ingest_prompt)])
         if not ingest_response or "ERROR" in ingest_response:
-            error_message = f"Falló el paso de ingesta: {ingest_response}"
-            print(f"❌ {error_message}")
-            return error_message
-        
-        file_uri = ingest_response
-        print(f"✅ Ingesta completada. URI del archivo: {file_uri}")
-
-        # --- PASO 2: Análisis ---
-        print("2️⃣  Llamando a AnalystAgent...")
+            raise IngestError(str(ingest_response))
+
+        uri_match = FILE_URI_PATTERN.search(ingest_response)
+        if not uri_match:
+            raise IngestError(f"No se encontró un URI de archivo en la respuesta: {ingest_response}")
+        return IngestedFile(
+            uri=uri_match.group(1),
+            mime_type=detect_mime_type(file_path),
+            name=uri_match.group(2),
+        )
+
+    async def _ingest_audio(self, file_path: str) -> IngestedFile | None:
+        """
+        Sube una versión mono, remuestreada y sin silencios del audio. Devuelve
+        None (y se sube el original) si no se puede preprocesar.
+        """
+        try:
+            result = await asyncio.to_thread(preprocess_audio, file_path, self.audio)
+        except AudioPreprocessError as e:
+            print(f"⚠️  No se pudo preprocesar el audio ({e}); se sube el archivo original.")
+            return None
+
+        print(f"🔉 Audio preprocesado: {result.source_seconds:.0f}s → {result.output_seconds:.0f}s, "
+              f"{result.source_bytes} → {result.output_bytes} bytes ({result.bytes_saved} bytes ahorrados).")
+        try:
+            ingested = await self._upload(result.path)
+        finally:
+            if os.path.exists(result.path):
+                os.remove(result.path)
+        ingested.timestamp_map = result.timestamp_map
+        ingested.preprocessed = {
+            "kind": "audio",
+            "source_bytes": result.source_bytes,
+            "output_bytes": result.output_bytes,
+            "bytes_saved": result.bytes_saved,
+            "source_seconds": result.source_seconds,
+            "output_seconds": result.output_seconds,
+        }
+        return ingested
+
+    async def _ingest_keyframes(self, file_path: str, content_hash: str | None) -> IngestedFile | None:
+        """
+        Reduce un video a sus fotogramas clave sin subir nada. Devuelve None
+        (y la ingesta sigue con el video completo) si el archivo no es un
+        video, la extracción falla o los fotogramas no caben en la petición.
+        """
+        if not detect_mime_type(file_path).startswith("video/"):
+            return None
+        try:
+            result = await asyncio.to_thread(extract_keyframes, file_path, self.keyframes)
+        except KeyframeExtractionError as e:
+            print(f"⚠️  No se pudieron extraer fotogramas clave ({e}); se sube el video completo.")
+            return None
+        if result.output_bytes > self.keyframes.max_inline_bytes:
+            print(f"⚠️  Los fotogramas clave ocupan {result.output_bytes} bytes; se sube el video completo.")
+            return None
+
+        print(f"🖼️  {len(result.frames)} fotogramas clave de {result.sampled_frames} muestras: "
+              f"{result.source_bytes} → {result.output_bytes} bytes (x{result.compression_ratio:.1f}).")
+        return IngestedFile(
+            uri="",
+            mime_type="image/jpeg",
+            name=f"keyframes/{os.path.basename(file_path)}",
+            sha256=content_hash,
+            duration_seconds=result.duration_seconds,
+            keyframes=result,
+            preprocessed={
+                "kind": "keyframes",
+                "frames": len(result.frames),
+                "source_bytes": result.source_bytes,
+                "output_bytes": result.output_bytes,
+                "compression_ratio": result.compression_ratio,
+            },
+        )
+
+    async def analyze(self, ingested: IngestedFile, user_context: str = "") -> str:
+        """
+        Etapa 2: el AnalystAgent extrae los hechos técnicos del archivo adjunto.
+        Si hay `chunking` y el video es largo, se analiza por segmentos.
+        Si el audio se recortó, las marcas de tiempo se devuelven en la
+        línea temporal original. Con `fact_schema` devuelve el registro de
+        hechos en JSON.
+        """
+        if ingested.keyframes:
+            return await self._analyze_keyframes(ingested, user_context)
+        if ingested.text:
+            return await self._analyze_text(ingested, user_context)
+        if self.chunking and self.chunking.applies_to(ingested.mime_type, ingested.duration_seconds):
+            return await self._analyze_in_segments(ingested, user_context)
+
         analysis_prompt = f"""
-        Analiza el contenido del archivo ubicado en el siguiente URI y extrae 
-        los hechos técnicos clave. 
+        Analiza el contenido del archivo adjunto y extrae
+        los hechos técnicos clave.
         Contexto proporcionado por el usuario: '{user_context}'
-        URI del archivo: {file_uri}
+        URI del archivo: {ingested.uri}
         """
-        analysis_events = await self.analyst_runner.run_debug(analysis_prompt)
-        technical_facts = "".join(part.text for part in analysis_events[-1].content.parts) if analysis_events and analysis_events[-1].content else None
+        if ingested.timestamp_map:
+            analysis_prompt += """
+        Cuando un hecho ocurra en un instante concreto del audio, indícalo con
+        una marca de tiempo [HH:MM:SS].
+        """
+        if self.fact_schema:
+            analysis_prompt += FACT_SCHEMA_PROMPT
+        technical_facts = await self._run_agent(self.analyst_runner, [
+            types.Part(text=analysis_prompt),
+            types.Part.from_uri(file_uri=ingested.uri, mime_type=ingested.mime_type),
+        ])
+
+        structured = self._structure_facts(technical_facts, ingested.timestamp_map)
+        if structured:
+            return structured
+        if not technical_facts or "ERROR" in technical_facts:
+            raise PipelineError(f"{PIPELINE_ERROR_PREFIX} análisis: {technical_facts}")
+        if ingested.timestamp_map:
+            # Los tiempos del audio recortado se traducen a los de la grabación original
+            technical_facts = ingested.timestamp_map.remap_text(technical_facts)
+        return technical_facts
 
+    async def _analyze_keyframes(self, ingested: IngestedFile, user_context: str) -> str:
+        frames = ingested.keyframes.frames
+        parts = [types.Part(text=f"""
+        Analiza los {len(frames)} fotogramas clave adjuntos, extraídos de un video
+        de {format_timestamp(ingested.duration_seconds)} en los instantes en que cambia
+        la imagen, y extrae los hechos técnicos clave.
+        Cada fotograma va precedido de su marca de tiempo [HH:MM:SS] en el video.
+        Contexto proporcionado por el usuario: '{user_context}'
+        """ + (FACT_SCHEMA_PROMPT if self.fact_schema else ""))]
+        for frame in frames:
+            parts.append(types.Part(text=f"[{format_timestamp(frame.seconds)}]"))
+            parts.append(types.Part.from_bytes(data=frame.data, mime_type="image/jpeg"))
+
+        technical_facts = await self._run_agent(self.analyst_runner, parts)
+        structured = self._structure_facts(technical_facts)
+        if structured:
+            return structured
         if not technical_facts or "ERROR" in technical_facts:
-            error_message = f"Falló el paso de análisis: {technical_facts}"
-            print(f"❌ {error_message}")
-            return error_message
+            raise PipelineError(f"{PIPELINE_ERROR_PREFIX} análisis: {technical_facts}")
+        return technical_facts
+
+    async def _analyze_text(self, ingested: IngestedFile, user_context: str) -> str:
+        inline = ingested.text
+        file_name = os.path.basename(ingested.name)
+        schema_prompt = FACT_SCHEMA_PROMPT if self.fact_schema else ""
+        if len(inline.chunks) > 1:
+            return await self._analyze_text_chunks(ingested, file_name, user_context, schema_prompt)
+
+        analysis_prompt = f"""
+        Analiza el contenido del archivo de texto adjunto ({file_name}, {ingested.mime_type})
+        y extrae los hechos técnicos clave.
+        Contexto proporcionado por el usuario: '{user_context}'
+        """ + schema_prompt
+        try:
+            technical_facts = check_analysis_reply(await self._run_agent(self.analyst_runner, [
+                types.Part(text=analysis_prompt),
+                text_part(inline.chunks[0], file_name),
+            ]))
+        except AnalysisRejected as e:
+            raise PipelineError(f"{PIPELINE_ERROR_PREFIX} análisis: {e}")
+        return self._structure_facts(technical_facts) or technical_facts
+
+    async def _analyze_text_chunks(self, ingested: IngestedFile, file_name: str, user_context: str,
+                                   schema_prompt: str) -> str:
+        inline, policy = ingested.text, self.inline_text
+        print(f"📄 Texto de ~{inline.tokens} tokens: análisis en {len(inline.chunks)} fragmentos de hasta "
+              f"{policy.chunk_tokens} tokens (concurrencia {policy.max_concurrency}).")
+        try:
+            responses = await analyze_text_chunks(
+                self._analyze_text_chunk,
+                inline, file_name, policy.max_concurrency, user_context, schema_prompt,
+            )
+        except ChunkAnalysisError as e:
+            raise PipelineError(f"{PIPELINE_ERROR_PREFIX} análisis: {e}")
+        if not self.fact_schema:
+            return merge_text_facts(responses)
+
+        # Los registros de hechos de los fragmentos se unen en uno; si alguno no
+        # cumple el esquema, todos se fusionan como texto (los válidos, en su forma compacta)
+        sheets = []
+        for response in responses:
+            try:
+                sheets.append(parse_fact_sheet(response))
+            except FactSchemaError as e:
+                print(f"⚠️  Un fragmento no cumple el esquema de hechos ({e}); se fusionan como texto.")
+                sheets.append(None)
+        if not all(sheets):
+            return merge_text_facts([
+                render_facts(sheet) if sheet else response for sheet, response in zip(sheets, responses)
+            ])
+        parsed = FactSheet(
+            facts=[fact for sheet in sheets for fact in sheet.facts],
+            rejected=sum(sheet.rejected for sheet in sheets),
+        )
+        sheet = dedupe_facts(parsed)
+        print(f"🧾 {len(sheet.facts)} hechos válidos ({len(parsed.facts) - len(sheet.facts)} duplicados, "
+              f"{sheet.rejected} descartados).")
+        return sheet.to_json()
+
+    async def _analyze_text_chunk(self, parts: list) -> str:
+        return check_analysis_reply(await self._run_agent(self.analyst_runner, parts))
+
+    def _structure_facts(self, technical_facts: str | None, timestamp_map=None) -> str | None:
+        """
+        Valida y deduplica el registro de hechos del analista y devuelve su
+        JSON canónico, o None si `fact_schema` está desactivado o la
+        respuesta no cumple el esquema (entonces se usa el texto libre).
+        """
+        if not self.fact_schema or not technical_facts:
+            return None
+        try:
+            parsed = parse_fact_sheet(technical_facts)
+        except FactSchemaError as e:
+            print(f"⚠️  La respuesta del AnalystAgent no cumple el esquema de hechos ({e}); se usa el texto libre.")
+            return None
+        sheet = dedupe_facts(parsed)
+        if timestamp_map:
+            sheet.remap_timestamps(timestamp_map.to_source)
+        print(f"🧾 {len(sheet.facts)} hechos válidos ({len(parsed.facts) - len(sheet.facts)} duplicados, "
+              f"{sheet.rejected} descartados).")
+        return sheet.to_json()
+
+    async def _analyze_in_segments(self, ingested: IngestedFile, user_context: str) -> str:
+        policy = self.chunking
+        print(f"🎞️  Video de {ingested.duration_seconds:.0f}s: análisis por segmentos de {policy.segment_seconds:.0f}s "
+              f"(solapamiento {policy.overlap_seconds:.0f}s, concurrencia {policy.max_concurrency}).")
+        schema = {}
+        if self.fact_schema:
+            # Los hechos se fusionan por instante y texto (el solapamiento repite los de los cortes)
+            # y después se deduplican por tipo y valor, como los de un análisis completo
+            schema = dict(format_prompt=FACT_SCHEMA_PROMPT, parse=parse_segment_facts,
+                          render=lambda facts: dedupe_facts(sheet_from_facts(facts)).to_json())
+        try:
+            return await analyze_in_segments(
+                lambda parts: self._run_agent(self.analyst_runner, parts),
+                ingested.uri, ingested.mime_type, ingested.duration_seconds, policy, user_context, **schema,
+            )
+        except SegmentAnalysisError as e:
+            raise PipelineError(f"{PIPELINE_ERROR_PREFIX} análisis: {e}")
+
+    def _analysis_cache_key(self, content_hash: str, user_context: str) -> tuple:
+        model = str(self.analyst_agent.model)
+        if self.chunking:
+            # El análisis por segmentos produce otra salida: no comparte entradas con el completo
+            model += f"+chunked:{self.chunking.segment_seconds:g}/{self.chunking.overlap_seconds:g}"
+        if self.keyframes:
+            model += f"+keyframes:{self.keyframes.threshold:g}/{self.keyframes.sample_fps:g}"
+        if self.audio:
+            model += f"+audio:{self.audio.target_sample_rate}/{self.audio.silence_threshold_db:g}"
+        if self.fact_schema:
+            model += f"+facts:v{FACT_SCHEMA_VERSION}"
+        if self.inline_text:
+            model += f"+inline:{self.inline_text.chunk_tokens}/{self.inline_text.overlap_lines}"
+        return (content_hash, user_context, model, instruction_hash(self.analyst_agent.instruction))
 
-        print("✅ Análisis completado. Hechos extraídos.")
-        print(f"🗒️ Hechos: {technical_facts}")
+    async def cached_analysis(self, content_hash: str | None, user_context: str = "") -> str | None:
+        """Hechos técnicos ya extraídos para este contenido y contexto, o None."""
+        if not self.analysis_cache or not content_hash:
+            return None
+        return await asyncio.to_thread(self.analysis_cache.get, *self._analysis_cache_key(content_hash, user_context))
 
-        # --- PASO 3: Redacción ---
-        print("3️⃣  Llamando a TechWriterAgent...")
+    async def store_analysis(self, content_hash: str | None, user_context: str, technical_facts: str):
+        if not self.analysis_cache or not content_hash:
+            return
+        await asyncio.to_thread(
+            self.analysis_cache.put, *self._analysis_cache_key(content_hash, user_context), technical_facts
+        )
+
+    async def write(self, technical_facts: str, on_chunk=None) -> str:
+        """
+        Etapa 3: el TechWriterAgent redacta el documento Markdown.
+        Con `on_chunk`, el documento se recibe en streaming fragmento a fragmento.
+        Un registro de hechos en JSON se convierte antes a su forma compacta.
+        """
+        format_hint = ""
+        sheet = load_fact_sheet(technical_facts)
+        if sheet:
+            technical_facts = render_facts(sheet)
+            format_hint = "Cada línea es un hecho con el formato `[HH:MM:SS] tipo: valor (nota)`."
         writer_prompt = f"""
         Toma los siguientes hechos técnicos y genera un documento profesional en Markdown.
+        {format_hint}
         Hechos:
         ---
         {technical_facts}
         ---
         """
-        writer_events = await self.writer_runner.run_debug(writer_prompt)
-        final_document = "".join(part.text for part in writer_events[-1].content.parts) if writer_events and writer_events[-1].content else None
+        on_partial = None
+        if on_chunk:
+            started_at = time.perf_counter()
+            first_chunk = True
+
+            def forward_chunk(chunk):
+                nonlocal first_chunk
+                if first_chunk:
+                    first_chunk = False
+                    print(f"⏱️  Primer fragmento del TechWriterAgent en {time.perf_counter() - started_at:.2f}s")
+                on_chunk(chunk)
+
+            on_partial = forward_chunk
+
+        final_document = await self._run_agent(
+            self.writer_runner, [types.Part(text=writer_prompt)], on_partial=on_partial
+        )
 
         if not final_document:
-            error_message = "Falló el paso de redacción: no se generó ningún documento."
-            print(f"❌ {error_message}")
-            return error_message
-            
-        print("✅ Redacción completada. Documento final generado.")
-
-        # --- PASO 4: Guardado ---
-        print("4️⃣  Llamando a SaverAgent...")
+            raise PipelineError(f"{PIPELINE_ERROR_PREFIX} redacción: no se generó ningún documento.")
+        return final_document
+
+    async def save(self, file_path: str, document: str) -> SavedDocument:
+        """
+        Etapa 4: guarda el documento en disco. Por defecto se escribe
+        directamente, sin volver a enviar el documento a un LLM.
+        """
         base_filename = os.path.splitext(os.path.basename(file_path))[0]
         timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
         output_filename = f"{base_filename}_doc_{timestamp}.md"
 
+        if not self.use_saver_agent:
+            try:
+                return await asyncio.to_thread(write_document, output_filename, document, self.output_dir)
+            except OSError as e:
+                raise PipelineError(f"{PIPELINE_ERROR_PREFIX} guardado: {e}")
+
         saver_prompt = f"""
         Guarda el siguiente documento en el archivo '{output_filename}'.
 
         Contenido:
         ---
-        {final_document}
+        {document}
         ---
         """
-        saver_events = await self.saver_runner.run_debug(saver_prompt)
-        save_confirmation = "".join(part.text for part in saver_events[-1].content.parts) if saver_events and saver_events[-1].content else None
-        
+        save_confirmation = await self._run_agent(self.saver_runner, [types.Part(text=saver_prompt)])
+
         if not save_confirmation or "ERROR" in save_confirmation:
-            error_message = f"Falló el paso de guardado: {save_confirmation}"
-            print(f"❌ {error_message}")
-            return error_message
+            raise PipelineError(f"{PIPELINE_ERROR_PREFIX} guardado: {save_confirmation}")
+        saved_path = os.path.join("output", output_filename)
+        size_bytes = os.path.getsize(saved_path) if os.path.exists(saved_path) else 0
+        return SavedDocument(path=saved_path, filename=output_filename, size_bytes=size_bytes)
 
-        print(f"✅ Pipeline completado. {save_confirmation}")
-        return save_confirmation
+    async def run_pipeline(self, file_path: str, user_context: str = "", on_event=None,
+                           content_hash: str | None = None, stage_limits: dict | None = None) -> str:
+        """
+        Ejecuta el pipeline completo de documentación.
+
+        1. Ingesta el archivo.
+        2. Analiza el contenido.
+        3. Escribe la documentación.
+        4. Guarda la documentación.
+
+        Devuelve el documento Markdown final o, si alguna etapa falla, el
+        mensaje de error (que empieza por PIPELINE_ERROR_PREFIX).
+
+        Si el llamador ya conoce el SHA-256 del archivo (p. ej., lo calculó
+        al recibirlo), `content_hash` evita volver a leerlo para las cachés.
+
+        `stage_limits` (opcional, ver PipelinedExecutor) asigna a cada etapa
+        un StageLimiter compartido entre pipelines: la etapa espera turno en
+        él antes de empezar, lo que permite solapar etapas de varios archivos.
+
+        `on_event(event, data)` (opcional) recibe el progreso: "stage_started",
+        "stage_completed" (con `seconds`), "stage_skipped" (etapas resueltas
+        por la caché de análisis o, la ingesta, por la lectura en línea de un
+        texto), "preprocessed" (tamaños y compresión de un preprocesado
+        local), "chunk" (fragmentos del documento según los genera el
+        TechWriterAgent), "completed" y "failed". Estos dos últimos
+        incluyen el resumen de la traza de la ejecución (`trace`: segundos por
+        etapa, tokens y bytes subidos) y, si se guarda, su ruta (`trace_path`).
+        """
+        trace = Trace(file_path)
+        with trace.activate():
+            try:
+                return await self._run_pipeline(trace, file_path, user_context, on_event, content_hash, stage_limits)
+            except Exception:
+                self._finish_trace(trace, "error")
+                raise
+            finally:
+                # Los archivos remotos que usó la ejecución quedan libres para el recolector
+                get_file_registry().release_run(trace.run_id)
+
+    def _finish_trace(self, trace: Trace, status: str) -> dict:
+        """Cuenta la ejecución en las métricas y guarda su traza JSON (si hay `trace_dir`)."""
+        get_metrics().increment("pipeline_runs_total", status=status)
+        data = {"trace": trace.summary()}
+        if self.trace_dir:
+            try:
+                data["trace_path"] = trace.write(self.trace_dir)
+            except OSError as e:
+                print(f"⚠️  No se pudo guardar la traza {trace.run_id}: {e}")
+        return data
+
+    async def _run_pipeline(self, trace: Trace, file_path: str, user_context: str, on_event,
+                            content_hash: str | None, stage_limits: dict | None) -> str:
+        print(f"--- INICIANDO PIPELINE PARA: {file_path} ---")
+
+        def emit(event: str, **data):
+            if on_event:
+                on_event(event, data)
+
+        async def run_stage(stage: str, coro):
+            limiter = (stage_limits or {}).get(stage)
+            if limiter is None:
+                return await timed_stage(stage, coro)
+            async with limiter:
+                return await timed_stage(stage, coro)
+
+        async def timed_stage(stage: str, coro):
+            emit("stage_started", stage=stage)
+            started_at = time.perf_counter()
+            with span("stage", stage=stage):
+                result = await coro
+            emit("stage_completed", stage=stage, seconds=time.perf_counter() - started_at)
+            return result
+
+        on_chunk = (lambda chunk: emit("chunk", text=chunk)) if on_event else None
+
+        try:
+            # --- Caché de análisis: si el resultado ya existe se salta a la redacción ---
+            technical_facts = None
+            if self.analysis_cache and os.path.exists(file_path):
+                if content_hash is None:
+                    content_hash = await asyncio.to_thread(hash_file, file_path)
+                technical_facts = await self.cached_analysis(content_hash, user_context)
+
+            if technical_facts is not None:
+                print("⚡ Análisis encontrado en la caché. Se omiten la ingesta y el análisis.")
+                emit("stage_skipped", stage="IngestAgent", reason="analysis_cache")
+                emit("stage_skipped", stage="AnalystAgent", reason="analysis_cache")
+            else:
+                # --- PASO 1: Ingesta (los textos se leen en local y no se suben) ---
+                ingested = await self.read_inline(file_path, content_hash)
+                if ingested:
+                    emit("stage_skipped", stage="IngestAgent", reason="inline_text")
+                else:
+                    if self.direct_ingest:
+                        print("1️⃣  Ingesta directa del archivo...")
+                    else:
+                        print("1️⃣  Llamando a IngestAgent...")
+                    ingested = await run_stage("IngestAgent", self.ingest(file_path, content_hash))
+                if ingested.preprocessed:
+                    emit("preprocessed", stage="IngestAgent", **ingested.preprocessed)
+                if ingested.text:
+                    print(f"⚡ Texto leído en local ({ingested.text.source_bytes} bytes, ~{ingested.text.tokens} "
+                          f"tokens): se omite la subida.")
+                elif ingested.keyframes:
+                    keyframes = ingested.keyframes
+                    print(f"✅ Ingesta completada con {len(keyframes.frames)} fotogramas clave "
+                          f"(compresión x{keyframes.compression_ratio:.1f}).")
+                else:
+                    print(f"✅ Ingesta completada. URI del archivo: {ingested.uri}")
+
+                # --- PASO 2: Análisis ---
+                print("2️⃣  Llamando a AnalystAgent...")
+                technical_facts = await run_stage("AnalystAgent", self.analyze(ingested, user_context))
+                print("✅ Análisis completado. Hechos extraídos.")
+                print(f"🗒️ Hechos: {technical_facts}")
+                await self.store_analysis(content_hash or ingested.sha256, user_context, technical_facts)
+
+            # --- PASO 3: Redacción ---
+            print("3️⃣  Llamando a TechWriterAgent...")
+            final_document = await run_stage("TechWriterAgent", self.write(technical_facts, on_chunk=on_chunk))
+            print("✅ Redacción completada. Documento final generado.")
+
+            # --- PASO 4: Guardado ---
+            if self.use_saver_agent:
+                print("4️⃣  Llamando a SaverAgent...")
+            else:
+                print("4️⃣  Guardando el documento...")
+            saved = await run_stage("SaverAgent", self.save(file_path, final_document))
+        except PipelineError as e:
+            print(f"❌ {e}")
+            emit("failed", error=str(e), **self._finish_trace(trace, "failed"))
+            return str(e)
+
+        print(f"✅ Pipeline completado. Documento guardado en: {saved.path} ({saved.size_bytes} bytes)")
+        emit("completed", document=final_document, saved_path=saved.path, **self._finish_trace(trace, "succeeded"))
+        return final_document
+
+    async def stream_pipeline(self, file_path: str, user_context: str = ""):
+        """
+        Ejecuta el pipeline y produce sus eventos `(event, data)` a medida que
+        ocurren, incluidos los fragmentos del documento final. El último evento
+        es siempre "completed" o "failed". Si el consumidor deja de iterar
+        (p. ej., el cliente se desconecta), el pipeline se cancela.
+        """
+        queue: asyncio.Queue = asyncio.Queue()
+        task = asyncio.create_task(self.run_pipeline(
+            file_path, user_context, on_event=lambda event, data: queue.put_nowait((event, data))
+        ))
+        task.add_done_callback(lambda _: queue.put_nowait(None))
+        try:
+            while (item := await queue.get()) is not None:
+                yield item
+            if not task.cancelled() and task.exception():
+                yield "failed", {"error": f"Error inesperado en el pipeline: {task.exception()}"}
+        finally:
+            if not task.done():
+                task.cancel()
 
 def create_orchestrator() -> Orchestrator:
-    """Función factory para crear una instancia del orquestador."""
-    return Orchestrator()
\ No newline at end of file
+    """
+    Función factory para crear una instancia del orquestador.
+    La variable de entorno DIRECT_INGEST=0 activa la ingesta mediante el IngestAgent,
+    USE_SAVER_AGENT=1 el guardado mediante el SaverAgent y ANALYSIS_CACHE=0
+    desactiva la caché de análisis. CHUNKED_ANALYSIS=1 activa el análisis por
+    segmentos de videos largos (CHUNK_SEGMENT_SECONDS, CHUNK_OVERLAP_SECONDS,
+    CHUNK_CONCURRENCY y CHUNK_MIN_DURATION_SECONDS lo ajustan). KEYFRAMES=1
+    reduce los videos a fotogramas clave antes del análisis (KEYFRAME_THRESHOLD,
+    KEYFRAME_SAMPLE_FPS y KEYFRAME_MAX_FRAMES lo ajustan). AUDIO_PREPROCESS=1
+    recorta silencios y remuestrea los audios antes de subirlos
+    (AUDIO_SAMPLE_RATE, AUDIO_SILENCE_DB y AUDIO_MIN_SILENCE_MS lo ajustan).
+    FACT_SCHEMA=0 vuelve a pasar al TechWriterAgent el texto libre del
+    analista en lugar del registro de hechos tipado. INLINE_TEXT=0 vuelve a
+    subir los textos y el código fuente en lugar de enviarlos en línea
+    (INLINE_CHUNK_TOKENS, INLINE_OVERLAP_LINES, INLINE_CONCURRENCY e
+    INLINE_MAX_FILE_BYTES lo ajustan). Las trazas JSON de cada
+    ejecución se guardan en TRACE_DIR (output/traces
+    por defecto; vacío para no guardarlas).
+    """
+    direct_ingest = os.getenv("DIRECT_INGEST", "1").lower() not in ("0", "false", "no")
+    use_saver_agent = os.getenv("USE_SAVER_AGENT", "0").lower() in ("1", "true", "yes")
+    use_analysis_cache = os.getenv("ANALYSIS_CACHE", "1").lower() not in ("0", "false", "no")
+    chunking = None
+    if os.getenv("CHUNKED_ANALYSIS", "0").lower() in ("1", "true", "yes"):
+        defaults = ChunkingPolicy()
+        chunking = ChunkingPolicy(
+            segment_seconds=float(os.getenv("CHUNK_SEGMENT_SECONDS", defaults.segment_seconds)),
+            overlap_seconds=float(os.getenv("CHUNK_OVERLAP_SECONDS", defaults.overlap_seconds)),
+            max_concurrency=int(os.getenv("CHUNK_CONCURRENCY", defaults.max_concurrency)),
+            min_duration_seconds=float(os.getenv("CHUNK_MIN_DURATION_SECONDS", defaults.min_duration_seconds)),
+        )
+    keyframes = None
+    if os.getenv("KEYFRAMES", "0").lower() in ("1", "true", "yes"):
+        defaults = KeyframePolicy()
+        keyframes = KeyframePolicy(
+            threshold=float(os.getenv("KEYFRAME_THRESHOLD", defaults.threshold)),
+            sample_fps=float(os.getenv("KEYFRAME_SAMPLE_FPS", defaults.sample_fps)),
+            max_frames=int(os.getenv("KEYFRAME_MAX_FRAMES", defaults.max_frames)),
+        )
+        if not keyframes_available():
+            print("⚠️  KEYFRAMES=1 pero OpenCV no está instalado: se subirán los videos completos.")
+    audio = None
+    if os.getenv("AUDIO_PREPROCESS", "0").lower() in ("1", "true", "yes"):
+        defaults = AudioPolicy()
+        audio = AudioPolicy(
+            target_sample_rate=int(os.getenv("AUDIO_SAMPLE_RATE", defaults.target_sample_rate)),
+            silence_threshold_db=float(os.getenv("AUDIO_SILENCE_DB", defaults.silence_threshold_db)),
+            min_silence_ms=int(os.getenv("AUDIO_MIN_SILENCE_MS", defaults.min_silence_ms)),
+        )
+    inline_text = None
+    if os.getenv("INLINE_TEXT", "1").lower() not in ("0", "false", "no"):
+        defaults = InlineTextPolicy()
+        inline_text = InlineTextPolicy(
+            chunk_tokens=int(os.getenv("INLINE_CHUNK_TOKENS", defaults.chunk_tokens)),
+            overlap_lines=int(os.getenv("INLINE_OVERLAP_LINES", defaults.overlap_lines)),
+            max_concurrency=int(os.getenv("INLINE_CONCURRENCY", defaults.max_concurrency)),
+            max_file_bytes=int(os.getenv("INLINE_MAX_FILE_BYTES", defaults.max_file_bytes)),
+        )
+    return Orchestrator(
+        direct_ingest=direct_ingest,
+        use_saver_agent=use_saver_agent,
+        analysis_cache=get_analysis_cache() if use_analysis_cache else None,
+        chunking=chunking,
+        keyframes=keyframes,
+        audio=audio,
+        trace_dir=os.getenv("TRACE_DIR", os.path.join("output", "traces")) or None,
+        fact_schema=os.getenv("FACT_SCHEMA", "1").lower() not in ("0", "false", "no"),
+        inline_text=inline_text,
+    )
@@ -0,0 +1,394 @@
+import os
+import time
+import random
+import asyncio
+import threading
+from dataclasses import dataclass
+
+from app.telemetry import get_metrics
+
+# Códigos HTTP que merece la pena reintentar (cuota agotada y fallos transitorios del servidor)
+THROTTLED_STATUS_CODES = (429,)
+RETRYABLE_STATUS_CODES = (408, 429, 500, 502, 503, 504)
+
+# Estados de las APIs de Google equivalentes a un 429
+THROTTLED_STATUS_NAMES = ("RESOURCE_EXHAUSTED", "TOO_MANY_REQUESTS")
+
+# Claves de los limitadores de la API de archivos (los modelos usan su nombre)
+FILES_UPLOAD = "files.upload"
+FILES_GET = "files.get"
+FILES_DELETE = "files.delete"
+
+# Tokens que se reservan por cada parte no textual (archivo o imagen) hasta conocer el uso real
+NON_TEXT_PART_TOKEN_ESTIMATE = 1000
+
+
+@dataclass
+class RateLimits:
+    """
+    Cuota de un modelo o de la API de archivos.
+
+    Args:
+        requests_per_minute: Peticiones por minuto (None para no limitarlas).
+        tokens_per_minute: Tokens por minuto (None para no limitarlos).
+        max_concurrency: Techo de llamadas simultáneas; el límite efectivo
+            se reduce a la mitad con cada 429 y vuelve a crecer de uno en uno.
+        burst_seconds: Ráfaga permitida, en segundos de cuota acumulada.
+    """
+    requests_per_minute: float | None = None
+    tokens_per_minute: float | None = None
+    max_concurrency: int = 8
+    burst_seconds: float = 10.0
+
+
+@dataclass
+class RetryPolicy:
+    """
+    Reintentos con espera exponencial y jitter ante errores reintentables.
+
+    Args:
+        max_attempts: Intentos totales (1 para no reintentar).
+        initial_delay: Espera antes del primer reintento (segundos).
+        max_delay: Espera máxima entre reintentos (segundos).
+        multiplier: Factor por el que crece la espera tras cada reintento.
+        jitter: Fracción aleatoria (±) aplicada a cada espera.
+    """
+    max_attempts: int = 5
+    initial_delay: float = 1.0
+    max_delay: float = 30.0
+    multiplier: float = 2.0
+    jitter: float = 0.2
+
+    def delay(self, retry: int, rng: random.Random | None = None) -> float:
+        """Espera antes del reintento número `retry` (desde 1)."""
+        delay = min(self.max_delay, self.initial_delay * self.multiplier ** (retry - 1))
+        spread = delay * self.jitter
+        return max(0.0, delay + (rng or random).uniform(-spread, spread))
+
+
+def status_code(exc: BaseException) -> int | None:
+    """Código HTTP de un error de las librerías de Google (o de un doble con `code`)."""
+    for candidate in (getattr(exc, "code", None), getattr(exc, "status_code", None),
+                      getattr(getattr(exc, "response", None), "status_code", None)):
+        try:
+            if candidate is not None:
+                return int(candidate)
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def is_throttled(exc: BaseException) -> bool:
+    """El error indica que se ha agotado la cuota (429 / RESOURCE_EXHAUSTED)."""
+    if status_code(exc) in THROTTLED_STATUS_CODES:
+        return True
+    return any(name in str(exc) for name in THROTTLED_STATUS_NAMES)
+
+
+def is_retryable(exc: BaseException) -> bool:
+    """El error es transitorio: cuota agotada, 5xx, timeout o fallo de conexión."""
+    if isinstance(exc, (ConnectionError, TimeoutError, asyncio.TimeoutError)):
+        return True
+    return status_code(exc) in RETRYABLE_STATUS_CODES or is_throttled(exc)
+
+
+class TokenBucket:
+    """
+    Cubo de tokens que se repone a `rate_per_second` hasta `capacity`.
+    `reserve()` descuenta de inmediato y devuelve cuánto hay que esperar, así
+    las peticiones se atienden por orden de llegada. Es seguro entre hilos y
+    entre event loops (no guarda primitivas de asyncio).
+    """
+    def __init__(self, rate_per_second: float, capacity: float, clock=time.monotonic):
+        self.rate = rate_per_second
+        self.capacity = capacity
+        self.clock = clock
+        self.tokens = capacity
+        self._updated_at = clock()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = self.clock()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated_at) * self.rate)
+        self._updated_at = now
+
+    def reserve(self, amount: float) -> float:
+        """Reserva `amount` tokens y devuelve los segundos hasta que estén disponibles."""
+        with self._lock:
+            self._refill()
+            self.tokens -= amount
+            return max(0.0, -self.tokens / self.rate)
+
+    def refund(self, amount: float):
+        """Devuelve tokens reservados de más (o descuenta si `amount` es negativo)."""
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+    async def acquire(self, amount: float) -> float:
+        wait = self.reserve(amount)
+        if wait:
+            try:
+                await asyncio.sleep(wait)
+            except asyncio.CancelledError:
+                self.refund(amount)
+                raise
+        return wait
+
+
+class AdaptiveConcurrency:
+    """
+    Límite de llamadas simultáneas con aumento aditivo y reducción
+    multiplicativa: cada 429 lo divide entre dos y cada `limit` éxitos
+    seguidos lo sube en uno, hasta `maximum`. Los que esperan pueden estar en
+    event loops distintos.
+    """
+    def __init__(self, maximum: int, minimum: int = 1):
+        self.maximum = maximum
+        self.minimum = minimum
+        self.limit = maximum
+        self.active = 0
+        self._successes = 0
+        self._waiters: list[tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+        self._lock = threading.Lock()
+
+    async def acquire(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            with self._lock:
+                if self.active < self.limit:
+                    self.active += 1
+                    return
+                waiter = loop.create_future()
+                self._waiters.append((loop, waiter))
+            try:
+                await waiter
+            finally:
+                with self._lock:
+                    if (loop, waiter) in self._waiters:
+                        self._waiters.remove((loop, waiter))
+                    # Si se canceló tras cederle el turno, lo recibe el siguiente
+                    self._wake()
+
+    def release(self):
+        with self._lock:
+            self.active -= 1
+            self._wake()
+
+    def on_success(self):
+        with self._lock:
+            self._successes += 1
+            if self._successes >= self.limit and self.limit < self.maximum:
+                self.limit += 1
+                self._successes = 0
+                self._wake()
+
+    def on_throttled(self):
+        with self._lock:
+            self.limit = max(self.minimum, self.limit // 2)
+            self._successes = 0
+
+    def _wake(self):
+        for loop, waiter in self._waiters[:max(0, self.limit - self.active)]:
+            if not loop.is_closed():
+                loop.call_soon_threadsafe(_resolve, waiter)
+
+
+def _resolve(waiter: asyncio.Future):
+    if not waiter.done():
+        waiter.set_result(None)
+
+
+class CallLimiter:
+    """Cuota, concurrencia adaptativa y estadísticas de un modelo o de la API de archivos."""
+    def __init__(self, name: str, limits: RateLimits, clock=time.monotonic):
+        self.name = name
+        self.limits = limits
+        self.requests = self._bucket(limits.requests_per_minute, clock)
+        self.tokens = self._bucket(limits.tokens_per_minute, clock)
+        self.concurrency = AdaptiveConcurrency(limits.max_concurrency)
+        self.calls = 0
+        self.retries = 0
+        self.throttled = 0
+        self.wait_seconds = 0.0
+
+    def _bucket(self, per_minute: float | None, clock) -> TokenBucket | None:
+        if not per_minute:
+            return None
+        rate = per_minute / 60
+        return TokenBucket(rate, max(1.0, rate * self.limits.burst_seconds), clock)
+
+    def stats(self) -> dict:
+        return {
+            "calls": self.calls,
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "concurrency_limit": self.concurrency.limit,
+            "active": self.concurrency.active,
+            "wait_seconds": round(self.wait_seconds, 3),
+        }
+
+
+class RateLimiter:
+    """
+    Limitador compartido de todas las llamadas a Gemini: la subida y el
+    sondeo de archivos y cada modelo tienen su propio CallLimiter (cubos de
+    peticiones y de tokens por minuto y concurrencia adaptativa). `call()`
+    espera turno, ejecuta la llamada y la reintenta con backoff si falla con
+    un error reintentable. Con `enabled=False` las llamadas pasan tal cual.
+    """
+    def __init__(self, default_limits: RateLimits | None = None, limits: dict[str, RateLimits] | None = None,
+                 retry: RetryPolicy | None = None, enabled: bool = True, rng: random.Random | None = None):
+        self.default_limits = default_limits or RateLimits()
+        self.limits = dict(limits or {})
+        self.retry = retry or RetryPolicy()
+        self.enabled = enabled
+        self.rng = rng
+        self._limiters: dict[str, CallLimiter] = {}
+        self._lock = threading.Lock()
+
+    def limiter(self, key: str) -> CallLimiter:
+        with self._lock:
+            if key not in self._limiters:
+                self._limiters[key] = CallLimiter(key, self.limits.get(key, self.default_limits))
+            return self._limiters[key]
+
+    async def call(self, key: str, fn, *args, tokens: float = 0, can_retry=None, **kwargs):
+        """
+        Ejecuta `await fn(*args, **kwargs)` respetando la cuota de `key`.
+        `tokens` es la estimación de tokens de entrada que se reserva en cada
+        intento (el uso real se ajusta con `record_tokens`). `can_retry()`
+        permite al llamador impedir un reintento (p. ej., si ya entregó
+        fragmentos en streaming). Tras agotar los intentos relanza el error.
+        """
+        if not self.enabled:
+            return await fn(*args, **kwargs)
+
+        limiter = self.limiter(key)
+        attempt = 0
+        while True:
+            attempt += 1
+            waited = await self._acquire(limiter, tokens)
+            limiter.calls += 1
+            try:
+                result = await fn(*args, **kwargs)
+            except Exception as e:
+                limiter.concurrency.release()
+                throttled = is_throttled(e)
+                if throttled:
+                    limiter.throttled += 1
+                    limiter.concurrency.on_throttled()
+                if not is_retryable(e) or attempt >= self.retry.max_attempts or (can_retry and not can_retry()):
+                    raise
+                limiter.retries += 1
+                get_metrics().increment("gemini_retries_total", target=key,
+                                        reason="throttled" if throttled else "transient")
+                delay = self.retry.delay(attempt, self.rng)
+                print(f"⏳ [{key}] {type(e).__name__}: {e}. Reintento {attempt}/{self.retry.max_attempts - 1} "
+                      f"en {delay:.1f}s.")
+                await asyncio.sleep(delay)
+                continue
+            except BaseException:
+                limiter.concurrency.release()
+                raise
+            limiter.concurrency.release()
+            limiter.concurrency.on_success()
+            if waited:
+                get_metrics().observe("rate_limit_wait_seconds", waited, target=key)
+            return result
+
+    async def _acquire(self, limiter: CallLimiter, tokens: float) -> float:
+        started_at = time.perf_counter()
+        if limiter.requests:
+            await limiter.requests.acquire(1)
+        if limiter.tokens and tokens:
+            await limiter.tokens.acquire(tokens)
+        await limiter.concurrency.acquire()
+        waited = time.perf_counter() - started_at
+        limiter.wait_seconds += waited
+        return waited
+
+    def record_tokens(self, key: str, estimated: float, actual: float):
+        """Ajusta el cubo de tokens de `key` con el uso real de una llamada."""
+        if self.enabled:
+            bucket = self.limiter(key).tokens
+            if bucket:
+                bucket.refund(estimated - actual)
+
+    def stats(self) -> dict:
+        with self._lock:
+            limiters = dict(self._limiters)
+        return {key: limiter.stats() for key, limiter in sorted(limiters.items())}
+
+
+def parse_model_limits(value: str) -> dict[str, RateLimits]:
+    """
+    Interpreta GEMINI_MODEL_LIMITS: `modelo=rpm/tpm` separados por comas
+    (p. ej., "gemini-pro-latest=150/2000000,gemini-flash-latest=1000/1000000").
+    """
+    limits = {}
+    for item in filter(None, (entry.strip() for entry in value.split(","))):
+        model, _, quota = item.partition("=")
+        rpm, _, tpm = quota.partition("/")
+        limits[model.strip()] = RateLimits(requests_per_minute=float(rpm) if rpm else None,
+                                           tokens_per_minute=float(tpm) if tpm else None)
+    return limits
+
+
+def rate_limiter_from_env(environ=os.environ) -> RateLimiter:
+    """
+    Construye el limitador a partir del entorno. RATE_LIMIT=0 lo desactiva.
+    GEMINI_RPM y GEMINI_TPM fijan la cuota por modelo (1000 y 1000000),
+    GEMINI_MODEL_LIMITS la sobrescribe para modelos concretos, FILES_RPM
+    limita por separado la subida, el sondeo y el borrado de archivos (600),
+    GEMINI_MAX_CONCURRENCY es el techo de llamadas simultáneas (8) y
+    GEMINI_MAX_RETRIES el número de reintentos (4).
+    """
+    enabled = environ.get("RATE_LIMIT", "1").lower() not in ("0", "false", "no")
+    max_concurrency = int(environ.get("GEMINI_MAX_CONCURRENCY", 8))
+    files_limits = RateLimits(requests_per_minute=float(environ.get("FILES_RPM", 600)),
+                              max_concurrency=max_concurrency)
+    limits = {FILES_UPLOAD: files_limits, FILES_GET: files_limits, FILES_DELETE: files_limits}
+    for model, model_limits in parse_model_limits(environ.get("GEMINI_MODEL_LIMITS", "")).items():
+        model_limits.max_concurrency = max_concurrency
+        limits[model] = model_limits
+    return RateLimiter(
+        default_limits=RateLimits(
+            requests_per_minute=float(environ.get("GEMINI_RPM", 1000)),
+            tokens_per_minute=float(environ.get("GEMINI_TPM", 1_000_000)),
+            max_concurrency=max_concurrency,
+        ),
+        limits=limits,
+        retry=RetryPolicy(max_attempts=int(environ.get("GEMINI_MAX_RETRIES", 4)) + 1),
+        enabled=enabled,
+    )
+
+
+_rate_limiter: RateLimiter | None = None
+_rate_limiter_lock = threading.Lock()
+
+
+def get_rate_limiter() -> RateLimiter:
+    """Devuelve el limitador compartido del proceso (se crea con la configuración del entorno)."""
+    global _rate_limiter
+    with _rate_limiter_lock:
+        if _rate_limiter is None:
+            _rate_limiter = rate_limiter_from_env()
+        return _rate_limiter
+
+
+def set_rate_limiter(limiter: RateLimiter | None):
+    """Sustituye el limitador compartido (benchmarks y pruebas); None lo recrea desde el entorno."""
+    global _rate_limiter
+    with _rate_limiter_lock:
+        _rate_limiter = limiter
+
+
+def model_name(model) -> str:
+    """Nombre del modelo de un agente de ADK (una cadena o un BaseLlm)."""
+    return model if isinstance(model, str) else getattr(model, "model", type(model).__name__)
+
+
+def estimate_tokens(parts) -> int:
+    """Estimación de los tokens de entrada (unos 4 caracteres por token) antes de conocer el uso real."""
+    return sum(len(part.text) // 4 if part.text else NON_TEXT_PART_TOKEN_ESTIMATE for part in parts)
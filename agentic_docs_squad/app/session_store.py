@@ -0,0 +1,209 @@
+import os
+import time
+from collections import OrderedDict
+from google.adk.events import Event
+from google.adk.sessions import InMemorySessionService, Session
+from google.genai import types
+
+# Límites por defecto del almacén de sesiones
+DEFAULT_MAX_SESSIONS = 256
+DEFAULT_MAX_EVENTS_PER_SESSION = 50
+DEFAULT_MAX_TOTAL_BYTES = 64 * 1024 * 1024
+DEFAULT_TTL_SECONDS = 3600.0
+
+# Eventos recientes que se conservan literalmente al compactar una sesión
+DEFAULT_KEEP_RECENT_EVENTS = 10
+
+# Caracteres que se conservan de cada evento antiguo y del resumen completo
+SUMMARY_CHARS_PER_EVENT = 200
+MAX_SUMMARY_CHARS = 4000
+
+# Marca (en custom_metadata) de los eventos que resumen historial compactado
+COMPACTED_EVENTS_KEY = "compacted_events"
+
+
+def _event_size(event: Event) -> int:
+    """Tamaño aproximado en memoria de un evento: su serialización JSON."""
+    return len(event.model_dump_json(exclude_none=True).encode("utf-8"))
+
+
+def _event_text(event: Event) -> str:
+    if not event.content or not event.content.parts:
+        return ""
+    return "".join(part.text for part in event.content.parts if part.text)
+
+
+class BoundedSessionService(InMemorySessionService):
+    """
+    Servicio de sesiones en memoria con límites, pensado para procesos de
+    larga duración que atienden muchas peticiones.
+
+    - `max_sessions` y `max_total_bytes` limitan el almacén completo: al
+      superarse se eliminan las sesiones usadas hace más tiempo (LRU).
+    - `ttl_seconds` elimina las sesiones que llevan ese tiempo sin usarse.
+    - `max_events_per_session` limita el historial de cada sesión: al
+      superarse, los eventos antiguos se compactan en un único evento de
+      resumen y solo los `keep_recent_events` más recientes se conservan
+      literalmente.
+
+    La sesión que se está usando en cada momento nunca se expulsa.
+    """
+    def __init__(self, max_sessions: int = DEFAULT_MAX_SESSIONS,
+                 max_events_per_session: int = DEFAULT_MAX_EVENTS_PER_SESSION,
+                 max_total_bytes: int = DEFAULT_MAX_TOTAL_BYTES,
+                 ttl_seconds: float | None = DEFAULT_TTL_SECONDS,
+                 keep_recent_events: int = DEFAULT_KEEP_RECENT_EVENTS,
+                 clock=time.monotonic):
+        super().__init__()
+        self.max_sessions = max_sessions
+        self.max_events_per_session = max_events_per_session
+        self.max_total_bytes = max_total_bytes
+        self.ttl_seconds = ttl_seconds
+        self.keep_recent_events = min(keep_recent_events, max(0, max_events_per_session - 1))
+        self._clock = clock
+        # (app_name, user_id, session_id) -> último acceso, en orden LRU
+        self._last_access: OrderedDict[tuple, float] = OrderedDict()
+        self._sizes: dict[tuple, int] = {}
+        self.evictions = 0
+        self.compactions = 0
+
+    # --- Contabilidad ---
+
+    @property
+    def total_bytes(self) -> int:
+        return sum(self._sizes.values())
+
+    def _touch(self, key: tuple):
+        self._last_access[key] = self._clock()
+        self._last_access.move_to_end(key)
+
+    def _forget(self, key: tuple):
+        self._last_access.pop(key, None)
+        self._sizes.pop(key, None)
+
+    def _storage_session(self, key: tuple) -> Session | None:
+        app_name, user_id, session_id = key
+        return self.sessions.get(app_name, {}).get(user_id, {}).get(session_id)
+
+    def _evict(self, key: tuple):
+        app_name, user_id, session_id = key
+        self._delete_session_impl(app_name=app_name, user_id=user_id, session_id=session_id)
+        self._forget(key)
+        self.evictions += 1
+
+    def _enforce_limits(self, protect: tuple | None = None):
+        """Expulsa sesiones caducadas y, después, las menos usadas hasta cumplir los límites."""
+        if self.ttl_seconds is not None:
+            deadline = self._clock() - self.ttl_seconds
+            for key, last_access in list(self._last_access.items()):
+                if last_access > deadline:
+                    break  # El resto se ha usado más recientemente
+                if key != protect:
+                    self._evict(key)
+
+        candidates = [key for key in self._last_access if key != protect]
+        while candidates and (len(self._last_access) > self.max_sessions
+                              or self.total_bytes > self.max_total_bytes):
+            self._evict(candidates.pop(0))
+
+    def _compact(self, key: tuple, session: Session):
+        """Sustituye los eventos antiguos de la sesión por un único evento de resumen."""
+        keep = self.keep_recent_events
+        old_events = session.events[:-keep] if keep else list(session.events)
+        recent_events = session.events[-keep:] if keep else []
+
+        lines = []
+        compacted = 0
+        for event in old_events:
+            metadata = event.custom_metadata or {}
+            if COMPACTED_EVENTS_KEY in metadata:
+                # Un resumen previo se conserva tal cual, sin volver a recortarlo
+                lines.extend(_event_text(event).splitlines()[1:])
+                compacted += metadata[COMPACTED_EVENTS_KEY]
+                continue
+            compacted += 1
+            text = " ".join(_event_text(event).split())
+            if text:
+                lines.append(f"- {event.author}: {text[:SUMMARY_CHARS_PER_EVENT]}")
+
+        # Si el resumen crece demasiado, se descartan primero las líneas más antiguas
+        while lines and sum(len(line) + 1 for line in lines) > MAX_SUMMARY_CHARS:
+            lines.pop(0)
+
+        summary = Event(
+            author="user",
+            invocation_id=old_events[-1].invocation_id,
+            timestamp=old_events[-1].timestamp,
+            custom_metadata={COMPACTED_EVENTS_KEY: compacted},
+            content=types.Content(role="user", parts=[types.Part(
+                text="\n".join([f"[Resumen de {compacted} eventos anteriores]"] + lines)
+            )]),
+        )
+        session.events = [summary] + recent_events
+        self._sizes[key] = sum(_event_size(event) for event in session.events)
+        self.compactions += 1
+
+    # --- API de BaseSessionService ---
+
+    async def create_session(self, *, app_name: str, user_id: str, state=None, session_id=None) -> Session:
+        session = await super().create_session(
+            app_name=app_name, user_id=user_id, state=state, session_id=session_id
+        )
+        key = (app_name, user_id, session.id)
+        self._sizes[key] = 0
+        self._touch(key)
+        self._enforce_limits(protect=key)
+        return session
+
+    async def get_session(self, *, app_name: str, user_id: str, session_id: str, config=None) -> Session | None:
+        session = await super().get_session(
+            app_name=app_name, user_id=user_id, session_id=session_id, config=config
+        )
+        if session is not None:
+            self._touch((app_name, user_id, session_id))
+        return session
+
+    async def delete_session(self, *, app_name: str, user_id: str, session_id: str) -> None:
+        await super().delete_session(app_name=app_name, user_id=user_id, session_id=session_id)
+        self._forget((app_name, user_id, session_id))
+
+    async def append_event(self, session: Session, event: Event) -> Event:
+        event = await super().append_event(session=session, event=event)
+        if event.partial:
+            return event
+
+        key = (session.app_name, session.user_id, session.id)
+        storage_session = self._storage_session(key)
+        if storage_session is None:
+            return event
+        self._sizes[key] = self._sizes.get(key, 0) + _event_size(event)
+        self._touch(key)
+        if len(storage_session.events) > self.max_events_per_session:
+            self._compact(key, storage_session)
+        self._enforce_limits(protect=key)
+        return event
+
+    def stats(self) -> dict:
+        """Estado del almacén, útil para health checks y para vigilar la memoria."""
+        return {
+            "sessions": len(self._last_access),
+            "events": sum(len(s.events) for key in self._last_access if (s := self._storage_session(key))),
+            "bytes": self.total_bytes,
+            "evictions": self.evictions,
+            "compactions": self.compactions,
+        }
+
+
+def create_session_service() -> BoundedSessionService:
+    """
+    Crea el servicio de sesiones con los límites de las variables de entorno
+    SESSION_MAX_SESSIONS, SESSION_MAX_EVENTS, SESSION_MAX_BYTES y
+    SESSION_TTL_SECONDS (0 desactiva la caducidad por tiempo).
+    """
+    ttl_seconds = float(os.getenv("SESSION_TTL_SECONDS", DEFAULT_TTL_SECONDS))
+    return BoundedSessionService(
+        max_sessions=int(os.getenv("SESSION_MAX_SESSIONS", DEFAULT_MAX_SESSIONS)),
+        max_events_per_session=int(os.getenv("SESSION_MAX_EVENTS", DEFAULT_MAX_EVENTS_PER_SESSION)),
+        max_total_bytes=int(os.getenv("SESSION_MAX_BYTES", DEFAULT_MAX_TOTAL_BYTES)),
+        ttl_seconds=ttl_seconds or None,
+    )
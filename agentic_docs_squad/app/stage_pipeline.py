@@ -0,0 +1,126 @@
+import asyncio
+import time
+
+# Etapas del pipeline, en orden
+PIPELINE_STAGES = ("IngestAgent", "AnalystAgent", "TechWriterAgent", "SaverAgent")
+
+# Concurrencia por defecto de cada etapa. La ingesta está limitada por el
+# ancho de banda de subida y el análisis/redacción por la cuota del modelo;
+# el guardado es local y barato.
+DEFAULT_STAGE_CONCURRENCY = {
+    "IngestAgent": 2,
+    "AnalystAgent": 2,
+    "TechWriterAgent": 2,
+    "SaverAgent": 4,
+}
+
+
+class StageLimiter:
+    """
+    Límite de concurrencia de una etapa con contadores observables: cuántos
+    archivos esperan turno (profundidad de la cola), cuántos se están
+    procesando y cuánto tiempo ha estado ocupada la etapa.
+
+    Se usa como context manager asíncrono alrededor del trabajo de la etapa.
+    """
+    def __init__(self, name: str, concurrency: int, clock=time.monotonic):
+        self.name = name
+        self.concurrency = max(1, concurrency)
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._clock = clock
+        self._created_at = clock()
+        self.waiting = 0
+        self.active = 0
+        self.completed = 0
+        self.busy_seconds = 0.0
+        self.wait_seconds = 0.0
+        self._active_since: list[float] = []
+
+    async def __aenter__(self):
+        self.waiting += 1
+        queued_at = self._clock()
+        try:
+            await self._semaphore.acquire()
+        finally:
+            self.waiting -= 1
+        now = self._clock()
+        self.wait_seconds += now - queued_at
+        self.active += 1
+        self._active_since.append(now)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        started_at = self._active_since.pop(0)
+        self.busy_seconds += self._clock() - started_at
+        self.active -= 1
+        self.completed += 1
+        self._semaphore.release()
+        return False
+
+    def utilization(self) -> float:
+        """Fracción (0-1) de la capacidad de la etapa usada desde su creación."""
+        now = self._clock()
+        elapsed = now - self._created_at
+        if elapsed <= 0:
+            return 0.0
+        # Se incluye el tiempo en curso de los archivos que se están procesando
+        busy = self.busy_seconds + sum(now - started_at for started_at in self._active_since)
+        return min(1.0, busy / (elapsed * self.concurrency))
+
+    def stats(self) -> dict:
+        return {
+            "concurrency": self.concurrency,
+            "queue_depth": self.waiting,
+            "active": self.active,
+            "completed": self.completed,
+            "busy_seconds": self.busy_seconds,
+            "wait_seconds": self.wait_seconds,
+            "utilization": self.utilization(),
+        }
+
+
+class PipelinedExecutor:
+    """
+    Ejecuta pipelines de varios archivos solapando sus etapas: cada etapa
+    tiene su propio límite de concurrencia, de modo que el archivo N+1 se
+    puede subir mientras el N se analiza y el N-1 se redacta. Así se
+    aprovechan a la vez el ancho de banda y la cuota del modelo, en lugar de
+    procesar los archivos uno detrás de otro.
+
+    Cada archivo avanza con `orchestrator.run_pipeline`, que espera turno en
+    el StageLimiter de cada etapa antes de ejecutarla.
+    """
+    def __init__(self, orchestrator, concurrency: dict | None = None):
+        self.orchestrator = orchestrator
+        concurrency = {**DEFAULT_STAGE_CONCURRENCY, **(concurrency or {})}
+        self.stages = {stage: StageLimiter(stage, concurrency[stage]) for stage in PIPELINE_STAGES}
+
+    async def run(self, file_path: str, user_context: str = "", on_event=None,
+                  content_hash: str | None = None) -> str:
+        """Ejecuta el pipeline de un archivo respetando los límites por etapa."""
+        return await self.orchestrator.run_pipeline(
+            file_path, user_context, on_event=on_event, content_hash=content_hash, stage_limits=self.stages,
+        )
+
+    async def run_many(self, file_paths: list[str], user_context: str = "") -> list[str]:
+        """Documenta varios archivos a la vez y devuelve sus resultados en el mismo orden."""
+        return list(await asyncio.gather(*(self.run(path, user_context) for path in file_paths)))
+
+    def stats(self) -> dict:
+        """Profundidad de cola, archivos activos y utilización de cada etapa."""
+        return {stage: limiter.stats() for stage, limiter in self.stages.items()}
+
+
+def stage_concurrency_from_env(environ) -> dict:
+    """
+    Concurrencia por etapa a partir de INGEST_CONCURRENCY,
+    ANALYSIS_CONCURRENCY, WRITER_CONCURRENCY y SAVER_CONCURRENCY.
+    """
+    variables = {
+        "IngestAgent": "INGEST_CONCURRENCY",
+        "AnalystAgent": "ANALYSIS_CONCURRENCY",
+        "TechWriterAgent": "WRITER_CONCURRENCY",
+        "SaverAgent": "SAVER_CONCURRENCY",
+    }
+    return {stage: int(environ.get(variable, DEFAULT_STAGE_CONCURRENCY[stage]))
+            for stage, variable in variables.items()}
@@ -0,0 +1,219 @@
+import os
+import json
+import time
+import uuid
+import bisect
+import threading
+import contextvars
+from contextlib import contextmanager
+from dataclasses import dataclass, field, asdict
+
+# Límites (en segundos) de los histogramas de duración
+DURATION_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0, 300.0, 600.0)
+
+# Prefijo de todas las métricas exportadas
+METRIC_PREFIX = "docsquad"
+
+
+@dataclass
+class Span:
+    """Tramo medido de un pipeline: una etapa, una llamada a un agente, una subida..."""
+    name: str
+    start: float
+    end: float | None = None
+    attributes: dict = field(default_factory=dict)
+
+    @property
+    def seconds(self) -> float | None:
+        return self.end - self.start if self.end is not None else None
+
+
+class Trace:
+    """
+    Tramos de una ejecución del pipeline. Se activa con `activate()` y, a
+    partir de ahí, `span()` registra en ella los tramos de cualquier función
+    llamada desde esa tarea (también en las subtareas y en `asyncio.to_thread`,
+    que heredan el contexto).
+    """
+    def __init__(self, file_path: str, run_id: str | None = None):
+        self.run_id = run_id or uuid.uuid4().hex
+        self.file_path = file_path
+        self.started_at = time.time()
+        self.spans: list[Span] = []
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def activate(self):
+        token = _current_trace.set(self)
+        try:
+            yield self
+        finally:
+            _current_trace.reset(token)
+
+    def add(self, span: Span):
+        with self._lock:
+            self.spans.append(span)
+
+    def summary(self) -> dict:
+        """Segundos por etapa, tokens y bytes subidos de la ejecución."""
+        with self._lock:
+            spans = list(self.spans)
+        stages = {span.attributes["stage"]: span.seconds for span in spans if span.name == "stage"}
+        calls = [span for span in spans if span.name == "agent_call"]
+        return {
+            "stages": stages,
+            "input_tokens": sum(span.attributes.get("input_tokens", 0) for span in calls),
+            "output_tokens": sum(span.attributes.get("output_tokens", 0) for span in calls),
+            "bytes_uploaded": sum(span.attributes.get("bytes", 0) for span in spans if span.name == "upload"),
+        }
+
+    def to_dict(self) -> dict:
+        with self._lock:
+            spans = list(self.spans)
+        return {
+            "run_id": self.run_id,
+            "file_path": self.file_path,
+            "started_at": self.started_at,
+            "summary": self.summary(),
+            # Los instantes de los tramos son relativos al inicio de la ejecución
+            "spans": [
+                {**asdict(span), "start": span.start - spans[0].start if spans else 0.0,
+                 "end": span.end - spans[0].start if spans and span.end is not None else None,
+                 "seconds": span.seconds}
+                for span in sorted(spans, key=lambda s: s.start)
+            ],
+        }
+
+    def write(self, directory: str) -> str:
+        """Guarda la traza como JSON en `directory` y devuelve la ruta."""
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{self.run_id}.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.to_dict(), f, ensure_ascii=False, indent=2)
+        return path
+
+
+_current_trace: contextvars.ContextVar[Trace | None] = contextvars.ContextVar("docsquad_trace", default=None)
+
+
+def current_trace() -> Trace | None:
+    return _current_trace.get()
+
+
+@contextmanager
+def span(name: str, **attributes):
+    """
+    Mide un tramo y lo registra en la traza activa (si la hay) y en las
+    métricas del proceso. Devuelve el Span para que el llamador pueda
+    añadir atributos conocidos al final (tokens, bytes...).
+    """
+    current = Span(name=name, start=time.perf_counter(), attributes=attributes)
+    try:
+        yield current
+    except BaseException:
+        current.attributes["error"] = True
+        raise
+    finally:
+        current.end = time.perf_counter()
+        trace = current_trace()
+        if trace:
+            trace.add(current)
+        get_metrics().record_span(current)
+
+
+class Histogram:
+    """Histograma acumulativo al estilo Prometheus (por combinación de etiquetas)."""
+    def __init__(self, buckets: tuple = DURATION_BUCKETS):
+        self.buckets = buckets
+        self.series: dict[tuple, dict] = {}
+
+    def observe(self, labels: tuple, value: float):
+        series = self.series.setdefault(labels, {"counts": [0] * (len(self.buckets) + 1), "sum": 0.0, "count": 0})
+        series["counts"][bisect.bisect_left(self.buckets, value)] += 1
+        series["sum"] += value
+        series["count"] += 1
+
+
+class MetricsRegistry:
+    """
+    Métricas del proceso a partir de los tramos medidos, exportables en el
+    formato de texto de Prometheus. Es segura entre hilos.
+    """
+    HELP = {
+        "stage_duration_seconds": ("histogram", "Duración de cada etapa del pipeline."),
+        "agent_call_duration_seconds": ("histogram", "Latencia de cada llamada a un agente."),
+        "upload_duration_seconds": ("histogram", "Duración de la subida de archivos a Gemini."),
+        "processing_wait_seconds": ("histogram", "Espera hasta que Gemini termina de procesar un archivo."),
+        "tokens_total": ("counter", "Tokens de entrada y salida consumidos por agente."),
+        "uploaded_bytes_total": ("counter", "Bytes subidos a Gemini."),
+        "pipeline_runs_total": ("counter", "Ejecuciones del pipeline por resultado."),
+        "rate_limit_wait_seconds": ("histogram", "Espera por cuota o concurrencia antes de llamar a Gemini."),
+        "gemini_retries_total": ("counter", "Reintentos de llamadas a Gemini por destino y motivo."),
+        "remote_files_deleted_total": ("counter", "Archivos borrados de Gemini por el recolector, por motivo."),
+    }
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._histograms = {name: Histogram() for name, (kind, _) in self.HELP.items() if kind == "histogram"}
+        self._counters: dict[str, dict[tuple, float]] = {
+            name: {} for name, (kind, _) in self.HELP.items() if kind == "counter"
+        }
+
+    def observe(self, name: str, value: float, **labels):
+        with self._lock:
+            self._histograms[name].observe(tuple(sorted(labels.items())), value)
+
+    def increment(self, name: str, value: float = 1, **labels):
+        with self._lock:
+            key = tuple(sorted(labels.items()))
+            self._counters[name][key] = self._counters[name].get(key, 0) + value
+
+    def record_span(self, span: Span):
+        attributes = span.attributes
+        if span.name == "stage":
+            self.observe("stage_duration_seconds", span.seconds, stage=attributes["stage"])
+        elif span.name == "agent_call":
+            agent = attributes["agent"]
+            self.observe("agent_call_duration_seconds", span.seconds, agent=agent)
+            self.increment("tokens_total", attributes.get("input_tokens", 0), agent=agent, direction="input")
+            self.increment("tokens_total", attributes.get("output_tokens", 0), agent=agent, direction="output")
+        elif span.name == "upload":
+            self.observe("upload_duration_seconds", span.seconds)
+            if not attributes.get("error"):
+                self.increment("uploaded_bytes_total", attributes.get("bytes", 0))
+        elif span.name == "processing_wait":
+            self.observe("processing_wait_seconds", span.seconds)
+
+    def render(self) -> str:
+        """Métricas en el formato de exposición de texto de Prometheus (0.0.4)."""
+        def format_labels(labels: tuple, extra: tuple = ()) -> str:
+            pairs = [f'{key}="{value}"' for key, value in labels + extra]
+            return "{" + ",".join(pairs) + "}" if pairs else ""
+
+        lines = []
+        with self._lock:
+            for name, (kind, help_text) in self.HELP.items():
+                metric = f"{METRIC_PREFIX}_{name}"
+                lines.append(f"# HELP {metric} {help_text}")
+                lines.append(f"# TYPE {metric} {kind}")
+                if kind == "counter":
+                    for labels, value in sorted(self._counters[name].items()):
+                        lines.append(f"{metric}{format_labels(labels)} {value:g}")
+                    continue
+                histogram = self._histograms[name]
+                for labels, series in sorted(histogram.series.items()):
+                    cumulative = 0
+                    for bound, count in zip(histogram.buckets + ("+Inf",), series["counts"]):
+                        cumulative += count
+                        lines.append(f"{metric}_bucket{format_labels(labels, (('le', str(bound)),))} {cumulative}")
+                    lines.append(f"{metric}_sum{format_labels(labels)} {series['sum']:g}")
+                    lines.append(f"{metric}_count{format_labels(labels)} {series['count']}")
+        return "\n".join(lines) + "\n"
+
+
+_metrics = MetricsRegistry()
+
+
+def get_metrics() -> MetricsRegistry:
+    """Devuelve el registro de métricas compartido del proceso."""
+    return _metrics
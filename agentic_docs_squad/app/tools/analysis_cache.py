@@ -0,0 +1,155 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+
+# Ubicación por defecto de la caché persistente de análisis
+DEFAULT_ANALYSIS_CACHE_PATH = os.path.join(
+    os.path.expanduser("~"), ".cache", "agentic_docs_squad", "analysis_cache.sqlite3"
+)
+
+# Tamaño máximo por defecto de los resultados almacenados (en bytes)
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+
+def normalize_context(context: str | None) -> str:
+    """Normaliza el contexto del usuario para que variaciones triviales compartan entrada."""
+    return " ".join((context or "").split()).casefold()
+
+
+def instruction_hash(instruction) -> str:
+    """Hash de la instrucción de un agente; si el prompt cambia, cambian las claves."""
+    return hashlib.sha256(str(instruction).encode("utf-8")).hexdigest()
+
+
+def analysis_key(content_hash: str, context: str | None, model: str, instruction_sha: str) -> str:
+    """Clave de un análisis: contenido, contexto normalizado, modelo e instrucción."""
+    payload = json.dumps([content_hash, normalize_context(context), model, instruction_sha])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class AnalysisCache:
+    """
+    Caché persistente (SQLite) de las salidas del AnalystAgent.
+
+    La clave combina el SHA-256 del contenido del archivo, el contexto
+    normalizado, el nombre del modelo y el hash de la instrucción del agente,
+    por lo que cambiar cualquiera de ellos produce un fallo de caché. Al
+    guardar un resultado se eliminan las entradas del mismo archivo, contexto
+    y modelo generadas con otra instrucción. Si el tamaño total supera
+    `max_bytes`, se expulsan las entradas usadas hace más tiempo (LRU).
+    Es segura entre hilos dentro de un mismo proceso.
+    """
+    def __init__(self, path: str | None = None, max_bytes: int | None = None):
+        self.path = path or os.getenv("ANALYSIS_CACHE_PATH", DEFAULT_ANALYSIS_CACHE_PATH)
+        self.max_bytes = max_bytes if max_bytes is not None else int(os.getenv("ANALYSIS_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES))
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS analyses (
+                    key TEXT PRIMARY KEY,
+                    content_hash TEXT NOT NULL,
+                    context TEXT NOT NULL,
+                    model TEXT NOT NULL,
+                    instruction_hash TEXT NOT NULL,
+                    result TEXT NOT NULL,
+                    size_bytes INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used_at REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS analyses_lru ON analyses (last_used_at)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    def _bump(self, name: str):
+        self._conn.execute(
+            "INSERT INTO stats (name, value) VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET value = value + 1",
+            (name,),
+        )
+
+    def get(self, content_hash: str, context: str | None, model: str, instruction_sha: str) -> str | None:
+        """Devuelve el análisis guardado para esta combinación, o None (y cuenta el acierto o fallo)."""
+        key = analysis_key(content_hash, context, model, instruction_sha)
+        with self._lock, self._conn:
+            row = self._conn.execute("SELECT result FROM analyses WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._bump("misses")
+                return None
+            self._conn.execute(
+                "UPDATE analyses SET last_used_at = ?, hits = hits + 1 WHERE key = ?", (time.time(), key)
+            )
+            self._bump("hits")
+            return row[0]
+
+    def put(self, content_hash: str, context: str | None, model: str, instruction_sha: str, result: str):
+        """Guarda un análisis, descarta versiones de otras instrucciones y aplica el límite de tamaño."""
+        key = analysis_key(content_hash, context, model, instruction_sha)
+        normalized = normalize_context(context)
+        size_bytes = len(result.encode("utf-8"))
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM analyses WHERE content_hash = ? AND context = ? AND model = ? AND instruction_hash != ?",
+                (content_hash, normalized, model, instruction_sha),
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO analyses "
+                "(key, content_hash, context, model, instruction_hash, result, size_bytes, created_at, last_used_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, content_hash, normalized, model, instruction_sha, result, size_bytes, now, now),
+            )
+            self._evict()
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM analyses").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size_bytes in self._conn.execute(
+            "SELECT key, size_bytes FROM analyses ORDER BY last_used_at ASC"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM analyses WHERE key = ?", (key,))
+            self._bump("evictions")
+            total -= size_bytes
+
+    def stats(self) -> dict:
+        """Aciertos, fallos, expulsiones, entradas y bytes almacenados."""
+        with self._lock:
+            counters = dict(self._conn.execute("SELECT name, value FROM stats").fetchall())
+            entries, total_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM analyses"
+            ).fetchone()
+        hits, misses = counters.get("hits", 0), counters.get("misses", 0)
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "evictions": counters.get("evictions", 0),
+            "entries": entries,
+            "bytes": total_bytes,
+        }
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM analyses")
+            self._conn.execute("DELETE FROM stats")
+
+
+_analysis_cache: AnalysisCache | None = None
+_analysis_cache_lock = threading.Lock()
+
+
+def get_analysis_cache() -> AnalysisCache:
+    """Devuelve la instancia compartida de la caché de análisis."""
+    global _analysis_cache
+    with _analysis_cache_lock:
+        if _analysis_cache is None:
+            _analysis_cache = AnalysisCache()
+        return _analysis_cache
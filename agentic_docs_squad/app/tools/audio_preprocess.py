@@ -0,0 +1,233 @@
+import os
+import re
+import bisect
+import shutil
+import wave
+import hashlib
+import tempfile
+import subprocess
+from dataclasses import dataclass, field
+import numpy as np
+
+# Marca de tiempo entre corchetes que el AnalystAgent usa para referirse al audio
+BRACKETED_TIMESTAMP_PATTERN = re.compile(r'\[(\d{1,2}(?::\d{2}){1,2})\]')
+
+
+@dataclass
+class AudioPolicy:
+    """
+    Configuración del preprocesado local de audio.
+
+    El audio se pasa a mono y se remuestrea a `target_sample_rate`. Se
+    considera voz cada ventana de `frame_ms` cuya energía supera
+    `silence_threshold_db` (dBFS); los silencios más largos que
+    `min_silence_ms` se recortan, conservando `keep_silence_ms` de margen a
+    cada lado para no cortar sílabas.
+    """
+    target_sample_rate: int = 16000
+    frame_ms: int = 30
+    silence_threshold_db: float = -40.0
+    min_silence_ms: int = 700
+    keep_silence_ms: int = 200
+
+
+@dataclass
+class TimestampMap:
+    """
+    Correspondencia entre el audio recortado y el original. Cada tramo
+    conservado es (inicio en el audio recortado, inicio en el original),
+    en segundos y ordenados.
+    """
+    spans: list[tuple[float, float]] = field(default_factory=list)
+
+    def to_source(self, seconds: float) -> float:
+        """Convierte un instante del audio recortado al instante del audio original."""
+        if not self.spans:
+            return seconds
+        index = max(0, bisect.bisect_right([start for start, _ in self.spans], seconds) - 1)
+        output_start, source_start = self.spans[index]
+        return source_start + (seconds - output_start)
+
+    def remap_text(self, text: str) -> str:
+        """Sustituye las marcas [HH:MM:SS] de un texto por las del audio original."""
+        def replace(match):
+            seconds = 0
+            for component in match.group(1).split(":"):
+                seconds = seconds * 60 + int(component)
+            source = int(round(self.to_source(seconds)))
+            return f"[{source // 3600:02d}:{source % 3600 // 60:02d}:{source % 60:02d}]"
+        return BRACKETED_TIMESTAMP_PATTERN.sub(replace, text)
+
+
+@dataclass
+class AudioResult:
+    """Audio preprocesado (WAV mono de 16 bits) y lo que se ha ahorrado respecto al original."""
+    path: str
+    source_bytes: int
+    output_bytes: int
+    source_seconds: float
+    output_seconds: float
+    timestamp_map: TimestampMap
+
+    @property
+    def bytes_saved(self) -> int:
+        return self.source_bytes - self.output_bytes
+
+
+class AudioPreprocessError(Exception):
+    """El audio no se pudo decodificar o preprocesar."""
+
+
+def read_wav(path: str) -> tuple[np.ndarray, int]:
+    """Lee un WAV PCM y devuelve muestras float32 en [-1, 1] con forma (n, canales) y la frecuencia."""
+    try:
+        with wave.open(path, "rb") as wav:
+            channels, width, rate = wav.getnchannels(), wav.getsampwidth(), wav.getframerate()
+            raw = wav.readframes(wav.getnframes())
+    except (wave.Error, EOFError) as e:
+        raise AudioPreprocessError(f"WAV no soportado: {e}")
+
+    if width == 1:
+        samples = (np.frombuffer(raw, dtype=np.uint8).astype(np.float32) - 128) / 128
+    elif width == 2:
+        samples = np.frombuffer(raw, dtype="<i2").astype(np.float32) / 32768
+    elif width == 3:
+        # 24 bits: se completa cada muestra a 32 bits con el byte de signo
+        packed = np.frombuffer(raw, dtype=np.uint8).reshape(-1, 3)
+        padded = np.zeros((len(packed), 4), dtype=np.uint8)
+        padded[:, 1:] = packed
+        samples = padded.view("<i4").reshape(-1).astype(np.float32) / 2147483648
+    elif width == 4:
+        samples = np.frombuffer(raw, dtype="<i4").astype(np.float32) / 2147483648
+    else:
+        raise AudioPreprocessError(f"Profundidad de bits no soportada: {width * 8}")
+    return samples.reshape(-1, channels), rate
+
+
+def decode_with_ffmpeg(path: str, sample_rate: int) -> tuple[np.ndarray, int]:
+    """Decodifica formatos comprimidos (mp3, m4a, ogg...) con ffmpeg, ya en mono y a `sample_rate`."""
+    if not shutil.which("ffmpeg"):
+        raise AudioPreprocessError("ffmpeg no está instalado; no se puede decodificar este formato.")
+    completed = subprocess.run(
+        ["ffmpeg", "-nostdin", "-loglevel", "error", "-i", path, "-ac", "1", "-ar", str(sample_rate),
+         "-f", "s16le", "-"],
+        capture_output=True,
+    )
+    if completed.returncode != 0:
+        raise AudioPreprocessError(f"ffmpeg no pudo decodificar el audio: {completed.stderr.decode(errors='replace')}")
+    samples = np.frombuffer(completed.stdout, dtype="<i2").astype(np.float32) / 32768
+    return samples.reshape(-1, 1), sample_rate
+
+
+def to_mono(samples: np.ndarray) -> np.ndarray:
+    return samples.mean(axis=1) if samples.ndim == 2 else samples
+
+
+def resample(samples: np.ndarray, source_rate: int, target_rate: int) -> np.ndarray:
+    """
+    Remuestreo por interpolación lineal. Al reducir la frecuencia se aplica
+    antes un filtro de media móvil para atenuar el aliasing.
+    """
+    if source_rate == target_rate or len(samples) == 0:
+        return samples
+    if target_rate < source_rate:
+        width = int(round(source_rate / target_rate))
+        if width > 1:
+            samples = np.convolve(samples, np.ones(width, dtype=np.float32) / width, mode="same")
+    duration = len(samples) / source_rate
+    target_times = np.arange(int(duration * target_rate)) / target_rate
+    return np.interp(target_times, np.arange(len(samples)) / source_rate, samples).astype(np.float32)
+
+
+def voiced_regions(samples: np.ndarray, sample_rate: int, policy: AudioPolicy) -> list[tuple[int, int]]:
+    """
+    Tramos [inicio, fin) en muestras que contienen voz. Los silencios más
+    cortos que `min_silence_ms` se consideran parte de la voz y cada tramo
+    se amplía `keep_silence_ms` por cada lado.
+    """
+    frame = max(1, sample_rate * policy.frame_ms // 1000)
+    frames = len(samples) // frame
+    if frames == 0:
+        return [(0, len(samples))] if len(samples) else []
+
+    rms = np.sqrt(np.mean(samples[:frames * frame].reshape(frames, frame) ** 2, axis=1))
+    voiced = 20 * np.log10(np.maximum(rms, 1e-10)) > policy.silence_threshold_db
+
+    regions = []
+    min_gap = policy.min_silence_ms * sample_rate // 1000
+    pad = policy.keep_silence_ms * sample_rate // 1000
+    for index in np.flatnonzero(voiced):
+        start, end = index * frame, (index + 1) * frame
+        if regions and start - regions[-1][1] < min_gap:
+            regions[-1] = (regions[-1][0], end)
+        else:
+            regions.append((start, end))
+    if frames * frame < len(samples) and regions and regions[-1][1] == frames * frame:
+        regions[-1] = (regions[-1][0], len(samples))  # El final parcial sigue a la voz
+
+    padded = []
+    for start, end in regions:
+        start, end = max(0, start - pad), min(len(samples), end + pad)
+        if padded and start <= padded[-1][1]:
+            padded[-1] = (padded[-1][0], end)
+        else:
+            padded.append((start, end))
+    return padded
+
+
+def trim_silence(samples: np.ndarray, sample_rate: int, policy: AudioPolicy) -> tuple[np.ndarray, TimestampMap]:
+    """Concatena los tramos con voz y devuelve el audio recortado con su mapa de tiempos."""
+    regions = voiced_regions(samples, sample_rate, policy)
+    spans = []
+    output_position = 0
+    for start, end in regions:
+        spans.append((output_position / sample_rate, start / sample_rate))
+        output_position += end - start
+    trimmed = np.concatenate([samples[start:end] for start, end in regions]) if regions else samples[:0]
+    return trimmed, TimestampMap(spans)
+
+
+def write_wav(path: str, samples: np.ndarray, sample_rate: int):
+    """Escribe un WAV mono PCM de 16 bits."""
+    pcm = (np.clip(samples, -1.0, 1.0) * 32767).astype("<i2")
+    with wave.open(path, "wb") as wav:
+        wav.setnchannels(1)
+        wav.setsampwidth(2)
+        wav.setframerate(sample_rate)
+        wav.writeframes(pcm.tobytes())
+
+
+def preprocess_audio(path: str, policy: AudioPolicy | None = None, output_dir: str | None = None) -> AudioResult:
+    """
+    Pasa el audio a mono, lo remuestrea, recorta los silencios y lo guarda
+    como WAV en `output_dir` (por defecto, el directorio temporal). Los WAV
+    se procesan con NumPy; el resto de formatos necesita ffmpeg para la
+    decodificación. El nombre del resultado depende del contenido y de la
+    política, de modo que el mismo audio produce siempre el mismo archivo.
+    """
+    policy = policy or AudioPolicy()
+    if os.path.splitext(path)[1].lower() == ".wav":
+        samples, rate = read_wav(path)
+    else:
+        samples, rate = decode_with_ffmpeg(path, policy.target_sample_rate)
+
+    mono = resample(to_mono(samples), rate, policy.target_sample_rate)
+    trimmed, timestamp_map = trim_silence(mono, policy.target_sample_rate, policy)
+    if len(trimmed) == 0:
+        raise AudioPreprocessError("El audio no contiene voz por encima del umbral de silencio.")
+
+    digest = hashlib.sha256(trimmed.tobytes() + repr(policy).encode("utf-8")).hexdigest()[:16]
+    output_dir = output_dir or tempfile.gettempdir()
+    os.makedirs(output_dir, exist_ok=True)
+    base_filename = os.path.splitext(os.path.basename(path))[0]
+    output_path = os.path.join(output_dir, f"{base_filename}_{digest}.wav")
+    write_wav(output_path, trimmed, policy.target_sample_rate)
+
+    return AudioResult(
+        path=output_path,
+        source_bytes=os.path.getsize(path),
+        output_bytes=os.path.getsize(output_path),
+        source_seconds=len(mono) / policy.target_sample_rate,
+        output_seconds=len(trimmed) / policy.target_sample_rate,
+        timestamp_map=timestamp_map,
+    )
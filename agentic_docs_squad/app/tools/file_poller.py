@@ -0,0 +1,77 @@
+import asyncio
+import random
+from dataclasses import dataclass
+
+from app.rate_limit import FILES_GET, get_rate_limiter
+
+# Estados de un archivo en la API de Gemini
+STATE_PROCESSING = "PROCESSING"
+STATE_ACTIVE = "ACTIVE"
+STATE_FAILED = "FAILED"
+
+
+class FileProcessingTimeout(Exception):
+    """El archivo no terminó de procesarse antes del plazo máximo."""
+
+
+@dataclass
+class BackoffPolicy:
+    """
+    Política de espera exponencial con jitter para el sondeo del estado de un archivo.
+
+    Args:
+        initial_delay: Espera antes del primer sondeo (segundos).
+        max_delay: Espera máxima entre sondeos (segundos).
+        multiplier: Factor por el que crece la espera tras cada sondeo.
+        jitter: Fracción aleatoria (±) aplicada a cada espera para no sincronizar clientes.
+        timeout: Plazo total de espera (segundos); None para no limitarlo.
+    """
+    initial_delay: float = 1.0
+    max_delay: float = 15.0
+    multiplier: float = 2.0
+    jitter: float = 0.2
+    timeout: float | None = 600.0
+
+    def delays(self, rng: random.Random | None = None):
+        """Generador infinito de esperas sucesivas."""
+        rng = rng or random
+        delay = self.initial_delay
+        while True:
+            spread = delay * self.jitter
+            yield max(0.0, delay + rng.uniform(-spread, spread))
+            delay = min(self.max_delay, delay * self.multiplier)
+
+
+async def wait_until_processed(file_service, file, policy: BackoffPolicy | None = None,
+                               rng: random.Random | None = None, on_poll=None):
+    """
+    Espera, sin bloquear el event loop, a que un archivo deje el estado PROCESSING.
+
+    `file_service` es cualquier objeto con un método `get_file(name)` (por
+    defecto el módulo `google.generativeai`); la llamada bloqueante se ejecuta
+    en un hilo, bajo la cuota del limitador compartido. Devuelve el archivo en su estado final (ACTIVE o FAILED).
+
+    Lanza FileProcessingTimeout si se supera `policy.timeout`. La cancelación
+    de la tarea que la espera (`task.cancel()`) interrumpe el sondeo de
+    inmediato y propaga asyncio.CancelledError.
+    """
+    policy = policy or BackoffPolicy()
+    loop = asyncio.get_running_loop()
+    deadline = loop.time() + policy.timeout if policy.timeout is not None else None
+
+    delays = policy.delays(rng)
+    while file.state.name == STATE_PROCESSING:
+        delay = next(delays)
+        if deadline is not None:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                raise FileProcessingTimeout(
+                    f"El archivo {file.name} sigue en procesamiento tras {policy.timeout:.0f}s."
+                )
+            delay = min(delay, remaining)
+
+        await asyncio.sleep(delay)
+        file = await get_rate_limiter().call(FILES_GET, asyncio.to_thread, file_service.get_file, file.name)
+        if on_poll:
+            on_poll(file)
+    return file
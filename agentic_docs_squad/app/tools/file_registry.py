@@ -0,0 +1,288 @@
+import os
+import time
+import asyncio
+import datetime
+import sqlite3
+import threading
+from contextlib import contextmanager
+import google.generativeai as genai
+
+from app.rate_limit import FILES_DELETE, get_rate_limiter, status_code
+from app.telemetry import get_metrics
+from app.tools.upload_cache import EXPIRY_MARGIN, get_upload_cache
+
+# Ubicación por defecto del registro de archivos remotos
+DEFAULT_FILE_REGISTRY_PATH = os.path.join(
+    os.path.expanduser("~"), ".cache", "agentic_docs_squad", "file_registry.sqlite3"
+)
+
+# Cuota de almacenamiento de la API de archivos de Gemini por proyecto (20 GB)
+DEFAULT_QUOTA_BYTES = 20 * 1024 * 1024 * 1024
+
+# Fracción de la cuota a partir de la cual se borran los archivos sin referencias más antiguos
+QUOTA_HIGH_WATER = 0.8
+
+# Tiempo que se conserva un archivo sin referencias, para que la caché de subidas lo reutilice
+DEFAULT_IDLE_SECONDS = 60 * 60
+
+# Una referencia más antigua que esto se da por abandonada (p. ej., el proceso murió a mitad de ejecución)
+DEFAULT_LEASE_TTL_SECONDS = 6 * 60 * 60
+
+# Intervalo por defecto entre pasadas del recolector
+DEFAULT_GC_INTERVAL_SECONDS = 5 * 60
+
+STATE_ACTIVE = "active"
+STATE_DELETING = "deleting"
+
+# Motivos por los que el recolector borra un archivo
+REASON_EXPIRING = "expiring"
+REASON_IDLE = "idle"
+REASON_QUOTA = "quota"
+
+
+def _to_epoch(value) -> float | None:
+    """Normaliza una fecha de expiración (datetime o ISO 8601) a segundos desde epoch."""
+    if isinstance(value, str):
+        try:
+            value = datetime.datetime.fromisoformat(value)
+        except ValueError:
+            return None
+    if not isinstance(value, datetime.datetime):
+        return None
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return value.timestamp()
+
+
+class FileRegistry:
+    """
+    Registro persistente (SQLite) de los archivos subidos a la API de Gemini:
+    ejecución que lo subió, tamaño, creación, expiración y referencias.
+
+    Cada ejecución del pipeline que usa un archivo toma una referencia
+    (`acquire`) y la suelta al terminar (`release_run`). El recolector
+    reclama con `claim_collectable` los archivos sin referencias vivas que
+    caducan pronto, llevan `idle_seconds` sin usarse o, si la ocupación
+    supera QUOTA_HIGH_WATER de `quota_bytes`, los más antiguos. Reclamar y
+    tomar una referencia son transacciones excluyentes: un archivo reclamado
+    (estado `deleting`) ya no admite referencias, y uno referenciado no se
+    reclama. Es segura entre hilos y entre procesos que compartan el archivo.
+    """
+    def __init__(self, path: str | None = None, quota_bytes: int | None = None, idle_seconds: float | None = None,
+                 lease_ttl_seconds: float = DEFAULT_LEASE_TTL_SECONDS):
+        self.path = path or os.getenv("FILE_REGISTRY_PATH", DEFAULT_FILE_REGISTRY_PATH)
+        self.quota_bytes = quota_bytes if quota_bytes is not None else int(os.getenv("GEMINI_FILES_QUOTA_BYTES", DEFAULT_QUOTA_BYTES))
+        self.idle_seconds = idle_seconds if idle_seconds is not None else float(os.getenv("FILE_GC_IDLE_SECONDS", DEFAULT_IDLE_SECONDS))
+        self.lease_ttl_seconds = lease_ttl_seconds
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        # Transacciones explícitas (BEGIN IMMEDIATE) para excluir a otros procesos al reclamar o referenciar
+        self._conn = sqlite3.connect(self.path, check_same_thread=False, isolation_level=None, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        with self._transaction():
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS remote_files (
+                    name TEXT PRIMARY KEY,
+                    sha256 TEXT,
+                    uri TEXT NOT NULL,
+                    mime_type TEXT NOT NULL,
+                    size_bytes INTEGER NOT NULL,
+                    owner_run TEXT,
+                    created_at REAL NOT NULL,
+                    expires_at REAL,
+                    last_released_at REAL,
+                    state TEXT NOT NULL
+                )
+            """)
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS leases (
+                    name TEXT NOT NULL,
+                    run_id TEXT NOT NULL,
+                    acquired_at REAL NOT NULL,
+                    PRIMARY KEY (name, run_id)
+                )
+            """)
+
+    @contextmanager
+    def _transaction(self):
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            self._conn.execute("COMMIT")
+
+    def acquire(self, name: str, run_id: str | None, sha256: str | None = None, uri: str = "",
+                mime_type: str = "", size_bytes: int = 0, expiration_time=None) -> bool:
+        """
+        Registra el archivo si no se conocía y, si hay `run_id`, toma una
+        referencia en nombre de esa ejecución. Devuelve False si el archivo
+        está reclamado para borrarse: el llamador debe subirlo de nuevo.
+        """
+        now = time.time()
+        with self._transaction():
+            row = self._conn.execute("SELECT state FROM remote_files WHERE name = ?", (name,)).fetchone()
+            if row and row[0] == STATE_DELETING:
+                return False
+            if row is None:
+                self._conn.execute(
+                    "INSERT INTO remote_files (name, sha256, uri, mime_type, size_bytes, owner_run, created_at, "
+                    "expires_at, last_released_at, state) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    (name, sha256, uri, mime_type, size_bytes, run_id, now, _to_epoch(expiration_time), now,
+                     STATE_ACTIVE),
+                )
+            if run_id:
+                self._conn.execute(
+                    "INSERT OR REPLACE INTO leases (name, run_id, acquired_at) VALUES (?, ?, ?)", (name, run_id, now)
+                )
+            return True
+
+    def release_run(self, run_id: str) -> int:
+        """Suelta todas las referencias de una ejecución; devuelve cuántas tenía."""
+        now = time.time()
+        with self._transaction():
+            names = [row[0] for row in self._conn.execute("SELECT name FROM leases WHERE run_id = ?", (run_id,))]
+            self._conn.execute("DELETE FROM leases WHERE run_id = ?", (run_id,))
+            self._conn.executemany(
+                "UPDATE remote_files SET last_released_at = ? WHERE name = ?", [(now, name) for name in names]
+            )
+            return len(names)
+
+    def claim_collectable(self, now: float | None = None) -> list[dict]:
+        """
+        Marca como `deleting` y devuelve (con su motivo) los archivos sin
+        referencias vivas que deben borrarse.
+        """
+        now = time.time() if now is None else now
+        margin = EXPIRY_MARGIN.total_seconds()
+        with self._transaction():
+            self._conn.execute("DELETE FROM leases WHERE acquired_at < ?", (now - self.lease_ttl_seconds,))
+            rows = self._conn.execute(
+                "SELECT name, sha256, size_bytes, expires_at, last_released_at FROM remote_files "
+                "WHERE state = ? AND name NOT IN (SELECT name FROM leases) ORDER BY created_at ASC",
+                (STATE_ACTIVE,),
+            ).fetchall()
+            total = self._conn.execute(
+                "SELECT COALESCE(SUM(size_bytes), 0) FROM remote_files WHERE state = ?", (STATE_ACTIVE,)
+            ).fetchone()[0]
+
+            claimed = []
+            for name, sha256, size_bytes, expires_at, last_released_at in rows:
+                if expires_at is not None and expires_at - margin <= now:
+                    reason = REASON_EXPIRING
+                elif last_released_at + self.idle_seconds <= now:
+                    reason = REASON_IDLE
+                elif total > self.quota_bytes * QUOTA_HIGH_WATER:
+                    reason = REASON_QUOTA
+                else:
+                    continue
+                total -= size_bytes
+                claimed.append({"name": name, "sha256": sha256, "size_bytes": size_bytes, "reason": reason})
+            self._conn.executemany(
+                "UPDATE remote_files SET state = ? WHERE name = ?",
+                [(STATE_DELETING, file["name"]) for file in claimed],
+            )
+            return claimed
+
+    def forget(self, name: str):
+        """Elimina del registro un archivo ya borrado en Gemini."""
+        with self._transaction():
+            self._conn.execute("DELETE FROM remote_files WHERE name = ?", (name,))
+            self._conn.execute("DELETE FROM leases WHERE name = ?", (name,))
+
+    def restore(self, name: str):
+        """Devuelve a `active` un archivo reclamado cuyo borrado falló."""
+        with self._transaction():
+            self._conn.execute("UPDATE remote_files SET state = ? WHERE name = ?", (STATE_ACTIVE, name))
+
+    def usage(self) -> dict:
+        """Archivos, bytes, referencias y ocupación de la cuota."""
+        with self._lock:
+            files, total_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM remote_files"
+            ).fetchone()
+            referenced = self._conn.execute("SELECT COUNT(DISTINCT name) FROM leases").fetchone()[0]
+            deleting = self._conn.execute(
+                "SELECT COUNT(*) FROM remote_files WHERE state = ?", (STATE_DELETING,)
+            ).fetchone()[0]
+        return {
+            "files": files,
+            "bytes": total_bytes,
+            "referenced_files": referenced,
+            "deleting_files": deleting,
+            "quota_bytes": self.quota_bytes,
+            "quota_used": total_bytes / self.quota_bytes if self.quota_bytes else 0.0,
+        }
+
+
+class FileCollector:
+    """
+    Recolector en segundo plano: cada `interval` segundos reclama en el
+    registro los archivos que sobran y los borra de Gemini (con el limitador
+    compartido). Un 404 cuenta como borrado; ante otros errores el archivo
+    vuelve a `active` y se reintenta en la siguiente pasada.
+    """
+    def __init__(self, registry: FileRegistry, file_service=genai, interval: float = DEFAULT_GC_INTERVAL_SECONDS):
+        self.registry = registry
+        self.file_service = file_service
+        self.interval = interval
+        self._task: asyncio.Task | None = None
+
+    async def collect_once(self) -> list[dict]:
+        """Hace una pasada y devuelve los archivos borrados."""
+        deleted = []
+        for file in self.registry.claim_collectable():
+            try:
+                await get_rate_limiter().call(FILES_DELETE, asyncio.to_thread, self.file_service.delete_file,
+                                              file["name"])
+            except Exception as e:
+                if status_code(e) != 404:
+                    print(f"[Recolector de archivos] No se pudo borrar {file['name']}: {str(e)}")
+                    self.registry.restore(file["name"])
+                    continue
+            self.registry.forget(file["name"])
+            if file["sha256"]:
+                get_upload_cache().invalidate(file["sha256"], name=file["name"])
+            get_metrics().increment("remote_files_deleted_total", reason=file["reason"])
+            print(f"[Recolector de archivos] Borrado {file['name']} ({file['reason']}, {file['size_bytes']} bytes)")
+            deleted.append(file)
+        return deleted
+
+    async def _run(self):
+        while True:
+            try:
+                await self.collect_once()
+            except Exception as e:
+                print(f"[Recolector de archivos] Error en la pasada: {str(e)}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+
+def create_file_collector() -> FileCollector | None:
+    """Recolector con la configuración del entorno; FILE_GC=0 lo desactiva (FILE_GC_INTERVAL, en segundos)."""
+    if os.getenv("FILE_GC", "1").lower() in ("0", "false", "no"):
+        return None
+    return FileCollector(get_file_registry(), interval=float(os.getenv("FILE_GC_INTERVAL", DEFAULT_GC_INTERVAL_SECONDS)))
+
+
+_file_registry: FileRegistry | None = None
+_file_registry_lock = threading.Lock()
+
+
+def get_file_registry() -> FileRegistry:
+    """Devuelve la instancia compartida del registro de archivos remotos."""
+    global _file_registry
+    with _file_registry_lock:
+        if _file_registry is None:
+            _file_registry = FileRegistry()
+        return _file_registry
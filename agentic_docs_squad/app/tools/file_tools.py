@@ -1,82 +1,203 @@
 import os
-import time
+import asyncio
+import datetime
+from dataclasses import dataclass
 import magic
 import google.generativeai as genai
 
-# Diccionario de tipos MIME soportados para evitar suposiciones
-SUPPORTED_MIME_TYPES = {
-    ".pdf": "application/pdf",
-    ".txt": "text/plain",
-    ".py": "text/x-python",
-    ".md": "text/markdown",
-    ".csv": "text/csv",
-    ".tsv": "text/tab-separated-values",
-    ".json": "application/json",
-    ".html": "text/html",
-    ".css": "text/css",
-    ".js": "application/javascript",
-    # Formatos de audio
-    ".mp3": "audio/mpeg",
-    ".wav": "audio/wav",
-    ".ogg": "audio/ogg",
-    ".flac": "audio/flac",
-    ".m4a": "audio/mp4",
-    # Formatos de video
-    ".mp4": "video/mp4",
-    ".mov": "video/quicktime",
-    ".avi": "video/x-msvideo",
-    ".mkv": "video/x-matroska",
-    ".webm": "video/webm",
-    # Formatos de imagen
-    ".jpeg": "image/jpeg",
-    ".jpg": "image/jpeg",
-    ".png": "image/png",
-    ".gif": "image/gif",
-    ".bmp": "image/bmp",
-    ".svg": "image/svg+xml",
-}
-
-def ingest_multimedia_tool(file_path: str) -> str:
+from app.tools.file_poller import (
+    BackoffPolicy, FileProcessingTimeout, STATE_ACTIVE, STATE_FAILED, wait_until_processed,
+)
+from app.tools.audio_preprocess import TimestampMap
+from app.tools.inline_text import InlineText
+from app.tools.keyframes import KeyframeResult
+from app.tools.upload_cache import get_upload_cache, hash_file
+from app.tools.file_registry import get_file_registry
+from app.tools.preflight import EXTENSION_MIME_TYPES, PreflightError, PreflightResult, preflight
+from app.telemetry import current_trace, span
+from app.rate_limit import FILES_GET, FILES_UPLOAD, get_rate_limiter
+
+@dataclass
+class IngestedFile:
     """
-    Sube un archivo a la API de Gemini, con detección de tipo MIME, 
-    y espera a que esté listo.
-    Retorna el URI del archivo o un mensaje de error.
+    Referencia estructurada a un archivo ya procesado por la API de Gemini.
+    Si el video se redujo a fotogramas clave locales, `keyframes` los contiene
+    y `uri` queda vacío (no hay archivo remoto). Si se subió una versión
+    recortada del audio, `timestamp_map` traduce sus tiempos a los del
+    original. `preprocessed` resume el preprocesado local (tamaños, ahorro)
+    y `preflight`, el tipo real y los metadatos leídos de la cabecera. Si
+    un texto se leyó en local para enviarlo en línea, `text` contiene sus
+    fragmentos y tampoco hay archivo remoto.
+    """
+    uri: str
+    mime_type: str
+    name: str
+    sha256: str | None = None
+    duration_seconds: float | None = None
+    keyframes: KeyframeResult | None = None
+    timestamp_map: TimestampMap | None = None
+    preprocessed: dict | None = None
+    preflight: PreflightResult | None = None
+    text: InlineText | None = None
+
+
+class IngestError(Exception):
+    """Error durante la ingesta. El mensaje mantiene el formato 'ERROR: ...' de la herramienta."""
+
+
+def media_duration_seconds(remote_file) -> float | None:
+    """Duración de un video según los metadatos de Gemini (None si no se conoce)."""
+    video_metadata = getattr(remote_file, "video_metadata", None)
+    duration = getattr(video_metadata, "video_duration", None)
+    if isinstance(duration, datetime.timedelta):
+        duration = duration.total_seconds()
+    if not isinstance(duration, (int, float)) or duration <= 0:
+        return None
+    return float(duration)
+
+
+def _magic_mime_type(file_path: str) -> str | None:
+    """Plan B para archivos sin firma conocida: python-magic."""
+    try:
+        mime_type = magic.from_file(file_path, mime=True)
+        print(f"[Herramienta de Ingesta] Tipo MIME detectado con python-magic: {mime_type}")
+        return mime_type
+    except Exception as e:
+        print(f"[Herramienta de Ingesta] python-magic no pudo detectar el tipo: {str(e)}")
+        return None
+
+
+def check_file(file_path: str, content_hash: str | None = None) -> PreflightResult:
+    """
+    Comprobación previa de un archivo local, sin red: tipo real por su firma
+    y metadatos de la cabecera (ver app/tools/preflight.py), memorizada por
+    hash de contenido. Lanza IngestError si el archivo está vacío, truncado
+    o no es de un tipo admitido.
+    """
+    try:
+        return preflight(file_path, content_hash, fallback=_magic_mime_type)
+    except PreflightError as e:
+        raise IngestError(f"ERROR: {str(e)}")
+
+
+def detect_mime_type(file_path: str) -> str:
+    """
+    Tipo MIME real de un archivo según la comprobación previa, o según su
+    extensión si no está en local (p. ej., ya lo subió el IngestAgent).
     """
     if not os.path.exists(file_path):
-        return f"ERROR: El archivo {file_path} no existe en el sistema local."
-
-    # 1. Detección del tipo MIME
-    file_extension = os.path.splitext(file_path)[1].lower()
-    mime_type = SUPPORTED_MIME_TYPES.get(file_extension)
-
-    if not mime_type:
-        try:
-            # Plan B: usar python-magic si el tipo no está en nuestro diccionario
-            mime_type = magic.from_file(file_path, mime=True)
-            print(f"[Herramienta de Ingesta] Tipo MIME detectado con python-magic: {mime_type}")
-        except Exception as e:
-            return f"ERROR: Tipo de archivo no soportado y no se pudo detectar con 'magic': {str(e)}"
-
-    print(f"[Herramienta de Ingesta] Subiendo {file_path} (Tipo: {mime_type})...")
-    
+        return EXTENSION_MIME_TYPES.get(os.path.splitext(file_path)[1].lower(), "application/octet-stream")
+    return check_file(file_path).mime_type
+
+
+async def ingest_file(file_path: str, policy: BackoffPolicy | None = None, file_service=genai,
+                      content_hash: str | None = None, run_id: str | None = None) -> IngestedFile:
+    """
+    Sube un archivo a la API de Gemini, con detección de tipo MIME,
+    y espera a que esté listo sin bloquear el event loop.
+
+    `policy` controla el sondeo del estado (backoff exponencial con jitter y
+    plazo máximo). `file_service` expone `upload_file` y `get_file` (por
+    defecto el módulo `google.generativeai`; en las pruebas, un doble local).
+    Si el llamador ya conoce el SHA-256 del contenido, `content_hash` evita
+    volver a leer el archivo para calcularlo. Las llamadas a Gemini pasan por
+    el limitador compartido (cuota y reintentos ante 429/5xx). El archivo
+    remoto queda en el registro de archivos con una referencia de la
+    ejecución `run_id` (por defecto, la de la traza en curso), que se suelta
+    al terminar el pipeline con `release_run`.
+    Retorna un IngestedFile o lanza IngestError. Cancelar la tarea interrumpe
+    la espera y propaga asyncio.CancelledError.
+    """
+    if not os.path.exists(file_path):
+        raise IngestError(f"ERROR: El archivo {file_path} no existe en el sistema local.")
+
+    # 1. Comprobación previa: tipo real y archivos vacíos o truncados, antes de cualquier llamada a la red
+    # (lee el archivo y puede recurrir a python-magic: fuera del event loop)
+    checked = await asyncio.to_thread(check_file, file_path, content_hash)
+    mime_type = checked.mime_type
+    print(f"[Herramienta de Ingesta] Comprobación previa: {checked.describe()} "
+          f"(leídos {checked.bytes_read} de {checked.size_bytes} bytes)")
+
     try:
-        # 2. Subida del archivo con el tipo MIME explícito
-        file_upload = genai.upload_file(path=file_path, mime_type=mime_type)
-        
-        # 3. Espera activa del procesamiento
-        while file_upload.state.name == "PROCESSING":
-            print("[Herramienta de Ingesta] Procesando...", end=".", flush=True)
-            time.sleep(10)
-            file_upload = genai.get_file(file_upload.name)
-
-        # 4. Verificación del estado final
-        if file_upload.state.name == "FAILED":
-            print("\\n[Herramienta de Ingesta] Falló el procesamiento del archivo.")
-            return "ERROR: Falló el procesamiento en Gemini."
-
-        print(f"\\n[Herramienta de Ingesta] Archivo listo: {file_upload.uri}")
-        return file_upload.uri
+        # 2. Consulta de la caché de subidas por hash de contenido
+        upload_cache = get_upload_cache()
+        file_registry = get_file_registry()
+        rate_limiter = get_rate_limiter()
+        if run_id is None:
+            trace = current_trace()
+            run_id = trace.run_id if trace else None
+        size_bytes = checked.size_bytes
+        if content_hash is None:
+            content_hash = await asyncio.to_thread(hash_file, file_path)
+        cached = upload_cache.get(content_hash)
+        if cached:
+            try:
+                # Comprobación ligera de que el archivo remoto sigue vivo
+                remote_file = await rate_limiter.call(FILES_GET, asyncio.to_thread, file_service.get_file,
+                                                      cached["name"])
+                # Si el recolector ya lo reclamó para borrarlo, se vuelve a subir
+                if remote_file.state.name == STATE_ACTIVE and file_registry.acquire(
+                    cached["name"], run_id, content_hash, cached["uri"], cached["mime_type"], size_bytes,
+                    cached.get("expiration_time"),
+                ):
+                    print(f"[Herramienta de Ingesta] Archivo ya subido (caché): {remote_file.uri}")
+                    return IngestedFile(remote_file.uri, cached["mime_type"], remote_file.name, content_hash,
+                                        media_duration_seconds(remote_file) or checked.duration_seconds,
+                                        preflight=checked)
+            except Exception as e:
+                print(f"[Herramienta de Ingesta] Entrada de caché no válida ({cached['name']}): {str(e)}")
+            upload_cache.invalidate(content_hash)
+
+        print(f"[Herramienta de Ingesta] Subiendo {file_path} (Tipo: {mime_type})...")
+
+        # 3. Subida del archivo con el tipo MIME explícito
+        with span("upload", bytes=size_bytes, mime_type=mime_type):
+            file_upload = await rate_limiter.call(FILES_UPLOAD, asyncio.to_thread, file_service.upload_file,
+                                                  path=file_path, mime_type=mime_type)
+        # Se registra antes de esperar al procesamiento para que, si falla, el recolector lo borre
+        file_registry.acquire(file_upload.name, run_id, content_hash, file_upload.uri, mime_type, size_bytes,
+                              getattr(file_upload, "expiration_time", None))
+
+        # 4. Espera no bloqueante del procesamiento
+        with span("processing_wait"):
+            file_upload = await wait_until_processed(
+                file_service, file_upload, policy,
+                on_poll=lambda f: print(f"[Herramienta de Ingesta] Estado de {f.name}: {f.state.name}"),
+            )
 
+        # 5. Verificación del estado final
+        if file_upload.state.name == STATE_FAILED:
+            print("[Herramienta de Ingesta] Falló el procesamiento del archivo.")
+            raise IngestError("ERROR: Falló el procesamiento en Gemini.")
+
+        upload_cache.put(
+            content_hash,
+            name=file_upload.name,
+            uri=file_upload.uri,
+            mime_type=mime_type,
+            expiration_time=file_upload.expiration_time,
+        )
+        print(f"[Herramienta de Ingesta] Archivo listo: {file_upload.uri}")
+        return IngestedFile(file_upload.uri, mime_type, file_upload.name, content_hash,
+                            media_duration_seconds(file_upload) or checked.duration_seconds, preflight=checked)
+
+    except IngestError:
+        raise
+    except FileProcessingTimeout as e:
+        print(f"[Herramienta de Ingesta] {str(e)}")
+        raise IngestError(f"ERROR: {str(e)}")
     except Exception as e:
-        print(f"\\n[Herramienta de Ingesta] ERROR CRÍTICO: {str(e)}")
-        return f"ERROR CRÍTICO: {str(e)}"
+        print(f"[Herramienta de Ingesta] ERROR CRÍTICO: {str(e)}")
+        raise IngestError(f"ERROR CRÍTICO: {str(e)}")
+
+
+async def ingest_multimedia_tool(file_path: str) -> str:
+    """
+    Sube un archivo a la API de Gemini, con detección de tipo MIME, 
+    y espera a que esté listo.
+    Retorna el URI del archivo o un mensaje de error.
+    """
+    try:
+        return (await ingest_file(file_path)).uri
+    except IngestError as e:
+        return str(e)
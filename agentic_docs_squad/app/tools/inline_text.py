@@ -0,0 +1,173 @@
+import os
+import re
+from dataclasses import dataclass, field
+
+# Caracteres por token con los que se estima el tamaño de un texto (la misma regla que el limitador de llamadas)
+CHARS_PER_TOKEN = 4
+
+# Viñetas y numeración que se eliminan al fusionar los hechos de varios fragmentos
+BULLET_PATTERN = re.compile(r'^\s*(?:[-*•]|\d+[.)])\s*')
+
+
+@dataclass
+class InlineTextPolicy:
+    """
+    Configuración del envío en línea de textos y código fuente.
+
+    Los archivos de texto (según la comprobación previa) de hasta
+    `max_file_bytes` se leen en local y se envían al AnalystAgent como partes
+    de texto, sin subirlos a Gemini. Si el contenido supera `chunk_tokens`, se
+    divide por líneas en fragmentos de como mucho ese tamaño, que repiten las
+    últimas `overlap_lines` líneas del anterior y se analizan como máximo
+    `max_concurrency` a la vez.
+    """
+    chunk_tokens: int = 200_000
+    overlap_lines: int = 20
+    max_concurrency: int = 4
+    max_file_bytes: int = 20 * 1024 * 1024
+
+    def applies_to(self, is_text: bool, size_bytes: int) -> bool:
+        return is_text and size_bytes <= self.max_file_bytes
+
+
+@dataclass
+class TextChunk:
+    """Fragmento del archivo entre las líneas `start_line` y `end_line` (desde 1, ambas incluidas)."""
+    index: int
+    start_line: int
+    end_line: int
+    text: str
+
+    @property
+    def tokens(self) -> int:
+        return len(self.text) // CHARS_PER_TOKEN
+
+
+@dataclass
+class InlineText:
+    """Contenido de un archivo de texto leído en local, dividido en fragmentos."""
+    chunks: list[TextChunk] = field(default_factory=list)
+    source_bytes: int = 0
+    total_lines: int = 0
+    encoding: str = "utf-8"
+
+    @property
+    def tokens(self) -> int:
+        return sum(chunk.tokens for chunk in self.chunks)
+
+
+class InlineTextError(Exception):
+    """No se pudo leer el archivo de texto en local."""
+
+
+def plan_chunks(text: str, chunk_tokens: int, overlap_lines: int = 0) -> list[TextChunk]:
+    """
+    Divide el texto en fragmentos de como mucho `chunk_tokens` (estimados)
+    sin partir líneas, salvo las que por sí solas superan ese tamaño. Cada
+    fragmento repite hasta `overlap_lines` líneas del final del anterior (las
+    que quepan junto a la primera línea nueva).
+    """
+    max_chars = max(1, chunk_tokens * CHARS_PER_TOKEN)
+    pieces = []  # (número de línea, texto)
+    for number, line in enumerate(text.splitlines(keepends=True), start=1):
+        for offset in range(0, len(line), max_chars):
+            pieces.append((number, line[offset:offset + max_chars]))
+
+    chunks = []
+    start = 0
+    while start < len(pieces):
+        end, size = start, 0
+        while end < len(pieces) and size + len(pieces[end][1]) <= max_chars:
+            size += len(pieces[end][1])
+            end += 1
+        chunks.append(TextChunk(
+            index=len(chunks),
+            start_line=pieces[start][0],
+            end_line=pieces[end - 1][0],
+            text="".join(piece for _, piece in pieces[start:end]),
+        ))
+        if end >= len(pieces):
+            break
+        # Se repiten hasta `overlap_lines` del final, siempre que quepan junto a la siguiente línea
+        overlap, size = 0, len(pieces[end][1])
+        while overlap < overlap_lines and size + len(pieces[end - overlap - 1][1]) <= max_chars:
+            overlap += 1
+            size += len(pieces[end - overlap][1])
+        start = end - overlap
+    return chunks
+
+
+def load_inline_text(file_path: str, policy: InlineTextPolicy) -> InlineText:
+    """
+    Lee un archivo de texto (UTF-8, con o sin BOM; si no lo es, Latin-1) y lo
+    divide en fragmentos según `policy`. Lanza InlineTextError si no se puede
+    leer, supera el tamaño máximo o no tiene contenido.
+    """
+    try:
+        source_bytes = os.path.getsize(file_path)
+        if source_bytes > policy.max_file_bytes:
+            raise InlineTextError(f"ocupa {source_bytes} bytes (máximo {policy.max_file_bytes})")
+        with open(file_path, "rb") as f:
+            data = f.read()
+    except OSError as e:
+        raise InlineTextError(str(e))
+
+    try:
+        text, encoding = data.decode("utf-8-sig"), "utf-8"
+    except UnicodeDecodeError:
+        text, encoding = data.decode("latin-1"), "latin-1"
+    if not text.strip():
+        raise InlineTextError("el archivo no tiene contenido")
+
+    return InlineText(
+        chunks=plan_chunks(text, policy.chunk_tokens, policy.overlap_lines),
+        source_bytes=source_bytes,
+        total_lines=len(text.splitlines()),
+        encoding=encoding,
+    )
+
+
+def chunk_prompt(chunk: TextChunk, total_chunks: int, total_lines: int, user_context: str = "") -> str:
+    return f"""
+    Analiza SOLO el fragmento adjunto del archivo de texto (líneas {chunk.start_line}-{chunk.end_line}
+    de {total_lines}, fragmento {chunk.index + 1} de {total_chunks}) y extrae los hechos técnicos
+    clave de ese fragmento. Los fragmentos contiguos comparten algunas líneas.
+    Contexto proporcionado por el usuario: '{user_context}'
+    """
+
+
+def chunk_header(chunk: TextChunk, file_name: str) -> str:
+    return f"--- {file_name} (líneas {chunk.start_line}-{chunk.end_line}) ---\n"
+
+
+def _normalize(text: str) -> str:
+    return " ".join(re.sub(r"[^\w\s]", " ", text.casefold()).split())
+
+
+def merge_text_facts(responses: list[str]) -> str:
+    """
+    Une las listas de hechos de varios fragmentos en su orden, descartando
+    los hechos repetidos (típicos de las líneas compartidas entre
+    fragmentos). Los bloques de código se copian tal cual.
+    """
+    seen = set()
+    lines = []
+    for response in responses:
+        in_code = False
+        for line in response.splitlines():
+            if line.strip().startswith("```"):
+                in_code = not in_code
+                lines.append(line)
+                continue
+            if in_code:
+                lines.append(line)
+                continue
+            line = BULLET_PATTERN.sub("", line.strip(), count=1).strip()
+            if not line or line.startswith("#"):
+                continue
+            normalized = _normalize(line) or line
+            if normalized in seen:
+                continue
+            seen.add(normalized)
+            lines.append(f"- {line}")
+    return "\n".join(lines)
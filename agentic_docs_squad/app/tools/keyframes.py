@@ -0,0 +1,145 @@
+import os
+from dataclasses import dataclass, field
+import numpy as np
+
+try:
+    import cv2
+except ImportError:  # Dependencia opcional (opencv-python-headless)
+    cv2 = None
+
+# Tamaño de la miniatura en escala de grises con la que se comparan los fotogramas
+THUMBNAIL_SIZE = (64, 36)
+
+
+@dataclass
+class KeyframePolicy:
+    """
+    Configuración de la extracción local de fotogramas clave.
+
+    Se toma una muestra cada `1 / sample_fps` segundos y se conserva como
+    fotograma clave si su diferencia media con el último conservado supera
+    `threshold` (0-1). Como máximo se conservan `max_frames`, reescalados a
+    `max_width` píxeles de ancho y comprimidos en JPEG con `jpeg_quality`.
+    Si los fotogramas ocupan más de `max_inline_bytes`, se sube el video.
+    """
+    threshold: float = 0.08
+    sample_fps: float = 1.0
+    max_frames: int = 120
+    max_width: int = 1280
+    jpeg_quality: int = 80
+    max_inline_bytes: int = 15 * 1024 * 1024
+
+
+@dataclass
+class Keyframe:
+    """Fotograma clave en JPEG con su instante en el video (en segundos)."""
+    seconds: float
+    data: bytes
+
+
+@dataclass
+class KeyframeResult:
+    """Fotogramas clave extraídos y tamaño del video original frente al de los fotogramas."""
+    frames: list[Keyframe] = field(default_factory=list)
+    source_bytes: int = 0
+    duration_seconds: float = 0.0
+    sampled_frames: int = 0
+
+    @property
+    def output_bytes(self) -> int:
+        return sum(len(frame.data) for frame in self.frames)
+
+    @property
+    def compression_ratio(self) -> float:
+        """Cuántas veces más pequeño es el conjunto de fotogramas que el video original."""
+        return self.source_bytes / self.output_bytes if self.output_bytes else 0.0
+
+
+class KeyframeExtractionError(Exception):
+    """No se pudieron extraer fotogramas clave del video."""
+
+
+def keyframes_available() -> bool:
+    return cv2 is not None
+
+
+def frame_difference(a: np.ndarray, b: np.ndarray) -> float:
+    """Diferencia media absoluta (0-1) entre dos miniaturas en escala de grises."""
+    return float(np.mean(np.abs(a.astype(np.int16) - b.astype(np.int16)))) / 255.0
+
+
+def select_keyframes(thumbnails: list[np.ndarray], threshold: float, max_frames: int) -> list[int]:
+    """
+    Índices de las muestras que inician una escena nueva: la primera siempre,
+    y cada una cuya diferencia con el último fotograma conservado supera el
+    umbral. Si hay más de `max_frames`, se conserva un subconjunto repartido
+    uniformemente (incluidos el primero y el último).
+    """
+    selected = []
+    last = None
+    for index, thumbnail in enumerate(thumbnails):
+        if last is None or frame_difference(thumbnail, last) > threshold:
+            selected.append(index)
+            last = thumbnail
+    if len(selected) > max_frames:
+        positions = np.linspace(0, len(selected) - 1, max_frames).round().astype(int)
+        selected = [selected[i] for i in sorted(set(positions.tolist()))]
+    return selected
+
+
+def extract_keyframes(video_path: str, policy: KeyframePolicy | None = None) -> KeyframeResult:
+    """
+    Detecta cambios de escena en el video y devuelve solo los fotogramas
+    distintos (JPEG en memoria) con sus marcas de tiempo. Requiere OpenCV.
+    """
+    if cv2 is None:
+        raise KeyframeExtractionError("OpenCV (cv2) no está instalado.")
+    policy = policy or KeyframePolicy()
+
+    capture = cv2.VideoCapture(video_path)
+    if not capture.isOpened():
+        raise KeyframeExtractionError(f"No se pudo abrir el video {video_path}.")
+    try:
+        fps = capture.get(cv2.CAP_PROP_FPS) or 25.0
+        total_frames = int(capture.get(cv2.CAP_PROP_FRAME_COUNT))
+        step = max(1, round(fps / policy.sample_fps))
+
+        # Primera pasada: miniaturas de las muestras (solo se decodifica lo necesario)
+        samples, thumbnails = [], []
+        frame_index = 0
+        while True:
+            if not capture.grab():
+                break
+            if frame_index % step == 0:
+                ok, frame = capture.retrieve()
+                if ok:
+                    gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+                    thumbnails.append(cv2.resize(gray, THUMBNAIL_SIZE, interpolation=cv2.INTER_AREA))
+                    samples.append(frame_index)
+            frame_index += 1
+
+        result = KeyframeResult(
+            source_bytes=os.path.getsize(video_path),
+            duration_seconds=(total_frames or frame_index) / fps,
+            sampled_frames=len(samples),
+        )
+
+        # Segunda pasada: se codifican únicamente los fotogramas seleccionados
+        for index in select_keyframes(thumbnails, policy.threshold, policy.max_frames):
+            capture.set(cv2.CAP_PROP_POS_FRAMES, samples[index])
+            ok, frame = capture.read()
+            if not ok:
+                continue
+            height, width = frame.shape[:2]
+            if width > policy.max_width:
+                frame = cv2.resize(frame, (policy.max_width, int(height * policy.max_width / width)),
+                                   interpolation=cv2.INTER_AREA)
+            ok, encoded = cv2.imencode(".jpg", frame, [cv2.IMWRITE_JPEG_QUALITY, policy.jpeg_quality])
+            if ok:
+                result.frames.append(Keyframe(seconds=samples[index] / fps, data=encoded.tobytes()))
+    finally:
+        capture.release()
+
+    if not result.frames:
+        raise KeyframeExtractionError(f"No se obtuvo ningún fotograma de {video_path}.")
+    return result
@@ -0,0 +1,560 @@
+import os
+import re
+import struct
+import threading
+from collections import OrderedDict
+from dataclasses import dataclass, field
+
+# Bytes que se leen del principio y del final del archivo; el resto solo se recorre por cabeceras
+HEADER_BYTES = 64 * 1024
+TAIL_BYTES = 4 * 1024
+
+# Resultados que se memorizan por proceso (por hash de contenido o por ruta, tamaño y fecha)
+MEMO_SIZE = 1024
+
+# Máximo de cajas/elementos que se recorren en un contenedor (evita bucles con archivos malformados)
+MAX_BOXES = 4096
+
+# Tipo MIME por extensión: decide entre formatos de texto, que no tienen firma
+EXTENSION_MIME_TYPES = {
+    ".pdf": "application/pdf",
+    ".txt": "text/plain",
+    ".py": "text/x-python",
+    ".md": "text/markdown",
+    ".csv": "text/csv",
+    ".tsv": "text/tab-separated-values",
+    ".json": "application/json",
+    ".html": "text/html",
+    ".css": "text/css",
+    ".js": "application/javascript",
+    ".mp3": "audio/mpeg",
+    ".wav": "audio/wav",
+    ".ogg": "audio/ogg",
+    ".flac": "audio/flac",
+    ".m4a": "audio/mp4",
+    ".mp4": "video/mp4",
+    ".mov": "video/quicktime",
+    ".avi": "video/x-msvideo",
+    ".mkv": "video/x-matroska",
+    ".webm": "video/webm",
+    ".jpeg": "image/jpeg",
+    ".jpg": "image/jpeg",
+    ".png": "image/png",
+    ".gif": "image/gif",
+    ".bmp": "image/bmp",
+    ".svg": "image/svg+xml",
+}
+
+# Tipos de texto fuera de text/*, y tipos que acepta el pipeline además de text/*, image/*, audio/* y video/*
+TEXT_APPLICATION_TYPES = ("application/json", "application/javascript", "application/xml")
+SUPPORTED_APPLICATION_TYPES = ("application/pdf",) + TEXT_APPLICATION_TYPES
+
+QUICKTIME_TOP_LEVEL_BOXES = (b"moov", b"mdat", b"wide", b"free", b"skip", b"pnot")
+
+# Códigos SOF de JPEG (los que llevan las dimensiones de la imagen)
+JPEG_SOF_MARKERS = {0xC0, 0xC1, 0xC2, 0xC3, 0xC5, 0xC6, 0xC7, 0xC9, 0xCA, 0xCB, 0xCD, 0xCE, 0xCF}
+
+# Kbps por índice de bitrate de MP3 (MPEG-1 y MPEG-2/2.5, capa III) y frecuencias por versión
+MP3_BITRATES = {
+    1: (0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320),
+    2: (0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160),
+}
+MP3_SAMPLE_RATES = {3: (44100, 48000, 32000), 2: (22050, 24000, 16000), 0: (11025, 12000, 8000)}
+
+PDF_PAGES_PATTERN = re.compile(rb"/Type\s*/Pages\b")
+PDF_COUNT_PATTERN = re.compile(rb"/Count\s+(\d+)")
+
+
+class PreflightError(Exception):
+    """El archivo está vacío, truncado, no corresponde a su formato o no es de un tipo admitido."""
+
+
+@dataclass
+class PreflightResult:
+    """
+    Tipo real de un archivo según sus bytes, con los metadatos baratos de
+    obtener (duración, resolución, páginas) y los bytes que hubo que leer.
+    """
+    mime_type: str
+    container: str
+    size_bytes: int
+    codecs: list[str] = field(default_factory=list)
+    duration_seconds: float | None = None
+    width: int | None = None
+    height: int | None = None
+    page_count: int | None = None
+    bytes_read: int = 0
+
+    @property
+    def is_text(self) -> bool:
+        return self.container == "text"
+
+    def describe(self) -> str:
+        details = [self.mime_type]
+        if self.codecs:
+            details.append("/".join(self.codecs))
+        if self.width and self.height:
+            details.append(f"{self.width}x{self.height}")
+        if self.duration_seconds is not None:
+            details.append(f"{self.duration_seconds:.1f} s")
+        if self.page_count is not None:
+            details.append(f"{self.page_count} páginas")
+        return ", ".join(details)
+
+
+def is_text_type(mime_type: str) -> bool:
+    return mime_type.startswith("text/") or mime_type in TEXT_APPLICATION_TYPES
+
+
+def is_supported(mime_type: str) -> bool:
+    return mime_type.startswith(("text/", "image/", "audio/", "video/")) or mime_type in SUPPORTED_APPLICATION_TYPES
+
+
+class _Reader:
+    """Lecturas puntuales de un archivo que cuentan los bytes leídos."""
+    def __init__(self, f, size: int):
+        self.f = f
+        self.size = size
+        self.bytes_read = 0
+
+    def read(self, offset: int, length: int) -> bytes:
+        if offset < 0 or offset >= self.size or length <= 0:
+            return b""
+        self.f.seek(offset)
+        data = self.f.read(min(length, self.size - offset))
+        self.bytes_read += len(data)
+        return data
+
+
+# --- ISO BMFF (MP4, MOV, M4A) ---
+
+def _iter_boxes(reader: _Reader, start: int, end: int):
+    """Cajas (tipo, inicio del contenido, fin) entre `start` y `end`, leyendo solo sus cabeceras."""
+    offset = start
+    for _ in range(MAX_BOXES):
+        if offset + 8 > end:
+            return
+        header = reader.read(offset, 16)
+        if len(header) < 8:
+            raise PreflightError("Archivo truncado: cabecera de caja MP4 incompleta.")
+        size, box_type = struct.unpack(">I4s", header[:8])
+        header_size = 8
+        if size == 1:
+            if len(header) < 16:
+                raise PreflightError("Archivo truncado: cabecera de caja MP4 incompleta.")
+            size = struct.unpack(">Q", header[8:16])[0]
+            header_size = 16
+        elif size == 0:
+            size = end - offset
+        if size < header_size:
+            raise PreflightError(f"Caja MP4 '{box_type.decode('latin-1')}' con tamaño no válido.")
+        if offset + size > end:
+            raise PreflightError(f"Archivo truncado: la caja MP4 '{box_type.decode('latin-1')}' "
+                                 f"termina en el byte {offset + size} y el archivo tiene {end}.")
+        yield box_type, offset + header_size, offset + size
+        offset += size
+
+
+def _child(reader: _Reader, start: int, end: int, box_type: bytes):
+    for child_type, child_start, child_end in _iter_boxes(reader, start, end):
+        if child_type == box_type:
+            return child_start, child_end
+    return None
+
+
+def _sniff_iso_bmff(reader: _Reader, head: bytes, result: PreflightResult):
+    brand = head[8:12] if head[4:8] == b"ftyp" else b""
+    if brand == b"qt  " or not brand:
+        result.mime_type, result.container = "video/quicktime", "mov"
+    elif brand in (b"M4A ", b"M4B ", b"M4P "):
+        result.mime_type, result.container = "audio/mp4", "mp4"
+    elif brand.startswith(b"3g"):
+        result.mime_type, result.container = "video/3gpp", "3gp"
+    else:
+        result.mime_type, result.container = "video/mp4", "mp4"
+
+    # Se recorren todas las cajas de primer nivel: una que pase del final delata un archivo truncado
+    top_level = {box_type: (start, end) for box_type, start, end in _iter_boxes(reader, 0, reader.size)}
+    moov = top_level.get(b"moov")
+    if moov is None:
+        raise PreflightError("Archivo MP4 sin índice ('moov'): está incompleto o dañado.")
+    mvhd = _child(reader, *moov, b"mvhd")
+    if mvhd:
+        payload = reader.read(mvhd[0], 32)
+        if payload[:1] == b"\x01" and len(payload) >= 32:
+            timescale, duration = struct.unpack(">IQ", payload[20:32])
+        elif len(payload) >= 20:
+            timescale, duration = struct.unpack(">II", payload[12:20])
+        else:
+            timescale, duration = 0, 0
+        if timescale:
+            result.duration_seconds = duration / timescale
+
+    for box_type, trak_start, trak_end in _iter_boxes(reader, *moov):
+        if box_type != b"trak":
+            continue
+        tkhd = _child(reader, trak_start, trak_end, b"tkhd")
+        if tkhd and tkhd[1] - tkhd[0] >= 84 and not result.width:
+            width, height = struct.unpack(">II", reader.read(tkhd[1] - 8, 8))
+            if width >> 16 and height >> 16:
+                result.width, result.height = width >> 16, height >> 16
+        mdia = _child(reader, trak_start, trak_end, b"mdia")
+        minf = mdia and _child(reader, *mdia, b"minf")
+        stbl = minf and _child(reader, *minf, b"stbl")
+        stsd = stbl and _child(reader, *stbl, b"stsd")
+        if stsd:
+            entry = reader.read(stsd[0] + 8, 8)
+            if len(entry) == 8:
+                codec = entry[4:8].decode("latin-1").strip()
+                if codec and codec not in result.codecs:
+                    result.codecs.append(codec)
+
+
+# --- Matroska / WebM (EBML) ---
+
+def _read_vint(data: bytes, pos: int, keep_marker: bool) -> tuple[int | None, int]:
+    first = data[pos]
+    length = 1
+    while length <= 8 and not first & (0x80 >> (length - 1)):
+        length += 1
+    if length > 8 or pos + length > len(data):
+        raise IndexError
+    value = first if keep_marker else first & (0xFF >> length)
+    for byte in data[pos + 1:pos + length]:
+        value = (value << 8) | byte
+    if not keep_marker and value == (1 << (7 * length)) - 1:
+        return None, pos + length
+    return value, pos + length
+
+
+# Elementos maestros que se recorren: cabecera EBML, Segment, Info, Tracks, TrackEntry, Video
+EBML_MASTERS = {0x1A45DFA3, 0x18538067, 0x1549A966, 0x1654AE6B, 0xAE, 0xE0}
+
+
+def _sniff_matroska(reader: _Reader, head: bytes, result: PreflightResult):
+    values = {}
+
+    def walk(start: int, end: int, depth: int):
+        pos = start
+        while pos < end and depth < 6:
+            try:
+                element_id, pos = _read_vint(head, pos, keep_marker=True)
+                size, pos = _read_vint(head, pos, keep_marker=False)
+            except IndexError:
+                return
+            if element_id == 0x18538067 and size is not None and pos + size > reader.size:
+                raise PreflightError(f"Archivo truncado: el segmento Matroska necesita {pos + size} bytes "
+                                     f"y el archivo tiene {reader.size}.")
+            element_end = len(head) if size is None else min(pos + size, len(head))
+            if element_id in EBML_MASTERS:
+                walk(pos, element_end, depth + 1)
+            else:
+                data = head[pos:element_end]
+                if element_id == 0x86:
+                    values.setdefault("codecs", []).append(data.decode("latin-1").rstrip("\x00"))
+                elif element_id not in values:
+                    values[element_id] = data
+            if size is None:
+                return
+            pos += size
+
+    walk(0, len(head), 0)
+    doc_type = values.get(0x4282, b"").rstrip(b"\x00")
+    if doc_type == b"webm":
+        result.mime_type, result.container = "video/webm", "webm"
+    else:
+        result.mime_type, result.container = "video/x-matroska", "matroska"
+    result.codecs = values.get("codecs", [])
+    if 0x4489 in values and len(values[0x4489]) in (4, 8):
+        duration = struct.unpack(">f" if len(values[0x4489]) == 4 else ">d", values[0x4489])[0]
+        timecode_scale = int.from_bytes(values.get(0x2AD7B1, b""), "big") or 1_000_000
+        result.duration_seconds = duration * timecode_scale / 1e9
+    if 0xB0 in values and 0xBA in values:
+        result.width = int.from_bytes(values[0xB0], "big")
+        result.height = int.from_bytes(values[0xBA], "big")
+    if result.codecs and all(codec.startswith("A_") for codec in result.codecs):
+        result.mime_type = "audio/webm" if doc_type == b"webm" else "audio/x-matroska"
+
+
+# --- RIFF (WAV, AVI, WebP) ---
+
+def _sniff_riff(reader: _Reader, head: bytes, result: PreflightResult):
+    form = head[8:12]
+    riff_size = struct.unpack("<I", head[4:8])[0]
+    # Las grabaciones en streaming dejan el tamaño a 0 o al máximo: no se puede comprobar
+    if riff_size not in (0, 0xFFFFFFFF) and riff_size + 8 > reader.size:
+        raise PreflightError(f"Archivo truncado: la cabecera RIFF indica {riff_size + 8} bytes "
+                             f"y el archivo tiene {reader.size}.")
+    if form == b"WAVE":
+        result.mime_type, result.container = "audio/wav", "wav"
+        byte_rate = None
+        offset = 12
+        for _ in range(MAX_BOXES):
+            chunk = reader.read(offset, 24)
+            if len(chunk) < 8:
+                break
+            chunk_id, chunk_size = struct.unpack("<4sI", chunk[:8])
+            if chunk_id == b"fmt " and len(chunk) >= 24:
+                format_tag, _, _, byte_rate = struct.unpack("<HHII", chunk[8:20])
+                result.codecs = ["pcm" if format_tag == 1 else f"wav-0x{format_tag:04x}"]
+            elif chunk_id == b"data":
+                available = reader.size - offset - 8
+                if chunk_size in (0, 0xFFFFFFFF):
+                    chunk_size = available
+                elif chunk_size > available:
+                    raise PreflightError(f"Archivo truncado: faltan {chunk_size - available} bytes de audio.")
+                if byte_rate:
+                    result.duration_seconds = chunk_size / byte_rate
+                break
+            offset += 8 + chunk_size + (chunk_size & 1)
+        if byte_rate is None:
+            raise PreflightError("Archivo WAV sin bloque de formato ('fmt ').")
+    elif form == b"AVI ":
+        result.mime_type, result.container = "video/x-msvideo", "avi"
+        index = head.find(b"avih")
+        if index != -1 and len(head) >= index + 48:
+            microseconds_per_frame, = struct.unpack("<I", head[index + 8:index + 12])
+            total_frames, = struct.unpack("<I", head[index + 24:index + 28])
+            result.width, result.height = struct.unpack("<II", head[index + 40:index + 48])
+            result.duration_seconds = total_frames * microseconds_per_frame / 1e6
+    elif form == b"WEBP":
+        result.mime_type, result.container = "image/webp", "webp"
+    else:
+        raise PreflightError(f"Formato RIFF no admitido ('{form.decode('latin-1')}').")
+
+
+# --- Audio comprimido ---
+
+def _sniff_mp3(reader: _Reader, head: bytes, result: PreflightResult):
+    result.mime_type, result.container, result.codecs = "audio/mpeg", "mp3", ["mp3"]
+    audio_start = 0
+    if head.startswith(b"ID3") and len(head) >= 10:
+        tag_size = (head[6] << 21) | (head[7] << 14) | (head[8] << 7) | head[9]
+        audio_start = 10 + tag_size
+    frame = reader.read(audio_start, 4) if audio_start >= len(head) else head[audio_start:audio_start + 4]
+    if len(frame) < 4 or frame[0] != 0xFF or frame[1] & 0xE0 != 0xE0:
+        return
+    version = (frame[1] >> 3) & 0x03
+    bitrate_index, rate_index = frame[2] >> 4, (frame[2] >> 2) & 0x03
+    if version == 1 or rate_index == 3 or bitrate_index in (0, 15):
+        return
+    sample_rate = MP3_SAMPLE_RATES[version][rate_index]
+    samples_per_frame = 1152 if version == 3 else 576
+    first_frame = head[audio_start:audio_start + 64] if audio_start < len(head) else reader.read(audio_start, 64)
+    for marker in (b"Xing", b"Info"):
+        index = first_frame.find(marker)
+        if index != -1 and len(first_frame) >= index + 12 and first_frame[index + 7] & 0x01:
+            frames, = struct.unpack(">I", first_frame[index + 8:index + 12])
+            result.duration_seconds = frames * samples_per_frame / sample_rate
+            return
+    bitrate = MP3_BITRATES[1 if version == 3 else 2][bitrate_index] * 1000
+    result.duration_seconds = (reader.size - audio_start) * 8 / bitrate
+
+
+def _sniff_flac(head: bytes, result: PreflightResult):
+    result.mime_type, result.container, result.codecs = "audio/flac", "flac", ["flac"]
+    if len(head) >= 26:
+        packed, = struct.unpack(">Q", head[18:26])
+        sample_rate = packed >> 44
+        total_samples = packed & 0xFFFFFFFFF
+        if sample_rate and total_samples:
+            result.duration_seconds = total_samples / sample_rate
+
+
+def _sniff_ogg(reader: _Reader, head: bytes, result: PreflightResult):
+    result.mime_type, result.container = "audio/ogg", "ogg"
+    sample_rate = None
+    if b"OpusHead" in head[:128]:
+        result.codecs, sample_rate = ["opus"], 48000
+    elif (index := head.find(b"\x01vorbis")) != -1 and len(head) >= index + 16:
+        result.codecs = ["vorbis"]
+        sample_rate, = struct.unpack("<I", head[index + 12:index + 16])
+    elif b"\x80theora" in head[:128]:
+        result.mime_type, result.codecs = "video/ogg", ["theora"]
+    tail = reader.read(max(0, reader.size - TAIL_BYTES), TAIL_BYTES)
+    last_page = tail.rfind(b"OggS")
+    if sample_rate and last_page != -1 and len(tail) >= last_page + 14:
+        granule, = struct.unpack("<q", tail[last_page + 6:last_page + 14])
+        if granule > 0:
+            result.duration_seconds = granule / sample_rate
+
+
+# --- Imágenes y PDF ---
+
+def _sniff_jpeg(head: bytes, tail: bytes, result: PreflightResult):
+    result.mime_type, result.container = "image/jpeg", "jpeg"
+    if not tail.rstrip(b"\x00").endswith(b"\xff\xd9"):
+        raise PreflightError("Archivo JPEG truncado: falta el marcador de fin de imagen.")
+    pos = 2
+    while pos + 9 <= len(head) and head[pos] == 0xFF:
+        marker = head[pos + 1]
+        if marker == 0xFF:
+            pos += 1
+            continue
+        segment_length, = struct.unpack(">H", head[pos + 2:pos + 4])
+        if marker in JPEG_SOF_MARKERS:
+            result.height, result.width = struct.unpack(">HH", head[pos + 5:pos + 9])
+            return
+        pos += 2 + segment_length
+
+
+def _sniff_pdf(reader: _Reader, head: bytes, tail: bytes, result: PreflightResult):
+    result.mime_type, result.container = "application/pdf", "pdf"
+    if b"%%EOF" not in tail:
+        raise PreflightError("Archivo PDF truncado: falta el marcador '%%EOF'.")
+    counts = []
+    for data in (head, tail):
+        for match in PDF_PAGES_PATTERN.finditer(data):
+            window = data[max(0, match.start() - 200):match.end() + 200]
+            counts.extend(int(count) for count in PDF_COUNT_PATTERN.findall(window))
+    # En PDF con flujos de objetos comprimidos el árbol de páginas no es legible sin descomprimir
+    result.page_count = max(counts) if counts else None
+
+
+def _sniff_text(head: bytes, extension: str, result: PreflightResult) -> bool:
+    if b"\x00" in head:
+        return False
+    control = sum(1 for byte in head if byte < 0x20 and byte not in (0x09, 0x0A, 0x0C, 0x0D))
+    if head and control / len(head) > 0.01:
+        return False
+    mime_type = EXTENSION_MIME_TYPES.get(extension)
+    if mime_type == "image/svg+xml" or (mime_type is None and b"<svg" in head[:1024]):
+        result.mime_type, result.container = "image/svg+xml", "svg"
+        return True
+    if mime_type is not None and not is_text_type(mime_type):
+        # Texto con extensión de un formato binario (p. ej., un .mp4 que no lo es)
+        return False
+    mime_type = mime_type or "text/plain"
+    result.mime_type, result.container = mime_type, "text"
+    return True
+
+
+def sniff_file(file_path: str, fallback=None) -> PreflightResult:
+    """
+    Identifica el tipo real de un archivo por su firma leyendo solo la
+    cabecera (HEADER_BYTES), el final (TAIL_BYTES) y, en los contenedores,
+    las cabeceras de sus cajas o bloques. Extrae duración, resolución,
+    códecs y páginas cuando son baratos de obtener.
+
+    Si no se reconoce ninguna firma, `fallback(file_path)` (p. ej., con
+    python-magic) puede devolver el tipo MIME. Lanza PreflightError si el
+    archivo está vacío o truncado, no corresponde a su extensión o no es de
+    un tipo admitido.
+    """
+    size_bytes = os.path.getsize(file_path)
+    if size_bytes == 0:
+        raise PreflightError(f"El archivo {os.path.basename(file_path)} está vacío.")
+    extension = os.path.splitext(file_path)[1].lower()
+    result = PreflightResult(mime_type="application/octet-stream", container="unknown", size_bytes=size_bytes)
+
+    with open(file_path, "rb") as f:
+        reader = _Reader(f, size_bytes)
+        head = reader.read(0, HEADER_BYTES)
+        tail = reader.read(max(len(head), size_bytes - TAIL_BYTES), TAIL_BYTES)
+        tail = (head + tail)[-TAIL_BYTES:]
+
+        if head.startswith(b"%PDF-"):
+            _sniff_pdf(reader, head, tail, result)
+        elif head.startswith(b"\x89PNG\r\n\x1a\n"):
+            result.mime_type, result.container = "image/png", "png"
+            if len(head) >= 24:
+                result.width, result.height = struct.unpack(">II", head[16:24])
+            if not tail.endswith(b"IEND\xaeB`\x82"):
+                raise PreflightError("Archivo PNG truncado: falta el bloque 'IEND'.")
+        elif head.startswith(b"\xff\xd8\xff"):
+            _sniff_jpeg(head, tail, result)
+        elif head[:6] in (b"GIF87a", b"GIF89a"):
+            result.mime_type, result.container = "image/gif", "gif"
+            result.width, result.height = struct.unpack("<HH", head[6:10])
+            if not tail.endswith(b"\x3b"):
+                raise PreflightError("Archivo GIF truncado: falta el terminador.")
+        elif head.startswith(b"BM") and len(head) >= 26 and struct.unpack("<I", head[14:18])[0] in (12, 40, 52, 56, 108, 124):
+            result.mime_type, result.container = "image/bmp", "bmp"
+            result.width, height = struct.unpack("<ii", head[18:26])
+            result.height = abs(height)
+        elif head[4:8] == b"ftyp" or head[4:8] in QUICKTIME_TOP_LEVEL_BOXES:
+            _sniff_iso_bmff(reader, head, result)
+        elif head.startswith(b"\x1a\x45\xdf\xa3"):
+            _sniff_matroska(reader, head, result)
+        elif head.startswith(b"RIFF") and len(head) >= 12:
+            _sniff_riff(reader, head, result)
+        elif head.startswith(b"OggS"):
+            _sniff_ogg(reader, head, result)
+        elif head.startswith(b"fLaC"):
+            _sniff_flac(head, result)
+        elif head.startswith(b"ID3") or (len(head) >= 2 and head[0] == 0xFF and head[1] & 0xE0 == 0xE0 and head[1] & 0x06):
+            _sniff_mp3(reader, head, result)
+        elif len(head) >= 2 and head[0] == 0xFF and head[1] & 0xF6 == 0xF0:
+            result.mime_type, result.container, result.codecs = "audio/aac", "adts", ["aac"]
+        elif not _sniff_text(head, extension, result):
+            expected = EXTENSION_MIME_TYPES.get(extension)
+            if expected and not is_text_type(expected):
+                raise PreflightError(f"El contenido de {os.path.basename(file_path)} no corresponde a un archivo "
+                                     f"{extension} válido (firma no reconocida).")
+            mime_type = fallback(file_path) if fallback else None
+            if not mime_type:
+                raise PreflightError(f"No se pudo identificar el tipo de {os.path.basename(file_path)}.")
+            result.mime_type = mime_type
+        result.bytes_read = reader.bytes_read
+
+    if not is_supported(result.mime_type):
+        raise PreflightError(f"Tipo de archivo no soportado: {result.mime_type}.")
+    return result
+
+
+class PreflightMemo:
+    """
+    Resultados de `sniff_file` memorizados por hash de contenido (si se
+    conoce) y extensión, y por ruta, tamaño y fecha de modificación. La
+    extensión forma parte de la clave porque decide el tipo de los textos:
+    los mismos bytes como `.txt` o como `.py` dan resultados distintos. Los
+    errores también se memorizan, para no volver a leer un archivo ya
+    rechazado. LRU y segura entre hilos.
+    """
+    def __init__(self, max_entries: int = MEMO_SIZE):
+        self.max_entries = max_entries
+        self._entries: OrderedDict = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _stat_key(file_path: str) -> str:
+        stat = os.stat(file_path)
+        return f"{os.path.realpath(file_path)}:{stat.st_size}:{stat.st_mtime_ns}"
+
+    def check(self, file_path: str, content_hash: str | None = None, fallback=None) -> PreflightResult:
+        keys = [self._stat_key(file_path)]
+        if content_hash:
+            extension = os.path.splitext(file_path)[1].lower()
+            keys.insert(0, f"sha256:{content_hash}:{extension}")
+        with self._lock:
+            for key in keys:
+                if key in self._entries:
+                    self._entries.move_to_end(key)
+                    outcome = self._entries[key]
+                    break
+            else:
+                outcome = None
+        if outcome is None:
+            try:
+                outcome = sniff_file(file_path, fallback)
+            except PreflightError as e:
+                outcome = e
+        with self._lock:
+            for key in keys:
+                self._entries[key] = outcome
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        if isinstance(outcome, PreflightError):
+            raise outcome
+        return outcome
+
+
+_preflight_memo = PreflightMemo()
+
+
+def preflight(file_path: str, content_hash: str | None = None, fallback=None) -> PreflightResult:
+    """Comprobación previa de un archivo (ver sniff_file), memorizada en el proceso."""
+    if not os.path.exists(file_path):
+        raise PreflightError(f"El archivo {file_path} no existe en el sistema local.")
+    return _preflight_memo.check(file_path, content_hash, fallback)
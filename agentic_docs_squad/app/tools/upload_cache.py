@@ -0,0 +1,125 @@
+import os
+import json
+import hashlib
+import datetime
+import threading
+
+# Ubicación por defecto de la caché persistente de subidas
+DEFAULT_UPLOAD_CACHE_PATH = os.path.join(
+    os.path.expanduser("~"), ".cache", "agentic_docs_squad", "upload_cache.json"
+)
+
+# Tamaño de bloque para el hash en streaming (no se carga el archivo entero en memoria)
+HASH_CHUNK_SIZE = 1024 * 1024
+
+# Margen de seguridad: una entrada que caduca en menos de este tiempo se considera caducada
+EXPIRY_MARGIN = datetime.timedelta(minutes=15)
+
+
+def hash_file(file_path: str, chunk_size: int = HASH_CHUNK_SIZE) -> str:
+    """
+    Calcula el SHA-256 del contenido de un archivo leyéndolo por bloques.
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def _to_iso(value) -> str | None:
+    """Normaliza una fecha de expiración (datetime o str) a ISO 8601 en UTC."""
+    if value is None:
+        return None
+    if isinstance(value, str):
+        return value
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=datetime.timezone.utc)
+    return value.astimezone(datetime.timezone.utc).isoformat()
+
+
+class UploadCache:
+    """
+    Caché persistente (archivo JSON) de archivos ya subidos a la API de Gemini.
+
+    La clave es el SHA-256 del contenido del archivo y el valor contiene el
+    nombre remoto (`files/...`), el URI, el tipo MIME y la fecha de expiración
+    en el servidor. Es segura entre hilos dentro de un mismo proceso.
+    """
+    def __init__(self, path: str | None = None):
+        self.path = path or os.getenv("UPLOAD_CACHE_PATH", DEFAULT_UPLOAD_CACHE_PATH)
+        self._lock = threading.Lock()
+        self._entries = self._load()
+
+    def _load(self) -> dict:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+            return data if isinstance(data, dict) else {}
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save(self):
+        # Escritura atómica: primero a un temporal y luego se reemplaza
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._entries, f, indent=2)
+        os.replace(tmp_path, self.path)
+
+    def get(self, sha256: str) -> dict | None:
+        """
+        Devuelve la entrada para el hash dado, o None si no existe o está
+        caducada (o a punto de caducar) en el servidor.
+        """
+        with self._lock:
+            entry = self._entries.get(sha256)
+            if not entry:
+                return None
+
+            expiration = entry.get("expiration_time")
+            if expiration:
+                expires_at = datetime.datetime.fromisoformat(expiration)
+                now = datetime.datetime.now(datetime.timezone.utc)
+                if expires_at - EXPIRY_MARGIN <= now:
+                    self._entries.pop(sha256, None)
+                    self._save()
+                    return None
+            return dict(entry)
+
+    def put(self, sha256: str, name: str, uri: str, mime_type: str, expiration_time=None):
+        """Registra (o actualiza) el archivo remoto asociado a un hash de contenido."""
+        with self._lock:
+            self._entries[sha256] = {
+                "name": name,
+                "uri": uri,
+                "mime_type": mime_type,
+                "expiration_time": _to_iso(expiration_time),
+                "uploaded_at": datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            }
+            self._save()
+
+    def invalidate(self, sha256: str, name: str | None = None):
+        """
+        Elimina una entrada (p. ej., si el archivo remoto ya no existe). Con
+        `name`, solo si la entrada sigue apuntando a ese archivo remoto.
+        """
+        with self._lock:
+            entry = self._entries.get(sha256)
+            if entry is None or (name is not None and entry.get("name") != name):
+                return
+            del self._entries[sha256]
+            self._save()
+
+
+_upload_cache: UploadCache | None = None
+_upload_cache_lock = threading.Lock()
+
+
+def get_upload_cache() -> UploadCache:
+    """Devuelve la instancia compartida de la caché de subidas."""
+    global _upload_cache
+    with _upload_cache_lock:
+        if _upload_cache is None:
+            _upload_cache = UploadCache()
+        return _upload_cache
@@ -0,0 +1,78 @@
+import os
+import re
+import asyncio
+import hashlib
+import tempfile
+from dataclasses import dataclass
+
+# Tamaño máximo por defecto de una subida (límite de la API de archivos de Gemini)
+DEFAULT_MAX_UPLOAD_BYTES = 2 * 1024 * 1024 * 1024
+
+# Tamaño de bloque con el que se reciben y escriben las subidas
+SPOOL_CHUNK_SIZE = 1024 * 1024
+
+# Caracteres permitidos en la extensión que se conserva del nombre del cliente
+SAFE_EXTENSION_PATTERN = re.compile(r'^\.[A-Za-z0-9]{1,10}$')
+
+
+@dataclass
+class SpooledUpload:
+    """Archivo recibido en disco, con su SHA-256 calculado durante la recepción."""
+    path: str
+    sha256: str
+    size_bytes: int
+    filename: str
+
+
+class UploadTooLarge(Exception):
+    """La subida supera el tamaño máximo permitido."""
+
+
+def max_upload_bytes() -> int:
+    return int(os.getenv("MAX_UPLOAD_BYTES", DEFAULT_MAX_UPLOAD_BYTES))
+
+
+def _write_chunk(f, digest, chunk: bytes):
+    digest.update(chunk)
+    f.write(chunk)
+
+
+async def spool_stream(chunks, directory: str, filename: str, max_bytes: int | None = None) -> SpooledUpload:
+    """
+    Escribe en un archivo único de `directory` los bloques de bytes que
+    produce el iterador asíncrono `chunks`, calculando a la vez su SHA-256.
+
+    La escritura y el hash de cada bloque se hacen fuera del event loop. El
+    archivo conserva la extensión de `filename` (la detección del tipo MIME
+    depende de ella), pero nunca su nombre, por lo que subidas simultáneas
+    con el mismo nombre no colisionan. Si se superan `max_bytes`, se borra
+    lo recibido y se lanza UploadTooLarge.
+    """
+    max_bytes = max_upload_bytes() if max_bytes is None else max_bytes
+    extension = os.path.splitext(filename or "")[1]
+    if not SAFE_EXTENSION_PATTERN.match(extension):
+        extension = ""
+
+    os.makedirs(directory, exist_ok=True)
+    fd, path = tempfile.mkstemp(dir=directory, prefix="upload_", suffix=extension.lower())
+    digest = hashlib.sha256()
+    size_bytes = 0
+    try:
+        with os.fdopen(fd, "wb") as f:
+            async for chunk in chunks:
+                if not chunk:
+                    continue
+                size_bytes += len(chunk)
+                if size_bytes > max_bytes:
+                    raise UploadTooLarge(f"El archivo supera el tamaño máximo permitido ({max_bytes} bytes).")
+                await asyncio.to_thread(_write_chunk, f, digest, chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return SpooledUpload(path=path, sha256=digest.hexdigest(), size_bytes=size_bytes, filename=filename)
+
+
+async def iter_upload_file(upload, chunk_size: int = SPOOL_CHUNK_SIZE):
+    """Itera por bloques un UploadFile de FastAPI sin bloquear el event loop."""
+    while chunk := await upload.read(chunk_size):
+        yield chunk
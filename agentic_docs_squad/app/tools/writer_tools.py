@@ -1,4 +1,32 @@
 import os
+from dataclasses import dataclass
+
+# Directorio donde se guardan los documentos generados
+DEFAULT_OUTPUT_DIR = "output"
+
+
+@dataclass
+class SavedDocument:
+    """Confirmación estructurada de un documento guardado en disco."""
+    path: str
+    filename: str
+    size_bytes: int
+
+
+def write_document(filename: str, content: str, output_dir: str = DEFAULT_OUTPUT_DIR) -> SavedDocument:
+    """
+    Escribe el contenido directamente en `output_dir/filename`, sin pasar por
+    ningún LLM. Lanza OSError si no se puede escribir.
+    """
+    os.makedirs(output_dir, exist_ok=True)
+    file_path = os.path.join(output_dir, os.path.basename(filename))
+
+    data = content.encode("utf-8")
+    with open(file_path, "wb") as f:
+        f.write(data)
+
+    return SavedDocument(path=file_path, filename=os.path.basename(file_path), size_bytes=len(data))
+
 
 def save_document_tool(filename: str, content: str) -> str:
     """
@@ -13,16 +41,9 @@ def save_document_tool(filename: str, content: str) -> str:
     """
     try:
         # Para mantener el proyecto ordenado, guardamos los resultados en un directorio 'output'
-        output_dir = "output"
-        if not os.path.exists(output_dir):
-            os.makedirs(output_dir)
-
-        file_path = os.path.join(output_dir, filename)
-        
-        with open(file_path, "w", encoding="utf-8") as f:
-            f.write(content)
+        saved = write_document(filename, content)
             
-        confirmation_message = f"Archivo guardado exitosamente en: {file_path}"
+        confirmation_message = f"Archivo guardado exitosamente en: {saved.path}"
         print(f"[Herramienta de Escritura] {confirmation_message}")
         return confirmation_message
     except Exception as e:
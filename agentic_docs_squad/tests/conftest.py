@@ -0,0 +1,11 @@
+import pytest
+
+from app.tools import file_registry
+
+
+@pytest.fixture(autouse=True)
+def isolated_file_registry(tmp_path_factory, monkeypatch):
+    """Cada prueba usa su propio registro de archivos remotos, fuera de ~/.cache."""
+    registry = file_registry.FileRegistry(str(tmp_path_factory.mktemp("registry") / "file_registry.sqlite3"))
+    monkeypatch.setattr(file_registry, "_file_registry", registry)
+    return registry
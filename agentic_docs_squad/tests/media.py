@@ -0,0 +1,15 @@
+import struct
+
+
+def _box(box_type: bytes, payload: bytes) -> bytes:
+    return struct.pack(">I4s", 8 + len(payload), box_type) + payload
+
+
+def mp4_bytes(duration_seconds: float = 30.0, width: int = 640, height: int = 360, mdat_bytes: int = 1024) -> bytes:
+    """MP4 mínimo pero bien formado (ftyp, moov con una pista de video avc1 y mdat) para las pruebas."""
+    timescale = 1000
+    mvhd = _box(b"mvhd", b"\x00" * 12 + struct.pack(">II", timescale, int(duration_seconds * timescale)) + b"\x00" * 80)
+    tkhd = _box(b"tkhd", b"\x00" * 76 + struct.pack(">II", width << 16, height << 16))
+    stsd = _box(b"stsd", struct.pack(">II", 0, 1) + _box(b"avc1", b"\x00" * 78))
+    trak = _box(b"trak", tkhd + _box(b"mdia", _box(b"minf", _box(b"stbl", stsd))))
+    return _box(b"ftyp", b"isom\x00\x00\x02\x00isomavc1") + _box(b"moov", mvhd + trak) + _box(b"mdat", b"\x00" * mdat_bytes)
@@ -0,0 +1,75 @@
+import os
+import pytest
+from unittest.mock import patch, AsyncMock
+
+from app.config import configure_environment
+from app.orchestrator import Orchestrator
+from app.tools.analysis_cache import AnalysisCache, instruction_hash
+from app.tools.file_tools import IngestedFile
+
+
+@pytest.fixture
+def cache(tmp_path):
+    return AnalysisCache(str(tmp_path / "analysis.sqlite3"))
+
+
+def test_key_covers_context_model_and_instruction(cache):
+    """El contexto se normaliza; cambiar modelo o instrucción produce un fallo."""
+    cache.put("sha", "  Tutorial de   Apache ", "gemini-pro", "v1", "Hechos")
+
+    assert cache.get("sha", "tutorial de apache", "gemini-pro", "v1") == "Hechos"
+    assert cache.get("sha", "tutorial de apache", "gemini-flash", "v1") is None
+    assert cache.get("sha", "tutorial de apache", "gemini-pro", "v2") is None
+    assert cache.get("otro", "tutorial de apache", "gemini-pro", "v1") is None
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"]) == (1, 3)
+
+
+def test_new_instruction_replaces_stale_entries(cache):
+    cache.put("sha", "", "gemini-pro", instruction_hash("prompt viejo"), "Hechos viejos")
+    cache.put("sha", "", "gemini-pro", instruction_hash("prompt nuevo"), "Hechos nuevos")
+
+    assert cache.stats()["entries"] == 1
+    assert cache.get("sha", "", "gemini-pro", instruction_hash("prompt nuevo")) == "Hechos nuevos"
+
+
+def test_size_cap_evicts_least_recently_used(tmp_path):
+    cache = AnalysisCache(str(tmp_path / "analysis.sqlite3"), max_bytes=250)
+    cache.put("a", "", "m", "i", "a" * 100)
+    cache.put("b", "", "m", "i", "b" * 100)
+    cache.get("a", "", "m", "i")  # "a" pasa a ser la más reciente
+    cache.put("c", "", "m", "i", "c" * 100)
+
+    assert cache.get("b", "", "m", "i") is None
+    assert cache.get("a", "", "m", "i") is not None
+    assert cache.stats()["evictions"] == 1
+
+    # Las entradas y estadísticas sobreviven a una recarga
+    reloaded = AnalysisCache(str(tmp_path / "analysis.sqlite3"), max_bytes=250)
+    assert reloaded.get("c", "", "m", "i") == "c" * 100
+
+
+@pytest.mark.asyncio
+async def test_pipeline_skips_ingest_and_analysis_on_hit(cache, tmp_path):
+    """La segunda ejecución con el mismo archivo y contexto pasa directamente a la redacción."""
+    with patch.dict(os.environ, {"GOOGLE_API_KEY": "test-key-1234"}):
+        configure_environment()
+    video = tmp_path / "video.mp4"
+    video.write_bytes(b"fake video")
+    orchestrator = Orchestrator(output_dir=str(tmp_path / "output"), analysis_cache=cache)
+    responses = {orchestrator.analyst_runner: "Hecho 1", orchestrator.writer_runner: "# Documento"}
+    orchestrator._run_agent = AsyncMock(side_effect=lambda runner, parts, on_partial=None: responses[runner])
+    ingested = IngestedFile(uri="https://x/files/abc", mime_type="video/mp4", name="files/abc")
+
+    with patch("app.orchestrator.ingest_file", AsyncMock(return_value=ingested)) as mock_ingest:
+        await orchestrator.run_pipeline(str(video), "Contexto")
+        events = []
+        result = await orchestrator.run_pipeline(str(video), "contexto", on_event=lambda e, d: events.append((e, d)))
+
+    assert result == "# Documento"
+    mock_ingest.assert_awaited_once()
+    called_runners = [call.args[0] for call in orchestrator._run_agent.call_args_list]
+    assert called_runners.count(orchestrator.analyst_runner) == 1
+    assert called_runners.count(orchestrator.writer_runner) == 2
+    skipped = [data["stage"] for event, data in events if event == "stage_skipped"]
+    assert skipped == ["IngestAgent", "AnalystAgent"]
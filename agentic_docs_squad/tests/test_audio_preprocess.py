@@ -0,0 +1,88 @@
+import os
+import wave
+import numpy as np
+import pytest
+from unittest.mock import patch, AsyncMock
+
+from app import orchestrator as orchestrator_module
+from app.config import configure_environment
+from app.orchestrator import Orchestrator
+from app.tools.audio_preprocess import (
+    AudioPolicy, TimestampMap, preprocess_audio, read_wav, resample,
+)
+from app.tools.file_tools import IngestedFile
+
+RATE = 44100
+
+
+def _write_stereo_wav(path, segments):
+    """WAV estéreo de 16 bits: `segments` es una lista de (segundos, hay_voz)."""
+    chunks = []
+    for seconds, voiced in segments:
+        t = np.arange(int(seconds * RATE)) / RATE
+        signal = 0.5 * np.sin(2 * np.pi * 220 * t) if voiced else np.zeros_like(t)
+        chunks.append(signal)
+    mono = np.concatenate(chunks)
+    stereo = (np.stack([mono, mono], axis=1) * 32767).astype("<i2")
+    with wave.open(str(path), "wb") as wav:
+        wav.setnchannels(2)
+        wav.setsampwidth(2)
+        wav.setframerate(RATE)
+        wav.writeframes(stereo.tobytes())
+
+
+def test_preprocess_trims_silence_downmixes_and_maps_timestamps(tmp_path):
+    source = tmp_path / "charla.wav"
+    # 2s voz, 10s silencio, 3s voz, 5s silencio
+    _write_stereo_wav(source, [(2, True), (10, False), (3, True), (5, False)])
+    policy = AudioPolicy(keep_silence_ms=0)
+
+    result = preprocess_audio(str(source), policy, output_dir=str(tmp_path))
+
+    samples, rate = read_wav(result.path)
+    assert rate == 16000 and samples.shape[1] == 1
+    assert result.output_seconds == pytest.approx(5, abs=0.1)
+    assert result.bytes_saved > 0.9 * result.source_bytes
+    # El segundo tramo de voz empieza a los ~2s del audio recortado y a los 12s del original
+    assert result.timestamp_map.to_source(3.0) == pytest.approx(13.0, abs=0.1)
+    assert result.timestamp_map.remap_text("- [00:00:03] Se reinicia nginx") == "- [00:00:13] Se reinicia nginx"
+
+
+def test_resample_preserves_duration():
+    signal = np.random.default_rng(0).standard_normal(RATE).astype(np.float32)
+    assert len(resample(signal, RATE, 16000)) == 16000
+
+
+def test_timestamp_map_without_spans_is_identity():
+    assert TimestampMap().to_source(42.0) == 42.0
+
+
+@pytest.mark.asyncio
+async def test_orchestrator_uploads_trimmed_audio_and_restores_timeline(tmp_path):
+    with patch.dict(os.environ, {"GOOGLE_API_KEY": "test-key-1234"}):
+        configure_environment()
+    source = tmp_path / "charla.wav"
+    _write_stereo_wav(source, [(1, True), (20, False), (3, True)])
+    orchestrator = Orchestrator(output_dir=str(tmp_path / "output"), audio=AudioPolicy(keep_silence_ms=0))
+    responses = {
+        orchestrator.analyst_runner: "- [00:00:02] Se menciona el puerto 8080",
+        orchestrator.writer_runner: "# Documento",
+    }
+    orchestrator._run_agent = AsyncMock(side_effect=lambda runner, parts, on_partial=None: responses[runner])
+    uploaded = []
+
+    async def fake_ingest(path, policy, content_hash=None):
+        uploaded.append((path, os.path.getsize(path)))
+        return IngestedFile(uri="https://x/files/audio", mime_type="audio/wav", name="files/audio")
+
+    events = []
+    with patch.object(orchestrator_module, "ingest_file", side_effect=fake_ingest):
+        await orchestrator.run_pipeline(str(source), on_event=lambda e, d: events.append((e, d)))
+
+    (path, size), = uploaded
+    assert path != str(source) and size < os.path.getsize(source) / 10
+    assert not os.path.exists(path)  # el WAV temporal se elimina tras la subida
+    writer_prompt = orchestrator._run_agent.call_args_list[-1].args[1][0].text
+    assert "[00:00:22] Se menciona el puerto 8080" in writer_prompt
+    preprocessed = next(data for event, data in events if event == "preprocessed")
+    assert preprocessed["kind"] == "audio" and preprocessed["bytes_saved"] > 0
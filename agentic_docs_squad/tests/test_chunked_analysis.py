@@ -0,0 +1,164 @@
+import os
+import json
+import asyncio
+import pytest
+from typing import AsyncGenerator
+from unittest.mock import patch
+from google.adk.models import BaseLlm, LlmResponse
+from google.genai import types
+
+from app.chunked_analysis import (
+    ChunkingPolicy, Segment, SegmentAnalysisError, analyze_in_segments, merge_facts, parse_facts,
+    parse_timestamp, plan_segments,
+)
+from app.config import configure_environment
+from app.facts import load_fact_sheet
+from app.orchestrator import Orchestrator
+from app.tools.file_tools import IngestedFile
+
+
+class FakeVideoModel(BaseLlm):
+    """
+    Modelo falso para el AnalystAgent: lee los offsets del video adjunto y
+    responde con un hecho por minuto del tramo, como lo haría el modelo real.
+    Los hechos de los minutos solapados se repiten entre segmentos.
+    """
+    model: str = "fake-video-model"
+    calls: list = []
+    in_flight: int = 0
+    max_in_flight: int = 0
+
+    async def generate_content_async(self, llm_request, stream=False) -> AsyncGenerator[LlmResponse, None]:
+        video_metadata = next(
+            part.video_metadata for content in llm_request.contents for part in content.parts
+            if part.video_metadata
+        )
+        start = int(parse_timestamp(video_metadata.start_offset.rstrip("s").split(".")[0]))
+        end = int(parse_timestamp(video_metadata.end_offset.rstrip("s").split(".")[0]))
+        self.calls.append((start, end))
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        await asyncio.sleep(0.01)
+        self.in_flight -= 1
+
+        minutes = range(-(-start // 60), -(-end // 60))
+        facts = "\n".join(f"- [{m // 60:02d}:{m % 60:02d}:00] Comando ejecutado en el minuto {m}" for m in minutes)
+        yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text=facts)]))
+
+
+def test_plan_segments_cover_video_with_overlap():
+    segments = plan_segments(5400, segment_seconds=600, overlap_seconds=30)
+
+    assert segments[0].start_seconds == 0 and segments[-1].end_seconds == 5400
+    for previous, current in zip(segments, segments[1:]):
+        assert current.start_seconds == previous.end_seconds - 30
+    with pytest.raises(ValueError):
+        plan_segments(100, segment_seconds=30, overlap_seconds=30)
+
+
+def test_merge_deduplicates_overlap_and_sorts_chronologically():
+    first = parse_facts("- [00:09:50] Reinicio de nginx.\n- [00:09:58] Error 502 en /api", Segment(0, 0, 600))
+    # El segundo segmento usa marcas relativas a su inicio (570s) y repite el hecho solapado
+    second = parse_facts("1. [00:00:28] reinicio de NGINX\n2. [00:01:00] Se edita /etc/hosts", Segment(1, 570, 1170))
+
+    merged = merge_facts([second, first], window_seconds=30)
+
+    assert [fact.text for fact in merged] == ["Reinicio de nginx.", "Error 502 en /api", "Se edita /etc/hosts"]
+    assert [fact.seconds for fact in merged] == [590, 598, 630]
+
+
+@pytest.mark.asyncio
+async def test_orchestrator_analyzes_long_video_in_segments():
+    """Con un modelo falso, el video largo se divide, se analiza en paralelo y se fusiona sin huecos."""
+    with patch.dict(os.environ, {"GOOGLE_API_KEY": "test-key-1234"}):
+        configure_environment()
+    policy = ChunkingPolicy(segment_seconds=600, overlap_seconds=60, max_concurrency=3, min_duration_seconds=900)
+    orchestrator = Orchestrator(chunking=policy)
+    fake_model = FakeVideoModel(calls=[])
+    orchestrator.analyst_agent.model = fake_model
+    ingested = IngestedFile(uri="https://x/files/long", mime_type="video/mp4", name="files/long",
+                            duration_seconds=5400)
+
+    facts = await orchestrator.analyze(ingested, "Migración de servidores")
+
+    assert len(fake_model.calls) == len(plan_segments(5400, 600, 60))
+    assert fake_model.max_in_flight == 3
+    lines = facts.splitlines()
+    assert len(lines) == 90  # un hecho por minuto, sin duplicados del solapamiento
+    assert lines[0] == "- [00:00:00] Comando ejecutado en el minuto 0"
+    assert lines[-1] == "- [01:29:00] Comando ejecutado en el minuto 89"
+
+
+@pytest.mark.asyncio
+async def test_short_videos_are_analyzed_in_one_call():
+    with patch.dict(os.environ, {"GOOGLE_API_KEY": "test-key-1234"}):
+        configure_environment()
+    orchestrator = Orchestrator(chunking=ChunkingPolicy(min_duration_seconds=900))
+    fake_model = FakeVideoModel(calls=[])
+    orchestrator.analyst_agent.model = fake_model
+    ingested = IngestedFile(uri="https://x/files/short", mime_type="video/mp4", name="files/short",
+                            duration_seconds=300)
+
+    with patch.object(orchestrator, "_run_agent", return_value="Hecho 1") as run_agent:
+        assert await orchestrator.analyze(ingested) == "Hecho 1"
+    run_agent.assert_called_once()
+    assert fake_model.calls == []
+
+
+class FakeSchemaVideoModel(FakeVideoModel):
+    """Como FakeVideoModel, pero responde con el esquema de hechos y marcas relativas al segmento."""
+    async def generate_content_async(self, llm_request, stream=False) -> AsyncGenerator[LlmResponse, None]:
+        video_metadata = next(
+            part.video_metadata for content in llm_request.contents for part in content.parts
+            if part.video_metadata
+        )
+        start = int(parse_timestamp(video_metadata.start_offset.rstrip("s").split(".")[0]))
+        async for response in super().generate_content_async(llm_request, stream):
+            facts = []
+            for line in response.content.parts[0].text.splitlines():
+                minute = int(line.split("minuto ")[1])
+                relative = minute * 60 - start
+                facts.append({"kind": "cmd", "value": f"make step-{minute}",
+                              "t": f"00:{relative // 60:02d}:{relative % 60:02d}"})
+            yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text=json.dumps({"facts": facts}))]))
+
+
+@pytest.mark.asyncio
+async def test_segmented_analysis_returns_one_fact_sheet():
+    """Con el esquema, los segmentos se fusionan en un único registro tipado en la línea temporal del video."""
+    with patch.dict(os.environ, {"GOOGLE_API_KEY": "test-key-1234"}):
+        configure_environment()
+    policy = ChunkingPolicy(segment_seconds=600, overlap_seconds=60, max_concurrency=3, min_duration_seconds=900)
+    orchestrator = Orchestrator(chunking=policy, fact_schema=True)
+    fake_model = FakeSchemaVideoModel(calls=[])
+    orchestrator.analyst_agent.model = fake_model
+    ingested = IngestedFile(uri="https://x/files/long", mime_type="video/mp4", name="files/long",
+                            duration_seconds=5400)
+
+    facts = await orchestrator.analyze(ingested, "Migración de servidores")
+
+    sheet = load_fact_sheet(facts)
+    assert [(fact.kind, fact.t) for fact in sheet.facts[:2]] == [("command", "00:00:00"), ("command", "00:01:00")]
+    assert [fact.value for fact in sheet.facts] == [f"make step-{minute}" for minute in range(90)]
+
+
+@pytest.mark.asyncio
+async def test_segment_facts_may_mention_error():
+    """Un hecho que cita una línea ERROR del log no es un fallo; el informe de error del modelo sí."""
+    policy = ChunkingPolicy(segment_seconds=600, overlap_seconds=60, max_concurrency=2)
+    replies = {0: "- [00:02:00] El log muestra `ERROR: connection refused` al arrancar\n- [00:05:00] Se reinicia nginx",
+               1: "- [00:01:00] Se comprueba el estado del servicio"}
+
+    async def analyze_segment(parts):
+        return replies[0 if parts[1].video_metadata.start_offset == "0s" else 1]
+
+    facts = await analyze_in_segments(analyze_segment, "https://x/files/v", "video/mp4", 1100, policy)
+    assert facts.splitlines() == [
+        "- [00:02:00] El log muestra `ERROR: connection refused` al arrancar",
+        "- [00:05:00] Se reinicia nginx",
+        "- [00:10:00] Se comprueba el estado del servicio",
+    ]
+
+    replies[1] = "ERROR: no se pudo procesar el video"
+    with pytest.raises(SegmentAnalysisError, match="segmento 2"):
+        await analyze_in_segments(analyze_segment, "https://x/files/v", "video/mp4", 1100, policy)
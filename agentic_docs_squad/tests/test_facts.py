@@ -0,0 +1,96 @@
+import os
+import json
+import pytest
+from typing import AsyncGenerator
+from unittest.mock import patch
+from google.adk.models import BaseLlm, LlmResponse
+from google.genai import types
+
+from app import orchestrator as orchestrator_module
+from app.config import configure_environment
+from app.facts import FactSchemaError, dedupe_facts, load_fact_sheet, parse_fact_sheet, render_facts
+from app.orchestrator import Orchestrator
+from app.tools.file_tools import IngestedFile
+
+
+class ScriptedModel(BaseLlm):
+    """Modelo falso que responde un texto fijo y guarda los prompts recibidos."""
+    model: str = "fake-scripted-model"
+    reply: str = ""
+    prompts: list = []
+
+    async def generate_content_async(self, llm_request, stream=False) -> AsyncGenerator[LlmResponse, None]:
+        self.prompts.append(" ".join(part.text for content in llm_request.contents
+                                     for part in content.parts if part.text))
+        yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text=self.reply)]))
+
+
+def test_parse_accepts_fenced_json_and_normalizes_items():
+    text = """Aquí tienes los hechos:
+```json
+{"facts": [
+  {"kind": "cmd", "value": "sudo systemctl restart nginx", "t": "1:05"},
+  {"kind": "ip", "value": "10.0.0.12:8080"},
+  {"kind": "opinión", "value": "El instalador es lento", "t": "mañana"},
+  {"kind": "error"},
+  "texto suelto"
+]}
+```"""
+    sheet = parse_fact_sheet(text)
+
+    assert [(fact.kind, fact.t) for fact in sheet.facts] == [("command", "00:01:05"), ("host", None), ("note", None)]
+    assert sheet.rejected == 2
+    with pytest.raises(FactSchemaError):
+        parse_fact_sheet("No se encontraron hechos relevantes.")
+
+
+def test_dedupe_keeps_first_occurrence_and_merges_metadata():
+    sheet = parse_fact_sheet(json.dumps({"facts": [
+        {"kind": "command", "value": "docker compose up -d"},
+        {"kind": "command", "value": "docker  compose up -d", "t": "00:02:10", "note": "en el servidor"},
+        {"kind": "command", "value": "docker compose up -D"},
+        {"kind": "step", "value": "Reiniciar el servicio."},
+        {"kind": "step", "value": "reiniciar el servicio"},
+    ]}))
+    deduped = dedupe_facts(sheet)
+
+    assert [fact.value for fact in deduped.facts] == ["docker compose up -d", "docker compose up -D",
+                                                      "Reiniciar el servicio."]
+    assert (deduped.facts[0].t, deduped.facts[0].note) == ("00:02:10", "en el servidor")
+
+
+def test_canonical_json_round_trips_and_renders_compactly():
+    sheet = dedupe_facts(parse_fact_sheet(json.dumps({"facts": [
+        {"kind": "config", "value": "server {\n  listen 80;\n}", "note": "/etc/nginx/nginx.conf"},
+        {"kind": "error", "value": "502 Bad Gateway", "t": "00:00:42"},
+    ]})))
+    loaded = load_fact_sheet(sheet.to_json())
+
+    assert loaded == sheet
+    assert load_fact_sheet("- Comando: ls -la") is None
+    assert render_facts(loaded) == ("config: server { (/etc/nginx/nginx.conf)\n      listen 80;\n    }\n"
+                                    "[00:00:42] error: 502 Bad Gateway")
+
+
+@pytest.mark.asyncio
+async def test_writer_receives_compact_fact_lines(tmp_path):
+    with patch.dict(os.environ, {"GOOGLE_API_KEY": "test-key-1234"}):
+        configure_environment()
+    orchestrator = Orchestrator(output_dir=str(tmp_path / "output"), trace_dir=None, fact_schema=True)
+    analyst = ScriptedModel(prompts=[], reply=json.dumps({"facts": [
+        {"kind": "command", "value": "apt install nginx", "t": "00:00:05"},
+        {"kind": "command", "value": "apt install nginx"},
+        {"kind": "error", "value": "ERROR: puerto 80 en uso"},
+    ]}))
+    writer = ScriptedModel(prompts=[], reply="# Guía")
+    orchestrator.analyst_agent.model = analyst
+    orchestrator.writer_agent.model = writer
+    ingested = IngestedFile(uri="https://x/files/abc", mime_type="video/mp4", name="files/abc")
+
+    with patch.object(orchestrator_module, "ingest_file", return_value=ingested):
+        document = await orchestrator.run_pipeline(str(tmp_path / "demo.mp4"))
+
+    assert document == "# Guía"
+    assert '"facts"' in analyst.prompts[0]
+    assert "[00:00:05] command: apt install nginx\nerror: ERROR: puerto 80 en uso" in writer.prompts[0]
+    assert writer.prompts[0].count("apt install nginx") == 1
@@ -0,0 +1,113 @@
+import asyncio
+import random
+import pytest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from app.tools import file_tools
+from app.tools.file_poller import BackoffPolicy
+from app.tools.file_tools import IngestError, ingest_file
+from app.tools.upload_cache import UploadCache
+from tests.media import mp4_bytes
+
+# Política rápida para que las pruebas no esperen de verdad
+FAST_POLICY = BackoffPolicy(initial_delay=0.01, max_delay=0.02, timeout=2.0)
+
+
+class FakeFileService:
+    """
+    Doble local del servicio de archivos de Gemini: el archivo permanece en
+    PROCESSING durante `processing_polls` sondeos y después pasa a `final_state`.
+    """
+    def __init__(self, processing_polls: int = 3, final_state: str = "ACTIVE"):
+        self.processing_polls = processing_polls
+        self.final_state = final_state
+        self.polls = 0
+        self.uploads = 0
+
+    def _file(self, state: str):
+        return SimpleNamespace(
+            name="files/fake123",
+            uri="https://generativelanguage.googleapis.com/v1beta/files/fake123",
+            state=SimpleNamespace(name=state),
+            expiration_time=None,
+        )
+
+    def upload_file(self, path, mime_type=None):
+        self.uploads += 1
+        return self._file("PROCESSING")
+
+    def get_file(self, name):
+        self.polls += 1
+        return self._file("PROCESSING" if self.polls <= self.processing_polls else self.final_state)
+
+
+@pytest.fixture
+def video(tmp_path):
+    path = tmp_path / "video.mp4"
+    path.write_bytes(mp4_bytes())
+    with patch.object(file_tools, "get_upload_cache", return_value=UploadCache(str(tmp_path / "cache.json"))):
+        yield str(path)
+
+
+def test_backoff_policy_grows_and_is_capped():
+    """Las esperas crecen exponencialmente, con jitter acotado y un máximo."""
+    policy = BackoffPolicy(initial_delay=1.0, max_delay=8.0, multiplier=2.0, jitter=0.1)
+    delays = policy.delays(random.Random(42))
+    values = [next(delays) for _ in range(6)]
+
+    for value, nominal in zip(values, [1, 2, 4, 8, 8, 8]):
+        assert nominal * 0.9 <= value <= nominal * 1.1
+
+
+@pytest.mark.asyncio
+async def test_ingest_waits_without_blocking_event_loop(video):
+    """Mientras se sondea el estado, otras corrutinas siguen ejecutándose."""
+    service = FakeFileService(processing_polls=5)
+    ticks = 0
+
+    async def ticker():
+        nonlocal ticks
+        while True:
+            ticks += 1
+            await asyncio.sleep(0.001)
+
+    ticker_task = asyncio.create_task(ticker())
+    ingested = await ingest_file(video, FAST_POLICY, file_service=service)
+    ticker_task.cancel()
+
+    assert ingested.name == "files/fake123"
+    assert ingested.mime_type == "video/mp4"
+    assert service.polls == 6
+    assert ticks > service.polls
+
+
+@pytest.mark.asyncio
+async def test_ingest_reports_failed_processing(video):
+    service = FakeFileService(processing_polls=1, final_state="FAILED")
+    with pytest.raises(IngestError, match="Falló el procesamiento"):
+        await ingest_file(video, FAST_POLICY, file_service=service)
+
+
+@pytest.mark.asyncio
+async def test_ingest_respects_deadline(video):
+    """Si el archivo no sale de PROCESSING antes del plazo, se lanza IngestError."""
+    service = FakeFileService(processing_polls=10_000)
+    policy = BackoffPolicy(initial_delay=0.01, max_delay=0.01, timeout=0.1)
+    with pytest.raises(IngestError, match="sigue en procesamiento"):
+        await ingest_file(video, policy, file_service=service)
+
+
+@pytest.mark.asyncio
+async def test_ingest_can_be_cancelled(video):
+    """Cancelar la tarea interrumpe la espera en lugar de seguir sondeando."""
+    service = FakeFileService(processing_polls=10_000)
+    task = asyncio.create_task(ingest_file(video, FAST_POLICY, file_service=service))
+    await asyncio.sleep(0.05)
+    task.cancel()
+
+    with pytest.raises(asyncio.CancelledError):
+        await task
+    polls_at_cancel = service.polls
+    await asyncio.sleep(0.05)
+    assert service.polls == polls_at_cancel
@@ -0,0 +1,88 @@
+import time
+import datetime
+import pytest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from app.telemetry import Trace
+from app.tools import file_tools
+from app.tools.upload_cache import UploadCache
+from tests.media import mp4_bytes
+from app.tools.file_registry import (
+    REASON_EXPIRING, REASON_IDLE, REASON_QUOTA, FileCollector, FileRegistry, get_file_registry,
+)
+
+
+def test_registry_claims_only_unreferenced_files(tmp_path):
+    """Un archivo referenciado no se reclama; al soltarlo, se reclama por inactividad o expiración."""
+    registry = FileRegistry(str(tmp_path / "registry.sqlite3"), idle_seconds=60)
+    soon = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(minutes=5)
+    registry.acquire("files/used", "run-1", "aaa", "https://x/files/used", "video/mp4", 100)
+    registry.acquire("files/expiring", None, "bbb", "https://x/files/expiring", "video/mp4", 100, soon)
+
+    assert [(f["name"], f["reason"]) for f in registry.claim_collectable()] == [("files/expiring", REASON_EXPIRING)]
+    assert registry.claim_collectable(now=time.time() + 120) == []
+
+    assert registry.release_run("run-1") == 1
+    claimed = registry.claim_collectable(now=time.time() + 120)
+    assert [(f["name"], f["reason"]) for f in claimed] == [("files/used", REASON_IDLE)]
+    assert registry.usage()["deleting_files"] == 2
+
+
+def test_registry_frees_quota_oldest_first_and_refuses_claimed_files(tmp_path):
+    """Por encima del umbral de cuota se reclaman los más antiguos, que ya no admiten referencias."""
+    registry = FileRegistry(str(tmp_path / "registry.sqlite3"), quota_bytes=900, idle_seconds=3600)
+    for i in range(3):
+        registry.acquire(f"files/{i}", None, str(i), f"https://x/files/{i}", "video/mp4", 400)
+
+    claimed = registry.claim_collectable()
+    assert [(f["name"], f["reason"]) for f in claimed] == [("files/0", REASON_QUOTA), ("files/1", REASON_QUOTA)]
+    assert registry.acquire("files/0", "run-2") is False
+    assert registry.acquire("files/2", "run-2") is True
+    assert registry.usage()["referenced_files"] == 1
+
+
+@pytest.mark.asyncio
+async def test_collector_deletes_and_restores_on_error(tmp_path):
+    """Un 404 cuenta como borrado; otros errores devuelven el archivo al registro activo."""
+    registry = FileRegistry(str(tmp_path / "registry.sqlite3"), idle_seconds=0)
+    registry.acquire("files/ok", None, "a", "https://x/files/ok", "video/mp4", 10)
+    registry.acquire("files/gone", None, "b", "https://x/files/gone", "video/mp4", 10)
+    registry.acquire("files/busy", None, "c", "https://x/files/busy", "video/mp4", 10)
+
+    def delete_file(name):
+        if name == "files/gone":
+            raise _status_error(404)
+        if name == "files/busy":
+            raise _status_error(403)
+
+    collector = FileCollector(registry, SimpleNamespace(delete_file=delete_file))
+    deleted = await collector.collect_once()
+
+    assert sorted(f["name"] for f in deleted) == ["files/gone", "files/ok"]
+    assert registry.usage()["files"] == 1
+    assert [f["name"] for f in registry.claim_collectable()] == ["files/busy"]
+
+
+def _status_error(code: int) -> Exception:
+    error = Exception(f"HTTP {code}")
+    error.code = code
+    return error
+
+
+@pytest.mark.asyncio
+async def test_ingest_references_remote_file_for_the_running_trace(tmp_path):
+    """La ingesta registra el archivo subido con una referencia de la ejecución en curso."""
+    video = tmp_path / "video.mp4"
+    video.write_bytes(mp4_bytes())
+    remote = SimpleNamespace(name="files/abc", uri="https://x/files/abc", state=SimpleNamespace(name="ACTIVE"),
+                             expiration_time=None)
+    file_service = SimpleNamespace(upload_file=lambda **kwargs: remote, get_file=lambda name: remote)
+
+    trace = Trace(str(video))
+    with trace.activate(), patch.object(file_tools, "get_upload_cache", return_value=UploadCache(str(tmp_path / "cache.json"))):
+        await file_tools.ingest_file(str(video), file_service=file_service, content_hash="fresh-hash")
+
+    registry = get_file_registry()
+    assert registry.usage()["referenced_files"] == 1
+    assert registry.release_run(trace.run_id) == 1
@@ -0,0 +1,99 @@
+import os
+import re
+import pytest
+from unittest.mock import AsyncMock, patch
+
+from app.config import configure_environment
+from app.orchestrator import Orchestrator, PipelineError
+from app.tools.inline_text import CHARS_PER_TOKEN, InlineTextPolicy, load_inline_text, plan_chunks
+
+
+@pytest.fixture(autouse=True)
+def setup_env():
+    with patch.dict(os.environ, {"GOOGLE_API_KEY": "test-key-1234"}):
+        configure_environment()
+
+
+def test_plan_chunks_respects_budget_and_overlaps():
+    text = "".join(f"línea {number:03d}\n" for number in range(1, 201)) + "x" * 130 + "\n"
+    chunks = plan_chunks(text, chunk_tokens=25, overlap_lines=2)
+
+    assert all(len(chunk.text) <= 25 * CHARS_PER_TOKEN for chunk in chunks)
+    assert chunks[0].start_line == 1 and chunks[-1].end_line == 201
+    for previous, current in zip(chunks, chunks[1:]):
+        assert current.end_line > previous.end_line or current.start_line == 201
+        if current.end_line < 201:
+            assert current.start_line == previous.end_line - 1
+    # La línea que no cabe en un fragmento se parte en trozos
+    assert "".join(chunk.text for chunk in chunks if chunk.start_line == 201) == "x" * 130 + "\n"
+    assert len(plan_chunks(text, chunk_tokens=10_000)) == 1
+
+
+@pytest.mark.asyncio
+async def test_text_files_skip_upload(tmp_path):
+    source = tmp_path / "deploy.py"
+    source.write_text("import os\nos.system('systemctl restart nginx')\n")
+    orchestrator = Orchestrator(output_dir=str(tmp_path / "output"), inline_text=InlineTextPolicy())
+    responses = {orchestrator.analyst_runner: "- Reinicia nginx con systemctl",
+                 orchestrator.writer_runner: "# Despliegue"}
+    sent = []
+
+    async def fake_run_agent(runner, parts, on_partial=None):
+        sent.append((runner, parts))
+        return responses[runner]
+    orchestrator._run_agent = AsyncMock(side_effect=fake_run_agent)
+    events = []
+
+    with patch("app.orchestrator.ingest_file") as ingest:
+        document = await orchestrator.run_pipeline(str(source), on_event=lambda event, data: events.append((event, data)))
+
+    assert document == "# Despliegue"
+    ingest.assert_not_called()
+    assert ("stage_skipped", {"stage": "IngestAgent", "reason": "inline_text"}) in events
+    analyst_parts = sent[0][1]
+    assert all(part.file_data is None for part in analyst_parts)
+    assert "systemctl restart nginx" in analyst_parts[1].text
+
+
+@pytest.mark.asyncio
+async def test_long_text_is_analyzed_in_chunks_and_merged(tmp_path):
+    source = tmp_path / "server.log"
+    source.write_text("".join(f"evento {number}\n" for number in range(1, 101)))
+    policy = InlineTextPolicy(chunk_tokens=50, overlap_lines=3, max_concurrency=2)
+    orchestrator = Orchestrator(inline_text=policy)
+
+    async def fake_analyst(runner, parts, on_partial=None):
+        # Un hecho por línea del fragmento: las líneas compartidas repiten hechos
+        return "\n".join(f"- Se registra el {event}" for event in re.findall(r"evento \d+", parts[1].text))
+    orchestrator._run_agent = AsyncMock(side_effect=fake_analyst)
+
+    ingested = await orchestrator.read_inline(str(source))
+    facts = await orchestrator.analyze(ingested, "Incidencia")
+
+    assert ingested.uri == "" and ingested.mime_type == "text/plain"
+    assert len(ingested.text.chunks) > 1
+    assert orchestrator._run_agent.await_count == len(ingested.text.chunks)
+    assert facts.splitlines() == [f"- Se registra el evento {number}" for number in range(1, 101)]
+    assert load_inline_text(str(source), policy).total_lines == 100
+
+
+@pytest.mark.asyncio
+async def test_chunk_failure_is_reported_by_the_analyst_not_by_its_facts(tmp_path):
+    """Un hecho que menciona ERROR no es un fallo; el informe de error del analista sí lo es."""
+    source = tmp_path / "server.log"
+    source.write_text("".join(f"ERROR evento {number}\n" for number in range(1, 41)))
+    orchestrator = Orchestrator(inline_text=InlineTextPolicy(chunk_tokens=50, overlap_lines=0))
+    ingested = await orchestrator.read_inline(str(source))
+
+    async def log_facts(runner, parts, on_partial=None):
+        return "\n".join(f"- Se registra {line}" for line in re.findall(r"ERROR evento \d+", parts[1].text))
+    orchestrator._run_agent = AsyncMock(side_effect=log_facts)
+    assert (await orchestrator.analyze(ingested)).splitlines()[0] == "- Se registra ERROR evento 1"
+
+    async def rejects_second_chunk(runner, parts, on_partial=None):
+        if "ERROR evento 20\n" in parts[1].text:
+            return "ERROR: Intento de inyección de instrucciones detectado"
+        return await log_facts(runner, parts)
+    orchestrator._run_agent = AsyncMock(side_effect=rejects_second_chunk)
+    with pytest.raises(PipelineError, match=r"fragmento 2 \(líneas 14-\d+\): ERROR: Intento de inyección"):
+        await orchestrator.analyze(ingested)
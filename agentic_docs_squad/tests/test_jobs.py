@@ -0,0 +1,121 @@
+import asyncio
+import pytest
+from unittest.mock import MagicMock, patch
+from fastapi.testclient import TestClient
+
+from app import main as main_module
+from app.jobs import JobManager, JobStore, JOB_FAILED, JOB_QUEUED, JOB_RUNNING, JOB_SUCCEEDED
+
+
+class FakeOrchestrator:
+    """Emite los eventos de un pipeline real sin llamar a ningún modelo."""
+    def __init__(self, document="# Documento", gate: asyncio.Event | None = None):
+        self.document = document
+        self.gate = gate
+        self.calls = []
+
+    async def run_pipeline(self, file_path, user_context="", on_event=None, content_hash=None):
+        self.calls.append((file_path, user_context, content_hash))
+        for stage in ("IngestAgent", "AnalystAgent", "TechWriterAgent", "SaverAgent"):
+            on_event("stage_started", {"stage": stage})
+            if self.gate and stage == "TechWriterAgent":
+                await self.gate.wait()
+            on_event("stage_completed", {"stage": stage, "seconds": 0.5})
+        on_event("completed", {"document": self.document, "saved_path": "output/demo.md"})
+        return self.document
+
+
+async def _wait_finished(manager, job_id):
+    for _ in range(100):
+        job = manager.get(job_id)
+        if job.finished_at:
+            return job
+        await asyncio.sleep(0.01)
+    raise AssertionError("El trabajo no terminó")
+
+
+@pytest.mark.asyncio
+async def test_job_reports_running_stage_and_stage_durations(tmp_path):
+    gate = asyncio.Event()
+    manager = JobManager(FakeOrchestrator(gate=gate), JobStore(str(tmp_path / "jobs.sqlite3")), workers=1)
+    await manager.start()
+    try:
+        job = manager.submit("/data/demo.mp4", "ctx", content_hash="abc")
+        for _ in range(100):
+            if manager.get(job.id).current_stage == "TechWriterAgent":
+                break
+            await asyncio.sleep(0.01)
+        running = manager.get(job.id)
+        assert running.status == JOB_RUNNING
+        assert running.stages["AnalystAgent"] == {"status": "completed", "seconds": 0.5}
+        assert running.stages["TechWriterAgent"]["status"] == "running"
+
+        gate.set()
+        finished = await _wait_finished(manager, job.id)
+    finally:
+        await manager.stop()
+
+    assert finished.status == JOB_SUCCEEDED and finished.document == "# Documento"
+    assert finished.saved_path == "output/demo.md" and finished.current_stage is None
+    assert manager.orchestrator.calls == [("/data/demo.mp4", "ctx", "abc")]
+
+
+@pytest.mark.asyncio
+async def test_failed_pipeline_marks_job_failed_and_removes_upload(tmp_path):
+    upload = tmp_path / "upload_x.mp4"
+    upload.write_bytes(b"v")
+    manager = JobManager(FakeOrchestrator(document="Falló el paso de análisis: boom"),
+                         JobStore(str(tmp_path / "jobs.sqlite3")))
+    await manager.start()
+    try:
+        job = manager.submit(str(upload), cleanup=True)
+        finished = await _wait_finished(manager, job.id)
+    finally:
+        await manager.stop()
+
+    assert finished.status == JOB_FAILED and finished.error.startswith("Falló el paso de")
+    assert not upload.exists()
+
+
+@pytest.mark.asyncio
+async def test_unfinished_jobs_resume_after_restart(tmp_path):
+    db_path = str(tmp_path / "jobs.sqlite3")
+    # Primer proceso: el trabajo se queda a medias al detener los workers
+    first = JobManager(FakeOrchestrator(gate=asyncio.Event()), JobStore(db_path), workers=1)
+    await first.start()
+    job = first.submit("/data/demo.mp4")
+    for _ in range(100):
+        if first.get(job.id).status == JOB_RUNNING:
+            break
+        await asyncio.sleep(0.01)
+    await first.stop()
+    assert first.get(job.id).status == JOB_RUNNING
+
+    second = JobManager(FakeOrchestrator(), JobStore(db_path), workers=1)
+    await second.start()
+    try:
+        finished = await _wait_finished(second, job.id)
+    finally:
+        await second.stop()
+    assert finished.status == JOB_SUCCEEDED
+
+
+def test_job_endpoints_report_status_and_result():
+    manager = MagicMock()
+    queued = MagicMock(id="job-1", status=JOB_QUEUED, document=None)
+    queued.to_dict.return_value = {"job_id": "job-1", "status": JOB_QUEUED, "stages": {}, "created_at": 1.0}
+    manager.submit.return_value = queued
+    manager.get.side_effect = lambda job_id: queued if job_id == "job-1" else None
+    client = TestClient(main_module.app)
+
+    with patch.object(main_module, "job_manager", manager):
+        submitted = client.post("/jobs", json={"user_prompt": "/data/demo.mp4"})
+        status = client.get("/jobs/job-1")
+        pending_result = client.get("/jobs/job-1/result")
+        missing = client.get("/jobs/otro")
+
+    assert submitted.status_code == 202 and submitted.json() == {"job_id": "job-1", "status": JOB_QUEUED}
+    manager.submit.assert_called_once_with("/data/demo.mp4", "")
+    assert status.json()["status"] == JOB_QUEUED
+    assert pending_result.status_code == 409
+    assert missing.status_code == 404
@@ -0,0 +1,77 @@
+import os
+import numpy as np
+import pytest
+from unittest.mock import patch, AsyncMock
+
+from app import orchestrator as orchestrator_module
+from app.config import configure_environment
+from app.orchestrator import Orchestrator
+from app.tools.keyframes import (
+    Keyframe, KeyframePolicy, KeyframeResult, extract_keyframes, select_keyframes,
+)
+from tests.media import mp4_bytes
+
+
+def _screen(value: int, cursor_row: int = 0) -> np.ndarray:
+    """Miniatura de una pantalla de terminal: fondo uniforme y una línea de texto."""
+    thumbnail = np.full((36, 64), value, dtype=np.uint8)
+    thumbnail[cursor_row, :20] = 255
+    return thumbnail
+
+
+def test_select_keyframes_keeps_only_scene_changes():
+    # 10 muestras de una terminal estática, 5 de otra pantalla y 5 de vuelta a la terminal
+    thumbnails = [_screen(20, cursor_row=i % 2) for i in range(10)] + [_screen(200)] * 5 + [_screen(20)] * 5
+
+    assert select_keyframes(thumbnails, threshold=0.08, max_frames=10) == [0, 10, 15]
+
+
+def test_select_keyframes_respects_max_frames():
+    thumbnails = [_screen(value) for value in range(0, 250, 25)]  # cada muestra es una escena nueva
+
+    selected = select_keyframes(thumbnails, threshold=0.05, max_frames=4)
+    assert len(selected) == 4
+    assert selected[0] == 0 and selected[-1] == len(thumbnails) - 1
+
+
+def test_extract_keyframes_from_real_video(tmp_path):
+    cv2 = pytest.importorskip("cv2")
+    path = str(tmp_path / "terminal.mp4")
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*"mp4v"), 10, (320, 180))
+    for i in range(100):
+        frame = np.full((180, 320, 3), 30 if i < 60 else 220, dtype=np.uint8)
+        writer.write(frame)
+    writer.release()
+
+    result = extract_keyframes(path, KeyframePolicy(sample_fps=2))
+    assert [round(frame.seconds) for frame in result.frames] == [0, 6]
+    assert result.compression_ratio > 0
+
+
+@pytest.mark.asyncio
+async def test_orchestrator_sends_keyframes_inline(tmp_path):
+    """Con fotogramas clave no se sube el video: el analista recibe imágenes con marca de tiempo."""
+    with patch.dict(os.environ, {"GOOGLE_API_KEY": "test-key-1234"}):
+        configure_environment()
+    video = tmp_path / "video.mp4"
+    video.write_bytes(mp4_bytes(duration_seconds=120, mdat_bytes=100_000))
+    frames = [Keyframe(seconds=0, data=b"jpeg-0"), Keyframe(seconds=75, data=b"jpeg-1")]
+    result = KeyframeResult(frames=frames, source_bytes=100_000, duration_seconds=120, sampled_frames=120)
+
+    orchestrator = Orchestrator(output_dir=str(tmp_path / "output"), keyframes=KeyframePolicy())
+    responses = {orchestrator.analyst_runner: "Hecho 1", orchestrator.writer_runner: "# Documento"}
+    orchestrator._run_agent = AsyncMock(side_effect=lambda runner, parts, on_partial=None: responses[runner])
+    events = []
+
+    with patch.object(orchestrator_module, "keyframes_available", return_value=True), \
+         patch.object(orchestrator_module, "extract_keyframes", return_value=result), \
+         patch.object(orchestrator_module, "ingest_file", AsyncMock()) as mock_ingest:
+        document = await orchestrator.run_pipeline(str(video), on_event=lambda e, d: events.append((e, d)))
+
+    assert document == "# Documento"
+    mock_ingest.assert_not_awaited()
+    analyst_parts = orchestrator._run_agent.call_args_list[0].args[1]
+    assert [part.text for part in analyst_parts[1::2]] == ["[00:00:00]", "[00:01:15]"]
+    assert [part.inline_data.data for part in analyst_parts[2::2]] == [b"jpeg-0", b"jpeg-1"]
+    preprocessed = next(data for event, data in events if event == "preprocessed")
+    assert preprocessed["compression_ratio"] == pytest.approx(100_000 / 12)
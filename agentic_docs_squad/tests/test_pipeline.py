@@ -1,6 +1,6 @@
 import pytest
 import os
-from unittest.mock import patch, MagicMock, AsyncMock
+from unittest.mock import patch, AsyncMock
 
 # Importar las funciones de creación de agentes y configuración
 from app.config import configure_environment
@@ -8,6 +8,7 @@ from app.agents.ingest_agent import create_ingest_agent
 from app.agents.analyst_agent import create_analyst_agent
 from app.agents.writer_agent import create_writer_agent
 from app.orchestrator import Orchestrator
+from app.tools.file_tools import IngestedFile, IngestError
 
 # --- Fixtures ---
 
@@ -45,44 +46,90 @@ def test_create_writer_agent(setup_env):
 
 # --- Prueba de Flujo del Orquestador (Integración con Mocks) ---
 
+def _mock_agents(orchestrator, responses):
+    """
+    Sustituye la ejecución de agentes del orquestador por respuestas fijas,
+    indexadas por runner, para no hacer llamadas reales a la API.
+    """
+    async def fake_run_agent(runner, parts, on_partial=None):
+        response = responses[runner]
+        if on_partial:
+            # Simula el streaming entregando la respuesta en dos fragmentos
+            middle = len(response) // 2
+            on_partial(response[:middle])
+            on_partial(response[middle:])
+        return response
+    orchestrator._run_agent = AsyncMock(side_effect=fake_run_agent)
+
 @pytest.mark.asyncio
-async def test_orchestrator_run_pipeline(setup_env):
+async def test_orchestrator_run_pipeline(setup_env, tmp_path):
     """
-    Prueba el método run_pipeline del Orchestrator, mockeando los runners.
+    Prueba el método run_pipeline del Orchestrator con ingesta directa,
+    mockeando la herramienta de subida y los runners.
     """
     # 1. Instanciar el Orquestador
-    orchestrator = Orchestrator()
-
-    # 2. Mockear los runners para que no hagan llamadas reales a la API
-    # Usamos AsyncMock para los métodos `run` que son `async`
-    mock_event = MagicMock()
-    mock_event.text = "mock response"
-    
-    orchestrator.ingest_runner.run = AsyncMock(return_value=[MagicMock(text="gs://fake-uri/video.mp4")])
-    orchestrator.analyst_runner.run = AsyncMock(return_value=[MagicMock(text="Hecho 1: comando 'ls -l'.")])
-    orchestrator.writer_runner.run = AsyncMock(return_value=[MagicMock(text="# Documento Final")])
-
-    # 3. Ejecutar el pipeline
+    orchestrator = Orchestrator(output_dir=str(tmp_path))
+    _mock_agents(orchestrator, {
+        orchestrator.analyst_runner: "Hecho 1: comando 'ls -l'.",
+        orchestrator.writer_runner: "# Documento Final",
+        orchestrator.saver_runner: "Archivo guardado exitosamente en: output/test_doc.md",
+    })
+    ingested = IngestedFile(
+        uri="https://generativelanguage.googleapis.com/v1beta/files/abc123",
+        mime_type="video/mp4",
+        name="files/abc123",
+    )
+
+    # 2. Ejecutar el pipeline
     test_file_path = "/tmp/test.mp4"
-    final_document = await orchestrator.run_pipeline(test_file_path)
-
-    # 4. Verificar que el resultado final es el esperado del writer
-    assert final_document == "# Documento Final"
+    with patch("app.orchestrator.ingest_file", AsyncMock(return_value=ingested)) as mock_ingest:
+        result = await orchestrator.run_pipeline(test_file_path)
+
+    # 3. Verificar el resultado y que ni la ingesta ni el guardado pasaron por un LLM
+    assert result == "# Documento Final"
+    mock_ingest.assert_awaited_once_with(test_file_path, orchestrator.poll_policy, content_hash=None)
+    called_runners = [call.args[0] for call in orchestrator._run_agent.call_args_list]
+    assert orchestrator.ingest_runner not in called_runners
+    assert orchestrator.saver_runner not in called_runners
+
+    # 4. El documento se escribe tal cual en el directorio de salida
+    saved_files = list(tmp_path.glob("test_doc_*.md"))
+    assert len(saved_files) == 1
+    assert saved_files[0].read_text(encoding="utf-8") == "# Documento Final"
+
+    # 5. El analista recibe el archivo como adjunto estructurado
+    analyst_index = called_runners.index(orchestrator.analyst_runner)
+    parts = orchestrator._run_agent.call_args_list[analyst_index].args[1]
+    assert parts[1].file_data.file_uri == ingested.uri
+    assert parts[1].file_data.mime_type == "video/mp4"
+
+    # 6. El writer recibe los hechos del analista
+    writer_call = orchestrator._run_agent.call_args_list[called_runners.index(orchestrator.writer_runner)]
+    assert "Hecho 1: comando 'ls -l'." in writer_call.args[1][0].text
 
-    # 5. Verificar que los runners fueron llamados en orden
-    orchestrator.ingest_runner.run.assert_awaited_once()
-    orchestrator.analyst_runner.run.assert_awaited_once()
-    orchestrator.writer_runner.run.assert_awaited_once()
-
-    # 6. (Opcional) Verificar los prompts con los que fueron llamados
-    ingest_call_args = orchestrator.ingest_runner.run.call_args
-    assert f"Sube y procesa el siguiente archivo: {test_file_path}" in ingest_call_args.kwargs['user_messages']
-    
-    analyst_call_args = orchestrator.analyst_runner.run.call_args
-    assert "gs://fake-uri/video.mp4" in analyst_call_args.kwargs['user_messages'][0]
-    
-    writer_call_args = orchestrator.writer_runner.run.call_args
-    assert "Hecho 1: comando 'ls -l'." in writer_call_args.kwargs['user_messages'][0]
+@pytest.mark.asyncio
+async def test_orchestrator_agent_ingest_mode(setup_env):
+    """
+    Con direct_ingest=False se usa el IngestAgent y el URI se extrae de su respuesta;
+    con use_saver_agent=True el guardado se delega en el SaverAgent.
+    """
+    orchestrator = Orchestrator(direct_ingest=False, use_saver_agent=True)
+    _mock_agents(orchestrator, {
+        orchestrator.ingest_runner: "Listo: https://generativelanguage.googleapis.com/v1beta/files/xyz789",
+        orchestrator.analyst_runner: "Hecho 1",
+        orchestrator.writer_runner: "# Documento Final",
+        orchestrator.saver_runner: "Archivo guardado exitosamente en: output/test_doc.md",
+    })
+
+    with patch("app.orchestrator.ingest_file", AsyncMock()) as mock_ingest:
+        result = await orchestrator.run_pipeline("/tmp/test.mp4")
+
+    assert result == "# Documento Final"
+    mock_ingest.assert_not_awaited()
+    assert orchestrator._run_agent.call_args_list[-1].args[0] is orchestrator.saver_runner
+    analyst_call = orchestrator._run_agent.call_args_list[1]
+    assert analyst_call.args[0] is orchestrator.analyst_runner
+    assert analyst_call.args[1][1].file_data.file_uri.endswith("files/xyz789")
 
 @pytest.mark.asyncio
 async def test_orchestrator_ingest_fails(setup_env):
@@ -90,14 +137,36 @@ async def test_orchestrator_ingest_fails(setup_env):
     Prueba que el pipeline se detiene si la ingesta falla.
     """
     orchestrator = Orchestrator()
-    
-    # Mockear el runner de ingesta para que devuelva un error
-    orchestrator.ingest_runner.run = AsyncMock(return_value=[MagicMock(text="ERROR: Ingesta fallida")])
-    orchestrator.analyst_runner.run = AsyncMock() # Mock para asegurar que no se llama
+    _mock_agents(orchestrator, {})
 
-    result = await orchestrator.run_pipeline("/tmp/fail.mp4")
+    with patch("app.orchestrator.ingest_file", AsyncMock(side_effect=IngestError("ERROR: Ingesta fallida"))):
+        result = await orchestrator.run_pipeline("/tmp/fail.mp4")
 
     assert "Falló el paso de ingesta" in result
     
-    # Verificar que el runner de análisis nunca fue llamado
-    orchestrator.analyst_runner.run.assert_not_awaited()
+    # Verificar que el análisis nunca se ejecutó
+    orchestrator._run_agent.assert_not_awaited()
+
+@pytest.mark.asyncio
+async def test_orchestrator_stream_pipeline(setup_env, tmp_path):
+    """
+    stream_pipeline emite el progreso por etapas y el documento en fragmentos.
+    """
+    orchestrator = Orchestrator(output_dir=str(tmp_path))
+    _mock_agents(orchestrator, {
+        orchestrator.analyst_runner: "Hecho 1",
+        orchestrator.writer_runner: "# Documento Final",
+    })
+    ingested = IngestedFile(uri="https://x/files/abc", mime_type="video/mp4", name="files/abc")
+
+    with patch("app.orchestrator.ingest_file", AsyncMock(return_value=ingested)):
+        events = [item async for item in orchestrator.stream_pipeline("/tmp/test.mp4")]
+
+    names = [event for event, _ in events]
+    assert names[0] == "stage_started"
+    assert names[-1] == "completed"
+    started = [data["stage"] for event, data in events if event == "stage_started"]
+    assert started == ["IngestAgent", "AnalystAgent", "TechWriterAgent", "SaverAgent"]
+    chunks = "".join(data["text"] for event, data in events if event == "chunk")
+    assert chunks == "# Documento Final"
+    assert events[-1][1]["document"] == "# Documento Final"
@@ -0,0 +1,108 @@
+import wave
+import struct
+import zlib
+import pytest
+from unittest.mock import patch
+
+from app.tools import preflight as preflight_module
+from app.tools.preflight import PreflightError, PreflightMemo, sniff_file
+from tests.media import mp4_bytes
+
+
+def _png(width: int, height: int) -> bytes:
+    def chunk(chunk_type: bytes, data: bytes) -> bytes:
+        return struct.pack(">I", len(data)) + chunk_type + data + struct.pack(">I", zlib.crc32(chunk_type + data))
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", struct.pack(">IIBBBBB", width, height, 8, 2, 0, 0, 0))
+            + chunk(b"IDAT", zlib.compress(b"\x00" * 16)) + chunk(b"IEND", b""))
+
+
+def test_mp4_metadata_from_headers_only(tmp_path):
+    """Duración, resolución y códec salen de las cabeceras, sin leer el contenido multimedia."""
+    video = tmp_path / "demo.mp4"
+    data = mp4_bytes(duration_seconds=95.5, width=1280, height=720, mdat_bytes=2_000_000)
+    video.write_bytes(data)
+
+    result = sniff_file(str(video))
+    assert (result.mime_type, result.container, result.codecs) == ("video/mp4", "mp4", ["avc1"])
+    assert (result.width, result.height, result.duration_seconds) == (1280, 720, 95.5)
+    assert result.bytes_read < 100_000
+
+    video.write_bytes(data[:1_000_000])
+    with pytest.raises(PreflightError, match="truncado"):
+        sniff_file(str(video))
+
+
+def test_audio_image_and_pdf_metadata_and_truncation(tmp_path):
+    audio = tmp_path / "charla.wav"
+    with wave.open(str(audio), "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(8000)
+        w.writeframes(b"\x00\x00" * 8000 * 3)
+    result = sniff_file(str(audio))
+    assert (result.mime_type, result.codecs, result.duration_seconds) == ("audio/wav", ["pcm"], 3.0)
+    audio.write_bytes(audio.read_bytes()[:20_000])
+    with pytest.raises(PreflightError, match="truncado"):
+        sniff_file(str(audio))
+
+    image = tmp_path / "captura.png"
+    image.write_bytes(_png(800, 600))
+    assert (sniff_file(str(image)).width, sniff_file(str(image)).height) == (800, 600)
+    image.write_bytes(_png(800, 600)[:-12])
+    with pytest.raises(PreflightError, match="IEND"):
+        sniff_file(str(image))
+
+    pdf = tmp_path / "manual.pdf"
+    body = b"%PDF-1.4\n1 0 obj << /Type /Catalog /Pages 2 0 R >> endobj\n2 0 obj << /Type /Pages /Kids [] /Count 12 >> endobj\n"
+    pdf.write_bytes(body + b"trailer << /Root 1 0 R >>\n%%EOF\n")
+    assert sniff_file(str(pdf)).page_count == 12
+    pdf.write_bytes(body)
+    with pytest.raises(PreflightError, match="EOF"):
+        sniff_file(str(pdf))
+
+
+def test_real_type_wins_over_extension(tmp_path):
+    """El tipo sale de los bytes: un PNG con extensión .mp4 es una imagen y un .mp4 de texto se rechaza."""
+    disguised = tmp_path / "captura.mp4"
+    disguised.write_bytes(_png(10, 10))
+    assert sniff_file(str(disguised)).mime_type == "image/png"
+
+    fake = tmp_path / "video.mp4"
+    fake.write_text("esto no es un video", encoding="utf-8")
+    with pytest.raises(PreflightError, match="no corresponde"):
+        sniff_file(str(fake))
+
+    script = tmp_path / "deploy.py"
+    script.write_text("print('hola')\n", encoding="utf-8")
+    assert (sniff_file(str(script)).mime_type, sniff_file(str(script)).is_text) == ("text/x-python", True)
+
+    empty = tmp_path / "vacio.txt"
+    empty.write_bytes(b"")
+    with pytest.raises(PreflightError, match="vacío"):
+        sniff_file(str(empty))
+
+    archive = tmp_path / "datos.bin"
+    archive.write_bytes(b"PK\x03\x04" + b"\x00" * 64)
+    with pytest.raises(PreflightError, match="no soportado"):
+        sniff_file(str(archive), fallback=lambda path: "application/zip")
+
+
+def test_memo_reuses_results_by_content_hash(tmp_path):
+    """Con el mismo hash de contenido no se vuelve a leer el archivo, aunque cambie la ruta."""
+    first, second = tmp_path / "a.mp4", tmp_path / "b.mp4"
+    first.write_bytes(mp4_bytes())
+    second.write_bytes(mp4_bytes())
+    memo = PreflightMemo()
+
+    with patch.object(preflight_module, "sniff_file", wraps=sniff_file) as sniff:
+        memo.check(str(first), content_hash="abc")
+        memo.check(str(second), content_hash="abc")
+        memo.check(str(first))
+    assert sniff.call_count == 1
+
+    # Los mismos bytes con otra extensión son otro tipo: no se reutiliza el resultado
+    notes, script = tmp_path / "notes.txt", tmp_path / "deploy.py"
+    notes.write_text("print('hola')\n")
+    script.write_text("print('hola')\n")
+    assert memo.check(str(notes), content_hash="def").mime_type == "text/plain"
+    assert memo.check(str(script), content_hash="def").mime_type == "text/x-python"
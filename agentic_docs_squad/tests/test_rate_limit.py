@@ -0,0 +1,94 @@
+import pytest
+from types import SimpleNamespace
+
+from app.rate_limit import (
+    AdaptiveConcurrency, RateLimiter, RateLimits, RetryPolicy, TokenBucket, is_retryable, is_throttled,
+    parse_model_limits, set_rate_limiter,
+)
+from app.tools.file_poller import BackoffPolicy, wait_until_processed
+
+
+class ApiError(Exception):
+    """Error con código HTTP, como los de google.genai y google.api_core."""
+    def __init__(self, code: int):
+        super().__init__(f"{code} error simulado")
+        self.code = code
+
+
+FAST_RETRY = RetryPolicy(max_attempts=3, initial_delay=0.001, max_delay=0.001, jitter=0)
+
+
+def test_token_bucket_waits_for_refill():
+    now = [0.0]
+    bucket = TokenBucket(rate_per_second=2.0, capacity=2.0, clock=lambda: now[0])
+
+    assert bucket.reserve(2) == 0.0
+    assert bucket.reserve(1) == pytest.approx(0.5)
+    now[0] = 1.5
+    assert bucket.reserve(1) == 0.0
+    bucket.refund(-10)
+    assert bucket.reserve(1) == pytest.approx(5.0)
+
+
+def test_retryable_errors_and_adaptive_concurrency():
+    assert is_throttled(ApiError(429)) and is_throttled(Exception("429 RESOURCE_EXHAUSTED"))
+    assert is_retryable(ApiError(503)) and is_retryable(ConnectionError())
+    assert not is_retryable(ApiError(400)) and not is_retryable(ValueError("prompt no válido"))
+
+    concurrency = AdaptiveConcurrency(maximum=8)
+    concurrency.on_throttled()
+    concurrency.on_throttled()
+    assert concurrency.limit == 2
+    for _ in range(2):
+        concurrency.on_success()
+    assert concurrency.limit == 3
+    assert parse_model_limits("gemini-pro-latest=150/2000000, x=60/")["x"] == RateLimits(requests_per_minute=60)
+
+
+@pytest.mark.asyncio
+async def test_call_retries_throttled_and_transient_errors():
+    limiter = RateLimiter(default_limits=RateLimits(requests_per_minute=6000, max_concurrency=4), retry=FAST_RETRY)
+    errors = [ApiError(429), ConnectionError("reset")]
+
+    async def flaky():
+        if errors:
+            raise errors.pop(0)
+        return "ok"
+
+    assert await limiter.call("gemini-flash-latest", flaky) == "ok"
+    stats = limiter.stats()["gemini-flash-latest"]
+    assert (stats["calls"], stats["retries"], stats["throttled"], stats["concurrency_limit"]) == (3, 2, 1, 2)
+
+    async def invalid():
+        raise ApiError(400)
+
+    with pytest.raises(ApiError):
+        await limiter.call("gemini-flash-latest", invalid)
+    assert limiter.stats()["gemini-flash-latest"]["retries"] == 2
+
+    # El llamador puede impedir el reintento (p. ej., si ya entregó fragmentos en streaming)
+    errors.append(ApiError(503))
+    with pytest.raises(ApiError):
+        await limiter.call("gemini-flash-latest", flaky, can_retry=lambda: False)
+
+
+@pytest.mark.asyncio
+async def test_polling_survives_transient_get_file_errors():
+    responses = iter([ConnectionError("reset"), "PROCESSING", ApiError(503), "ACTIVE"])
+
+    def get_file(name):
+        response = next(responses)
+        if isinstance(response, Exception):
+            raise response
+        return SimpleNamespace(name=name, state=SimpleNamespace(name=response))
+
+    set_rate_limiter(RateLimiter(retry=FAST_RETRY))
+    try:
+        file = await wait_until_processed(
+            SimpleNamespace(get_file=get_file), SimpleNamespace(name="files/abc", state=SimpleNamespace(name="PROCESSING")),
+            BackoffPolicy(initial_delay=0.001, jitter=0),
+        )
+    finally:
+        set_rate_limiter(None)
+
+    assert file.state.name == "ACTIVE"
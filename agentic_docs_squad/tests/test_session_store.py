@@ -0,0 +1,82 @@
+import pytest
+from google.adk.events import Event
+from google.genai import types
+
+from app.session_store import BoundedSessionService, COMPACTED_EVENTS_KEY
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def _event(text: str, author: str = "AnalystAgent") -> Event:
+    return Event(author=author, invocation_id="inv", content=types.Content(role="model", parts=[types.Part(text=text)]))
+
+
+async def _add_session(service, events: int = 0, text: str = "hecho técnico"):
+    session = await service.create_session(app_name="app", user_id="user")
+    for i in range(events):
+        await service.append_event(session, _event(f"{text} {i}"))
+    return session
+
+
+@pytest.mark.asyncio
+async def test_evicts_least_recently_used_sessions():
+    service = BoundedSessionService(max_sessions=3, ttl_seconds=None)
+    first = await _add_session(service)
+    second = await _add_session(service)
+    await _add_session(service)
+
+    # Usar la primera sesión la convierte en la más reciente
+    assert await service.get_session(app_name="app", user_id="user", session_id=first.id)
+    await _add_session(service)
+
+    assert service.stats()["sessions"] == 3
+    assert service.evictions == 1
+    assert await service.get_session(app_name="app", user_id="user", session_id=second.id) is None
+    assert await service.get_session(app_name="app", user_id="user", session_id=first.id) is not None
+
+
+@pytest.mark.asyncio
+async def test_expires_idle_sessions():
+    clock = FakeClock()
+    service = BoundedSessionService(ttl_seconds=60, clock=clock)
+    idle = await _add_session(service)
+    clock.now = 120
+    active = await _add_session(service)
+
+    assert await service.get_session(app_name="app", user_id="user", session_id=idle.id) is None
+    assert await service.get_session(app_name="app", user_id="user", session_id=active.id) is not None
+
+
+@pytest.mark.asyncio
+async def test_compacts_old_events_into_summary():
+    """Los eventos antiguos se resumen y solo los recientes se conservan literalmente."""
+    service = BoundedSessionService(max_events_per_session=5, keep_recent_events=2)
+    session = await _add_session(service, events=12, text="x" * 1000)
+
+    stored = await service.get_session(app_name="app", user_id="user", session_id=session.id)
+    assert len(stored.events) <= 5
+    summary = stored.events[0]
+    assert summary.custom_metadata[COMPACTED_EVENTS_KEY] + len(stored.events) - 1 == 12
+    assert stored.events[-1].content.parts[0].text.endswith(" 11")
+    assert service.compactions > 0
+
+
+@pytest.mark.asyncio
+async def test_memory_plateaus_under_sustained_load():
+    """Con carga sostenida, sesiones y bytes se estabilizan en lugar de crecer linealmente."""
+    service = BoundedSessionService(max_sessions=1000, max_events_per_session=10,
+                                    max_total_bytes=200_000, ttl_seconds=None)
+    sizes = []
+    for request in range(300):
+        await _add_session(service, events=15, text=f"petición {request} " + "y" * 200)
+        sizes.append(service.total_bytes)
+
+    assert max(sizes) <= 200_000
+    assert service.stats()["sessions"] < 300
+    assert sizes[-1] <= sizes[len(sizes) // 2] * 1.1
@@ -0,0 +1,77 @@
+import os
+import asyncio
+import pytest
+from unittest.mock import patch
+
+from app.config import configure_environment
+from app.orchestrator import Orchestrator
+from app.stage_pipeline import PipelinedExecutor, StageLimiter
+from app.tools.file_tools import IngestedFile
+from app.tools.writer_tools import SavedDocument
+
+
+@pytest.fixture
+def orchestrator(tmp_path):
+    """Orquestador cuyas etapas solo esperan y anotan cuándo empiezan y terminan."""
+    with patch.dict(os.environ, {"GOOGLE_API_KEY": "test-key-1234"}):
+        configure_environment()
+    orchestrator = Orchestrator(output_dir=str(tmp_path / "output"))
+    orchestrator.timeline = []
+
+    def stage(name, result):
+        async def run(key, *args, **kwargs):
+            orchestrator.timeline.append(("start", name, key))
+            await asyncio.sleep(0.02)
+            orchestrator.timeline.append(("end", name, key))
+            return result(key)
+        return run
+
+    ingest = stage("IngestAgent", lambda path: IngestedFile(uri=f"https://x/{path}", mime_type="video/mp4", name=path))
+    analyze = stage("AnalystAgent", lambda name: f"Hechos de {name}")
+    write = stage("TechWriterAgent", lambda facts: f"# {facts}")
+    save = stage("SaverAgent", lambda path: SavedDocument(path=f"output/{path}.md", filename=f"{path}.md", size_bytes=1))
+    orchestrator.ingest = ingest
+    orchestrator.analyze = lambda ingested, context: analyze(ingested.name)
+    orchestrator.write = lambda facts, on_chunk=None: write(facts)
+    orchestrator.save = lambda path, document: save(path)
+    return orchestrator
+
+
+@pytest.mark.asyncio
+async def test_stages_of_different_files_overlap(orchestrator):
+    executor = PipelinedExecutor(orchestrator, {stage: 1 for stage in
+                                                ("IngestAgent", "AnalystAgent", "TechWriterAgent", "SaverAgent")})
+
+    documents = await executor.run_many(["a", "b", "c"])
+
+    assert documents == ["# Hechos de a", "# Hechos de b", "# Hechos de c"]
+    timeline = orchestrator.timeline
+    # El archivo b se sube mientras a se analiza
+    assert timeline.index(("start", "IngestAgent", "b")) < timeline.index(("end", "AnalystAgent", "a"))
+    # Nunca hay dos archivos a la vez en una etapa con concurrencia 1
+    active = {}
+    for kind, stage, _ in timeline:
+        active[stage] = active.get(stage, 0) + (1 if kind == "start" else -1)
+        assert active[stage] <= 1
+    stats = executor.stats()
+    assert stats["IngestAgent"]["completed"] == 3
+    assert stats["IngestAgent"]["wait_seconds"] > 0
+    assert 0 < stats["AnalystAgent"]["utilization"] <= 1
+
+
+@pytest.mark.asyncio
+async def test_stage_limiter_reports_queue_depth():
+    limiter = StageLimiter("AnalystAgent", concurrency=1)
+    release = asyncio.Event()
+
+    async def work():
+        async with limiter:
+            await release.wait()
+
+    tasks = [asyncio.create_task(work()) for _ in range(3)]
+    await asyncio.sleep(0)
+    assert limiter.stats()["active"] == 1 and limiter.stats()["queue_depth"] == 2
+
+    release.set()
+    await asyncio.gather(*tasks)
+    assert limiter.stats()["queue_depth"] == 0 and limiter.completed == 3
@@ -0,0 +1,100 @@
+import os
+import json
+import pytest
+from types import SimpleNamespace
+from typing import AsyncGenerator
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from google.adk.models import BaseLlm, LlmResponse
+from google.genai import types
+
+from app import main as main_module
+from app import orchestrator as orchestrator_module
+from app.config import configure_environment
+from app.orchestrator import Orchestrator
+from app.telemetry import MetricsRegistry, Span, Trace, get_metrics
+from app.tools.file_poller import BackoffPolicy
+from app.tools.file_tools import IngestedFile, ingest_file
+from tests.media import mp4_bytes
+
+
+class CountingModel(BaseLlm):
+    """Modelo falso que informa de un uso fijo de tokens en cada respuesta."""
+    model: str = "fake-counting-model"
+
+    async def generate_content_async(self, llm_request, stream=False) -> AsyncGenerator[LlmResponse, None]:
+        yield LlmResponse(
+            content=types.Content(role="model", parts=[types.Part(text="# Documento")]),
+            usage_metadata=types.GenerateContentResponseUsageMetadata(
+                prompt_token_count=120, candidates_token_count=30, total_token_count=150,
+            ),
+        )
+
+
+@pytest.mark.asyncio
+async def test_pipeline_writes_trace_with_stages_and_tokens(tmp_path):
+    with patch.dict(os.environ, {"GOOGLE_API_KEY": "test-key-1234"}):
+        configure_environment()
+    orchestrator = Orchestrator(output_dir=str(tmp_path / "output"), trace_dir=str(tmp_path / "traces"))
+    orchestrator.analyst_agent.model = CountingModel()
+    orchestrator.writer_agent.model = CountingModel()
+    ingested = IngestedFile(uri="https://x/files/abc", mime_type="video/mp4", name="files/abc")
+    events = []
+
+    with patch.object(orchestrator_module, "ingest_file", return_value=ingested):
+        await orchestrator.run_pipeline(str(tmp_path / "demo.mp4"), on_event=lambda e, d: events.append((e, d)))
+
+    completed = next(data for event, data in events if event == "completed")
+    with open(completed["trace_path"], encoding="utf-8") as f:
+        trace = json.load(f)
+    assert set(trace["summary"]["stages"]) == {"IngestAgent", "AnalystAgent", "TechWriterAgent", "SaverAgent"}
+    assert trace["summary"]["input_tokens"] == 240 and trace["summary"]["output_tokens"] == 60
+    calls = [span for span in trace["spans"] if span["name"] == "agent_call"]
+    assert [span["attributes"]["agent"] for span in calls] == ["AnalystAgent", "TechWriterAgent"]
+    assert completed["trace"]["input_tokens"] == 240
+
+
+@pytest.mark.asyncio
+async def test_ingest_records_upload_bytes_and_processing_wait(tmp_path):
+    path = tmp_path / "demo.mp4"
+    data = mp4_bytes(mdat_bytes=4096)
+    path.write_bytes(data)
+    states = iter(["PROCESSING", "ACTIVE"])
+
+    def remote():
+        return SimpleNamespace(name="files/abc", uri="https://x/files/abc", state=SimpleNamespace(name=next(states)),
+                               expiration_time=None)
+
+    file_service = SimpleNamespace(upload_file=lambda **kwargs: remote(), get_file=lambda name: remote())
+    trace = Trace(str(path))
+    with trace.activate(), \
+         patch("app.tools.file_tools.get_upload_cache", return_value=SimpleNamespace(get=lambda h: None, put=lambda *a, **k: None)):
+        await ingest_file(str(path), BackoffPolicy(initial_delay=0.01, jitter=0), file_service=file_service)
+
+    assert [span.name for span in trace.spans] == ["upload", "processing_wait"]
+    assert trace.summary()["bytes_uploaded"] == len(data)
+
+
+def test_metrics_render_prometheus_text_format():
+    registry = MetricsRegistry()
+    registry.record_span(Span("stage", start=0.0, end=0.3, attributes={"stage": "AnalystAgent"}))
+    registry.record_span(Span("agent_call", start=0.0, end=0.2,
+                              attributes={"agent": "AnalystAgent", "input_tokens": 100, "output_tokens": 10}))
+    registry.record_span(Span("upload", start=0.0, end=1.0, attributes={"bytes": 2048}))
+
+    text = registry.render()
+    assert '# TYPE docsquad_stage_duration_seconds histogram' in text
+    assert 'docsquad_stage_duration_seconds_bucket{stage="AnalystAgent",le="0.25"} 0' in text
+    assert 'docsquad_stage_duration_seconds_bucket{stage="AnalystAgent",le="0.5"} 1' in text
+    assert 'docsquad_stage_duration_seconds_count{stage="AnalystAgent"} 1' in text
+    assert 'docsquad_tokens_total{agent="AnalystAgent",direction="input"} 100' in text
+    assert 'docsquad_uploaded_bytes_total 2048' in text
+
+
+def test_metrics_endpoint_serves_process_registry():
+    get_metrics().increment("pipeline_runs_total", status="succeeded")
+    response = TestClient(main_module.app).get("/metrics")
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    assert 'docsquad_pipeline_runs_total{status="succeeded"}' in response.text
@@ -0,0 +1,50 @@
+import datetime
+import pytest
+from unittest.mock import patch, MagicMock
+
+from app.tools.upload_cache import UploadCache, hash_file
+from app.tools import file_tools
+from tests.media import mp4_bytes
+
+
+def test_hash_file_is_content_addressed(tmp_path):
+    """Dos archivos con el mismo contenido producen el mismo hash."""
+    a = tmp_path / "a.txt"
+    b = tmp_path / "b.txt"
+    a.write_bytes(b"x" * 3_000_000)
+    b.write_bytes(b"x" * 3_000_000)
+    assert hash_file(str(a), chunk_size=4096) == hash_file(str(b))
+
+
+def test_upload_cache_persists_and_expires(tmp_path):
+    """Las entradas sobreviven a una recarga y se descartan si están por caducar."""
+    path = str(tmp_path / "cache.json")
+    future = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=47)
+    soon = datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(minutes=1)
+
+    cache = UploadCache(path)
+    cache.put("abc", name="files/abc", uri="https://x/files/abc", mime_type="video/mp4", expiration_time=future)
+    cache.put("old", name="files/old", uri="https://x/files/old", mime_type="video/mp4", expiration_time=soon)
+
+    reloaded = UploadCache(path)
+    assert reloaded.get("abc")["name"] == "files/abc"
+    assert reloaded.get("old") is None
+
+
+@pytest.mark.asyncio
+async def test_ingest_tool_skips_upload_on_cache_hit(tmp_path):
+    """Un acierto de caché con archivo remoto ACTIVE no vuelve a subir el archivo."""
+    video = tmp_path / "video.mp4"
+    video.write_bytes(mp4_bytes())
+    cache = UploadCache(str(tmp_path / "cache.json"))
+    cache.put(hash_file(str(video)), name="files/v1", uri="https://x/files/v1", mime_type="video/mp4")
+
+    remote = MagicMock(uri="https://x/files/v1")
+    remote.state.name = "ACTIVE"
+    with patch.object(file_tools, "get_upload_cache", return_value=cache), \
+         patch.object(file_tools.genai, "get_file", return_value=remote) as get_file, \
+         patch.object(file_tools.genai, "upload_file") as upload_file:
+        assert await file_tools.ingest_multimedia_tool(str(video)) == "https://x/files/v1"
+
+    get_file.assert_called_once_with("files/v1")
+    upload_file.assert_not_called()
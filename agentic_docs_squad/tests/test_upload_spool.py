@@ -0,0 +1,72 @@
+import os
+import hashlib
+import pytest
+from unittest.mock import patch, AsyncMock
+from fastapi.testclient import TestClient
+
+from app import main as main_module
+from app.tools.upload_spool import UploadTooLarge, spool_stream
+
+
+async def _chunks(*parts):
+    for part in parts:
+        yield part
+
+
+@pytest.mark.asyncio
+async def test_spool_stream_hashes_while_writing(tmp_path):
+    spooled = await spool_stream(_chunks(b"abc", b"", b"def"), str(tmp_path), "grabación.MP4")
+
+    assert spooled.path.endswith(".mp4") and os.path.dirname(spooled.path) == str(tmp_path)
+    assert spooled.size_bytes == 6
+    assert spooled.sha256 == hashlib.sha256(b"abcdef").hexdigest()
+    with open(spooled.path, "rb") as f:
+        assert f.read() == b"abcdef"
+
+
+@pytest.mark.asyncio
+async def test_spool_stream_uses_unique_paths_and_drops_unsafe_extensions(tmp_path):
+    first = await spool_stream(_chunks(b"1"), str(tmp_path), "video.mp4")
+    second = await spool_stream(_chunks(b"2"), str(tmp_path), "video.mp4")
+    unsafe = await spool_stream(_chunks(b"3"), str(tmp_path), "../../etc/passwd.$(rm)")
+
+    assert first.path != second.path
+    assert os.path.dirname(unsafe.path) == str(tmp_path)
+    assert os.path.splitext(unsafe.path)[1] == ""
+
+
+@pytest.mark.asyncio
+async def test_spool_stream_rejects_oversized_uploads(tmp_path):
+    with pytest.raises(UploadTooLarge):
+        await spool_stream(_chunks(b"x" * 4, b"x" * 4), str(tmp_path), "a.mp4", max_bytes=6)
+
+    assert os.listdir(tmp_path) == []
+
+
+def test_upload_endpoint_passes_hash_and_cleans_up(tmp_path):
+    orchestrator = AsyncMock()
+    orchestrator.run_pipeline.return_value = "# Documento"
+    client = TestClient(main_module.app)
+
+    with patch.object(main_module, "orchestrator", orchestrator), \
+         patch.object(main_module, "TEMPORARY_UPLOAD_DIR", str(tmp_path)):
+        multipart = client.post("/document/upload_and_run", files={"file": ("demo.mp4", b"video-bytes")},
+                                data={"user_context": "ctx"})
+        raw = client.post("/document/upload_and_run/raw", params={"filename": "demo.mp4"}, content=b"video-bytes")
+
+    assert multipart.status_code == 200 and raw.status_code == 200
+    assert multipart.json()["document"] == "# Documento"
+    expected_hash = hashlib.sha256(b"video-bytes").hexdigest()
+    for call in orchestrator.run_pipeline.await_args_list:
+        assert call.kwargs["content_hash"] == expected_hash
+    assert orchestrator.run_pipeline.await_args_list[0].kwargs["user_context"] == "ctx"
+    assert os.listdir(tmp_path) == []
+
+
+def test_upload_endpoint_rejects_declared_oversized_body(tmp_path):
+    client = TestClient(main_module.app)
+    with patch.object(main_module, "orchestrator", AsyncMock()), \
+         patch.dict(os.environ, {"MAX_UPLOAD_BYTES": "4"}):
+        response = client.post("/document/upload_and_run/raw", params={"filename": "a.mp4"}, content=b"too-big")
+
+    assert response.status_code == 413
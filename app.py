@@ -1,16 +1,20 @@
 import streamlit as st
 import os
-import tempfile
+import time
 import google.generativeai as genai
 import nest_asyncio
 from dotenv import load_dotenv
 try:
-    from src.doc_squad import run_documentation_pipeline
+    from src.doc_squad import run_documentation_pipeline, get_agent_pool, warm_up_agent_pool, pipeline_version
+    from src.upload_spool import UploadTooLarge, hash_upload, spool_upload
+    from src.result_cache import get_result_cache
 except ImportError:
     # Fallback para diferentes estructuras de carpetas en Streamlit Cloud
     import sys
     sys.path.append(os.path.join(os.getcwd(), "src"))
-    from doc_squad import run_documentation_pipeline
+    from doc_squad import run_documentation_pipeline, get_agent_pool, warm_up_agent_pool, pipeline_version
+    from upload_spool import UploadTooLarge, hash_upload, spool_upload
+    from result_cache import get_result_cache
 
 # Configuración de compatibilidad asíncrona para Streamlit
 nest_asyncio.apply()
@@ -23,6 +27,13 @@ st.set_page_config(
     initial_sidebar_state="expanded"
 )
 
+@st.cache_resource
+def warm_up_pool():
+    # Se ejecuta una sola vez por proceso: los agentes quedan listos antes de la primera petición
+    return warm_up_agent_pool()
+
+warm_up_pool()
+
 # Estilos CSS personalizados
 st.markdown("""
 <style>
@@ -81,6 +92,15 @@ with st.sidebar:
     st.markdown("- **IngestAgent**: Procesa multimedia")
     st.markdown("- **AnalystAgent**: Extrae datos técnicos")
     st.markdown("- **TechWriterAgent**: Escribe documentación")
+
+    pool_health = get_agent_pool().health()
+    st.caption(f"Pool de agentes: {pool_health['status']} · "
+               f"{pool_health['pipelines_served']} pipelines servidos · "
+               f"creado en {pool_health['build_seconds'] * 1000:.0f} ms")
+    cache_stats = get_result_cache().stats()
+    st.caption(f"Caché de documentos: {cache_stats['entries']} documentos · "
+               f"{cache_stats['bytes'] / 1e6:.1f} MB · "
+               f"{cache_stats['hit_rate'] * 100:.0f}% de aciertos")
     
     st.markdown("---")
     st.markdown("Created by [Michel Macias](https://github.com/Michel-Macias)")
@@ -89,16 +109,64 @@ with st.sidebar:
 st.markdown('<h1 class="main-header">🤖 Doc Squad AI</h1>', unsafe_allow_html=True)
 st.markdown('<p class="sub-header">Transforma videos y audios técnicos en documentación profesional automáticamente.</p>', unsafe_allow_html=True)
 
+def upload_hash(uploaded_file) -> str:
+    # El hash de cada subida se calcula una sola vez por sesión, aunque la página se vuelva a ejecutar
+    upload_hashes = st.session_state.setdefault("upload_hashes", {})
+    if uploaded_file.file_id not in upload_hashes:
+        upload_hashes[uploaded_file.file_id] = hash_upload(uploaded_file)
+    return upload_hashes[uploaded_file.file_id]
+
+def show_result(result, output_container):
+    """Muestra el documento (y su procedencia, tiempos y botón de descarga) de la última ejecución."""
+    # Mostrar resultado final (Seguro: sin unsafe_allow_html para el contenido de la IA)
+    output_container.markdown(result["document"])
+    if result["cached_at"] is not None:
+        st.info(f"Resultado en caché: generado el {time.strftime('%d/%m/%Y %H:%M', time.localtime(result['cached_at']))} "
+                f"y servido {result['hits']} veces. Marca \"Forzar regeneración\" para volver a generarlo.", icon="📦")
+
+    # Desglose de tiempos por etapa de esta ejecución
+    stage_timings = result["stage_timings"]
+    routing_report = result["routing_report"]
+    stages = [(stage, seconds) for stage, seconds in stage_timings.items() if "." not in stage]
+    if stages:
+        total_seconds = sum(seconds for _, seconds in stages)
+        with st.expander(f"⏱️ Tiempos por etapa ({total_seconds:.1f} s)"):
+            st.table([
+                {"Etapa": stage, "Segundos": round(seconds, 2),
+                 "%": round(100 * seconds / total_seconds, 1) if total_seconds else 0.0}
+                for stage, seconds in stages
+            ])
+            if "TechWriterAgent.first_token" in stage_timings:
+                st.caption(f"Primer fragmento del documento a los {stage_timings['TechWriterAgent.first_token']:.2f} s de empezar la redacción.")
+            if routing_report.get("calls"):
+                st.table([
+                    {"Etapa": call["stage"], "Modelo": call["model"], "Motivo": call["reason"],
+                     "Segundos": round(call["seconds"], 2), "USD (est.)": round(call["cost_usd"], 5)}
+                    for call in routing_report["calls"]
+                ])
+                st.caption(f"Enrutado {routing_report['mode']}: ~{routing_report['cost_usd']:.4f} USD "
+                           f"frente a ~{routing_report['pro_cost_usd']:.4f} USD usando solo Pro.")
+
+    # Botón de descarga
+    st.download_button(
+        label="Descargar Markdown",
+        data=result["document"],
+        file_name="documentacion_generada.md",
+        mime="text/markdown"
+    )
+
 col1, col2 = st.columns([1, 1])
 
 with col1:
     st.markdown("### 1. Sube tu archivo")
-    uploaded_file = st.file_uploader("Elige un archivo multimedia o de texto", type=['mp4', 'webm', 'mp3', 'wav', 'png', 'jpg', 'pdf', 'txt'])
+    uploaded_file = st.file_uploader("Elige un archivo multimedia o de texto", type=['mp4', 'webm', 'mp3', 'wav', 'png', 'jpg', 'pdf', 'txt', 'md', 'py', 'json', 'csv'])
     
     context = st.text_area("Contexto adicional (Opcional)", 
                           placeholder="Ej: Este es un tutorial sobre cómo instalar Apache en Ubuntu...",
                           height=100)
 
+    force_regenerate = st.checkbox("Forzar regeneración", help="Ignora el documento guardado en caché para este archivo y contexto, y vuelve a ejecutar el pipeline.")
+
     generate_btn = st.button("Generar Documentación", type="primary", disabled=not uploaded_file)
 
 with col2:
@@ -109,42 +177,58 @@ with col2:
         if not active_api_key:
             st.error("⚠️ Por favor configura tu Google API Key en la barra lateral.")
         else:
-            # Guardar archivo temporalmente
-            with tempfile.NamedTemporaryFile(delete=False, suffix=f".{uploaded_file.name.split('.')[-1]}") as tmp_file:
-                tmp_file.write(uploaded_file.getvalue())
-                tmp_path = tmp_file.name
-
             try:
-                # Contenedor para logs en tiempo real
-                status_container = st.container()
-                
-                def update_ui_status(msg):
-                    with status_container:
-                        if "IngestAgent" in msg:
-                            st.info(msg, icon="📥")
-                        elif "AnalystAgent" in msg:
-                            st.info(msg, icon="🧠")
-                        elif "TechWriterAgent" in msg:
-                            st.info(msg, icon="✍️")
-                        elif "✅" in msg:
-                            st.success(msg)
-                        else:
-                            st.write(msg)
-
-                with st.spinner('El Doc Squad está trabajando... Esto puede tardar unos minutos.'):
-                    final_doc = run_documentation_pipeline(tmp_path, context, api_key=active_api_key, status_callback=update_ui_status)
-                
-                # Mostrar resultado final (Seguro: sin unsafe_allow_html para el contenido de la IA)
-                output_container.markdown(final_doc)
-                
-                # Botón de descarga
-                st.download_button(
-                    label="Descargar Markdown",
-                    data=final_doc,
-                    file_name="documentacion_generada.md",
-                    mime="text/markdown"
-                )
+                # Documento ya generado (en cualquier sesión) para el mismo archivo, contexto y versión del pipeline
+                result_cache = get_result_cache()
+                content_hash = upload_hash(uploaded_file)
+                version = pipeline_version()
+                cached = None if force_regenerate else result_cache.get(content_hash, context, version)
+
+                if cached:
+                    result = {"document": cached.document, "cached_at": cached.created_at, "hits": cached.hits,
+                              "stage_timings": {}, "routing_report": {}}
+                else:
+                    # Copiar la subida a disco por bloques de 1 MB; el hash ya está calculado,
+                    # así que el pipeline no tiene que volver a leer el archivo
+                    spooled = spool_upload(uploaded_file, uploaded_file.name, sha256=content_hash)
+                    tmp_path = spooled.path
+
+                    # Contenedor para logs en tiempo real
+                    status_container = st.container()
+                    
+                    def update_ui_status(msg):
+                        with status_container:
+                            if "IngestAgent" in msg:
+                                st.info(msg, icon="📥")
+                            elif "AnalystAgent" in msg:
+                                st.info(msg, icon="🧠")
+                            elif "TechWriterAgent" in msg:
+                                st.info(msg, icon="✍️")
+                            elif "✅" in msg:
+                                st.success(msg)
+                            else:
+                                st.write(msg)
+
+                    # El documento se va mostrando a medida que el TechWriterAgent lo genera
+                    def update_ui_document(partial_doc):
+                        output_container.markdown(partial_doc + " ▌")
+
+                    stage_timings = {}
+                    routing_report = {}
+                    with st.spinner('El Doc Squad está trabajando... Esto puede tardar unos minutos.'):
+                        final_doc = run_documentation_pipeline(tmp_path, context, api_key=active_api_key, status_callback=update_ui_status, stream_callback=update_ui_document, stage_timings=stage_timings, routing_report=routing_report, content_hash=spooled.sha256)
+
+                    # El pipeline terminó con éxito: el documento se comparte (la caché descarta los vacíos o de error)
+                    result_cache.put(content_hash, context, version, final_doc)
+                    result = {"document": final_doc, "cached_at": None, "hits": 0,
+                              "stage_timings": stage_timings, "routing_report": routing_report}
+
+                # Se conserva para que el resultado siga visible en las siguientes ejecuciones de la página
+                st.session_state.last_result = {**result, "file_id": uploaded_file.file_id, "context": context}
+                show_result(result, output_container)
                 
+            except UploadTooLarge as e:
+                st.error(f"⚠️ {e}")
             except Exception as e:
                 # Sanitizar el mensaje de error antes de mostrarlo
                 st.error(f"Ocurrió un error: {str(e).replace('<', '&lt;')}")
@@ -155,3 +239,9 @@ with col2:
 
     elif not uploaded_file:
         output_container.info("👈 Sube un archivo para comenzar.")
+
+    else:
+        # Cualquier otra ejecución de la página (p. ej., al descargar) muestra el último resultado de esta subida
+        last_result = st.session_state.get("last_result")
+        if last_result and last_result["file_id"] == uploaded_file.file_id and last_result["context"] == context:
+            show_result(last_result, output_container)
@@ -0,0 +1,182 @@
+"""
+Dobles locales de Gemini para los benchmarks sin red: un modelo (BaseLlm de
+ADK) y un servicio de archivos con la misma interfaz que el módulo
+`google.generativeai` (`upload_file` y `get_file`).
+
+La latencia, la tasa de fallos y el tamaño de las respuestas son
+configurables, de modo que las mediciones reflejan el coste propio del
+pipeline (orquestación, sesiones, hashing, caché...) y no la red. Ambos
+pueden imponer además una cuota de peticiones por segundo que, al
+superarse, responde como la API real con un 429.
+"""
+import os
+import time
+import random
+import asyncio
+import datetime
+import itertools
+import threading
+import collections
+from dataclasses import dataclass
+from types import SimpleNamespace
+from typing import AsyncGenerator
+from google.adk.models import BaseLlm, LlmResponse
+from google.genai import types
+
+
+class FakeModelError(Exception):
+    """Fallo simulado del modelo (equivalente a un 5xx de la API)."""
+    code = 503
+
+
+class FakeQuotaExceeded(Exception):
+    """Cuota simulada agotada (equivalente a un 429 RESOURCE_EXHAUSTED)."""
+    code = 429
+
+
+class FakeQuota:
+    """Ventana deslizante de un segundo con `per_second` peticiones como máximo."""
+    def __init__(self, per_second: float):
+        self.per_second = per_second
+        self.rejected = 0
+        self._calls = collections.deque()
+        self._lock = threading.Lock()
+
+    def check(self):
+        if not self.per_second:
+            return
+        with self._lock:
+            now = time.monotonic()
+            while self._calls and now - self._calls[0] >= 1.0:
+                self._calls.popleft()
+            if len(self._calls) >= self.per_second:
+                self.rejected += 1
+                raise FakeQuotaExceeded("429 RESOURCE_EXHAUSTED: cuota simulada agotada")
+            self._calls.append(now)
+
+
+class FakeGeminiLlm(BaseLlm):
+    """
+    Modelo falso: espera `latency_seconds` (± `jitter`) y responde con
+    `output_chars` caracteres de Markdown. Con `stream=True` entrega la
+    respuesta en `stream_chunks` fragmentos parciales seguidos del texto
+    completo, como hace ADK con StreamingMode.SSE. Falla con probabilidad
+    `failure_rate` y responde 429 por encima de `quota_per_second` (0 sin cuota).
+    """
+    model: str = "fake-gemini"
+    latency_seconds: float = 0.05
+    jitter: float = 0.0
+    failure_rate: float = 0.0
+    output_chars: int = 2000
+    stream_chunks: int = 8
+    quota_per_second: float = 0.0
+    seed: int = 0
+    calls: int = 0
+
+    def model_post_init(self, __context):
+        self._rng = random.Random(self.seed)
+        self._quota = FakeQuota(self.quota_per_second)
+
+    @property
+    def quota(self) -> FakeQuota:
+        return self._quota
+
+    def _text(self) -> str:
+        line = "- [00:00:00] Se ejecuta `systemctl restart nginx` y se comprueba el puerto 8080.\n"
+        return (line * (self.output_chars // len(line) + 1))[:self.output_chars]
+
+    def _usage(self, llm_request, text: str) -> types.GenerateContentResponseUsageMetadata:
+        # Aproximación de 4 caracteres por token, suficiente para las métricas de uso
+        prompt_chars = sum(len(part.text or "") for content in llm_request.contents for part in content.parts or [])
+        return types.GenerateContentResponseUsageMetadata(
+            prompt_token_count=prompt_chars // 4,
+            candidates_token_count=len(text) // 4,
+            total_token_count=(prompt_chars + len(text)) // 4,
+        )
+
+    async def generate_content_async(self, llm_request, stream=False) -> AsyncGenerator[LlmResponse, None]:
+        self.calls += 1
+        self._quota.check()
+        latency = self.latency_seconds * (1 + self._rng.uniform(-self.jitter, self.jitter))
+        if self._rng.random() < self.failure_rate:
+            await asyncio.sleep(latency / 2)
+            raise FakeModelError("Fallo simulado del modelo")
+
+        text = self._text()
+        if not stream:
+            await asyncio.sleep(latency)
+            yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text=text)]),
+                              usage_metadata=self._usage(llm_request, text))
+            return
+
+        size = max(1, -(-len(text) // self.stream_chunks))
+        for start in range(0, len(text), size):
+            await asyncio.sleep(latency / self.stream_chunks)
+            yield LlmResponse(
+                content=types.Content(role="model", parts=[types.Part(text=text[start:start + size])]),
+                partial=True,
+            )
+        yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text=text)]),
+                          usage_metadata=self._usage(llm_request, text))
+
+
+@dataclass
+class FakeFileService:
+    """
+    Servicio de archivos falso. La subida tarda lo que marque
+    `upload_bytes_per_second` según el tamaño del archivo y el archivo queda
+    en PROCESSING durante `processing_seconds`. Falla con probabilidad
+    `failure_rate` y responde 429 por encima de `quota_per_second` (0 sin
+    cuota). Las llamadas son bloqueantes, como las del SDK real.
+    """
+    upload_bytes_per_second: float = 100 * 1024 * 1024
+    processing_seconds: float = 0.0
+    failure_rate: float = 0.0
+    quota_per_second: float = 0.0
+    seed: int = 0
+
+    def __post_init__(self):
+        self._rng = random.Random(self.seed)
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._files = {}
+        self.uploads = 0
+        self.quota = FakeQuota(self.quota_per_second)
+
+    def _remote(self, name: str) -> SimpleNamespace:
+        entry = self._files[name]
+        ready = time.monotonic() >= entry["ready_at"]
+        return SimpleNamespace(
+            name=name,
+            uri=f"https://generativelanguage.googleapis.com/v1beta/{name}",
+            mime_type=entry["mime_type"],
+            state=SimpleNamespace(name="ACTIVE" if ready else "PROCESSING"),
+            expiration_time=datetime.datetime.now(datetime.timezone.utc) + datetime.timedelta(hours=48),
+            video_metadata=None,
+        )
+
+    def upload_file(self, path, mime_type=None, **kwargs):
+        self.quota.check()
+        with self._lock:
+            failed = self._rng.random() < self.failure_rate
+            name = f"files/fake-{next(self._ids)}"
+        time.sleep(os.path.getsize(path) / self.upload_bytes_per_second)
+        if failed:
+            raise ConnectionError("Fallo simulado de la subida")
+        with self._lock:
+            self._files[name] = {
+                "mime_type": mime_type or "application/octet-stream",
+                "ready_at": time.monotonic() + self.processing_seconds,
+            }
+            self.uploads += 1
+        return self._remote(name)
+
+    def get_file(self, name):
+        self.quota.check()
+        with self._lock:
+            return self._remote(name)
+
+    def delete_file(self, name):
+        self.quota.check()
+        with self._lock:
+            self._files.pop(name, None)
@@ -0,0 +1,86 @@
+"""
+Benchmark de latencia de la etapa de ingesta: ingesta directa frente a
+ingesta mediante el IngestAgent.
+
+Requiere GOOGLE_API_KEY. La primera ejecución (warm-up) sube el archivo y
+rellena la caché de subidas, de modo que las mediciones posteriores de ambos
+modos parten del mismo estado y la diferencia refleja la ida y vuelta al LLM.
+
+Uso:
+    python -m benchmarks.ingest_modes --file test_data/sample_video.mp4 --runs 5
+"""
+import os
+import time
+import asyncio
+import argparse
+import statistics
+from dotenv import load_dotenv
+import google.generativeai as genai
+from google.adk.runners import InMemoryRunner
+from google.genai import types
+
+from src.doc_squad import create_agents, ingest_file, parse_ingest_response
+
+
+async def ingest_direct(file_path: str):
+    """Ingesta en el propio proceso, como en run_pipeline_async(direct_ingest=True)."""
+    return await ingest_file(file_path)
+
+
+async def ingest_with_agent(ingest_agent, file_path: str):
+    """Ingesta a través del IngestAgent, como en run_pipeline_async(direct_ingest=False)."""
+    runner = InMemoryRunner(agent=ingest_agent, app_name="agents")
+    session = await runner.session_service.create_session(app_name="agents", user_id="bench_user")
+    message = types.Content(role="user", parts=[types.Part(text=f"Sube y procesa el archivo: {file_path}")])
+    events = [
+        event async for event in runner.run_async(
+            user_id=session.user_id, session_id=session.id, new_message=message
+        )
+    ]
+    final_parts = events[-1].content.parts if events and events[-1].content else []
+    return parse_ingest_response("".join(part.text for part in final_parts if part.text), file_path)
+
+
+async def measure(label: str, make_call, runs: int) -> list[float]:
+    timings = []
+    for i in range(runs):
+        start = time.perf_counter()
+        await make_call()
+        timings.append(time.perf_counter() - start)
+        print(f"  {label} #{i + 1}: {timings[-1]:.2f}s")
+    return timings
+
+
+def summarize(label: str, timings: list[float]):
+    print(
+        f"{label:<8} min={min(timings):.2f}s  mediana={statistics.median(timings):.2f}s  "
+        f"media={statistics.mean(timings):.2f}s"
+    )
+
+
+async def main(file_path: str, runs: int):
+    ingest_agent, _, _ = create_agents()
+
+    print(f"Warm-up (rellena la caché de subidas) con {file_path}...")
+    await ingest_direct(file_path)
+
+    direct = await measure("directa", lambda: ingest_direct(file_path), runs)
+    agent = await measure("agente", lambda: ingest_with_agent(ingest_agent, file_path), runs)
+
+    print("\n--- LATENCIA DE LA ETAPA DE INGESTA ---")
+    summarize("directa", direct)
+    summarize("agente", agent)
+    print(f"Ahorro medio por ejecución: {statistics.mean(agent) - statistics.mean(direct):.2f}s")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--file", default="test_data/sample_video.mp4")
+    parser.add_argument("--runs", type=int, default=3)
+    args = parser.parse_args()
+
+    load_dotenv()
+    if not os.getenv("GOOGLE_API_KEY"):
+        raise SystemExit("GOOGLE_API_KEY no encontrada. Configúrala en el archivo .env.")
+    genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+    asyncio.run(main(args.file, args.runs))
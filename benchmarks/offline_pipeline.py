@@ -0,0 +1,363 @@
+"""
+Benchmark del pipeline completo sin red ni GOOGLE_API_KEY.
+
+Sustituye el modelo y el servicio de archivos de Gemini por dobles locales
+(benchmarks/fake_gemini.py) con latencia, tasa de fallos y tamaño de salida
+configurables, y ejecuta tanto `run_pipeline_async` (src/doc_squad.py, la app
+de Streamlit) como `Orchestrator.run_pipeline` (agentic_docs_squad, la API)
+con distintas concurrencias y tamaños de archivo.
+
+Para cada escenario informa del rendimiento (archivos/s), los percentiles
+p50/p95 de latencia por etapa, la sobrecarga del pipeline (latencia total
+menos la latencia simulada de modelo y subida) y el pico de memoria. Los
+resultados se comparan con una línea base guardada para detectar regresiones
+(el proceso termina con código 1 si alguna métrica empeora más de la
+tolerancia).
+
+Uso:
+    python -m benchmarks.offline_pipeline
+    python -m benchmarks.offline_pipeline --concurrency 1 4 8 --sizes 1 16 --files 16
+    python -m benchmarks.offline_pipeline --save-baseline
+"""
+import os
+import struct
+import io
+import sys
+import json
+import time
+import asyncio
+import argparse
+import logging
+import tempfile
+import contextlib
+import tracemalloc
+from dataclasses import dataclass, asdict
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# El paquete `app` de la API vive en agentic_docs_squad/ (y no debe confundirse con app.py de Streamlit)
+sys.path.insert(0, os.path.join(ROOT_DIR, "agentic_docs_squad"))
+
+import google.generativeai as genai
+from unittest.mock import patch
+
+from benchmarks.fake_gemini import FakeFileService, FakeGeminiLlm
+from src.batch import percentile
+
+DEFAULT_BASELINE_PATH = os.path.join(ROOT_DIR, "benchmarks", "baselines", "offline_pipeline.json")
+
+# Etapas que se informan de cada implementación
+TARGET_STAGES = {
+    "doc_squad": ("IngestAgent", "AnalystAgent", "TechWriterAgent"),
+    "orchestrator": ("IngestAgent", "AnalystAgent", "TechWriterAgent", "SaverAgent"),
+}
+
+# Holguras absolutas al comparar con la línea base: por debajo de estos
+# márgenes las diferencias son ruido del planificador y del recolector
+LATENCY_SLACK_SECONDS = 0.02
+MEMORY_SLACK_BYTES = 2 * 1024 * 1024
+
+
+@dataclass
+class FakeConfig:
+    """Comportamiento de los dobles de Gemini en un escenario."""
+    model_latency: float = 0.05
+    failure_rate: float = 0.0
+    output_chars: int = 2000
+    upload_mb_per_second: float = 100.0
+    processing_seconds: float = 0.0
+
+    def simulated_seconds(self, file_bytes: int) -> float:
+        """Latencia que aportan los dobles a un pipeline (subida + análisis + redacción)."""
+        upload = file_bytes / (self.upload_mb_per_second * 1024 * 1024)
+        return upload + self.processing_seconds + 2 * self.model_latency
+
+
+@dataclass
+class ScenarioResult:
+    target: str
+    concurrency: int
+    file_bytes: int
+    files: int
+    succeeded: int
+    failed: int
+    wall_seconds: float
+    files_per_second: float
+    pipeline_latency: dict
+    overhead_p50: float | None
+    stage_latency: dict
+    peak_memory_bytes: int
+
+    @property
+    def key(self) -> str:
+        return scenario_key(self.target, self.concurrency, self.file_bytes)
+
+
+def scenario_key(target: str, concurrency: int, file_bytes: int) -> str:
+    return f"{target}/c{concurrency}/{file_bytes // (1024 * 1024)}MB"
+
+
+def mp4_header(duration_seconds: float, mdat_bytes: int) -> bytes:
+    """Cajas ftyp y moov (con la duración) y cabecera de mdat de un MP4 que supera la comprobación previa."""
+    def box(box_type: bytes, payload: bytes) -> bytes:
+        return struct.pack(">I4s", 8 + len(payload), box_type) + payload
+    mvhd = box(b"mvhd", b"\x00" * 12 + struct.pack(">II", 1000, int(duration_seconds * 1000)) + b"\x00" * 80)
+    return box(b"ftyp", b"isom\x00\x00\x02\x00isom") + box(b"moov", mvhd) + struct.pack(">I4s", 8 + mdat_bytes, b"mdat")
+
+
+def make_files(directory: str, count: int, file_bytes: int) -> list[str]:
+    """MP4 de contenido aleatorio (hashes distintos: sin aciertos de caché)."""
+    paths = []
+    for i in range(count):
+        path = os.path.join(directory, f"bench_{file_bytes}_{i}.mp4")
+        header = mp4_header(60.0, max(0, file_bytes - 128))
+        with open(path, "wb") as f:
+            f.write(header)
+            f.write(os.urandom(max(0, file_bytes - 128)))
+        paths.append(path)
+    return paths
+
+
+def fake_model(config: FakeConfig, seed: int) -> FakeGeminiLlm:
+    return FakeGeminiLlm(latency_seconds=config.model_latency, failure_rate=config.failure_rate,
+                         output_chars=config.output_chars, seed=seed)
+
+
+def fast_poll_policy(backoff_policy_class):
+    return backoff_policy_class(initial_delay=0.01, max_delay=0.05, jitter=0.0, timeout=60.0)
+
+
+async def run_doc_squad(paths: list[str], concurrency: int, config: FakeConfig, output_dir: str):
+    """Ejecuta run_pipeline_async (src/doc_squad.py) con un pool propio y modelos falsos."""
+    from src.doc_squad import AgentPool, BackoffPolicy, run_pipeline_async
+
+    pool = AgentPool()
+    for seed, agent in enumerate((pool.ingest_agent, pool.analyst_agent, pool.tech_writer_agent,
+                                  pool.analyst_flash_agent, pool.tech_writer_flash_agent)):
+        agent.model = fake_model(config, seed)
+    policy = fast_poll_policy(BackoffPolicy)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(path):
+        async with semaphore:
+            timings = {}
+            started_at = time.perf_counter()
+            try:
+                await run_pipeline_async(path, "benchmark", poll_policy=policy, stage_timings=timings,
+                                         pool=pool, use_analysis_cache=False)
+                ok = True
+            except Exception:
+                ok = False
+            return ok, time.perf_counter() - started_at, timings
+
+    try:
+        return await measure(one, paths)
+    finally:
+        pool.shutdown()
+
+
+async def run_orchestrator(paths: list[str], concurrency: int, config: FakeConfig, output_dir: str):
+    """Ejecuta Orchestrator.run_pipeline (agentic_docs_squad) con modelos falsos."""
+    from app.config import configure_environment
+    from app.orchestrator import Orchestrator, PIPELINE_ERROR_PREFIX
+    from app.tools.file_poller import BackoffPolicy
+
+    configure_environment()
+    orchestrator = Orchestrator(output_dir=output_dir, poll_policy=fast_poll_policy(BackoffPolicy))
+    for seed, agent in enumerate((orchestrator.ingest_agent, orchestrator.analyst_agent,
+                                  orchestrator.writer_agent, orchestrator.saver_agent)):
+        agent.model = fake_model(config, seed)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def one(path):
+        async with semaphore:
+            timings = {}
+
+            def on_event(event, data):
+                if event == "stage_completed":
+                    timings[data["stage"]] = data["seconds"]
+
+            started_at = time.perf_counter()
+            try:
+                document = await orchestrator.run_pipeline(path, "benchmark", on_event=on_event)
+                ok = not document.startswith(PIPELINE_ERROR_PREFIX)
+            except Exception:
+                ok = False
+            return ok, time.perf_counter() - started_at, timings
+
+    return await measure(one, paths)
+
+
+async def measure(one, paths: list[str]):
+    """
+    Ejecuta el primer archivo como calentamiento (primer uso de los runners y
+    de los modelos, que no se mide) y después el resto a la vez. Devuelve los
+    resultados por archivo y la duración total.
+    """
+    await one(paths[0])
+    started_at = time.perf_counter()
+    outcomes = await asyncio.gather(*(one(path) for path in paths[1:]))
+    return outcomes, time.perf_counter() - started_at
+
+
+TARGETS = {"doc_squad": run_doc_squad, "orchestrator": run_orchestrator}
+
+
+def run_scenario(target: str, concurrency: int, file_bytes: int, files: int, config: FakeConfig,
+                 work_dir: str) -> ScenarioResult:
+    paths = make_files(work_dir, files + 1, file_bytes)
+    file_service = FakeFileService(upload_bytes_per_second=config.upload_mb_per_second * 1024 * 1024,
+                                   processing_seconds=config.processing_seconds,
+                                   failure_rate=config.failure_rate)
+    tracemalloc.start()
+    try:
+        with patch.object(genai, "upload_file", file_service.upload_file), \
+             patch.object(genai, "get_file", file_service.get_file), \
+             contextlib.redirect_stdout(io.StringIO()):
+            outcomes, wall_seconds = asyncio.run(
+                TARGETS[target](paths, concurrency, config, os.path.join(work_dir, "output"))
+            )
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+        for path in paths:
+            os.remove(path)
+
+    succeeded = [(seconds, timings) for ok, seconds, timings in outcomes if ok]
+    totals = [seconds for seconds, _ in succeeded]
+    stage_latency = {}
+    for stage in TARGET_STAGES[target]:
+        values = [timings[stage] for _, timings in succeeded if stage in timings]
+        stage_latency[stage] = {"p50": percentile(values, 50), "p95": percentile(values, 95)}
+    p50 = percentile(totals, 50)
+    return ScenarioResult(
+        target=target,
+        concurrency=concurrency,
+        file_bytes=file_bytes,
+        files=files,
+        succeeded=len(succeeded),
+        failed=len(outcomes) - len(succeeded),
+        wall_seconds=wall_seconds,
+        files_per_second=len(succeeded) / wall_seconds if wall_seconds > 0 else 0.0,
+        pipeline_latency={"p50": p50, "p95": percentile(totals, 95)},
+        overhead_p50=p50 - config.simulated_seconds(file_bytes) if p50 is not None else None,
+        stage_latency=stage_latency,
+        peak_memory_bytes=peak_memory,
+    )
+
+
+def compare_with_baseline(results: list[ScenarioResult], baseline: dict, tolerance: float) -> list[str]:
+    """
+    Métricas que empeoran más de `tolerance` (fracción) respecto a la línea
+    base: rendimiento, p95 por etapa y pico de memoria. Los escenarios que no
+    están en la línea base se ignoran.
+    """
+    regressions = []
+    for result in results:
+        reference = baseline.get("scenarios", {}).get(result.key)
+        if not reference:
+            continue
+        if result.files_per_second < reference["files_per_second"] * (1 - tolerance):
+            regressions.append(f"{result.key}: rendimiento {result.files_per_second:.2f} archivos/s "
+                               f"(línea base {reference['files_per_second']:.2f})")
+        for stage, latency in result.stage_latency.items():
+            reference_p95 = reference["stage_latency"].get(stage, {}).get("p95")
+            if latency["p95"] is None or reference_p95 is None:
+                continue
+            if latency["p95"] > reference_p95 * (1 + tolerance) + LATENCY_SLACK_SECONDS:
+                regressions.append(f"{result.key}: p95 de {stage} {latency['p95'] * 1000:.1f} ms "
+                                   f"(línea base {reference_p95 * 1000:.1f} ms)")
+        if result.peak_memory_bytes > reference["peak_memory_bytes"] * (1 + tolerance) + MEMORY_SLACK_BYTES:
+            regressions.append(f"{result.key}: pico de memoria {result.peak_memory_bytes / 1e6:.1f} MB "
+                               f"(línea base {reference['peak_memory_bytes'] / 1e6:.1f} MB)")
+    return regressions
+
+
+def print_result(result: ScenarioResult):
+    stages = "  ".join(
+        f"{stage}={latency['p50'] * 1000:.0f}/{latency['p95'] * 1000:.0f}ms"
+        for stage, latency in result.stage_latency.items() if latency["p50"] is not None
+    )
+    overhead = f"{result.overhead_p50 * 1000:.1f} ms" if result.overhead_p50 is not None else "-"
+    print(f"{result.key:<28} {result.files_per_second:6.2f} arch/s  ok={result.succeeded}/{result.files}  "
+          f"sobrecarga p50={overhead}  memoria={result.peak_memory_bytes / 1e6:.1f} MB")
+    print(f"{'':<28} p50/p95 {stages}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--targets", nargs="+", choices=sorted(TARGETS), default=sorted(TARGETS))
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4])
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1, 8], help="Tamaños de archivo en MB")
+    parser.add_argument("--files", type=int, default=8, help="Archivos por escenario")
+    parser.add_argument("--model-latency", type=float, default=0.05, help="Segundos por llamada al modelo")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="Probabilidad de fallo de cada llamada")
+    parser.add_argument("--output-chars", type=int, default=2000, help="Caracteres de cada respuesta del modelo")
+    parser.add_argument("--upload-mbps", type=float, default=100.0, help="Ancho de banda de subida simulado (MB/s)")
+    parser.add_argument("--processing-seconds", type=float, default=0.0, help="Tiempo en PROCESSING tras subir")
+    parser.add_argument("--baseline", default=DEFAULT_BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="Guarda los resultados como nueva línea base")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="Empeoramiento tolerado (fracción)")
+    parser.add_argument("--report", help="Ruta donde guardar los resultados en JSON")
+    args = parser.parse_args()
+
+    logging.getLogger("DocSquad").setLevel(logging.WARNING)
+    # Los fallos simulados se cuentan en el informe; sus trazas de ADK solo añaden ruido
+    logging.getLogger("google_adk").setLevel(logging.CRITICAL)
+    config = FakeConfig(
+        model_latency=args.model_latency,
+        failure_rate=args.failure_rate,
+        output_chars=args.output_chars,
+        upload_mb_per_second=args.upload_mbps,
+        processing_seconds=args.processing_seconds,
+    )
+
+    with tempfile.TemporaryDirectory(prefix="docsquad_bench_") as work_dir:
+        # Cachés aisladas: el benchmark no toca (ni aprovecha) las del usuario
+        os.environ.update({
+            "GOOGLE_API_KEY": os.getenv("GOOGLE_API_KEY", "offline-benchmark"),
+            "UPLOAD_CACHE_PATH": os.path.join(work_dir, "upload_cache.json"),
+            "ANALYSIS_CACHE_PATH": os.path.join(work_dir, "analysis_cache.sqlite3"),
+            "FILE_REGISTRY_PATH": os.path.join(work_dir, "file_registry.sqlite3"),
+        })
+        results = []
+        for target in args.targets:
+            for size_mb in args.sizes:
+                for concurrency in args.concurrency:
+                    result = run_scenario(target, concurrency, size_mb * 1024 * 1024, args.files, config, work_dir)
+                    print_result(result)
+                    results.append(result)
+
+    report = {
+        "config": asdict(config),
+        "files_per_scenario": args.files,
+        "scenarios": {result.key: asdict(result) for result in results},
+    }
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.save_baseline:
+        os.makedirs(os.path.dirname(args.baseline), exist_ok=True)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nLínea base guardada en {args.baseline}")
+        return
+
+    if not os.path.exists(args.baseline):
+        print(f"\nNo hay línea base en {args.baseline}; usa --save-baseline para crearla.")
+        return
+    with open(args.baseline, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+    if baseline.get("config") != asdict(config) or baseline.get("files_per_scenario") != args.files:
+        print("\n⚠️  La configuración de los dobles difiere de la de la línea base; la comparación es orientativa.")
+    regressions = compare_with_baseline(results, baseline, args.tolerance)
+    if regressions:
+        print("\n❌ Regresiones respecto a la línea base:")
+        for regression in regressions:
+            print(f"  - {regression}")
+        sys.exit(1)
+    print(f"\n✅ Sin regresiones respecto a la línea base (tolerancia {args.tolerance:.0%}).")
+
+
+if __name__ == "__main__":
+    main()
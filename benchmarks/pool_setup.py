@@ -0,0 +1,66 @@
+"""
+Benchmark del coste de preparación por petición: construir agentes, runners
+y sesiones en cada petición frente a reutilizar el pool de agentes.
+
+No llama a ningún modelo ni necesita GOOGLE_API_KEY: mide solo el trabajo
+previo a la primera llamada al LLM. También informa del arranque en frío
+(construcción del pool) para compararlo con el ahorro por petición.
+
+Uso:
+    python -m benchmarks.pool_setup --runs 50
+"""
+import time
+import argparse
+import statistics
+from google.adk.runners import InMemoryRunner
+
+from src.doc_squad import AgentPool, create_agents, POOL_APP_NAME
+
+
+async def setup_per_request():
+    """Preparación previa al pool: agentes, runners y sesiones nuevos en cada petición."""
+    runners = [InMemoryRunner(agent=agent, app_name=POOL_APP_NAME) for agent in create_agents()]
+    for runner in runners:
+        await runner.session_service.create_session(app_name=POOL_APP_NAME, user_id="bench_user")
+
+
+async def setup_with_pool(pool: AgentPool):
+    """Preparación con el pool: solo sesiones, que se liberan al terminar."""
+    sessions = await pool.create_sessions("bench_user")
+    await pool.release_sessions(sessions)
+
+
+def measure(label: str, make_call, runs: int) -> list[float]:
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        make_call()
+        timings.append(time.perf_counter() - start)
+    print(
+        f"{label:<12} mediana={statistics.median(timings) * 1000:.2f} ms  "
+        f"media={statistics.mean(timings) * 1000:.2f} ms  máx={max(timings) * 1000:.2f} ms"
+    )
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Coste de preparación por petición con y sin pool de agentes")
+    parser.add_argument("--runs", type=int, default=50, help="Peticiones simuladas por modo")
+    args = parser.parse_args()
+
+    cold_start = time.perf_counter()
+    pool = AgentPool()
+    cold_start = time.perf_counter() - cold_start
+    print(f"Arranque en frío del pool: {cold_start * 1000:.2f} ms\n")
+
+    per_request = measure("por petición", lambda: pool.submit(setup_per_request()).result(), args.runs)
+    pooled = measure("con pool", lambda: pool.submit(setup_with_pool(pool)).result(), args.runs)
+
+    saved = statistics.median(per_request) - statistics.median(pooled)
+    print(f"\nAhorro por petición (mediana): {saved * 1000:.2f} ms")
+    if saved > 0:
+        print(f"El arranque en frío se amortiza tras ~{cold_start / saved:.1f} peticiones.")
+
+
+if __name__ == "__main__":
+    main()
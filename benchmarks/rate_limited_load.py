@@ -0,0 +1,117 @@
+"""
+Carga sintética contra los dobles de Gemini con cuota, con y sin el
+limitador de llamadas (agentic_docs_squad/app/rate_limit.py).
+
+Lanza `--files` pipelines de `Orchestrator.run_pipeline` a la vez contra un
+modelo y un servicio de archivos locales que responden 429 por encima de
+`--quota` peticiones por segundo (y fallan con `--failure-rate`). Sin el
+limitador, cada 429 o 5xx hace fallar su pipeline; con él, las llamadas se
+reparten según la cuota y se reintentan. Para cada modo informa de los
+pipelines completados, los 429 que devolvió el servicio, los reintentos y la
+duración total.
+
+Uso:
+    python -m benchmarks.rate_limited_load
+    python -m benchmarks.rate_limited_load --files 40 --quota 10 --failure-rate 0.05
+"""
+import os
+import io
+import sys
+import time
+import asyncio
+import argparse
+import logging
+import tempfile
+import contextlib
+from unittest.mock import patch
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT_DIR, "agentic_docs_squad"))
+
+import google.generativeai as genai
+
+from benchmarks.fake_gemini import FakeFileService, FakeGeminiLlm
+from benchmarks.offline_pipeline import fast_poll_policy, make_files
+
+
+def limiter_for(enabled: bool, quota: float, max_concurrency: int):
+    """Limitador con la cuota de los dobles (en peticiones por minuto) y reintentos rápidos."""
+    from app.rate_limit import RateLimiter, RateLimits, RetryPolicy
+
+    return RateLimiter(
+        default_limits=RateLimits(requests_per_minute=quota * 60, max_concurrency=max_concurrency,
+                                  burst_seconds=1.0),
+        retry=RetryPolicy(max_attempts=6, initial_delay=0.2, max_delay=2.0),
+        enabled=enabled,
+    )
+
+
+async def run_load(paths: list[str], enabled: bool, args, output_dir: str) -> dict:
+    from app.config import configure_environment
+    from app.orchestrator import Orchestrator, PIPELINE_ERROR_PREFIX
+    from app.rate_limit import set_rate_limiter
+    from app.tools.file_poller import BackoffPolicy
+
+    configure_environment()
+    limiter = limiter_for(enabled, args.quota, args.max_concurrency)
+    set_rate_limiter(limiter)
+    file_service = FakeFileService(quota_per_second=args.quota, failure_rate=args.failure_rate, seed=1)
+    orchestrator = Orchestrator(output_dir=output_dir, poll_policy=fast_poll_policy(BackoffPolicy), trace_dir=None)
+    models = []
+    for seed, agent in enumerate((orchestrator.ingest_agent, orchestrator.analyst_agent,
+                                  orchestrator.writer_agent, orchestrator.saver_agent)):
+        agent.model = FakeGeminiLlm(model=f"fake-gemini-{agent.name}", latency_seconds=args.model_latency,
+                                    failure_rate=args.failure_rate, quota_per_second=args.quota, seed=seed)
+        models.append(agent.model)
+
+    async def one(path):
+        try:
+            document = await orchestrator.run_pipeline(path, "benchmark")
+            return not document.startswith(PIPELINE_ERROR_PREFIX)
+        except Exception:
+            return False
+
+    started_at = time.perf_counter()
+    with patch.object(genai, "upload_file", file_service.upload_file), \
+         patch.object(genai, "get_file", file_service.get_file):
+        outcomes = await asyncio.gather(*(one(path) for path in paths))
+    stats = limiter.stats()
+    return {
+        "succeeded": sum(outcomes),
+        "rejected_429": file_service.quota.rejected + sum(model.quota.rejected for model in models),
+        "retries": sum(entry["retries"] for entry in stats.values()),
+        "wall_seconds": time.perf_counter() - started_at,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--files", type=int, default=24, help="Pipelines lanzados a la vez")
+    parser.add_argument("--quota", type=float, default=8.0, help="Peticiones por segundo que admite cada doble")
+    parser.add_argument("--failure-rate", type=float, default=0.02, help="Probabilidad de un 5xx simulado")
+    parser.add_argument("--model-latency", type=float, default=0.05, help="Segundos por llamada al modelo")
+    parser.add_argument("--max-concurrency", type=int, default=8, help="Techo de llamadas simultáneas por destino")
+    args = parser.parse_args()
+
+    logging.getLogger("google_adk").setLevel(logging.CRITICAL)
+    with tempfile.TemporaryDirectory(prefix="docsquad_ratelimit_") as work_dir:
+        os.environ.update({
+            "GOOGLE_API_KEY": os.getenv("GOOGLE_API_KEY", "offline-benchmark"),
+            "UPLOAD_CACHE_PATH": os.path.join(work_dir, "upload_cache.json"),
+            "ANALYSIS_CACHE_PATH": os.path.join(work_dir, "analysis_cache.sqlite3"),
+            "FILE_REGISTRY_PATH": os.path.join(work_dir, "file_registry.sqlite3"),
+        })
+        for enabled in (False, True):
+            # Archivos distintos en cada modo para que la caché de subidas no oculte las llamadas
+            paths = make_files(work_dir, args.files, 64 * 1024)
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = asyncio.run(run_load(paths, enabled, args, os.path.join(work_dir, "output")))
+            for path in paths:
+                os.remove(path)
+            label = "con limitador" if enabled else "sin limitador"
+            print(f"{label:<14} ok={result['succeeded']}/{args.files}  429={result['rejected_429']}  "
+                  f"reintentos={result['retries']}  duración={result['wall_seconds']:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Benchmark de memoria de la recepción de subidas en la app de Streamlit.
+
+Compara, para varios tamaños de archivo y subidas simultáneas, la copia
+anterior (`uploaded_file.getvalue()` + NamedTemporaryFile + relectura del
+archivo para calcular su hash) con `spool_upload` (src/upload_spool.py), que
+copia por bloques y calcula el hash durante la copia.
+
+Cada escenario se ejecuta en un proceso nuevo. El contenido subido se crea
+antes de medir (Streamlit ya lo tiene en memoria) y se informa del pico de
+memoria residente (VmHWM, reiniciado con /proc/self/clear_refs) que añade la
+recepción sobre esa base. Con `spool_upload` debe mantenerse constante por
+subida, sea cual sea el tamaño del archivo. (En CPython, `getvalue()` de un
+BytesIO comparte su búfer en lugar de copiarlo, así que la diferencia entre
+ambos métodos está en la relectura del archivo para el hash, no en la
+memoria; la memoria proporcional al tamaño es la del propio contenido que
+guarda Streamlit.)
+
+Uso:
+    python -m benchmarks.upload_memory
+    python -m benchmarks.upload_memory --sizes 64 256 1024 --concurrency 1 4
+"""
+import io
+import os
+import argparse
+import tempfile
+import threading
+import multiprocessing
+
+CHUNK = 1024 * 1024
+
+
+def rss_bytes(field: str) -> int:
+    with open("/proc/self/status", encoding="ascii") as f:
+        for line in f:
+            if line.startswith(field + ":"):
+                return int(line.split()[1]) * 1024
+    raise RuntimeError(f"{field} no disponible")
+
+
+def reset_peak_rss():
+    """Reinicia VmHWM al RSS actual (Linux >= 4.0)."""
+    with open("/proc/self/clear_refs", "w", encoding="ascii") as f:
+        f.write("5")
+
+
+def make_upload(size_bytes: int) -> io.BytesIO:
+    """Contenido en memoria como el UploadedFile de Streamlit, construido sin copias intermedias."""
+    upload = io.BytesIO()
+    block = os.urandom(CHUNK)
+    for _ in range(size_bytes // CHUNK):
+        upload.write(block)
+    upload.seek(0)
+    return upload
+
+
+def receive_with_getvalue(upload: io.BytesIO, directory: str) -> str:
+    """Recepción anterior: copia completa en memoria, escritura y relectura para el hash."""
+    from src import shared  # noqa: F401 (la caché de subidas es común con la API)
+    from app.tools.upload_cache import hash_file
+
+    with tempfile.NamedTemporaryFile(delete=False, suffix=".mp4", dir=directory) as tmp_file:
+        tmp_file.write(upload.getvalue())
+        path = tmp_file.name
+    hash_file(path)
+    return path
+
+
+def receive_with_spool(upload: io.BytesIO, directory: str) -> str:
+    from src.upload_spool import spool_upload
+
+    return spool_upload(upload, "video.mp4", directory).path
+
+
+METHODS = {"getvalue": receive_with_getvalue, "spool": receive_with_spool}
+
+
+def run_scenario(method: str, size_bytes: int, concurrency: int, queue):
+    uploads = [make_upload(size_bytes) for _ in range(concurrency)]
+    with tempfile.TemporaryDirectory(prefix="docsquad_upload_mem_") as directory:
+        reset_peak_rss()
+        baseline = rss_bytes("VmRSS")
+        threads = [threading.Thread(target=METHODS[method], args=(upload, directory)) for upload in uploads]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        queue.put(rss_bytes("VmHWM") - baseline)
+
+
+def measure(method: str, size_bytes: int, concurrency: int) -> int:
+    context = multiprocessing.get_context("spawn")
+    queue = context.Queue()
+    process = context.Process(target=run_scenario, args=(method, size_bytes, concurrency, queue))
+    process.start()
+    extra = queue.get()
+    process.join()
+    return extra
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", nargs="+", type=int, default=[64, 256], help="Tamaños de archivo en MB")
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4], help="Subidas simultáneas")
+    args = parser.parse_args()
+
+    for size_mb in args.sizes:
+        for concurrency in args.concurrency:
+            for method in METHODS:
+                extra = measure(method, size_mb * CHUNK, concurrency)
+                print(f"{method:<9} {size_mb:>5} MB x{concurrency}  pico RSS añadido={extra / 1e6:8.1f} MB  "
+                      f"({extra / concurrency / 1e6:.1f} MB por subida)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""
+Modo batch: documenta una carpeta completa (o un manifiesto) de archivos
+ejecutando varios pipelines en paralelo con un límite de concurrencia.
+
+Uso:
+    python -m src.batch ruta/a/carpeta --concurrency 4 --report batch_report.json
+    python -m src.batch manifiesto.jsonl --context "Sesiones de soporte de Linux"
+
+Formatos de manifiesto:
+    - .txt: una ruta por línea (las líneas vacías y las que empiezan por '#' se ignoran).
+    - .json: lista de rutas o de objetos {"path": ..., "context": ...}.
+    - .jsonl: un objeto {"path": ..., "context": ...} por línea.
+Las rutas relativas de un manifiesto se resuelven respecto a su carpeta.
+"""
+import os
+import sys
+import json
+import hashlib
+import time
+import asyncio
+import argparse
+import logging
+from dataclasses import dataclass, field, asdict
+
+try:
+    from src import shared  # noqa: F401 (módulos comunes con la API)
+    from src.doc_squad import run_pipeline_async
+except ImportError:
+    # Fallback cuando 'src' está directamente en sys.path (Streamlit Cloud)
+    import shared  # noqa: F401
+    from doc_squad import run_pipeline_async
+from app.tools.preflight import EXTENSION_MIME_TYPES
+
+logger = logging.getLogger("DocSquad")
+
+# Extensiones que se recogen al recorrer una carpeta: las que admite la comprobación previa
+BATCH_EXTENSIONS = frozenset(EXTENSION_MIME_TYPES)
+
+# Orden en el que se informan las etapas en el resumen
+STAGES = ("IngestAgent", "AnalystAgent", "TechWriterAgent")
+
+
+@dataclass
+class BatchItem:
+    """Un archivo a documentar, con su contexto opcional."""
+    path: str
+    context: str = ""
+
+
+@dataclass
+class BatchResult:
+    """Resultado de un archivo del batch."""
+    path: str
+    status: str  # "ok" | "failed"
+    seconds: float
+    stage_timings: dict = field(default_factory=dict)
+    output_path: str | None = None
+    error: str | None = None
+
+
+def percentile(values: list[float], pct: float) -> float | None:
+    """Percentil por el método del rango más cercano (None si no hay valores)."""
+    if not values:
+        return None
+    ordered = sorted(values)
+    rank = max(1, int(-(-pct * len(ordered) // 100)))  # ceil(pct/100 * n)
+    return ordered[min(rank, len(ordered)) - 1]
+
+
+@dataclass
+class BatchReport:
+    """Resultados por archivo y resumen agregado del batch."""
+    results: list[BatchResult]
+    wall_seconds: float
+    concurrency: int
+
+    def summary(self) -> dict:
+        succeeded = [r for r in self.results if r.status == "ok"]
+        failed = [r for r in self.results if r.status != "ok"]
+
+        stage_latency = {}
+        for stage in STAGES:
+            values = [r.stage_timings[stage] for r in self.results if stage in r.stage_timings]
+            stage_latency[stage] = {
+                "count": len(values),
+                "p50": percentile(values, 50),
+                "p95": percentile(values, 95),
+            }
+
+        total = [r.seconds for r in succeeded]
+        return {
+            "files": len(self.results),
+            "succeeded": len(succeeded),
+            "failed": len(failed),
+            "concurrency": self.concurrency,
+            "wall_seconds": self.wall_seconds,
+            "files_per_hour": len(succeeded) / self.wall_seconds * 3600 if self.wall_seconds > 0 else 0.0,
+            "pipeline_latency": {"p50": percentile(total, 50), "p95": percentile(total, 95)},
+            "stage_latency": stage_latency,
+            "failures": [{"path": r.path, "error": r.error} for r in failed],
+        }
+
+    def to_dict(self) -> dict:
+        return {"summary": self.summary(), "results": [asdict(r) for r in self.results]}
+
+
+def _manifest_item(entry, base_dir: str, default_context: str) -> BatchItem:
+    if isinstance(entry, str):
+        path, context = entry, default_context
+    else:
+        path, context = entry["path"], entry.get("context", default_context)
+    return BatchItem(path=os.path.join(base_dir, os.path.expanduser(path)), context=context)
+
+
+def collect_items(source: str, default_context: str = "") -> list[BatchItem]:
+    """
+    Construye la lista de archivos a documentar a partir de una carpeta
+    (recorrido recursivo por extensión) o de un manifiesto.
+    """
+    if os.path.isdir(source):
+        paths = []
+        for root, _, files in os.walk(source):
+            for name in files:
+                if os.path.splitext(name)[1].lower() in BATCH_EXTENSIONS:
+                    paths.append(os.path.join(root, name))
+        return [BatchItem(path=p, context=default_context) for p in sorted(paths)]
+
+    base_dir = os.path.dirname(os.path.abspath(source))
+    extension = os.path.splitext(source)[1].lower()
+    with open(source, "r", encoding="utf-8") as f:
+        if extension == ".json":
+            entries = json.load(f)
+        elif extension == ".jsonl":
+            entries = [json.loads(line) for line in f if line.strip()]
+        else:
+            entries = [line.strip() for line in f if line.strip() and not line.lstrip().startswith("#")]
+    return [_manifest_item(entry, base_dir, default_context) for entry in entries]
+
+
+def _output_path(output_dir: str, file_path: str) -> str:
+    # Un sufijo derivado de la ruta completa evita colisiones entre carpetas
+    base_filename = os.path.splitext(os.path.basename(file_path))[0]
+    path_digest = hashlib.sha1(os.path.abspath(file_path).encode("utf-8")).hexdigest()[:8]
+    return os.path.join(output_dir, f"{base_filename}_{path_digest}_doc.md")
+
+
+def _write_document(output_path: str, document: str):
+    with open(output_path, "w", encoding="utf-8") as f:
+        f.write(document)
+
+
+async def run_batch(items: list[BatchItem], concurrency: int = 4, output_dir: str = "output",
+                    api_key: str = None, direct_ingest: bool = True, on_result=None,
+                    use_analysis_cache: bool = True) -> BatchReport:
+    """
+    Documenta todos los archivos con como máximo `concurrency` pipelines a la vez.
+
+    El fallo de un archivo se registra en su BatchResult y no interrumpe el
+    resto del batch. `on_result` (opcional) se llama con cada BatchResult en
+    cuanto termina su archivo. Cada documento se guarda en `output_dir`.
+    """
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+    os.makedirs(output_dir, exist_ok=True)
+
+    async def process(item: BatchItem) -> BatchResult:
+        async with semaphore:
+            stage_timings = {}
+            started_at = time.perf_counter()
+            try:
+                document = await run_pipeline_async(
+                    item.path, item.context, api_key=api_key,
+                    direct_ingest=direct_ingest, stage_timings=stage_timings,
+                    use_analysis_cache=use_analysis_cache,
+                )
+                output_path = _output_path(output_dir, item.path)
+                await asyncio.to_thread(_write_document, output_path, document)
+                result = BatchResult(item.path, "ok", time.perf_counter() - started_at,
+                                     stage_timings, output_path=output_path)
+            except Exception as e:
+                logger.error(f"[Batch] Falló {item.path}: {e}")
+                result = BatchResult(item.path, "failed", time.perf_counter() - started_at,
+                                     stage_timings, error=str(e))
+        if on_result:
+            on_result(result)
+        return result
+
+    batch_started = time.perf_counter()
+    results = await asyncio.gather(*(process(item) for item in items))
+    return BatchReport(results=list(results), wall_seconds=time.perf_counter() - batch_started,
+                       concurrency=concurrency)
+
+
+def _format_seconds(value: float | None) -> str:
+    return "-" if value is None else f"{value:.1f}s"
+
+
+def print_summary(summary: dict):
+    print("\n--- RESUMEN DEL BATCH ---")
+    print(f"Archivos: {summary['files']}  OK: {summary['succeeded']}  Fallidos: {summary['failed']}  "
+          f"(concurrencia {summary['concurrency']})")
+    print(f"Tiempo total: {summary['wall_seconds']:.1f}s  Throughput: {summary['files_per_hour']:.1f} archivos/hora")
+    latency = summary["pipeline_latency"]
+    print(f"Pipeline completo: p50={_format_seconds(latency['p50'])}  p95={_format_seconds(latency['p95'])}")
+    for stage, stats in summary["stage_latency"].items():
+        print(f"  {stage:<16} p50={_format_seconds(stats['p50'])}  p95={_format_seconds(stats['p95'])}  (n={stats['count']})")
+    for failure in summary["failures"]:
+        print(f"❌ {failure['path']}: {failure['error']}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("source", help="Carpeta con archivos o manifiesto (.txt, .json, .jsonl).")
+    parser.add_argument("--context", default="", help="Contexto por defecto para todos los archivos.")
+    parser.add_argument("--concurrency", type=int, default=4, help="Pipelines simultáneos (por defecto 4).")
+    parser.add_argument("--output-dir", default="output", help="Carpeta donde guardar los documentos.")
+    parser.add_argument("--report", help="Ruta opcional para guardar el informe en JSON.")
+    parser.add_argument("--agent-ingest", action="store_true", help="Usar el IngestAgent en lugar de la ingesta directa.")
+    parser.add_argument("--no-analysis-cache", action="store_true", help="Volver a analizar aunque exista un análisis en caché.")
+    args = parser.parse_args(argv)
+
+    items = collect_items(args.source, args.context)
+    if not items:
+        print(f"No se encontraron archivos para documentar en {args.source}.")
+        return 1
+
+    print(f"Documentando {len(items)} archivos con concurrencia {args.concurrency}...")
+
+    def report_progress(result: BatchResult):
+        icon = "✅" if result.status == "ok" else "❌"
+        print(f"{icon} {result.path} ({result.seconds:.1f}s)")
+
+    report = asyncio.run(run_batch(
+        items, concurrency=args.concurrency, output_dir=args.output_dir,
+        api_key=os.getenv("GOOGLE_API_KEY"), direct_ingest=not args.agent_ingest,
+        on_result=report_progress, use_analysis_cache=not args.no_analysis_cache,
+    ))
+    summary = report.summary()
+    print_summary(summary)
+
+    if args.report:
+        with open(args.report, "w", encoding="utf-8") as f:
+            json.dump(report.to_dict(), f, indent=2, ensure_ascii=False)
+        print(f"Informe guardado en {args.report}")
+    return 0 if summary["failed"] == 0 else 2
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,15 +1,41 @@
 import os
 # Fix for Streamlit deployment: robust URI handling
+import re
 import time
+import uuid
 import asyncio
+import threading
+import concurrent.futures
 import logging
 import mimetypes
 import google.generativeai as genai
 from google.adk.agents.llm_agent import Agent
-from google.adk.runners import InMemoryRunner
+from google.adk.agents.run_config import RunConfig, StreamingMode
+from google.adk.runners import InMemoryRunner, Runner
 from dotenv import load_dotenv
 from google.genai import types
 import nest_asyncio
+try:
+    from src import shared  # noqa: F401 (módulos comunes con la API)
+    from src import model_router
+except ImportError:
+    # Fallback cuando 'src' está directamente en sys.path (Streamlit Cloud)
+    import shared  # noqa: F401
+    import model_router
+from app.rate_limit import estimate_tokens, get_rate_limiter, model_name
+from app.tools.file_poller import BackoffPolicy
+from app.tools.upload_cache import hash_file
+from app.tools.file_registry import get_file_registry
+from app.tools.file_tools import IngestedFile, IngestError, check_file, ingest_file, ingest_multimedia_tool
+from app.tools.analysis_cache import get_analysis_cache, instruction_hash
+from app.chunked_analysis import ChunkAnalysisError, analyze_text_chunks, check_analysis_reply
+from app.facts import (
+    FACT_SCHEMA_PROMPT, FACT_SCHEMA_VERSION, FactSchemaError, FactSheet, dedupe_facts, load_fact_sheet,
+    parse_fact_sheet, render_facts,
+)
+from app.tools.inline_text import (
+    InlineText, InlineTextError, InlineTextPolicy, chunk_header, load_inline_text, merge_text_facts,
+)
 
 # nest_asyncio.apply()  <-- Removido, ahora se aplica en app.py
 
@@ -41,37 +67,59 @@ if os.getenv("GOOGLE_API_KEY"):
     genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
 
 # --- TOOLS ---
-def ingest_multimedia_tool(file_path: str) -> str:
+# La ingesta (comprobación previa, caché de subidas, registro de archivos y sondeo)
+# es la de la API: ingest_file, check_file e ingest_multimedia_tool de app/tools/file_tools.py.
+def guess_mime_type(file_path: str) -> str:
     """
-    Sube un archivo a la API de Gemini y espera a que esté listo.
-    Retorna el URI del archivo o un mensaje de error.
+    Determina el mime_type de un archivo: el real según la comprobación previa
+    si está en local (y es válido), o por su extensión en otro caso.
     """
-    if not os.path.exists(file_path):
-        logger.error(f"El archivo {file_path} no existe en el sistema local.")
-        return f"ERROR: El archivo {file_path} no existe en el sistema local."
+    if os.path.exists(file_path):
+        try:
+            return check_file(file_path).mime_type
+        except IngestError:
+            pass
+    mime_type, _ = mimetypes.guess_type(file_path)
+    if not mime_type:
+        logger.warning(f"No se pudo determinar el mime_type para {file_path}. Usando 'application/octet-stream'.")
+        mime_type = 'application/octet-stream'
+    return mime_type
 
-    logger.info(f"Subiendo {file_path} a la API de Gemini...")
-    try:
-        file_upload = genai.upload_file(file_path)
-        
-        while file_upload.state.name == "PROCESSING":
-            logger.info(f"Esperando procesamiento del archivo: {file_upload.name}...")
-            time.sleep(2)
-            file_upload = genai.get_file(file_upload.name)
+def parse_ingest_response(response_text: str, file_path: str) -> IngestedFile:
+    """
+    Convierte la respuesta en texto libre del IngestAgent en un IngestedFile.
+    Lanza IngestError si la respuesta no contiene un URI de archivo válido.
+    """
+    ingest_uri = response_text.strip()
 
-        if file_upload.state.name == "FAILED":
-            logger.error(f"Falló el procesamiento del archivo en Gemini: {file_upload.name}")
-            return "ERROR: Falló el procesamiento en Gemini."
+    # Extraer URI si hay texto adicional (fallback)
+    uri_match = re.search(r'(https://generativelanguage\.googleapis\.com/v1beta/(files/[a-z0-9-]+))', ingest_uri)
+    if uri_match:
+        ingest_uri = uri_match.group(1)
+        logger.info(f"URI extraído por regex: {ingest_uri}")
 
-        logger.info(f"Archivo {file_upload.name} procesado y listo con URI: {file_upload.uri}")
-        return file_upload.uri
-    except Exception as e:
-        logger.critical(f"Error crítico durante la subida del archivo: {str(e)}")
-        return f"ERROR CRÍTICO: {str(e)}"
+    if "ERROR" in ingest_uri or "files/" not in ingest_uri:
+        raise IngestError(ingest_uri)
+
+    name = uri_match.group(2) if uri_match else ingest_uri[ingest_uri.index("files/"):]
+    return IngestedFile(uri=ingest_uri, mime_type=guess_mime_type(file_path), name=name)
+
+def cacheable_analysis(technical_facts: str) -> bool:
+    """
+    Indica si unos hechos técnicos pueden guardarse en la caché de análisis:
+    no lo son una respuesta vacía ni el informe de error del AnalystAgent
+    ("ERROR: ...", p. ej., ante una inyección de instrucciones). Un hecho que
+    solo menciona la palabra (las líneas ERROR de un log) sí se guarda.
+    """
+    text = (technical_facts or "").strip()
+    return bool(text) and not text.startswith("ERROR") and model_router.INJECTION_REPORT not in text
 
 # --- AGENTS SETUP ---
-def create_agents():
-    """Inicializa y retorna los objetos Agent."""
+def create_agents(analyst_model: str = model_router.PRO_MODEL, writer_model: str = model_router.PRO_MODEL):
+    """
+    Inicializa y retorna los objetos Agent. El modelo del AnalystAgent y del
+    TechWriterAgent es configurable para construir sus variantes Flash y Pro.
+    """
     
     ingest_agent = Agent(
         model='gemini-2.5-flash',
@@ -86,7 +134,7 @@ def create_agents():
     )
 
     analyst_agent = Agent(
-        model='gemini-2.5-pro',
+        model=analyst_model,
         name='AnalystAgent',
         description="Analiza contenido técnico y extrae hechos.",
         instruction="""
@@ -103,7 +151,7 @@ def create_agents():
     )
 
     tech_writer_agent = Agent(
-        model='gemini-2.5-pro',
+        model=writer_model,
         name='TechWriterAgent',
         description="Genera documentación final.",
         instruction="""
@@ -128,146 +176,675 @@ def create_agents():
     
     return ingest_agent, analyst_agent, tech_writer_agent
 
+# --- AGENT POOL ---
+POOL_APP_NAME = "agents"
+
+class AgentPool:
+    """
+    Agentes y runners pre-construidos, compartidos por todo el proceso.
+
+    Los agentes guardan en caché su cliente del modelo, cuyas conexiones HTTP
+    asíncronas quedan ligadas al event loop donde se usaron por primera vez.
+    Por eso el pool tiene su propio event loop en un hilo de fondo y todos los
+    pipelines se ejecutan en él; cada petición solo crea sesiones ligeras.
+
+    El AnalystAgent y el TechWriterAgent tienen además una variante Flash
+    para el enrutado de modelos; su runner comparte los servicios (y por
+    tanto las sesiones) con el de la variante Pro.
+    """
+    def __init__(self):
+        started_at = time.perf_counter()
+        self.ingest_agent, self.analyst_agent, self.tech_writer_agent = create_agents()
+        _, self.analyst_flash_agent, self.tech_writer_flash_agent = create_agents(
+            analyst_model=model_router.FLASH_MODEL, writer_model=model_router.FLASH_MODEL
+        )
+        self.runners = {
+            agent.name: InMemoryRunner(agent=agent, app_name=POOL_APP_NAME)
+            for agent in (self.ingest_agent, self.analyst_agent, self.tech_writer_agent)
+        }
+        self.flash_runners = {}
+        for agent in (self.analyst_flash_agent, self.tech_writer_flash_agent):
+            runner = self.runners[agent.name]
+            self.flash_runners[agent.name] = Runner(
+                agent=agent, app_name=POOL_APP_NAME, session_service=runner.session_service,
+                artifact_service=runner.artifact_service, memory_service=runner.memory_service,
+            )
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="DocSquadAgentPool", daemon=True)
+        self._thread.start()
+        self.build_seconds = time.perf_counter() - started_at
+        self.created_at = time.time()
+        self.active_sessions = 0
+        self.pipelines_served = 0
+        logger.info(f"Pool de agentes creado en {self.build_seconds * 1000:.1f} ms.")
+
+    def runner_for(self, agent_name: str, tier: str = model_router.TIER_PRO):
+        """Runner de un agente en el nivel de modelo dado (Pro si no tiene variante Flash)."""
+        if tier == model_router.TIER_FLASH and agent_name in self.flash_runners:
+            return self.flash_runners[agent_name]
+        return self.runners[agent_name]
+
+    def submit(self, coro) -> concurrent.futures.Future:
+        """Programa una corrutina en el event loop del pool (seguro desde cualquier hilo)."""
+        if not self._thread.is_alive():
+            coro.close()
+            raise RuntimeError("El pool de agentes está detenido.")
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def shutdown(self, timeout: float = 5.0):
+        """
+        Cancela lo que quede en el event loop del pool, lo detiene y espera a
+        su hilo. Después el pool ya no admite peticiones.
+        """
+        if not self._thread.is_alive():
+            return
+
+        async def cancel_pending():
+            tasks = [task for task in asyncio.all_tasks() if task is not asyncio.current_task()]
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self.loop.stop()
+
+        asyncio.run_coroutine_threadsafe(cancel_pending(), self.loop)
+        self._thread.join(timeout)
+        if not self._thread.is_alive():
+            self.loop.close()
+        logger.info("Pool de agentes detenido.")
+
+    async def create_sessions(self, user_id: str) -> dict:
+        """Crea una sesión nueva en cada runner. Debe llamarse desde el loop del pool."""
+        sessions = {}
+        for agent_name, runner in self.runners.items():
+            sessions[agent_name] = await runner.session_service.create_session(
+                app_name=POOL_APP_NAME, user_id=user_id
+            )
+        self.active_sessions += len(sessions)
+        return sessions
+
+    async def release_sessions(self, sessions: dict):
+        """Elimina las sesiones de una petición para que los runners no acumulen eventos."""
+        for agent_name, session in sessions.items():
+            await self.runners[agent_name].session_service.delete_session(
+                app_name=POOL_APP_NAME, user_id=session.user_id, session_id=session.id
+            )
+        self.active_sessions -= len(sessions)
+
+    async def _warm_up(self, ping_models: bool):
+        sessions = await self.create_sessions("warmup_user")
+        try:
+            if ping_models:
+                # Llamada mínima a cada modelo para abrir las conexiones HTTP de antemano
+                ping = types.Content(role="user", parts=[types.Part(text="Responde únicamente: OK")])
+                for agent_name, runner in self.runners.items():
+                    session = sessions[agent_name]
+                    async for _ in runner.run_async(new_message=ping, user_id=session.user_id, session_id=session.id):
+                        pass
+        finally:
+            await self.release_sessions(sessions)
+
+    def warm_up(self, ping_models: bool = False) -> dict:
+        """
+        Ejercita el pool (sesiones y, opcionalmente, una llamada a cada modelo)
+        y devuelve su estado de salud con la duración del calentamiento.
+        """
+        started_at = time.perf_counter()
+        self.submit(self._warm_up(ping_models)).result()
+        health = self.health()
+        health["warm_up_seconds"] = time.perf_counter() - started_at
+        logger.info(f"Pool de agentes calentado en {health['warm_up_seconds'] * 1000:.1f} ms.")
+        return health
+
+    def health(self) -> dict:
+        return {
+            "status": "ok" if self._thread.is_alive() and self.loop.is_running() else "down",
+            "agents": list(self.runners),
+            "build_seconds": self.build_seconds,
+            "uptime_seconds": time.time() - self.created_at,
+            "active_sessions": self.active_sessions,
+            "pipelines_served": self.pipelines_served,
+        }
+
+_agent_pool = None
+_agent_pool_lock = threading.Lock()
+
+def get_agent_pool() -> AgentPool:
+    """Devuelve el pool compartido del proceso, creándolo la primera vez."""
+    global _agent_pool
+    with _agent_pool_lock:
+        if _agent_pool is None:
+            _agent_pool = AgentPool()
+        return _agent_pool
+
+def warm_up_agent_pool(ping_models: bool = False) -> dict:
+    """Hook de arranque/health check: crea y calienta el pool compartido."""
+    return get_agent_pool().warm_up(ping_models)
+
+# Súbela al cambiar el pipeline de forma que los documentos ya generados dejen de ser válidos
+PIPELINE_VERSION = 1
+
+def inline_text_policy_from_env() -> InlineTextPolicy | None:
+    """
+    Envío en línea de textos y código fuente: activo salvo con INLINE_TEXT=0;
+    INLINE_CHUNK_TOKENS, INLINE_OVERLAP_LINES, INLINE_CONCURRENCY e
+    INLINE_MAX_FILE_BYTES lo ajustan.
+    """
+    if os.getenv("INLINE_TEXT", "1").lower() in ("0", "false", "no"):
+        return None
+    defaults = InlineTextPolicy()
+    return InlineTextPolicy(
+        chunk_tokens=int(os.getenv("INLINE_CHUNK_TOKENS", defaults.chunk_tokens)),
+        overlap_lines=int(os.getenv("INLINE_OVERLAP_LINES", defaults.overlap_lines)),
+        max_concurrency=int(os.getenv("INLINE_CONCURRENCY", defaults.max_concurrency)),
+        max_file_bytes=int(os.getenv("INLINE_MAX_FILE_BYTES", defaults.max_file_bytes)),
+    )
+
+def _inline_text_label(policy: InlineTextPolicy | None) -> str:
+    return f"inline:{policy.chunk_tokens}/{policy.overlap_lines}" if policy else "inline:off"
+
+def fact_schema_from_env() -> bool:
+    """Registro de hechos en JSON (app/facts.py) para el AnalystAgent: activo salvo con FACT_SCHEMA=0."""
+    return os.getenv("FACT_SCHEMA", "1").lower() not in ("0", "false", "no")
+
+def _fact_schema_label(fact_schema: bool) -> str:
+    return f"facts:v{FACT_SCHEMA_VERSION}" if fact_schema else "facts:off"
+
+def structure_facts(responses: list[str], fact_schema: bool = True) -> str:
+    """
+    Une las respuestas del AnalystAgent (una, o una por fragmento de un texto
+    largo). Con `fact_schema`, si todas cumplen el esquema de hechos, devuelve
+    el JSON canónico del registro validado y deduplicado; si no, fusiona los
+    hechos como texto (los registros válidos, en su forma compacta).
+    """
+    if not fact_schema:
+        return responses[0] if len(responses) == 1 else merge_text_facts(responses)
+    sheets = []
+    for response in responses:
+        try:
+            sheets.append(parse_fact_sheet(response))
+        except FactSchemaError as e:
+            logger.warning(f"Una respuesta del AnalystAgent no cumple el esquema de hechos ({e}); se usa el texto libre.")
+            sheets.append(None)
+    if not all(sheets):
+        if len(responses) == 1:
+            return responses[0]
+        return merge_text_facts([render_facts(sheet) if sheet else response for sheet, response in zip(sheets, responses)])
+    parsed = FactSheet(facts=[fact for sheet in sheets for fact in sheet.facts], rejected=sum(sheet.rejected for sheet in sheets))
+    sheet = dedupe_facts(parsed)
+    logger.info(f"{len(sheet.facts)} hechos válidos ({len(parsed.facts) - len(sheet.facts)} duplicados, {sheet.rejected} descartados).")
+    return sheet.to_json()
+
+def pipeline_version(pool: AgentPool = None, routing_mode: str = None) -> str:
+    """
+    Huella del pipeline para la caché de documentos: PIPELINE_VERSION, modo de
+    enrutado, envío en línea de textos, esquema de hechos y modelo e
+    instrucción de cada agente del pool.
+    """
+    pool = pool or get_agent_pool()
+    routing_mode = routing_mode or model_router.routing_mode_from_env()
+    agents = (pool.ingest_agent, pool.analyst_agent, pool.analyst_flash_agent, pool.tech_writer_agent, pool.tech_writer_flash_agent)
+    parts = [str(PIPELINE_VERSION), routing_mode, _inline_text_label(inline_text_policy_from_env()), _fact_schema_label(fact_schema_from_env())] + [f"{_model_label(agent.model)}:{instruction_hash(agent.instruction)}" for agent in agents]
+    return instruction_hash("|".join(parts))[:16]
+
+# --- SESSION HISTORY ---
+# El historial es de cada ejecución del pipeline y cada agente se llama una vez por
+# ejecución (al escalar de Flash a Pro se retira el intento descartado), así que
+# tiene como mucho una entrada por agente y no crece entre peticiones.
+def format_history(history: list) -> str:
+    return "\n".join(f"Historial anterior:\n- Pregunta: {entry['prompt']}\n- Respuesta: {entry['response']}"
+                     for entry in history)
+
 # --- PIPELINE FUNCTION (ASYNC) ---
-async def run_pipeline_async(file_path: str, request_context: str, api_key: str = None, status_callback=None):
+async def run_pipeline_async(file_path: str, request_context: str, api_key: str = None, status_callback=None, direct_ingest: bool = True, poll_policy: BackoffPolicy = None, stage_timings: dict = None, stream_callback=None, pool: AgentPool = None, use_analysis_cache: bool = True, routing_mode: str = None, routing_report: dict = None, content_hash: str = None):
+    """
+    Ejecuta el pipeline Ingesta -> Análisis -> Redacción y devuelve el Markdown final.
+
+    Con direct_ingest=True (por defecto) el archivo se sube llamando a la
+    herramienta en el propio proceso, sin la ida y vuelta al IngestAgent.
+    Con direct_ingest=False se mantiene la ingesta mediante el agente.
+    poll_policy configura la espera del procesamiento del archivo en Gemini.
+    Si se pasa stage_timings, se rellena con la duración en segundos de cada
+    etapa ("IngestAgent", "AnalystAgent", "TechWriterAgent") y con el coste
+    de preparación de la petición ("setup").
+    Si se pasa stream_callback, el TechWriterAgent responde en streaming y la
+    función se llama con el texto acumulado del documento cada vez que llega
+    un fragmento nuevo; el tiempo hasta el primer fragmento se registra en
+    stage_timings["TechWriterAgent.first_token"].
+    Con use_analysis_cache=True (por defecto), si el mismo contenido ya se
+    analizó con el mismo contexto, modelo e instrucción del AnalystAgent, se
+    omiten la ingesta y el análisis y se pasa directamente a la redacción.
+    Solo se guardan análisis completos y válidos (ver cacheable_analysis).
+    Si el llamador ya conoce el SHA-256 del archivo (p. ej., lo calculó al
+    copiar la subida a disco), content_hash evita volver a leerlo.
+
+    routing_mode elige el modelo del AnalystAgent y del TechWriterAgent
+    (ver src/model_router.py): "pro" usa siempre Pro, "auto" elige Flash o
+    Pro según el tipo, tamaño y duración de la entrada, la longitud del
+    contexto y el volumen de hechos, y "cascade" prueba primero Flash y
+    escala a Pro si la salida no supera una comprobación local. Por defecto
+    se toma de MODEL_ROUTING ("pro"). Las decisiones, con su latencia y
+    coste estimado, se registran en el log y, si se pasa routing_report, se
+    rellena con ellas y con el resumen de la ejecución.
+
+    El pipeline se ejecuta en el event loop del pool de agentes (por defecto,
+    el compartido del proceso). Los callbacks se siguen invocando en el
+    event loop del llamador.
+    """
+    pool = pool or get_agent_pool()
+    routing_mode = routing_mode or model_router.routing_mode_from_env()
+    caller_loop = asyncio.get_running_loop()
+    if caller_loop is pool.loop:
+        return await _run_pipeline_in_pool(pool, file_path, request_context, api_key, status_callback, direct_ingest, poll_policy, stage_timings, stream_callback, use_analysis_cache, routing_mode, routing_report, content_hash)
+
+    def on_caller_loop(callback):
+        if callback is None:
+            return None
+        return lambda arg: caller_loop.call_soon_threadsafe(callback, arg)
+
+    future = pool.submit(_run_pipeline_in_pool(
+        pool, file_path, request_context, api_key, on_caller_loop(status_callback),
+        direct_ingest, poll_policy, stage_timings, on_caller_loop(stream_callback), use_analysis_cache,
+        routing_mode, routing_report, content_hash,
+    ))
+    return await asyncio.wrap_future(future)
+
+def _model_label(model) -> str:
+    return model if isinstance(model, str) else getattr(model, "model", type(model).__name__)
+
+async def _run_pipeline_in_pool(pool: AgentPool, file_path: str, request_context: str, api_key: str, status_callback, direct_ingest: bool, poll_policy: BackoffPolicy, stage_timings: dict, stream_callback, use_analysis_cache: bool, routing_mode: str = model_router.ROUTING_PRO, routing_report: dict = None, content_hash: str = None):
     if api_key:
         genai.configure(api_key=api_key)
     
     user_id = "default_user" # Define a user_id
-    session_id = f"session_{int(time.time())}" # Generate a unique session_id
-    
-    ingest_agent, analyst_agent, tech_writer_agent = create_agents()
-    
-    # Create a single InMemoryRunner instance
-    # The initial agent doesn't matter much as it will be dynamically updated
-    runner = InMemoryRunner(agent=ingest_agent, app_name="agents")
-    
-    # Explicitly create a session for the runner
-    session = await runner.session_service.create_session(
-        app_name="agents", user_id=user_id, session_id=session_id
-    )
-    
-    session_history = {
-        "IngestAgent": [],
-        "AnalystAgent": [],
-        "TechWriterAgent": [],
-    }
-
-    def update_status(msg):
-        logger.info(msg)
-        if status_callback:
-            status_callback(msg)
-
-    async def run_agent_with_memory(current_agent, agent_name, prompt, file_uri_parts=None):
-        # Dynamically update the agent for the single runner instance
-        runner.agent = current_agent
-
-        history = "\n".join([f"Historial anterior:\n- Pregunta: {h['prompt']}\n- Respuesta: {h['response']}" for h in session_history[agent_name]])
-        full_prompt = f"{history}\n\nTarea actual: {prompt}"
-        
-        update_status(f"Iniciando tarea para {agent_name}...")
+
+    def record_timing(stage, started_at):
+        if stage_timings is not None:
+            stage_timings[stage] = time.perf_counter() - started_at
+
+    # Solo se crean sesiones ligeras: agentes y runners vienen del pool
+    setup_started = time.perf_counter()
+    sessions = await pool.create_sessions(user_id)
+    record_timing("setup", setup_started)
+    logger.debug(f"Sesiones de la petición creadas en {(time.perf_counter() - setup_started) * 1000:.2f} ms.")
+    session_id = sessions["AnalystAgent"].id
+    pool.pipelines_served += 1
+    # Identificador de la ejecución para las referencias del registro de archivos remotos
+    run_id = uuid.uuid4().hex
+    try:
+        session_history = {
+            "IngestAgent": [],
+            "AnalystAgent": [],
+            "TechWriterAgent": [],
+        }
+
+        # Agentes de los que se recibió alguna respuesta sin texto en esta ejecución
+        incomplete_agents = set()
+
+        def update_status(msg):
+            logger.info(msg)
+            if status_callback:
+                status_callback(msg)
+
+        async def run_agent_with_memory(agent_name, prompt, file_uri_parts=None, on_partial=None, tier=model_router.TIER_PRO, fresh_session=False, extra_parts=None, isolated=False):
+            # Cada agente tiene su propio runner en el pool y su sesión en esta petición
+            runner = pool.runner_for(agent_name, tier)
+            session = sessions[agent_name]
+            # Una llamada aislada (p. ej., un fragmento de texto analizado en paralelo) no usa ni amplía el historial
+            fresh_session = fresh_session or isolated
+            if fresh_session:
+                # Al escalar, el modelo Pro no debe ver el intento descartado de Flash
+                session = await runner.session_service.create_session(app_name=POOL_APP_NAME, user_id=user_id)
+
+            if isolated:
+                full_prompt = prompt
+            else:
+                history = format_history(session_history[agent_name])
+                full_prompt = f"{history}\n\nTarea actual: {prompt}"
         
-        collected_events = []
+            update_status(f"Iniciando tarea para {agent_name}...")
         
-        # Construir las partes del mensaje
-        parts = [types.Part(text=full_prompt)]
-        if file_uri_parts:
-            uri, mime_type = file_uri_parts
-            if uri and mime_type and "files/" in uri:
-                logger.info(f"Adjuntando archivo {uri} ({mime_type}) a la petición para {agent_name}.")
-                parts.append(types.Part.from_uri(file_uri=uri, mime_type=mime_type))
-            else:
-                logger.warning(f"Se intentó adjuntar un archivo pero el URI o mime_type no son válidos: {file_uri_parts}")
+            # Construir las partes del mensaje
+            parts = [types.Part(text=full_prompt)]
+            if file_uri_parts:
+                uri, mime_type = file_uri_parts
+                if uri and mime_type and "files/" in uri:
+                    logger.info(f"Adjuntando archivo {uri} ({mime_type}) a la petición para {agent_name}.")
+                    parts.append(types.Part.from_uri(file_uri=uri, mime_type=mime_type))
+                else:
+                    logger.warning(f"Se intentó adjuntar un archivo pero el URI o mime_type no son válidos: {file_uri_parts}")
+            if extra_parts:
+                parts.extend(extra_parts)
 
-        new_message_content = types.Content(role='user', parts=parts)
+            new_message_content = types.Content(role='user', parts=parts)
 
-        async for event in runner.run_async(new_message=new_message_content, user_id=session.user_id, session_id=session.id):
-            collected_events.append(event)
-            logger.debug(f"Evento de {agent_name}: {event}")
-        
-        # Asumimos que el último evento contiene la respuesta final del agente
-        if collected_events:
-            final_response_event = collected_events[-1]
-            response_text = ""
-            if final_response_event.content and final_response_event.content.parts:
-                # Concatenar todas las partes de texto si hay varias
-                response_text = "".join([part.text for part in final_response_event.content.parts if part.text])
-            else:
-                logger.warning(f"El evento final del agente {agent_name} no contiene contenido de texto esperado.")
-                response_text = str(final_response_event) # Fallback
+            run_config = RunConfig(streaming_mode=StreamingMode.SSE) if on_partial else None
+            delivered = False
+            attempts = 0
+
+            def forward(chunk):
+                nonlocal delivered
+                delivered = True
+                on_partial(chunk)
+
+            async def run_once():
+                """Un intento de la llamada: devuelve los eventos finales y los tokens consumidos."""
+                nonlocal attempts
+                attempts += 1
+                attempt_session = session
+                if attempts > 1:
+                    # Un intento fallido puede haber dejado el mensaje en la sesión: el reintento usa otra
+                    attempt_session = await runner.session_service.create_session(app_name=POOL_APP_NAME, user_id=user_id)
+                events = []
+                input_tokens = output_tokens = 0
+                try:
+                    async for event in runner.run_async(new_message=new_message_content, user_id=attempt_session.user_id, session_id=attempt_session.id, run_config=run_config):
+                        if event.partial:
+                            # Fragmento de una respuesta en streaming; el evento final trae el texto completo
+                            if on_partial and event.content and event.content.parts:
+                                chunk = "".join(part.text for part in event.content.parts if part.text)
+                                if chunk:
+                                    forward(chunk)
+                            continue
+                        events.append(event)
+                        if event.usage_metadata:
+                            input_tokens += event.usage_metadata.prompt_token_count or 0
+                            output_tokens += event.usage_metadata.candidates_token_count or 0
+                        logger.debug(f"Evento de {agent_name}: {event}")
+                finally:
+                    if attempt_session is not session:
+                        await runner.session_service.delete_session(app_name=POOL_APP_NAME, user_id=user_id, session_id=attempt_session.id)
+                return events, input_tokens, output_tokens
+
+            # La llamada respeta la cuota del modelo en el limitador compartido con la API y se
+            # reintenta ante un 429 o un 5xx, salvo que ya se hayan entregado fragmentos en streaming
+            rate_limiter = get_rate_limiter()
+            model = model_name(runner.agent.model)
+            estimated_tokens = estimate_tokens(parts)
+            try:
+                collected_events, input_tokens, output_tokens = await rate_limiter.call(
+                    model, run_once, tokens=estimated_tokens, can_retry=lambda: not delivered,
+                )
+            finally:
+                if fresh_session:
+                    await runner.session_service.delete_session(app_name=POOL_APP_NAME, user_id=user_id, session_id=session.id)
+            rate_limiter.record_tokens(model, estimated_tokens, input_tokens + output_tokens)
+
+            # Asumimos que el último evento contiene la respuesta final del agente
+            if collected_events:
+                final_response_event = collected_events[-1]
+                response_text = ""
+                if final_response_event.content and final_response_event.content.parts:
+                    # Concatenar todas las partes de texto si hay varias
+                    response_text = "".join([part.text for part in final_response_event.content.parts if part.text])
+                else:
+                    logger.warning(f"El evento final del agente {agent_name} no contiene contenido de texto esperado.")
+                    response_text = str(final_response_event) # Fallback
+                    # Una respuesta así no debe reutilizarse (p. ej., desde la caché de análisis)
+                    incomplete_agents.add(agent_name)
             
-            session_history[agent_name].append({"prompt": prompt, "response": response_text})
-            update_status(f"Tarea para {agent_name} completada.")
-            logger.debug(f"Respuesta de {agent_name}: {response_text}")
+                if not isolated:
+                    session_history[agent_name].append({"prompt": prompt, "response": response_text})
+                update_status(f"Tarea para {agent_name} completada.")
+                logger.debug(f"Respuesta de {agent_name}: {response_text}")
             
-            # Devolver un objeto con un atributo 'text' para mantener la compatibilidad
-            class AgentResponse:
-                def __init__(self, text):
-                    self.text = text
-            return AgentResponse(response_text)
+                # Devolver un objeto con un atributo 'text' para mantener la compatibilidad
+                class AgentResponse:
+                    def __init__(self, text):
+                        self.text = text
+                        self.input_tokens = input_tokens
+                        self.output_tokens = output_tokens
+                return AgentResponse(response_text)
+            else:
+                logger.error(f"No se recibieron eventos del agente {agent_name}.")
+                raise Exception(f"No se recibió respuesta del agente {agent_name}.")
+
+        report = model_router.RoutingReport(routing_mode)
+        routing_policy = model_router.RoutingPolicy()
+
+        def routed_agent(agent_name, tier):
+            return pool.runner_for(agent_name, tier).agent
+
+        async def run_routed(agent_name, prompt, tier, reason, check, before_escalation=None, **kwargs):
+            """Ejecuta un agente en el nivel elegido y, en modo cascada, escala a Pro si falla la comprobación."""
+            stage_started = time.perf_counter()
+            response = await run_agent_with_memory(agent_name, prompt, tier=tier, **kwargs)
+            call = model_router.RoutedCall(
+                stage=agent_name, tier=tier, model=_model_label(routed_agent(agent_name, tier).model), reason=reason,
+                seconds=time.perf_counter() - stage_started,
+                input_tokens=response.input_tokens, output_tokens=response.output_tokens,
+            )
+            if routing_mode == model_router.ROUTING_CASCADE and tier == model_router.TIER_FLASH:
+                call.problems = check(response.text)
+            report.add(call)
+            if not call.problems:
+                return response
+
+            update_status(f"La salida de Flash para {agent_name} no supera la comprobación; se repite con Pro.")
+            # La respuesta descartada no debe formar parte del historial
+            if not kwargs.get("isolated"):
+                session_history[agent_name].pop()
+            if before_escalation:
+                before_escalation()
+            stage_started = time.perf_counter()
+            response = await run_agent_with_memory(agent_name, prompt, tier=model_router.TIER_PRO, fresh_session=True, **kwargs)
+            report.add(model_router.RoutedCall(
+                stage=agent_name, tier=model_router.TIER_PRO,
+                model=_model_label(routed_agent(agent_name, model_router.TIER_PRO).model),
+                reason=f"escalado: {', '.join(call.problems)}", seconds=time.perf_counter() - stage_started,
+                input_tokens=response.input_tokens, output_tokens=response.output_tokens,
+            ))
+            return response
+
+        def choose_tier(route) -> tuple[str, str]:
+            if routing_mode == model_router.ROUTING_PRO:
+                return model_router.TIER_PRO, "modo pro"
+            if routing_mode == model_router.ROUTING_CASCADE:
+                return model_router.TIER_FLASH, "cascada: primero Flash"
+            return route()
+
+        update_status(f"🚀 Iniciando pipeline para: {os.path.basename(file_path)} (Sesión: {session_id})")
+
+        # COMPROBACIÓN PREVIA: tipo real y metadatos leyendo solo cabeceras; un archivo
+        # vacío, truncado o no admitido se rechaza aquí, sin gastar subida ni llamadas al modelo
+        checked = None
+        if os.path.exists(file_path):
+            stage_started = time.perf_counter()
+            try:
+                checked = await asyncio.to_thread(check_file, file_path, content_hash)
+            except IngestError as e:
+                update_status(f"Archivo rechazado en la comprobación previa: {e}")
+                raise Exception(f"La ingesta del archivo falló: {e}")
+            finally:
+                record_timing("preflight", stage_started)
+            update_status(f"Comprobación previa: {checked.describe()}")
+
+        # ENRUTADO DEL ANÁLISIS: se decide con lo que se sabe del archivo local, antes de subirlo
+        analysis_tier, analysis_reason = choose_tier(lambda: model_router.route_analysis(
+            model_router.profile_input(
+                file_path, checked.mime_type if checked else guess_mime_type(file_path), request_context,
+                duration_seconds=checked.duration_seconds if checked else None,
+            ),
+            routing_policy,
+        ))
+        if routing_mode == model_router.ROUTING_CASCADE:
+            analysis_model_key = f"cascade:{_model_label(pool.analyst_flash_agent.model)}>{_model_label(pool.analyst_agent.model)}"
         else:
-            logger.error(f"No se recibieron eventos del agente {agent_name}.")
-            raise Exception(f"No se recibió respuesta del agente {agent_name}.")
+            analysis_model_key = str(routed_agent("AnalystAgent", analysis_tier).model)
 
-    update_status(f"🚀 Iniciando pipeline para: {os.path.basename(file_path)} (Sesión: {session_id})")
-    
-    # PASO 1: INGESTA
-    ingest_response = await run_agent_with_memory(
-        current_agent=ingest_agent, 
-        agent_name="IngestAgent", 
-        prompt=f"Sube y procesa el archivo: {file_path}"
-    )
-    
-    # Validar respuesta de la ingesta
-    ingest_uri = ingest_response.text.strip()
+        # Los textos y el código fuente se envían en línea al AnalystAgent, sin subirlos
+        inline_policy = inline_text_policy_from_env()
+        use_inline = bool(inline_policy and checked and inline_policy.applies_to(checked.is_text, checked.size_bytes))
+        if use_inline:
+            # El análisis de un texto en línea puede diferir del de un archivo subido
+            analysis_model_key += f"+{_inline_text_label(inline_policy)}"
+        # El AnalystAgent responde con el registro de hechos en JSON (app/facts.py), que se valida y deduplica
+        fact_schema = fact_schema_from_env()
+        schema_prompt = FACT_SCHEMA_PROMPT if fact_schema else ""
+        analysis_model_key += f"+{_fact_schema_label(fact_schema)}"
+
+        async def analyze_inline(inline: InlineText) -> str:
+            """Análisis del texto leído en local: en una sola llamada o por fragmentos en paralelo."""
+            file_name = os.path.basename(file_path)
+            if len(inline.chunks) == 1:
+                chunk = inline.chunks[0]
+                response = await run_routed(
+                    agent_name="AnalystAgent",
+                    prompt=f"Contexto extra proporcionado: '{request_context}'. Analiza exhaustivamente el contenido del archivo de texto adjunto ({file_name}) y extrae todos los hechos técnicos clave como se describe en tus instrucciones." + schema_prompt,
+                    tier=analysis_tier,
+                    reason=analysis_reason,
+                    check=model_router.check_analysis,
+                    extra_parts=[types.Part(text=chunk_header(chunk, file_name) + chunk.text)],
+                )
+                return structure_facts([response.text], fact_schema)
+
+            update_status(f"📄 Texto de ~{inline.tokens} tokens: análisis en {len(inline.chunks)} fragmentos en paralelo.")
+
+            async def analyze_chunk(parts):
+                # Un fragmento vacío o con el informe de error del agente detiene el análisis (AnalysisRejected)
+                response = await run_routed(
+                    agent_name="AnalystAgent",
+                    prompt=parts[0].text,
+                    tier=analysis_tier,
+                    reason=f"{analysis_reason}, fragmento de texto",
+                    check=model_router.check_analysis,
+                    extra_parts=parts[1:],
+                    isolated=True,
+                )
+                return check_analysis_reply(response.text)
+
+            try:
+                responses = await analyze_text_chunks(
+                    analyze_chunk, inline, file_name, inline_policy.max_concurrency, request_context, schema_prompt,
+                )
+            except ChunkAnalysisError as e:
+                update_status(f"Error en el análisis: {e}")
+                raise Exception(f"El análisis del texto falló: {e}")
+            return structure_facts(responses, fact_schema)
     
-    # Extraer URI si hay texto adicional (fallback)
-    import re
-    uri_match = re.search(r'(https://generativelanguage\.googleapis\.com/v1beta/files/[a-z0-9]+)', ingest_uri)
-    if uri_match:
-        ingest_uri = uri_match.group(1)
-        logger.info(f"URI extraído por regex: {ingest_uri}")
+        # CACHÉ DE ANÁLISIS: si el resultado ya existe se salta a la redacción
+        analysis_cache = get_analysis_cache() if use_analysis_cache else None
+        technical_facts = None
+        cache_key = None
+        if analysis_cache and os.path.exists(file_path):
+            if content_hash is None:
+                content_hash = await asyncio.to_thread(hash_file, file_path)
+            cache_key = (content_hash, request_context, analysis_model_key, instruction_hash(pool.analyst_agent.instruction))
+            technical_facts = await asyncio.to_thread(analysis_cache.get, *cache_key)
 
-    if "ERROR" in ingest_uri or "files/" not in ingest_uri:
-        update_status(f"Error en la ingesta: {ingest_uri}")
-        raise Exception(f"La ingesta del archivo falló: {ingest_uri}")
+        if technical_facts is not None:
+            update_status("⚡ Análisis encontrado en la caché: se omiten la ingesta y el análisis.")
+        else:
+            inline = None
+            if use_inline:
+                try:
+                    inline = await asyncio.to_thread(load_inline_text, file_path, inline_policy)
+                except InlineTextError as e:
+                    logger.warning(f"No se pudo leer el texto en local ({e}); se sube el archivo.")
 
-    update_status(f"Archivo subido con éxito: {ingest_uri}")
+            if inline is not None:
+                # Sin ingesta: el contenido viaja en la propia petición del análisis
+                update_status(f"⚡ Texto leído en local ({inline.source_bytes} bytes, ~{inline.tokens} tokens): se omite la subida.")
+                stage_started = time.perf_counter()
+                technical_facts = await analyze_inline(inline)
+                record_timing("AnalystAgent", stage_started)
+            else:
+                # PASO 1: INGESTA
+                stage_started = time.perf_counter()
+                try:
+                    if direct_ingest:
+                        update_status("Iniciando ingesta directa del archivo (sin IngestAgent)...")
+                        ingested = await ingest_file(file_path, poll_policy, content_hash=content_hash, run_id=run_id)
+                    else:
+                        ingest_response = await run_agent_with_memory(
+                            agent_name="IngestAgent", 
+                            prompt=f"Sube y procesa el archivo: {file_path}"
+                        )
+                        ingested = parse_ingest_response(ingest_response.text, file_path)
+                except IngestError as e:
+                    update_status(f"Error en la ingesta: {e}")
+                    raise Exception(f"La ingesta del archivo falló: {e}")
+                finally:
+                    record_timing("IngestAgent", stage_started)
 
-    # PASO 2: ANÁLISIS
-    # Determinar el mime_type del archivo original para la API
-    mime_type, _ = mimetypes.guess_type(file_path)
-    if not mime_type:
-        logger.warning(f"No se pudo determinar el mime_type para {file_path}. Usando 'application/octet-stream'.")
-        mime_type = 'application/octet-stream'
+                update_status(f"Archivo subido con éxito: {ingested.uri}")
 
-    analysis_prompt = f"Contexto extra proporcionado: '{request_context}'. Analiza exhaustivamente el contenido del archivo adjunto y extrae todos los hechos técnicos clave como se describe en tus instrucciones."
-    analysis_response = await run_agent_with_memory(
-        current_agent=analyst_agent,
-        agent_name="AnalystAgent",
-        prompt=analysis_prompt,
-        file_uri_parts=(ingest_uri, mime_type)
-    )
+                # PASO 2: ANÁLISIS
+                analysis_prompt = f"Contexto extra proporcionado: '{request_context}'. Analiza exhaustivamente el contenido del archivo adjunto y extrae todos los hechos técnicos clave como se describe en tus instrucciones." + schema_prompt
+                stage_started = time.perf_counter()
+                analysis_response = await run_routed(
+                    agent_name="AnalystAgent",
+                    prompt=analysis_prompt,
+                    tier=analysis_tier,
+                    reason=analysis_reason,
+                    check=model_router.check_analysis,
+                    file_uri_parts=(ingested.uri, ingested.mime_type)
+                )
+                record_timing("AnalystAgent", stage_started)
+                technical_facts = structure_facts([analysis_response.text], fact_schema)
 
-    # PASO 3: REDACCIÓN
-    writer_prompt = f"Aquí tienes los hechos técnicos extraídos: \n{analysis_response.text}\n. Genera el documento final."
-    final_doc_response = await run_agent_with_memory(
-        current_agent=tech_writer_agent,
-        agent_name="TechWriterAgent",
-        prompt=writer_prompt
-    )
+            # Solo se guarda un análisis completo y válido
+            if cache_key and "AnalystAgent" not in incomplete_agents and cacheable_analysis(technical_facts):
+                await asyncio.to_thread(analysis_cache.put, *cache_key, technical_facts)
+
+        # PASO 3: REDACCIÓN
+        # Un registro de hechos en JSON (también el de la caché) llega al redactor en su forma compacta
+        writer_facts, format_hint = technical_facts, ""
+        sheet = load_fact_sheet(technical_facts)
+        if sheet:
+            writer_facts = render_facts(sheet)
+            format_hint = "Cada línea es un hecho con el formato `[HH:MM:SS] tipo: valor (nota)`. "
+        writer_prompt = f"Aquí tienes los hechos técnicos extraídos: \n{writer_facts}\n. {format_hint}Genera el documento final."
+        stage_started = time.perf_counter()
+        on_partial = None
+        if stream_callback:
+            streamed_text = []
+
+            def forward_chunk(chunk):
+                if not streamed_text:
+                    first_token = time.perf_counter() - stage_started
+                    logger.info(f"Primer fragmento del TechWriterAgent en {first_token:.2f}s")
+                    if stage_timings is not None:
+                        stage_timings["TechWriterAgent.first_token"] = first_token
+                streamed_text.append(chunk)
+                stream_callback("".join(streamed_text))
+
+            on_partial = forward_chunk
+
+        writer_tier, writer_reason = choose_tier(lambda: model_router.route_writing(writer_facts, routing_policy))
+        final_doc_response = await run_routed(
+            agent_name="TechWriterAgent",
+            prompt=writer_prompt,
+            tier=writer_tier,
+            reason=writer_reason,
+            check=lambda text: model_router.check_document(text, writer_facts),
+            before_escalation=streamed_text.clear if stream_callback else None,
+            on_partial=on_partial
+        )
+        record_timing("TechWriterAgent", stage_started)
+
+        report.log_summary()
+        if routing_report is not None:
+            routing_report.update(report.summary())
+            routing_report["calls"] = [call.to_dict() for call in report.calls]
     
-    update_status("Pipeline finalizado con éxito.")
-    return final_doc_response.text
+        update_status("Pipeline finalizado con éxito.")
+        return final_doc_response.text
+    finally:
+        await pool.release_sessions(sessions)
+        # Los archivos remotos que usó la ejecución quedan libres para el recolector
+        await asyncio.to_thread(get_file_registry().release_run, run_id)
 
 # --- WRAPPER SÍNCRONO PARA APP.PY ---
-def run_documentation_pipeline(file_path: str, request_context: str = "", api_key: str = None, status_callback=None):
+def run_documentation_pipeline(file_path: str, request_context: str = "", api_key: str = None, status_callback=None, direct_ingest: bool = True, stream_callback=None, use_analysis_cache: bool = True, stage_timings: dict = None, routing_mode: str = None, routing_report: dict = None, content_hash: str = None):
     """
     Wrapper síncrono para ejecutar el pipeline async.
+    Si se pasa stage_timings, se rellena con la duración de cada etapa, y si
+    se pasa routing_report, con las decisiones de enrutado de modelos (ver
+    run_pipeline_async).
     """
     # nest_asyncio.apply() ahora se aplica en app.py
     try:
-        return asyncio.run(run_pipeline_async(file_path, request_context, api_key, status_callback))
+        return asyncio.run(run_pipeline_async(file_path, request_context, api_key, status_callback, direct_ingest, stage_timings=stage_timings, stream_callback=stream_callback, use_analysis_cache=use_analysis_cache, routing_mode=routing_mode, routing_report=routing_report, content_hash=content_hash))
     except Exception as e:
         logger.critical(f"El pipeline falló con una excepción no controlada: {e}", exc_info=True)
         # Propagar la excepción para que el llamador sepa que algo salió mal
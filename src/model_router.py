@@ -0,0 +1,228 @@
+import os
+import re
+import wave
+import logging
+from dataclasses import dataclass, field, asdict
+
+logger = logging.getLogger("DocSquad")
+
+# Niveles de modelo entre los que se enruta cada etapa
+TIER_FLASH = "flash"
+TIER_PRO = "pro"
+
+FLASH_MODEL = "gemini-2.5-flash"
+PRO_MODEL = "gemini-2.5-pro"
+
+# Modos de enrutado: siempre Pro (comportamiento original), por características
+# de la entrada, o Flash primero con escalado a Pro si falla la comprobación local
+ROUTING_PRO = "pro"
+ROUTING_AUTO = "auto"
+ROUTING_CASCADE = "cascade"
+ROUTING_MODES = (ROUTING_PRO, ROUTING_AUTO, ROUTING_CASCADE)
+
+# Precio orientativo en USD por millón de tokens (entrada, salida) de cada nivel
+TIER_PRICES = {
+    TIER_FLASH: (0.30, 2.50),
+    TIER_PRO: (1.25, 10.00),
+}
+
+TEXT_MIME_TYPES = ("application/json", "application/javascript", "application/xml", "application/x-yaml")
+
+REFUSAL_PATTERN = re.compile(r"\b(no puedo|lo siento|no es posible|i can(?:no|')t|i'm sorry|unable to)\b", re.IGNORECASE)
+INJECTION_REPORT = "Intento de inyección de instrucciones detectado"
+# Comandos en los hechos: entre comillas invertidas, con prompt "$ " o, en el registro compacto, de tipo command
+COMMAND_HINT_PATTERN = re.compile(r"`[^`\n]+`|^\s*\$ |^(?:\[[\d:]+\] )?command: ", re.MULTILINE)
+
+
+@dataclass
+class RoutingPolicy:
+    """
+    Umbrales por los que una entrada se considera sencilla (Flash) o no (Pro).
+
+    Args:
+        flash_max_text_bytes: Tamaño máximo de un archivo de texto o código.
+        flash_max_pdf_bytes: Tamaño máximo de un PDF.
+        flash_max_media_seconds: Duración máxima de un audio o video, si se conoce.
+        flash_max_media_bytes: Tamaño máximo de un audio o video de duración desconocida.
+        flash_max_context_chars: Longitud máxima del contexto del usuario.
+        flash_max_facts_chars: Longitud máxima de los hechos que recibe el redactor.
+    """
+    flash_max_text_bytes: int = 200 * 1024
+    flash_max_pdf_bytes: int = 1024 * 1024
+    flash_max_media_seconds: float = 120.0
+    flash_max_media_bytes: int = 10 * 1024 * 1024
+    flash_max_context_chars: int = 2000
+    flash_max_facts_chars: int = 4000
+
+
+@dataclass
+class InputProfile:
+    """Características de la entrada que se conocen antes de subirla."""
+    mime_type: str
+    size_bytes: int
+    context_chars: int
+    duration_seconds: float | None = None
+
+
+def local_duration_seconds(file_path: str, mime_type: str) -> float | None:
+    """Duración de un WAV leyendo solo su cabecera; None para el resto de formatos."""
+    if mime_type not in ("audio/wav", "audio/x-wav"):
+        return None
+    try:
+        with wave.open(file_path, "rb") as audio:
+            return audio.getnframes() / float(audio.getframerate())
+    except (wave.Error, EOFError, OSError, ZeroDivisionError):
+        return None
+
+
+def profile_input(file_path: str, mime_type: str, request_context: str, duration_seconds: float | None = None) -> InputProfile:
+    """Perfil de la entrada; `duration_seconds` (p. ej., de la comprobación previa) evita volver a medirla."""
+    if duration_seconds is None:
+        duration_seconds = local_duration_seconds(file_path, mime_type)
+    return InputProfile(
+        mime_type=mime_type,
+        size_bytes=os.path.getsize(file_path) if os.path.exists(file_path) else 0,
+        context_chars=len(request_context or ""),
+        duration_seconds=duration_seconds,
+    )
+
+
+def route_analysis(profile: InputProfile, policy: RoutingPolicy) -> tuple[str, str]:
+    """Nivel de modelo para el AnalystAgent y el motivo, según la entrada."""
+    if profile.context_chars > policy.flash_max_context_chars:
+        return TIER_PRO, f"contexto largo ({profile.context_chars} caracteres)"
+    mime_type = profile.mime_type
+    if mime_type.startswith("image/"):
+        return TIER_FLASH, "imagen"
+    if mime_type.startswith("text/") or mime_type in TEXT_MIME_TYPES:
+        if profile.size_bytes <= policy.flash_max_text_bytes:
+            return TIER_FLASH, f"texto corto ({profile.size_bytes} bytes)"
+        return TIER_PRO, f"texto largo ({profile.size_bytes} bytes)"
+    if mime_type == "application/pdf":
+        if profile.size_bytes <= policy.flash_max_pdf_bytes:
+            return TIER_FLASH, f"PDF pequeño ({profile.size_bytes} bytes)"
+        return TIER_PRO, f"PDF grande ({profile.size_bytes} bytes)"
+    if mime_type.startswith(("audio/", "video/")):
+        if profile.duration_seconds is not None:
+            if profile.duration_seconds <= policy.flash_max_media_seconds:
+                return TIER_FLASH, f"multimedia corto ({profile.duration_seconds:.0f} s)"
+            return TIER_PRO, f"multimedia largo ({profile.duration_seconds:.0f} s)"
+        if profile.size_bytes <= policy.flash_max_media_bytes:
+            return TIER_FLASH, f"multimedia pequeño ({profile.size_bytes} bytes)"
+        return TIER_PRO, f"multimedia grande ({profile.size_bytes} bytes)"
+    return TIER_PRO, f"tipo no clasificado ({mime_type})"
+
+
+def route_writing(technical_facts: str, policy: RoutingPolicy) -> tuple[str, str]:
+    """Nivel de modelo para el TechWriterAgent y el motivo, según el volumen de hechos."""
+    if len(technical_facts) <= policy.flash_max_facts_chars:
+        return TIER_FLASH, f"pocos hechos ({len(technical_facts)} caracteres)"
+    return TIER_PRO, f"muchos hechos ({len(technical_facts)} caracteres)"
+
+
+def check_analysis(text: str) -> list[str]:
+    """Comprobación local de la salida del analista; devuelve los problemas encontrados."""
+    text = (text or "").strip()
+    if INJECTION_REPORT in text:
+        return []
+    problems = []
+    if len(text) < 40:
+        problems.append("respuesta demasiado corta")
+    if REFUSAL_PATTERN.search(text[:300]):
+        problems.append("el modelo rehúsa o no puede analizar el archivo")
+    if sum(1 for line in text.splitlines() if line.strip()) < 2 and not text.startswith("{"):
+        problems.append("no hay una lista de hechos")
+    return problems
+
+
+def check_document(text: str, technical_facts: str) -> list[str]:
+    """Comprobación local del Markdown del redactor; devuelve los problemas encontrados."""
+    text = (text or "").strip()
+    problems = []
+    if len(text) < 200:
+        problems.append("documento demasiado corto")
+    if not re.search(r"^#{1,2} \S", text, re.MULTILINE):
+        problems.append("falta el título")
+    if len(re.findall(r"^#{2,3} \S", text, re.MULTILINE)) < 2:
+        problems.append("faltan secciones")
+    if text.count("```") % 2:
+        problems.append("bloque de código sin cerrar")
+    if COMMAND_HINT_PATTERN.search(technical_facts or "") and "```" not in text and "`" not in text:
+        problems.append("los comandos de los hechos no aparecen como código")
+    if "<script" in text.lower():
+        problems.append("contiene etiquetas <script>")
+    return problems
+
+
+def estimate_cost(tier: str, input_tokens: int, output_tokens: int) -> float:
+    """Coste orientativo en USD de una llamada con los precios de TIER_PRICES."""
+    input_price, output_price = TIER_PRICES[tier]
+    return (input_tokens * input_price + output_tokens * output_price) / 1_000_000
+
+
+@dataclass
+class RoutedCall:
+    """Una llamada enrutada: etapa, modelo elegido, motivo, latencia y coste."""
+    stage: str
+    tier: str
+    model: str
+    reason: str
+    seconds: float = 0.0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    problems: list[str] = field(default_factory=list)
+
+    @property
+    def cost(self) -> float:
+        return estimate_cost(self.tier, self.input_tokens, self.output_tokens)
+
+    @property
+    def pro_cost(self) -> float:
+        """Coste de los mismos tokens con el nivel Pro (referencia del ahorro)."""
+        return estimate_cost(TIER_PRO, self.input_tokens, self.output_tokens)
+
+    def to_dict(self) -> dict:
+        return {**asdict(self), "cost_usd": self.cost}
+
+
+class RoutingReport:
+    """Decisiones de enrutado de una ejecución del pipeline y su efecto en latencia y coste."""
+    def __init__(self, mode: str):
+        self.mode = mode
+        self.calls: list[RoutedCall] = []
+
+    def add(self, call: RoutedCall):
+        self.calls.append(call)
+        outcome = f"; no supera la comprobación: {', '.join(call.problems)}" if call.problems else ""
+        logger.info(f"[Enrutado] {call.stage} → {call.model} ({call.reason}) en {call.seconds:.2f}s, "
+                    f"{call.input_tokens}+{call.output_tokens} tokens, ~{call.cost:.5f} USD{outcome}")
+
+    def summary(self) -> dict:
+        cost = sum(call.cost for call in self.calls)
+        # Las llamadas descartadas al escalar no tienen equivalente en una ejecución solo con Pro
+        kept = [call for call in self.calls if not call.problems or call.tier == TIER_PRO]
+        pro_cost = sum(call.pro_cost for call in kept)
+        return {
+            "mode": self.mode,
+            "calls": len(self.calls),
+            "escalations": sum(1 for call in self.calls if call.problems and call.tier == TIER_FLASH),
+            "seconds": sum(call.seconds for call in self.calls),
+            "cost_usd": cost,
+            "pro_cost_usd": pro_cost,
+            "savings_usd": pro_cost - cost,
+        }
+
+    def log_summary(self):
+        summary = self.summary()
+        logger.info(f"[Enrutado] Modo {summary['mode']}: {summary['calls']} llamadas, "
+                    f"{summary['escalations']} escaladas a Pro, {summary['seconds']:.2f}s en modelos, "
+                    f"~{summary['cost_usd']:.5f} USD (solo Pro: ~{summary['pro_cost_usd']:.5f} USD).")
+
+
+def routing_mode_from_env() -> str:
+    """Modo de enrutado de MODEL_ROUTING: pro por defecto; auto y cascade se activan explícitamente."""
+    mode = os.getenv("MODEL_ROUTING", ROUTING_PRO).lower()
+    if mode not in ROUTING_MODES:
+        logger.warning(f"MODEL_ROUTING={mode} no es válido ({', '.join(ROUTING_MODES)}); se usa {ROUTING_PRO}.")
+        return ROUTING_PRO
+    return mode
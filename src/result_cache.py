@@ -0,0 +1,175 @@
+import os
+import json
+import time
+import sqlite3
+import hashlib
+import threading
+from dataclasses import dataclass
+
+try:
+    from src import shared  # noqa: F401 (módulos comunes con la API)
+except ImportError:
+    import shared  # noqa: F401
+from app.tools.analysis_cache import normalize_context
+
+# Ubicación por defecto de la caché compartida de documentos generados
+DEFAULT_RESULT_CACHE_PATH = os.path.join(
+    os.path.expanduser("~"), ".cache", "doc_squad", "result_cache.sqlite3"
+)
+
+# Tamaño máximo por defecto de los documentos almacenados (en bytes)
+DEFAULT_MAX_BYTES = 128 * 1024 * 1024
+
+
+def result_key(content_hash: str, context: str | None, pipeline_version: str) -> str:
+    """Clave de un documento: contenido, contexto normalizado y versión del pipeline."""
+    payload = json.dumps([content_hash, normalize_context(context), pipeline_version])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def cacheable_document(document: str | None) -> bool:
+    """Un documento vacío o que es un informe de error ("ERROR: ...") no se comparte con otras sesiones."""
+    text = (document or "").strip()
+    return bool(text) and not text.startswith("ERROR")
+
+
+@dataclass
+class CachedResult:
+    """Documento guardado y su procedencia."""
+    document: str
+    created_at: float
+    hits: int
+
+
+class ResultCache:
+    """
+    Caché persistente (SQLite) de los documentos Markdown finales, compartida
+    por todas las sesiones de la app.
+
+    La clave combina el SHA-256 del archivo, el contexto normalizado y la
+    versión del pipeline (modelos, instrucciones y modo de enrutado), así que
+    cualquier cambio en el pipeline produce un fallo de caché. Al guardar un
+    documento se eliminan los del mismo archivo y contexto generados con otra
+    versión. Si el tamaño total supera `max_bytes`, se expulsan las entradas
+    usadas hace más tiempo (LRU). Solo se guardan documentos que superan
+    `cacheable_document`. Es segura entre hilos dentro de un proceso.
+    """
+    def __init__(self, path: str | None = None, max_bytes: int | None = None):
+        self.path = path or os.getenv("RESULT_CACHE_PATH", DEFAULT_RESULT_CACHE_PATH)
+        self.max_bytes = max_bytes if max_bytes is not None else int(os.getenv("RESULT_CACHE_MAX_BYTES", DEFAULT_MAX_BYTES))
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        with self._conn:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("""
+                CREATE TABLE IF NOT EXISTS results (
+                    key TEXT PRIMARY KEY,
+                    content_hash TEXT NOT NULL,
+                    context TEXT NOT NULL,
+                    pipeline_version TEXT NOT NULL,
+                    document TEXT NOT NULL,
+                    size_bytes INTEGER NOT NULL,
+                    created_at REAL NOT NULL,
+                    last_used_at REAL NOT NULL,
+                    hits INTEGER NOT NULL DEFAULT 0
+                )
+            """)
+            self._conn.execute("CREATE INDEX IF NOT EXISTS results_lru ON results (last_used_at)")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS stats (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+
+    def _bump(self, name: str):
+        self._conn.execute(
+            "INSERT INTO stats (name, value) VALUES (?, 1) ON CONFLICT(name) DO UPDATE SET value = value + 1",
+            (name,),
+        )
+
+    def get(self, content_hash: str, context: str | None, pipeline_version: str) -> CachedResult | None:
+        """Devuelve el documento guardado para esta combinación, o None (y cuenta el acierto o fallo)."""
+        key = result_key(content_hash, context, pipeline_version)
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "SELECT document, created_at, hits FROM results WHERE key = ?", (key,)
+            ).fetchone()
+            if row is None:
+                self._bump("misses")
+                return None
+            self._conn.execute(
+                "UPDATE results SET last_used_at = ?, hits = hits + 1 WHERE key = ?", (time.time(), key)
+            )
+            self._bump("hits")
+            return CachedResult(document=row[0], created_at=row[1], hits=row[2] + 1)
+
+    def put(self, content_hash: str, context: str | None, pipeline_version: str, document: str) -> bool:
+        """
+        Guarda un documento, descarta los de otras versiones del pipeline y
+        aplica el límite de tamaño. Devuelve False si el documento no es válido
+        para la caché (y no se guarda).
+        """
+        if not cacheable_document(document):
+            return False
+        key = result_key(content_hash, context, pipeline_version)
+        normalized = normalize_context(context)
+        size_bytes = len(document.encode("utf-8"))
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                "DELETE FROM results WHERE content_hash = ? AND context = ? AND pipeline_version != ?",
+                (content_hash, normalized, pipeline_version),
+            )
+            self._conn.execute(
+                "INSERT OR REPLACE INTO results "
+                "(key, content_hash, context, pipeline_version, document, size_bytes, created_at, last_used_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, content_hash, normalized, pipeline_version, document, size_bytes, now, now),
+            )
+            self._evict()
+        return True
+
+    def _evict(self):
+        total = self._conn.execute("SELECT COALESCE(SUM(size_bytes), 0) FROM results").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for key, size_bytes in self._conn.execute(
+            "SELECT key, size_bytes FROM results ORDER BY last_used_at ASC"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            self._conn.execute("DELETE FROM results WHERE key = ?", (key,))
+            self._bump("evictions")
+            total -= size_bytes
+
+    def stats(self) -> dict:
+        """Aciertos, fallos, expulsiones, entradas y bytes almacenados."""
+        with self._lock:
+            counters = dict(self._conn.execute("SELECT name, value FROM stats").fetchall())
+            entries, total_bytes = self._conn.execute(
+                "SELECT COUNT(*), COALESCE(SUM(size_bytes), 0) FROM results"
+            ).fetchone()
+        hits, misses = counters.get("hits", 0), counters.get("misses", 0)
+        return {
+            "hits": hits,
+            "misses": misses,
+            "hit_rate": hits / (hits + misses) if hits + misses else 0.0,
+            "evictions": counters.get("evictions", 0),
+            "entries": entries,
+            "bytes": total_bytes,
+        }
+
+    def clear(self):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM results")
+            self._conn.execute("DELETE FROM stats")
+
+
+_result_cache: ResultCache | None = None
+_result_cache_lock = threading.Lock()
+
+
+def get_result_cache() -> ResultCache:
+    """Devuelve la instancia compartida de la caché de documentos."""
+    global _result_cache
+    with _result_cache_lock:
+        if _result_cache is None:
+            _result_cache = ResultCache()
+        return _result_cache
@@ -0,0 +1,19 @@
+"""
+Acceso del pipeline de Streamlit a los módulos comunes con la API.
+
+La comprobación previa, el envío de textos en línea, las cachés de subidas
+y de análisis, el sondeo de archivos, el limitador de llamadas y el
+registro de archivos remotos viven en agentic_docs_squad/app y los usan los
+dos árboles. Importar este módulo pone esa carpeta en sys.path para que
+`from app.tools... import ...` resuelva al paquete de la API (y no al
+app.py de Streamlit de la raíz).
+"""
+import os
+import sys
+
+AGENTIC_DOCS_SQUAD_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "agentic_docs_squad"
+)
+
+if AGENTIC_DOCS_SQUAD_DIR not in sys.path:
+    sys.path.insert(0, AGENTIC_DOCS_SQUAD_DIR)
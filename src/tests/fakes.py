@@ -0,0 +1,47 @@
+"""Dobles locales para probar el pipeline de src sin red ni GOOGLE_API_KEY."""
+import threading
+from typing import AsyncGenerator
+from google.adk.models import BaseLlm, LlmResponse
+from google.genai import types
+
+from src.doc_squad import AgentPool
+
+
+class ScriptedLlm(BaseLlm):
+    """
+    Modelo falso que responde, en orden, con los textos de `replies` (el
+    último se repite). Un None responde sin contenido y una excepción se
+    lanza. Guarda el texto de cada petición en `prompts` y el hilo en el que
+    se atendió en `threads`.
+    """
+    model: str = "scripted"
+    replies: list = []
+    prompts: list[str] = []
+    threads: list[str] = []
+
+    async def generate_content_async(self, llm_request, stream=False) -> AsyncGenerator[LlmResponse, None]:
+        self.prompts.append("".join(part.text or "" for part in llm_request.contents[-1].parts or []))
+        self.threads.append(threading.current_thread().name)
+        text = self.replies[min(len(self.prompts), len(self.replies)) - 1]
+        if isinstance(text, Exception):
+            raise text
+        if text is None:
+            yield LlmResponse(content=types.Content(role="model", parts=[]))
+            return
+        if stream:
+            yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text=text[:10])]), partial=True)
+        yield LlmResponse(content=types.Content(role="model", parts=[types.Part(text=text)]))
+
+
+def scripted_pool(**replies) -> AgentPool:
+    """
+    Pool de agentes con modelos falsos. `replies` asigna la lista de
+    respuestas por atributo del pool (p. ej., analyst_agent=[...]); los
+    agentes sin guion responden "OK".
+    """
+    pool = AgentPool()
+    for attribute in ("ingest_agent", "analyst_agent", "tech_writer_agent",
+                      "analyst_flash_agent", "tech_writer_flash_agent"):
+        agent = getattr(pool, attribute)
+        agent.model = ScriptedLlm(model=f"scripted-{attribute}", replies=replies.get(attribute, ["OK"]), prompts=[], threads=[])
+    return pool
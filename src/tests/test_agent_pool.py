@@ -0,0 +1,69 @@
+import asyncio
+import pytest
+
+from src import doc_squad
+from src.tests.fakes import scripted_pool
+
+FACTS = "- Se reinicia nginx con `systemctl restart nginx`\n- El servicio escucha en el puerto 8080"
+
+
+@pytest.fixture
+def notes(tmp_path):
+    path = tmp_path / "notes.md"
+    path.write_text("# Despliegue\n\nsystemctl restart nginx\n")
+    return str(path)
+
+
+def test_sequential_runs_reuse_runners_and_loop(notes):
+    """Dos ejecuciones desde event loops distintos (como las reejecuciones de Streamlit) usan el mismo pool."""
+    pool = scripted_pool(analyst_agent=[FACTS], tech_writer_agent=["# Documento"])
+    runners, loop = dict(pool.runners), pool.loop
+    try:
+        for _ in range(2):
+            document = asyncio.run(doc_squad.run_pipeline_async(
+                notes, "Despliegue", pool=pool, routing_mode="pro", use_analysis_cache=False,
+            ))
+            assert document == "# Documento"
+
+        assert pool.runners == runners and all(pool.runners[name] is runners[name] for name in runners)
+        assert pool.loop is loop
+        writer = pool.tech_writer_agent.model
+        assert len(writer.prompts) == 2 and set(writer.threads) == {"DocSquadAgentPool"}
+        health = pool.health()
+        assert (health["status"], health["pipelines_served"], health["active_sessions"]) == ("ok", 2, 0)
+    finally:
+        pool.shutdown()
+
+
+def test_failing_coroutine_surfaces_its_exception(notes):
+    """Un error dentro del loop del pool llega al llamador y las sesiones se liberan."""
+    pool = scripted_pool(analyst_agent=[ValueError("modelo roto")])
+    try:
+        async def fails():
+            raise KeyError("sin runner")
+        with pytest.raises(KeyError, match="sin runner"):
+            pool.submit(fails()).result(timeout=5)
+
+        with pytest.raises(ValueError, match="modelo roto"):
+            asyncio.run(doc_squad.run_pipeline_async(
+                notes, "Despliegue", pool=pool, routing_mode="pro", use_analysis_cache=False,
+            ))
+        assert pool.health()["active_sessions"] == 0
+        assert pool.health()["status"] == "ok"
+    finally:
+        pool.shutdown()
+
+
+def test_shutdown_cancels_pending_work_and_refuses_new_work():
+    pool = scripted_pool()
+    pending = pool.submit(asyncio.sleep(60))
+
+    pool.shutdown()
+
+    assert pending.cancelled()
+    assert pool.health()["status"] == "down"
+    assert pool.loop.is_closed()
+    coro = asyncio.sleep(0)
+    with pytest.raises(RuntimeError, match="detenido"):
+        pool.submit(coro)
+    pool.shutdown()  # idempotente
@@ -0,0 +1,90 @@
+import json
+import pytest
+from unittest.mock import patch
+
+from src import batch
+from src.batch import BatchItem, BatchReport, BatchResult, collect_items, percentile, run_batch
+
+
+def test_collect_items_filters_folder_by_preflight_extensions(tmp_path):
+    for name in ("b/sesion.MP4", "a/notas.md", "a/deploy.py", "a/captura.gif", "a/datos.zip", "a/.DS_Store"):
+        path = tmp_path / name
+        path.parent.mkdir(exist_ok=True)
+        path.write_bytes(b"x")
+
+    items = collect_items(str(tmp_path), "Soporte")
+
+    assert [item.path for item in items] == [
+        str(tmp_path / name) for name in ("a/captura.gif", "a/deploy.py", "a/notas.md", "b/sesion.MP4")
+    ]
+    assert {item.context for item in items} == {"Soporte"}
+
+
+def test_collect_items_reads_manifests_with_per_file_context(tmp_path):
+    (tmp_path / "lista.txt").write_text("# sesiones\nuno.mp4\n\n/abs/dos.mp4\n")
+    (tmp_path / "lista.json").write_text(json.dumps(["uno.mp4", {"path": "dos.mp4", "context": "Redes"}]))
+    (tmp_path / "lista.jsonl").write_text('{"path": "uno.mp4"}\n\n{"path": "dos.mp4", "context": "Redes"}\n')
+
+    assert collect_items(str(tmp_path / "lista.txt")) == [
+        BatchItem(str(tmp_path / "uno.mp4")), BatchItem("/abs/dos.mp4"),
+    ]
+    for manifest in ("lista.json", "lista.jsonl"):
+        assert collect_items(str(tmp_path / manifest), "General") == [
+            BatchItem(str(tmp_path / "uno.mp4"), "General"), BatchItem(str(tmp_path / "dos.mp4"), "Redes"),
+        ]
+
+
+def test_percentile_nearest_rank():
+    values = [5.0, 1.0, 4.0, 2.0, 3.0]
+    assert percentile([], 50) is None
+    assert percentile([7.0], 95) == 7.0
+    assert (percentile(values, 50), percentile(values, 95), percentile(values, 100)) == (3.0, 5.0, 5.0)
+    assert percentile(values, 20) == 1.0 and percentile(values, 21) == 2.0
+    assert percentile(list(map(float, range(1, 201))), 95) == 190.0
+
+
+@pytest.mark.asyncio
+async def test_run_batch_keeps_going_after_a_failure(tmp_path):
+    """El fallo de un archivo queda en su resultado y el resto se documenta."""
+    items = [BatchItem(f"/data/sesion{i}.mp4", f"ctx{i}") for i in range(4)]
+
+    async def fake_pipeline(path, context, stage_timings=None, **kwargs):
+        if path.endswith("sesion2.mp4"):
+            stage_timings["IngestAgent"] = 0.5
+            raise RuntimeError("La ingesta del archivo falló: 503")
+        stage_timings.update({"IngestAgent": 1.0, "AnalystAgent": 2.0, "TechWriterAgent": 3.0})
+        return f"# {context}"
+    finished = []
+
+    with patch.object(batch, "run_pipeline_async", side_effect=fake_pipeline):
+        report = await run_batch(items, concurrency=2, output_dir=str(tmp_path / "out"), on_result=finished.append)
+
+    assert [result.status for result in report.results] == ["ok", "ok", "failed", "ok"]
+    assert len(finished) == 4
+    failed = report.results[2]
+    assert failed.output_path is None and "503" in failed.error and failed.stage_timings == {"IngestAgent": 0.5}
+    with open(report.results[3].output_path, encoding="utf-8") as f:
+        assert f.read() == "# ctx3"
+
+
+def test_summary_and_report_json():
+    results = [
+        BatchResult("a.mp4", "ok", 10.0, {"IngestAgent": 1.0, "AnalystAgent": 4.0}, output_path="out/a.md"),
+        BatchResult("b.mp4", "ok", 20.0, {"IngestAgent": 3.0, "AnalystAgent": 6.0}, output_path="out/b.md"),
+        BatchResult("c.mp4", "failed", 1.0, {"IngestAgent": 2.0}, error="boom"),
+    ]
+    report = BatchReport(results=results, wall_seconds=36.0, concurrency=2)
+
+    summary = report.summary()
+    assert (summary["files"], summary["succeeded"], summary["failed"]) == (3, 2, 1)
+    assert summary["files_per_hour"] == 200.0
+    assert summary["pipeline_latency"] == {"p50": 10.0, "p95": 20.0}
+    assert summary["stage_latency"]["IngestAgent"] == {"count": 3, "p50": 2.0, "p95": 3.0}
+    assert summary["stage_latency"]["TechWriterAgent"] == {"count": 0, "p50": None, "p95": None}
+    assert summary["failures"] == [{"path": "c.mp4", "error": "boom"}]
+
+    data = json.loads(json.dumps(report.to_dict()))
+    assert data["summary"] == summary
+    assert data["results"][2] == {"path": "c.mp4", "status": "failed", "seconds": 1.0,
+                                  "stage_timings": {"IngestAgent": 2.0}, "output_path": None, "error": "boom"}
+    assert BatchReport(results=[], wall_seconds=0.0, concurrency=1).summary()["files_per_hour"] == 0.0
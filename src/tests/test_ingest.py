@@ -0,0 +1,57 @@
+import pytest
+from types import SimpleNamespace
+from unittest.mock import patch
+
+from src import doc_squad
+from app.tools import file_tools
+from app.tools.file_registry import get_file_registry
+from app.tools.upload_cache import UploadCache
+from tests.media import mp4_bytes
+
+
+def _remote(name: str):
+    return SimpleNamespace(name=name, uri=f"https://x/{name}", mime_type="video/mp4",
+                           state=SimpleNamespace(name="ACTIVE"), expiration_time=None)
+
+
+@pytest.mark.asyncio
+async def test_ingest_references_remote_file_for_the_run(tmp_path):
+    """La subida queda en el registro compartido con una referencia de la ejecución."""
+    video = tmp_path / "video.mp4"
+    video.write_bytes(mp4_bytes())
+    remote = _remote("files/abc")
+    file_service = SimpleNamespace(upload_file=lambda *args, **kwargs: remote, get_file=lambda name: remote)
+
+    with patch.object(file_tools, "get_upload_cache", return_value=UploadCache(str(tmp_path / "cache.json"))):
+        ingested = await doc_squad.ingest_file(str(video), file_service=file_service, content_hash="h1", run_id="run-1")
+
+    assert ingested.name == "files/abc"
+    registry = get_file_registry()
+    assert registry.usage()["referenced_files"] == 1
+    assert registry.release_run("run-1") == 1
+
+
+@pytest.mark.asyncio
+async def test_ingest_reuploads_when_cached_file_was_claimed(tmp_path):
+    """Si el recolector ya reclamó el archivo de la caché de subidas, se sube de nuevo."""
+    video = tmp_path / "video.mp4"
+    video.write_bytes(mp4_bytes())
+    upload_cache = UploadCache(str(tmp_path / "cache.json"))
+    upload_cache.put("h1", name="files/old", uri="https://x/files/old", mime_type="video/mp4", expiration_time=None)
+    registry = get_file_registry()
+    registry.acquire("files/old", None, "h1", "https://x/files/old", "video/mp4", 10)
+    registry.idle_seconds = 0
+    assert [f["name"] for f in registry.claim_collectable()] == ["files/old"]
+
+    uploads = []
+
+    def upload_file(*args, **kwargs):
+        uploads.append(args)
+        return _remote("files/new")
+    file_service = SimpleNamespace(upload_file=upload_file, get_file=_remote)
+
+    with patch.object(file_tools, "get_upload_cache", return_value=upload_cache):
+        ingested = await doc_squad.ingest_file(str(video), file_service=file_service, content_hash="h1", run_id="run-2")
+
+    assert ingested.name == "files/new" and len(uploads) == 1
+    assert registry.release_run("run-2") == 1
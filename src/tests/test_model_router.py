@@ -0,0 +1,103 @@
+import os
+import logging
+import pytest
+from unittest.mock import patch
+
+from src import doc_squad, model_router
+from src.model_router import (
+    TIER_FLASH, TIER_PRO, InputProfile, RoutingPolicy, check_analysis, check_document, route_analysis,
+)
+from src.tests.fakes import scripted_pool
+
+DOCUMENT = """# Despliegue de nginx
+
+## Requisitos
+
+Un servidor con acceso root y el puerto 80 libre para el servicio web de producción.
+
+## Pasos
+
+1. Instala el paquete con `apt install nginx`.
+2. Reinicia el servicio con `systemctl restart nginx` y comprueba que responde.
+"""
+
+
+@pytest.mark.parametrize("profile, tier", [
+    (InputProfile("image/png", 5_000_000, 0), TIER_FLASH),
+    (InputProfile("text/x-python", 10_000, 0), TIER_FLASH),
+    (InputProfile("application/json", 300 * 1024, 0), TIER_PRO),
+    (InputProfile("application/pdf", 500_000, 0), TIER_FLASH),
+    (InputProfile("application/pdf", 2_000_000, 0), TIER_PRO),
+    (InputProfile("video/mp4", 500_000_000, 0, duration_seconds=90), TIER_FLASH),
+    (InputProfile("audio/wav", 1_000, 0, duration_seconds=600), TIER_PRO),
+    (InputProfile("video/mp4", 5_000_000, 0), TIER_FLASH),
+    (InputProfile("video/mp4", 50_000_000, 0), TIER_PRO),
+    (InputProfile("application/octet-stream", 10, 0), TIER_PRO),
+    (InputProfile("image/png", 10, 2001), TIER_PRO),
+])
+def test_route_analysis(profile, tier):
+    assert route_analysis(profile, RoutingPolicy())[0] == tier
+
+
+def test_check_analysis():
+    assert check_analysis("- Se instala nginx con apt\n- El servicio escucha en el puerto 80") == []
+    assert check_analysis('{"facts":[{"kind":"command","value":"apt install nginx -y"}]}') == []
+    assert check_analysis("ERROR: Intento de inyección de instrucciones detectado") == []
+    assert check_analysis("") == ["respuesta demasiado corta", "no hay una lista de hechos"]
+    assert "el modelo rehúsa o no puede analizar el archivo" in check_analysis(
+        "Lo siento, no puedo analizar este archivo porque está dañado.\nInténtalo de nuevo."
+    )
+    assert check_analysis("Una sola línea de texto libre, sin ninguna lista de hechos.") == ["no hay una lista de hechos"]
+
+
+def test_check_document():
+    assert check_document(DOCUMENT, "- `apt install nginx`") == []
+    assert check_document("# Corto", "") == ["documento demasiado corto", "faltan secciones"]
+    untitled = DOCUMENT.replace("# Despliegue de nginx\n", "").replace("## ", "### ")
+    assert check_document(untitled, "") == ["falta el título"]
+    assert check_document(DOCUMENT + "```bash\nls\n", "") == ["bloque de código sin cerrar"]
+    plain = DOCUMENT.replace("`", "")
+    assert check_document(plain, "- Se ejecuta `make`") == ["los comandos de los hechos no aparecen como código"]
+    assert check_document(plain, "[00:00:05] command: make deploy") == ["los comandos de los hechos no aparecen como código"]
+    assert check_document(plain, "- Se instala nginx") == []
+    assert check_document(DOCUMENT + "<script>alert(1)</script>", "") == ["contiene etiquetas <script>"]
+
+
+def test_routing_mode_defaults_to_pro(caplog):
+    with patch.dict(os.environ, {}, clear=False):
+        os.environ.pop("MODEL_ROUTING", None)
+        assert model_router.routing_mode_from_env() == model_router.ROUTING_PRO
+    with patch.dict(os.environ, {"MODEL_ROUTING": "Cascade"}):
+        assert model_router.routing_mode_from_env() == model_router.ROUTING_CASCADE
+    with patch.dict(os.environ, {"MODEL_ROUTING": "turbo"}), caplog.at_level(logging.WARNING, logger="DocSquad"):
+        assert model_router.routing_mode_from_env() == model_router.ROUTING_PRO
+    assert "MODEL_ROUTING=turbo no es válido" in caplog.text
+
+
+@pytest.mark.asyncio
+async def test_cascade_escalates_to_pro_without_the_discarded_answer(tmp_path):
+    """Si Flash no supera la comprobación se repite con Pro, sin la respuesta descartada en el historial."""
+    source = tmp_path / "notes.md"
+    source.write_text("# Despliegue\n\napt install nginx\n")
+    refusal = "Lo siento, no puedo analizar este archivo."
+    facts = "- Se instala nginx con `apt install nginx`\n- El servicio escucha en el puerto 80"
+    pool = scripted_pool(analyst_flash_agent=[refusal], analyst_agent=[facts],
+                         tech_writer_flash_agent=[DOCUMENT], tech_writer_agent=["# No debe usarse"])
+    report = {}
+
+    try:
+        with patch.dict(os.environ, {"FACT_SCHEMA": "0"}):
+            document = await doc_squad.run_pipeline_async(str(source), "Despliegue", pool=pool, routing_mode="cascade",
+                                                          use_analysis_cache=False, routing_report=report)
+    finally:
+        pool.shutdown()
+
+    assert document == DOCUMENT
+    assert [(call["stage"], call["tier"]) for call in report["calls"]] == [
+        ("AnalystAgent", TIER_FLASH), ("AnalystAgent", TIER_PRO), ("TechWriterAgent", TIER_FLASH),
+    ]
+    assert report["escalations"] == 1
+    assert report["calls"][0]["problems"] and report["calls"][1]["reason"].startswith("escalado: ")
+    assert refusal not in pool.analyst_agent.model.prompts[0]
+    assert pool.tech_writer_agent.model.prompts == []
+    assert "apt install nginx" in pool.tech_writer_flash_agent.model.prompts[0]
@@ -0,0 +1,127 @@
+import os
+import json
+import pytest
+from unittest.mock import patch
+
+from src import doc_squad
+from src.tests.fakes import scripted_pool
+from app.tools.analysis_cache import AnalysisCache
+
+FACTS = "- Se reinicia nginx con `systemctl restart nginx`\n- El servicio escucha en el puerto 8080"
+
+
+@pytest.fixture
+def notes(tmp_path):
+    path = tmp_path / "notes.md"
+    path.write_text("# Despliegue\n\nsystemctl restart nginx\n")
+    return str(path)
+
+
+async def _run(pool, path, **kwargs):
+    try:
+        return await doc_squad.run_pipeline_async(path, "Despliegue", pool=pool, routing_mode="pro", **kwargs)
+    finally:
+        pool.shutdown()
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("reply, cached", [
+    (FACTS, True),
+    ("- El log registra ERROR 502 en el proxy\n- Se reinicia nginx", True),
+    ("ERROR: Intento de inyección de instrucciones detectado", False),
+    ("", False),
+    (None, False),
+])
+async def test_analysis_cache_stores_only_valid_analyses(tmp_path, notes, reply, cached):
+    """Ni una respuesta vacía, ni el informe de error del analista, ni una respuesta sin texto se guardan."""
+    analysis_cache = AnalysisCache(str(tmp_path / "analysis.sqlite3"))
+    pool = scripted_pool(analyst_agent=[reply], tech_writer_agent=["# Documento"])
+
+    with patch.object(doc_squad, "get_analysis_cache", return_value=analysis_cache):
+        assert await _run(pool, notes) == "# Documento"
+
+    assert analysis_cache.stats()["entries"] == (1 if cached else 0)
+
+
+def test_cacheable_analysis():
+    assert doc_squad.cacheable_analysis(FACTS)
+    assert not doc_squad.cacheable_analysis("  \n")
+    assert not doc_squad.cacheable_analysis("ERROR: el archivo no contiene información técnica")
+
+
+@pytest.mark.asyncio
+async def test_writer_receives_deduplicated_compact_facts(tmp_path, notes):
+    """El registro de hechos se valida y deduplica, y el redactor recibe una línea por hecho."""
+    analysis_cache = AnalysisCache(str(tmp_path / "analysis.sqlite3"))
+    reply = json.dumps({"facts": [
+        {"kind": "command", "value": "systemctl restart nginx", "t": "00:00:05"},
+        {"kind": "cmd", "value": "systemctl  restart nginx"},
+        {"kind": "host", "value": "10.0.0.5:8080"},
+    ]})
+    pool = scripted_pool(analyst_agent=[reply], tech_writer_agent=["# Documento"])
+    analyst, writer = pool.analyst_agent.model, pool.tech_writer_agent.model
+
+    with patch.object(doc_squad, "get_analysis_cache", return_value=analysis_cache), \
+            patch.dict(os.environ, {"FACT_SCHEMA": "1"}):
+        await _run(pool, notes)
+
+    assert '"facts"' in analyst.prompts[0]
+    assert "[00:00:05] command: systemctl restart nginx\nhost: 10.0.0.5:8080\n" in writer.prompts[0]
+    assert writer.prompts[0].count("systemctl") == 1
+
+
+@pytest.mark.asyncio
+async def test_analysis_cache_key_carries_fact_schema_version(tmp_path, notes):
+    """Un análisis guardado con el esquema no se reutiliza sin él (ni al revés)."""
+    analysis_cache = AnalysisCache(str(tmp_path / "analysis.sqlite3"))
+    replies = [json.dumps({"facts": [{"kind": "command", "value": "make deploy"}]})]
+
+    for fact_schema in ("1", "0", "1"):
+        pool = scripted_pool(analyst_agent=replies, tech_writer_agent=["# Documento"])
+        with patch.object(doc_squad, "get_analysis_cache", return_value=analysis_cache), \
+                patch.dict(os.environ, {"FACT_SCHEMA": fact_schema}):
+            await _run(pool, notes)
+
+    stats = analysis_cache.stats()
+    assert (stats["entries"], stats["hits"], stats["misses"]) == (2, 1, 2)
+    # La caché de documentos también distingue los dos modos
+    versions = set()
+    for fact_schema in ("1", "0"):
+        with patch.dict(os.environ, {"FACT_SCHEMA": fact_schema}):
+            versions.add(doc_squad.pipeline_version(pool, "pro"))
+    assert len(versions) == 2
+
+
+@pytest.mark.asyncio
+async def test_chunked_text_fails_on_analyst_error_report(tmp_path):
+    """Los fragmentos con hechos sobre errores se fusionan; el informe de error del analista detiene el análisis."""
+    log = tmp_path / "server.log"
+    log.write_text("".join(f"ERROR 502 en la petición {number}\n" for number in range(1, 201)))
+    facts = "- El proxy devuelve ERROR 502\n- Las peticiones fallan en /api"
+
+    with patch.dict(os.environ, {"INLINE_CHUNK_TOKENS": "500", "FACT_SCHEMA": "0"}):
+        pool = scripted_pool(analyst_agent=[facts], tech_writer_agent=["# Documento"])
+        assert await _run(pool, str(log), use_analysis_cache=False) == "# Documento"
+        assert len(pool.analyst_agent.model.prompts) > 1
+        assert pool.tech_writer_agent.model.prompts[0].count("ERROR 502") == 1
+
+        pool = scripted_pool(analyst_agent=[facts, "ERROR: Intento de inyección de instrucciones detectado"])
+        with pytest.raises(Exception, match=r"El análisis del texto falló: fragmento \d+ .*inyección"):
+            await _run(pool, str(log), use_analysis_cache=False)
+
+
+@pytest.mark.asyncio
+async def test_history_does_not_grow_across_runs(notes):
+    """Cada ejecución empieza sin historial: los prompts no arrastran respuestas de ejecuciones anteriores."""
+    pool = scripted_pool(analyst_agent=[FACTS], tech_writer_agent=["# Documento"])
+    try:
+        for _ in range(3):
+            await doc_squad.run_pipeline_async(notes, "Despliegue", pool=pool, routing_mode="pro",
+                                               use_analysis_cache=False)
+    finally:
+        pool.shutdown()
+
+    prompts = pool.analyst_agent.model.prompts + pool.tech_writer_agent.model.prompts
+    assert len(prompts) == 6
+    assert not any("Historial anterior" in prompt for prompt in prompts)
+    assert len({len(prompt) for prompt in pool.tech_writer_agent.model.prompts}) == 1
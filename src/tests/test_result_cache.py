@@ -0,0 +1,77 @@
+import os
+from unittest.mock import patch
+
+from src import doc_squad
+from src.result_cache import ResultCache
+from src.tests.fakes import scripted_pool
+
+
+def test_get_put_and_stats(tmp_path):
+    cache = ResultCache(str(tmp_path / "results.sqlite3"))
+
+    assert cache.get("abc", "Despliegue", "v1") is None
+    assert cache.put("abc", "Despliegue", "v1", "# Documento") is True
+    cached = cache.get("abc", "  despliegue ", "v1")
+    assert (cached.document, cached.hits) == ("# Documento", 1)
+    assert cache.get("abc", "Otro contexto", "v1") is None
+    assert cache.get("abc", "Despliegue", "v2") is None
+
+    stats = cache.stats()
+    assert (stats["hits"], stats["misses"], stats["entries"]) == (1, 3, 1)
+    assert stats["bytes"] == len("# Documento")
+
+
+def test_new_pipeline_version_replaces_old_documents(tmp_path):
+    cache = ResultCache(str(tmp_path / "results.sqlite3"))
+    cache.put("abc", "Despliegue", "v1", "# Antiguo")
+    cache.put("abc", "Otro contexto", "v1", "# Otro")
+
+    cache.put("abc", "Despliegue", "v2", "# Nuevo")
+
+    assert cache.get("abc", "Despliegue", "v1") is None
+    assert cache.get("abc", "Despliegue", "v2").document == "# Nuevo"
+    assert cache.get("abc", "Otro contexto", "v1").document == "# Otro"
+
+
+def test_lru_eviction_keeps_recently_used_documents(tmp_path):
+    cache = ResultCache(str(tmp_path / "results.sqlite3"), max_bytes=250)
+    for name in ("a", "b"):
+        cache.put(name, "", "v1", name * 100)
+    cache.get("a", "", "v1")  # "b" pasa a ser el menos usado
+
+    cache.put("c", "", "v1", "c" * 100)
+
+    assert cache.get("b", "", "v1") is None
+    assert cache.get("a", "", "v1") and cache.get("c", "", "v1")
+    assert cache.stats()["evictions"] == 1
+
+
+def test_empty_and_error_documents_are_not_cached(tmp_path):
+    cache = ResultCache(str(tmp_path / "results.sqlite3"))
+
+    assert cache.put("abc", "", "v1", "  \n") is False
+    assert cache.put("abc", "", "v1", "ERROR: no se pudo generar el documento") is False
+    assert cache.stats()["entries"] == 0
+    # Un documento corto pero válido sí se comparte (ya no depende de la comprobación del enrutado)
+    assert cache.put("abc", "", "v1", "# Nota\n\nReiniciar nginx.") is True
+
+
+def test_pipeline_version_tracks_models_instructions_and_modes():
+    pool = scripted_pool()
+    try:
+        base = doc_squad.pipeline_version(pool, "pro")
+        assert doc_squad.pipeline_version(pool, "pro") == base
+        assert doc_squad.pipeline_version(pool, "cascade") != base
+
+        pool.tech_writer_agent.instruction += "\nUsa tablas."
+        changed_instruction = doc_squad.pipeline_version(pool, "pro")
+        assert changed_instruction != base
+
+        pool.analyst_flash_agent.model.model = "otro-modelo"
+        assert doc_squad.pipeline_version(pool, "pro") not in (base, changed_instruction)
+
+        current = doc_squad.pipeline_version(pool, "pro")
+        with patch.dict(os.environ, {"INLINE_TEXT": "0"}):
+            assert doc_squad.pipeline_version(pool, "pro") != current
+    finally:
+        pool.shutdown()
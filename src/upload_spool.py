@@ -0,0 +1,67 @@
+"""
+Copia a disco de las subidas de Streamlit.
+
+Los límites, la validación de la extensión y los tipos (SpooledUpload,
+UploadTooLarge) son los de la API (app/tools/upload_spool.py); aquí solo
+viven las versiones síncronas para los objetos tipo archivo de Streamlit.
+"""
+import os
+import hashlib
+import tempfile
+
+try:
+    from src import shared  # noqa: F401 (módulos comunes con la API)
+except ImportError:
+    import shared  # noqa: F401
+from app.tools.upload_spool import (
+    SAFE_EXTENSION_PATTERN, SPOOL_CHUNK_SIZE, SpooledUpload, UploadTooLarge, max_upload_bytes,
+)
+
+
+def hash_upload(upload, chunk_size: int = SPOOL_CHUNK_SIZE) -> str:
+    """SHA-256 de un objeto tipo archivo leído por bloques, sin escribirlo a disco."""
+    digest = hashlib.sha256()
+    upload.seek(0)
+    for chunk in iter(lambda: upload.read(chunk_size), b""):
+        digest.update(chunk)
+    upload.seek(0)
+    return digest.hexdigest()
+
+
+def spool_upload(upload, filename: str, directory: str | None = None, chunk_size: int = SPOOL_CHUNK_SIZE,
+                 max_bytes: int | None = None, sha256: str | None = None) -> SpooledUpload:
+    """
+    Copia a un archivo temporal único un objeto tipo archivo (p. ej., el
+    UploadedFile de Streamlit) por bloques de `chunk_size`, calculando a la
+    vez su SHA-256: la copia no retiene en memoria más que un bloque además
+    del contenido que ya tenga el propio objeto, y el hash se obtiene sin
+    volver a leer el archivo de disco.
+
+    El archivo conserva la extensión de `filename` (el tipo MIME se deduce de
+    ella), pero no su nombre. Si la copia falla o se superan `max_bytes`
+    (MAX_UPLOAD_BYTES por defecto), se borra lo escrito; en el segundo caso
+    se lanza UploadTooLarge. Si ya se conoce el hash (`sha256`, p. ej., de
+    hash_upload), no se vuelve a calcular.
+    """
+    max_bytes = max_upload_bytes() if max_bytes is None else max_bytes
+    extension = os.path.splitext(filename or "")[1]
+    if not SAFE_EXTENSION_PATTERN.match(extension):
+        extension = ""
+
+    fd, path = tempfile.mkstemp(dir=directory, prefix="upload_", suffix=extension.lower())
+    digest = hashlib.sha256() if sha256 is None else None
+    size_bytes = 0
+    try:
+        upload.seek(0)
+        with os.fdopen(fd, "wb") as f:
+            for chunk in iter(lambda: upload.read(chunk_size), b""):
+                size_bytes += len(chunk)
+                if size_bytes > max_bytes:
+                    raise UploadTooLarge(f"El archivo supera el tamaño máximo permitido ({max_bytes} bytes).")
+                if digest is not None:
+                    digest.update(chunk)
+                f.write(chunk)
+    except BaseException:
+        os.remove(path)
+        raise
+    return SpooledUpload(path=path, sha256=sha256 if digest is None else digest.hexdigest(), size_bytes=size_bytes, filename=filename)